@@ -0,0 +1,2725 @@
+"""
+Local micro-benchmarks for the transcription POC functions.
+
+Run from the repository root, e.g.:
+
+    python poc-benchmarks.py normalizer --samples 20 --minutes 90
+
+Every benchmark loads the Cloud Function source file directly (the files are deployed as
+`main.py`, so they are not importable packages) and runs fully offline.
+"""
+import argparse
+import base64
+import concurrent.futures
+import contextlib
+import datetime
+import hashlib
+import http.server
+import importlib.util
+import io
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import types
+import urllib.parse
+from typing import Callable, Dict, Iterable, List, Optional
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_function_module(file_name: str, module_name: str):
+    """
+    Loads one of the Cloud Function source files (e.g. 'process-transcription-fn-poc.py') as a module,
+    registered in sys.modules and importable by `module_name` from sys.path, as functions_framework leaves
+    main.py (spawned process pool workers import it by name).
+    """
+    # Un enlace con un nombre importable en un directorio temporal de sys.path (los archivos tienen guiones), como
+    # el main.py que deja functions_framework; bench_cpu falla si aun así la etapa CPU pasa a hilos
+    module_dir = os.path.join(tempfile.gettempdir(), "poc-benchmark-modules")
+    os.makedirs(module_dir, exist_ok=True)
+    link_path = os.path.join(module_dir, module_name + ".py")
+    if not os.path.lexists(link_path):
+        os.symlink(os.path.join(REPO_DIR, file_name), link_path)
+    if module_dir not in sys.path:
+        sys.path.append(module_dir)
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(REPO_DIR, file_name))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def legacy_limpiar_text(full_text: str, candidate_name: str) -> str:
+    """
+    Text part of the original multi-pass `limpiar_transcripcion_texto`, kept as the reference output.
+    """
+    full_text = re.sub(r"\b\d{2}:\d{2}:\d{2}\b", "", full_text)
+    full_text = re.sub(r"\n\s*\n", "\n", full_text)
+
+    candidate_name_lower = candidate_name.lower()
+    full_text = re.sub(candidate_name, candidate_name_lower, full_text, flags=re.IGNORECASE)
+
+    fillers = [
+        r"\buh\b", r"\bum\b", r"\byou know\b", r"\bokay\b", r"\bsorry\b", r"\bwell\b",
+        r"\bso\b", r"\bi mean\b", r"\blet me see\b", r"\bjust\b", r"\blike\b", r"\bkind of\b", r"\bperfect\b", r"\byeah\b",
+    ]
+    full_text = re.sub("|".join(fillers), "", full_text, flags=re.IGNORECASE)
+    full_text = re.sub(r"\s{2,}", " ", full_text)
+
+    lines = full_text.splitlines()
+    filtered_lines = [
+        line.strip()
+        for line in lines
+        if line.strip().lower().startswith(candidate_name_lower + ":")
+    ]
+    return "\n".join(filtered_lines)
+
+
+# --- SYNTHETIC CORPUS ---
+
+FILLER_SAMPLES = ["uh", "um", "you know", "okay", "sorry", "well", "so", "I mean", "let me see",
+                  "just", "like", "kind of", "perfect", "yeah", "Yeah", "Okay"]
+WORD_SAMPLES = ["experience", "project", "team", "Java", "cloud", "migration", "client", "worked",
+                "salary", "role", "the", "and", "we", "built", "pipeline", "testing", "solo", "unlike",
+                "Jean", "MASSUCATTO", "interview", "position", "skills", "because", "control"]
+ODD_WHITESPACE = ["  ", "\t", " \t ", "\r", "\xa0", " ", "\x0c", ""]
+
+
+def synthetic_transcript(rng: random.Random, minutes: int, speakers: List[str], filler_density: float = 0.15,
+                         odd_whitespace: bool = True, timestamp_fraction: float = 0.5) -> str:
+    """
+    Builds a Gemini-notes-style transcript: summary header, "Transcript" marker, then
+    timestamped speaker turns with fillers, blank lines and irregular whitespace.
+    """
+    lines = [f"Notes by Gemini", "", "Summary", "The team discussed the position and next steps.", "",
+             f"{speakers[0]} - Transcript", ""]
+    turns = minutes * 6
+    for turn in range(turns):
+        seconds = turn * 10
+        if rng.random() < timestamp_fraction:
+            lines.append(f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}")
+        speaker = speakers[turn % len(speakers)] if rng.random() < 0.9 else rng.choice(speakers)
+        words = []
+        for _ in range(rng.randint(4, 40)):
+            words.append(rng.choice(FILLER_SAMPLES) if rng.random() < filler_density else rng.choice(WORD_SAMPLES))
+        line = f"{speaker}: " + " ".join(words)
+        if odd_whitespace and rng.random() < 0.2:
+            line = line.replace(" ", rng.choice(ODD_WHITESPACE) or " ", 1) + rng.choice(ODD_WHITESPACE)
+        lines.append(line)
+        if rng.random() < 0.1:
+            lines.append(rng.choice(["", " ", "um", "uh okay", "\t"]))
+        if rng.random() < 0.05:
+            lines.append("")
+    return "\n".join(lines) + "\n"
+
+
+def fuzz_text(rng: random.Random, length: int) -> str:
+    """
+    Short random texts built from the characters the cleaning rules care about.
+    """
+    alphabet = ["a", "b", "jean", "Jean:", "um", "so", "12:34:56", ":", " ", " ", "\n", "\n", "\t",
+                "\r", "\r\n", "\xa0", "\x0c", " ", "yeah", "you know", "x"]
+    return "".join(rng.choice(alphabet) for _ in range(length))
+
+
+def best_time(function: Callable[[], object], repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def bench_normalizer(args) -> int:
+    module = load_function_module("process-transcription-fn-poc.py", "process_transcription_fn_poc")
+    normalizer = module.TRANSCRIPT_NORMALIZER
+    rng = random.Random(args.seed)
+    candidate = "Jean Massucatto"
+    speakers = [candidate, "Francisco Ahijado"]
+
+    corpus = [synthetic_transcript(rng, args.minutes, speakers) for _ in range(args.samples)]
+    corpus += [fuzz_text(rng, rng.randint(0, 200)) for _ in range(args.fuzz)]
+
+    mismatches = 0
+    for text in corpus:
+        for name in (candidate, "jean"):
+            if normalizer.normalize(text, name) != legacy_limpiar_text(text, name):
+                mismatches += 1
+            page_chunks = [text[i:i + 997] for i in range(0, len(text), 997)]
+            if normalizer.normalize(page_chunks, name) != legacy_limpiar_text(text, name):
+                mismatches += 1
+    print(f"Equivalence: {len(corpus)} texts, {mismatches} mismatches against the original function.")
+
+    documents = corpus[:args.samples]
+    total_mb = sum(len(text.encode("utf-8")) for text in documents) / 1e6
+    results: Dict[str, float] = {
+        "original (6 passes)": best_time(lambda: [legacy_limpiar_text(t, candidate) for t in documents], args.repeat),
+        "TranscriptNormalizer": best_time(lambda: [normalizer.normalize(t, candidate) for t in documents], args.repeat),
+    }
+    print(f"Corpus: {args.samples} transcripts x {args.minutes} min, {total_mb:.2f} MB")
+    for label, seconds in results.items():
+        print(f"  {label:<22} {seconds * 1000:9.1f} ms   {total_mb / seconds:8.2f} MB/s")
+    return 1 if mismatches else 0
+
+
+# --- LOCAL STAND-INS ---
+
+class FakeGCSServer:
+    """
+    Minimal local stand-in for the GCS JSON API (multipart and resumable uploads, media downloads with Range,
+    metadata and patches, paginated listing by prefix, deletes, bucket metadata, ifGenerationMatch preconditions),
+    served over keep-alive HTTP/1.1 so connection reuse shows up in the timings.
+    Point a client at it with `client()`; `latency_seconds` is added to every request and a
+    `throttle_fraction` of the requests is answered with 429 Too Many Requests. Every object write calls
+    the `listeners` with (bucket, name), like an object-finalize notification.
+    """
+
+    def __init__(self, latency_seconds: float = 0.0, throttle_fraction: float = 0.0, seed: int = 7):
+        self.throttle_fraction = throttle_fraction
+        self.throttled = 0
+        self._throttle_rng = random.Random(seed)
+        self.objects: Dict[tuple, bytes] = {}
+        self.sessions: Dict[str, tuple] = {}
+        self.session_count = 0
+        self.created: Dict[tuple, float] = {}
+        self.generations: Dict[tuple, int] = {}
+        self.generation_count = 0
+        self.content_types: Dict[tuple, str] = {}
+        self.listeners: List[Callable[[str, str], None]] = []
+        self.started = time.time()
+        self.latency_seconds = latency_seconds
+        self.requests = 0
+        self.connections = 0
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                with server._lock:
+                    server.connections += 1
+
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status: int, body: bytes, headers: Optional[Dict[str, str]] = None):
+                self.send_response(status)
+                for key, value in (headers or {"Content-Type": "application/json"}).items():
+                    self.send_header(key, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _begin(self):
+                with server._lock:
+                    server.requests += 1
+                    throttled = server._throttle_rng.random() < server.throttle_fraction
+                    server.throttled += throttled
+                if server.latency_seconds:
+                    time.sleep(server.latency_seconds)
+                if throttled:
+                    self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                    self._reply(429, b'{"error": {"code": 429, "message": "Too Many Requests"}}')
+                    return None
+                return urllib.parse.urlsplit(self.path)
+
+            def do_POST(self):
+                url = self._begin()
+                if url is None:
+                    return
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                bucket = urllib.parse.unquote(url.path.split("/b/")[1].split("/")[0])
+                query = urllib.parse.parse_qs(url.query)
+                if query.get("uploadType") == ["resumable"]:
+                    metadata = json.loads(body or b"{}")
+                    name = metadata.get("name") or query["name"][0]
+                    content_type = metadata.get("contentType") or self.headers.get("X-Upload-Content-Type")
+                    with server._lock:
+                        server.session_count += 1
+                        upload_id = f"upload-{server.session_count}"
+                        server.sessions[upload_id] = (bucket, name, bytearray(), content_type)
+                    location = f"{server.url}/upload/storage/v1/b/{bucket}/o?uploadType=resumable&upload_id={upload_id}"
+                    self._reply(200, b"", {"Location": location})
+                    return
+                boundary = self.headers["Content-Type"].split("boundary=")[1].strip('"').encode()
+                parts = body.split(b"--" + boundary)
+                metadata = json.loads(parts[1].split(b"\r\n\r\n", 1)[1])
+                data = parts[2].split(b"\r\n\r\n", 1)[1][:-2]
+                if_generation_match = query.get("ifGenerationMatch", [None])[0]
+                if not server.store(bucket, metadata["name"], data, metadata.get("contentType"), if_generation_match):
+                    self._reply(412, b'{"error": {"code": 412, "message": "Precondition Failed"}}')
+                    return
+                self._reply(200, server.object_resource(bucket, metadata["name"], data))
+
+            def do_PUT(self):
+                url = self._begin()
+                if url is None:
+                    return
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                upload_id = urllib.parse.parse_qs(url.query)["upload_id"][0]
+                bucket, name, received, content_type = server.sessions[upload_id]
+                received.extend(body)
+                total = self.headers.get("Content-Range", "bytes */*").rsplit("/", 1)[1]
+                if total != "*" and int(total) == len(received):
+                    server.sessions.pop(upload_id)
+                    server.store(bucket, name, bytes(received), content_type)
+                    self._reply(200, server.object_resource(bucket, name, bytes(received)))
+                elif received:
+                    self._reply(308, b"", {"Range": f"bytes=0-{len(received) - 1}"})
+                else:
+                    self._reply(308, b"", {})
+
+            def _list(self, bucket: str, query: Dict[str, List[str]]):
+                # Páginas de maxResults objetos (1000 por defecto, como GCS); el pageToken es el desplazamiento
+                prefix = query.get("prefix", [""])[0]
+                start = int(query.get("pageToken", ["0"])[0])
+                page_size = int(query.get("maxResults", ["1000"])[0])
+                names = sorted(name for object_bucket, name in list(server.objects)
+                               if object_bucket == bucket and name.startswith(prefix))
+                page = {"kind": "storage#objects", "items": [
+                    json.loads(server.object_resource(bucket, name, server.objects[(bucket, name)]))
+                    for name in names[start:start + page_size]]}
+                if start + page_size < len(names):
+                    page["nextPageToken"] = str(start + page_size)
+                self._reply(200, json.dumps(page).encode())
+
+            def do_PATCH(self):
+                url = self._begin()
+                if url is None:
+                    return
+                metadata = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                bucket, _, name = (urllib.parse.unquote(part) for part in url.path.split("/b/", 1)[1].partition("/o/"))
+                if (bucket, name) not in server.objects:
+                    self._reply(404, b'{"error": {"code": 404, "message": "Not Found"}}')
+                    return
+                if "contentType" in metadata:
+                    server.content_types[(bucket, name)] = metadata["contentType"]
+                self._reply(200, server.object_resource(bucket, name, server.objects[(bucket, name)]))
+
+            def do_DELETE(self):
+                url = self._begin()
+                if url is None:
+                    return
+                upload_id = urllib.parse.parse_qs(url.query).get("upload_id")
+                if upload_id:
+                    # Cancelación de una sesión resumable: GCS responde 499
+                    server.sessions.pop(upload_id[0], None)
+                    self._reply(499, b"")
+                    return
+                bucket, _, name = url.path.split("/b/", 1)[1].partition("/o/")
+                key = (urllib.parse.unquote(bucket), urllib.parse.unquote(name))
+                if_generation_match = urllib.parse.parse_qs(url.query).get("ifGenerationMatch", [None])[0]
+                with server._lock:
+                    if key not in server.objects:
+                        status = 404
+                    elif if_generation_match is not None and int(if_generation_match) != server.generations.get(key):
+                        status = 412
+                    else:
+                        status = 204
+                        server.objects.pop(key)
+                        server.generations.pop(key, None)
+                if status == 404:
+                    self._reply(404, b'{"error": {"code": 404, "message": "Not Found"}}')
+                elif status == 412:
+                    self._reply(412, b'{"error": {"code": 412, "message": "Precondition Failed"}}')
+                else:
+                    self._reply(204, b"")
+
+            def do_GET(self):
+                url = self._begin()
+                if url is None:
+                    return
+                path = url.path.split("/b/", 1)[1]
+                if "/" not in path:
+                    self._reply(200, json.dumps({"kind": "storage#bucket", "name": urllib.parse.unquote(path)}).encode())
+                    return
+                if path.endswith("/o"):
+                    self._list(urllib.parse.unquote(path[:-2]), urllib.parse.parse_qs(url.query))
+                    return
+                bucket, _, name = path.partition("/o/")
+                with server._lock:
+                    data = server.objects.get((urllib.parse.unquote(bucket), urllib.parse.unquote(name)))
+                    generation = str(server.generations.get((urllib.parse.unquote(bucket), urllib.parse.unquote(name)), 1))
+                if data is None:
+                    self._reply(404, b'{"error": {"code": 404, "message": "Not Found"}}')
+                    return
+                if "alt=media" not in url.query:
+                    self._reply(200, server.object_resource(urllib.parse.unquote(bucket), urllib.parse.unquote(name), data))
+                    return
+                range_header = self.headers.get("Range")
+                if range_header:
+                    start, end = range_header.split("=")[1].split("-")
+                    start, end = int(start), min(int(end), len(data) - 1)
+                    self._reply(206, data[start:end + 1], {
+                        "Content-Type": "application/octet-stream",
+                        "Content-Range": f"bytes {start}-{end}/{len(data)}",
+                        "X-Goog-Generation": generation,
+                    })
+                else:
+                    self._reply(200, data, {"Content-Type": "application/octet-stream", "X-Goog-Generation": generation})
+
+        self._httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self._httpd.server_address[1]}"
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+
+    def store(self, bucket: str, name: str, data: bytes, content_type: Optional[str] = None,
+              if_generation_match: Optional[str] = None) -> bool:
+        """
+        Writes an object with a new generation; False (nothing written) if `if_generation_match` does not
+        match the current generation (0: the object must not exist).
+        """
+        with self._lock:
+            if if_generation_match is not None and int(if_generation_match) != self.generations.get((bucket, name), 0):
+                return False
+            self.generation_count += 1
+            self.generations[(bucket, name)] = self.generation_count
+            self.objects[(bucket, name)] = data
+            self.created[(bucket, name)] = time.time()
+            if content_type:
+                self.content_types[(bucket, name)] = content_type
+        for listener in self.listeners:
+            listener(bucket, name)
+        return True
+
+    def object_resource(self, bucket: str, name: str, data: bytes) -> bytes:
+        import google_crc32c
+        crc32c = base64.b64encode(google_crc32c.value(data).to_bytes(4, "big")).decode()
+        md5_hash = base64.b64encode(hashlib.md5(data).digest()).decode()
+        created = self.created.get((bucket, name), self.started)
+        time_created = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(created)) + f".{int(created * 1e6) % 10**6:06d}Z"
+        generation = str(self.generations.get((bucket, name), 1))
+        resource = {"bucket": bucket, "name": name, "size": str(len(data)), "generation": generation,
+                    "crc32c": crc32c, "md5Hash": md5_hash, "timeCreated": time_created}
+        if (bucket, name) in self.content_types:
+            resource["contentType"] = self.content_types[(bucket, name)]
+        return json.dumps(resource).encode()
+
+    def client(self):
+        from google.auth.credentials import AnonymousCredentials
+        from google.cloud import storage
+        return storage.Client(project="local-bench", credentials=AnonymousCredentials(),
+                              client_options={"api_endpoint": self.url})
+
+    def close(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+class FakeMetadataServer:
+    """
+    Local stand-in for the GCE metadata server's identity endpoint: returns an unsigned JWT for the requested
+    audience, valid for `token_lifetime` seconds. Point code at it through GCE_METADATA_HOST (`host`).
+    """
+
+    def __init__(self, latency_seconds: float = 0.0, token_lifetime: int = 3600):
+        self.latency_seconds = latency_seconds
+        self.token_lifetime = token_lifetime
+        self.requests = 0
+        self.connections = 0
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                with server._lock:
+                    server.connections += 1
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                with server._lock:
+                    server.requests += 1
+                time.sleep(server.latency_seconds)
+                url = urllib.parse.urlsplit(self.path)
+                audience = urllib.parse.parse_qs(url.query).get("audience", [""])[0]
+                if self.headers.get("Metadata-Flavor") != "Google" or not url.path.endswith("/identity"):
+                    body, status = b"Missing Metadata-Flavor header", 403
+                else:
+                    body, status = server.token(audience).encode(), 200
+                self.send_response(status)
+                self.send_header("Content-Type", "text/plain")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self._httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._httpd.daemon_threads = True
+        self.host = f"127.0.0.1:{self._httpd.server_address[1]}"
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+
+    def token(self, audience: str) -> str:
+        def segment(value: Dict) -> str:
+            return base64.urlsafe_b64encode(json.dumps(value).encode()).rstrip(b"=").decode()
+        now = int(time.time())
+        claims = {"aud": audience, "iat": now, "exp": now + self.token_lifetime, "iss": "https://accounts.google.com"}
+        return f"{segment({'alg': 'RS256', 'typ': 'JWT'})}.{segment(claims)}.signature"
+
+    def close(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+class FakeMainFunction:
+    """
+    Stand-in for poc-main-trigger-email behind Cloud Run: requires a Bearer token, answers after
+    `latency_seconds` (batches {"events": [...]} are processed in parallel, as hello_http does), and adds
+    `connect_seconds` to every new connection to stand in for the TLS handshake of a real endpoint.
+    """
+
+    def __init__(self, latency_seconds: float = 0.0, connect_seconds: float = 0.0):
+        self.latency_seconds = latency_seconds
+        self.connect_seconds = connect_seconds
+        self.requests = 0
+        self.connections = 0
+        self.events = 0
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                time.sleep(server.connect_seconds)
+                with server._lock:
+                    server.connections += 1
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                events = payload.get("events", [payload])
+                with server._lock:
+                    server.requests += 1
+                    server.events += len(events)
+                time.sleep(server.latency_seconds)
+                if not self.headers.get("Authorization", "").startswith("Bearer "):
+                    body, status = b'{"Error": "Unauthorized"}', 401
+                elif "events" in payload:
+                    body, status = json.dumps({"results": [{"name": event["name"], "status": 200}
+                                                           for event in events]}).encode(), 200
+                else:
+                    body, status = b'{"signed_url": "https://example.invalid/signed"}', 200
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self._httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self._httpd.server_address[1]}/"
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+class FakeOTLPCollector:
+    """
+    Stand-in for an OpenTelemetry Collector's OTLP/HTTP receiver: keeps every span POSTed as JSON to
+    /v1/traces (`spans`, flattened from resourceSpans/scopeSpans).
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.spans: List[Dict] = []
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                if self.path != "/v1/traces":
+                    status = 404
+                else:
+                    status = 200
+                    with server._lock:
+                        server.requests += 1
+                        for resource_spans in payload["resourceSpans"]:
+                            for scope_spans in resource_spans["scopeSpans"]:
+                                server.spans.extend(scope_spans["spans"])
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", "2")
+                self.end_headers()
+                self.wfile.write(b"{}")
+
+        self._httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self._httpd.server_address[1]}"
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+class FakeQuota:
+    """
+    Project quota shared by Vertex AI stand-ins (across simulated instances): at most `requests_per_second`
+    calls in any one-second window; calls over it fail with ResourceExhausted (429), like the real API.
+    """
+
+    def __init__(self, requests_per_second: float):
+        self.requests_per_second = requests_per_second
+        self.admitted: List[float] = []
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def admit(self):
+        with self._lock:
+            now = time.monotonic()
+            while self.admitted and now - self.admitted[0] >= 1.0:
+                self.admitted.pop(0)
+            if len(self.admitted) >= self.requests_per_second:
+                self.rejected += 1
+                raise importlib.import_module("google.api_core.exceptions").ResourceExhausted(
+                    "Quota exceeded for aiplatform.googleapis.com/generate_content_requests_per_minute")
+            self.admitted.append(now)
+
+
+class FakeEmbeddingModel:
+    """
+    Vertex AI TextEmbeddingModel stand-in: `load_seconds` to build, fixed-size vectors, the request limits
+    of the real models (`max_texts` per request, `max_input_chars` per text when auto_truncate is off) and
+    an optional FakeQuota.
+    """
+
+    def __init__(self, load_seconds: float = 0.0, dimensions: int = 3072, call_seconds: float = 0.0,
+                 max_texts: int = 250, max_input_chars: Optional[int] = None, quota: Optional[FakeQuota] = None):
+        time.sleep(load_seconds)
+        self.quota = quota
+        self.dimensions = dimensions
+        self.call_seconds = call_seconds
+        self.max_texts = max_texts
+        self.max_input_chars = max_input_chars
+        self.calls = 0
+
+    def get_embeddings(self, texts: List[str], auto_truncate: bool = True, output_dimensionality: Optional[int] = None,
+                       **kwargs):
+        self.calls += 1
+        if self.quota:
+            self.quota.admit()
+        time.sleep(self.call_seconds)
+        if len(texts) > self.max_texts:
+            raise ValueError(f"{len(texts)} texts in one request; the model accepts {self.max_texts}")
+        if self.max_input_chars and not auto_truncate and max(map(len, texts)) > self.max_input_chars:
+            raise ValueError("input longer than the model limit")
+        dimensions = output_dimensionality or self.dimensions
+        return [types.SimpleNamespace(values=[(len(text) % 97) / 97.0] * dimensions) for text in texts]
+
+
+class FakeGenerativeModel:
+    """
+    Vertex AI GenerativeModel stand-in returning a fixed 8-question JSON analysis, optionally with an
+    LLM-like latency (prefill time per input token plus decode time for max_output_tokens) and a FakeQuota.
+    With a response_schema it answers every requested field; the first `drift_calls` answers can be
+    damaged like real outputs (`malformed_fields` emitted as invalid JSON, output cut at `truncate_at`).
+    Supports stream=True.
+    """
+
+    def __init__(self, load_seconds: float = 0.0, call_seconds: float = 0.0, response_text: Optional[str] = None,
+                 prefill_tokens_per_second: float = 0.0, output_tokens_per_second: float = 0.0,
+                 quota: Optional[FakeQuota] = None, malformed_fields: Iterable[str] = (),
+                 truncate_at: Optional[float] = None, fenced: bool = False, drift_calls: int = 1):
+        time.sleep(load_seconds)
+        self.quota = quota
+        self.malformed_fields = set(malformed_fields)
+        self.truncate_at = truncate_at
+        self.fenced = fenced
+        self.drift_calls = drift_calls
+        self.call_seconds = call_seconds
+        self.prefill_tokens_per_second = prefill_tokens_per_second
+        self.output_tokens_per_second = output_tokens_per_second
+        self.calls = 0
+        self.input_tokens = 0
+        self._lock = threading.Lock()
+        self.response_text = response_text or json.dumps(
+            {f"{number}. Question": f"Answer {number}." for number in range(1, 9)})
+
+    def schema_response(self, schema: Dict, drifted: bool) -> str:
+        fields = schema.get("property_ordering") or list(schema["properties"])
+        parts = []
+        for name in fields:
+            answer = f"{schema['properties'][name].get('description', name)}\n- Evidence quoted from the transcript."
+            if drifted and name in self.malformed_fields:
+                parts.append(f'"{name}": {answer}')
+            else:
+                parts.append(f'"{name}": ' + json.dumps(answer, ensure_ascii=False).replace("\\n", "\n"))
+        text = "{\n  " + ",\n  ".join(parts) + "\n}"
+        if drifted and self.truncate_at is not None:
+            text = text[:int(len(text) * self.truncate_at)]
+        if drifted and self.fenced:
+            text = "```json\n" + text + "\n```"
+        return text
+
+    def generate_content(self, contents, generation_config=None, stream: bool = False, **kwargs):
+        # Latencia opcional de un LLM real: prefill proporcional a la entrada, decode a max_output_tokens
+        if hasattr(generation_config, "to_dict"):
+            generation_config = generation_config.to_dict()
+        input_tokens = len(contents) // 3
+        with self._lock:
+            self.calls += 1
+            call_number = self.calls
+            self.input_tokens += input_tokens
+        if self.quota:
+            self.quota.admit()
+        seconds = self.call_seconds
+        if self.prefill_tokens_per_second:
+            seconds += input_tokens / self.prefill_tokens_per_second
+        if self.output_tokens_per_second:
+            seconds += (generation_config or {}).get("max_output_tokens", 0) / self.output_tokens_per_second
+        time.sleep(seconds)
+        schema = (generation_config or {}).get("response_schema")
+        text = self.schema_response(schema, call_number <= self.drift_calls) if schema else self.response_text
+        if stream:
+            return iter([types.SimpleNamespace(text=text[start:start + 64]) for start in range(0, len(text), 64)])
+        candidate = {"content": {"parts": [{"text": text}]}}
+        return types.SimpleNamespace(text=text, to_dict=lambda: {"candidates": [candidate]})
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def bench_pool(args) -> int:
+    module = load_function_module("process-transcription-fn-poc.py", "process_transcription_fn_poc")
+    gcs = FakeGCSServer()
+    load_seconds = args.model_load_ms / 1000
+    prompt_path = os.path.join(REPO_DIR, module.PROMPT)
+    gcs.objects[(module.BUCKET_NAME, "interview.txt")] = b"Jean Massucatto: hello\n" * 2000
+
+    def invocation(storage_client, embedding_model, generative_model, prompt_template):
+        # Same resource usage as one process_transcription call: download, embed, TXT upload, Gemini, DOCX upload.
+        text = storage_client().bucket(module.BUCKET_NAME).blob("interview.txt").download_as_bytes().decode()
+        embedding_model().get_embeddings([text])
+        storage_client().bucket(module.BUCKET_DESTINO).blob("TXT/bench.txt").upload_from_string(text)
+        generative_model().generate_content(prompt_template().format(embeddings_str="") + text)
+        storage_client().bucket(module.BUCKET_DESTINO).blob("bench.docx").upload_from_string(b"docx")
+
+    def cold_path():
+        invocation(gcs.client,
+                   lambda: FakeEmbeddingModel(load_seconds),
+                   lambda: FakeGenerativeModel(load_seconds),
+                   lambda: module.read_prompt_template(prompt_path))
+
+    pool = module.ResourcePool(factories={
+        "storage": gcs.client,
+        "embedding_model": lambda: FakeEmbeddingModel(load_seconds),
+        "generative_model": lambda: FakeGenerativeModel(load_seconds),
+        "prompt_template": lambda: module.read_prompt_template(prompt_path),
+    })
+
+    def warm_path():
+        invocation(lambda: pool.get("storage"), lambda: pool.get("embedding_model"),
+                   lambda: pool.get("generative_model"), lambda: pool.get("prompt_template"))
+
+    print(f"Stand-ins: local GCS at {gcs.url}, Vertex model load {args.model_load_ms} ms")
+    for label, path in (("per-invocation clients", cold_path), ("ResourcePool", warm_path)):
+        connections_before = gcs.connections
+        latencies = []
+        for _ in range(args.invocations):
+            start = time.perf_counter()
+            path()
+            latencies.append((time.perf_counter() - start) * 1000)
+        print(f"  {label:<24} p50 {percentile(latencies, 0.5):7.1f} ms   p95 {percentile(latencies, 0.95):7.1f} ms   "
+              f"new connections {gcs.connections - connections_before}")
+
+    # Concurrent warm requests must share a single instance of every resource.
+    concurrent_pool = module.ResourcePool(factories={"storage": gcs.client})
+    with concurrent.futures.ThreadPoolExecutor(max_workers=16) as executor:
+        clients = list(executor.map(lambda _: concurrent_pool.get("storage"), range(64)))
+    print(f"  16 threads x 64 get('storage'): {len({id(client) for client in clients})} client(s) created, "
+          f"stats {concurrent_pool.stats}")
+    gcs.close()
+    return 0
+
+
+def synthetic_interview_pdf(rng: random.Random, candidate: str, minutes: int = 10) -> bytes:
+    """
+    A Gemini-notes-like PDF: a summary page, then the "Transcript" marker and the dialogue.
+    """
+    fitz = importlib.import_module("fitz")
+    transcript = synthetic_transcript(rng, minutes, ["Francisco Ahijado", candidate])
+    lines = ["Notes by Gemini", "Summary", f"{candidate} - Transcript"] + transcript.splitlines()
+    document = fitz.open()
+    document.new_page().insert_text((72, 72), "\n".join(lines[:2]), fontsize=9)
+    for start in range(2, len(lines), 60):
+        document.new_page().insert_text((36, 36), "\n".join(lines[start:start + 60]), fontsize=8)
+    return document.tobytes()
+
+
+def install_pipeline_fakes(module, gcs: "FakeGCSServer", embed_seconds: float = 0.0, generate_seconds: float = 0.0,
+                           prompt_template: Optional[str] = None):
+    """
+    Points the function module's RESOURCE_POOL at the local GCS server and the Vertex AI stand-ins
+    (and, if given, a prompt template instead of prompt.prompt).
+    """
+    factories = {
+        "storage": gcs.client,
+        "embedding_model": lambda: FakeEmbeddingModel(call_seconds=embed_seconds),
+        "generative_model": lambda: FakeGenerativeModel(call_seconds=generate_seconds),
+    }
+    if prompt_template is not None:
+        factories["prompt_template"] = lambda: prompt_template
+    module.RESOURCE_POOL = module.ResourcePool(factories=factories)
+    return module.RESOURCE_POOL
+
+
+def bench_batch(args) -> int:
+    module = load_function_module("process-transcription-fn-poc.py", "process_transcription_fn_poc")
+    os.chdir(REPO_DIR)  # prompt.prompt is read relative to the working directory, as in the deployed function
+    rng = random.Random(args.seed)
+    gcs = FakeGCSServer(latency_seconds=args.gcs_latency_ms / 1000)
+    install_pipeline_fakes(module, gcs, args.embed_ms / 1000, args.generate_ms / 1000)
+    module._stage_cache, module._stage_cache_created = None, True  # every run must do the full work
+    prefix = "bulk/"
+    for number in range(args.files):
+        name = f"{prefix}30 Minute Interview (Candidate {number}) - Notes by Gemini-francisco.pdf"
+        gcs.objects[(module.BUCKET_NAME, name)] = synthetic_interview_pdf(rng, f"Candidate {number}", args.minutes)
+    # One corrupt file and one file that is not an interview must not abort the batch.
+    gcs.objects[(module.BUCKET_NAME, prefix + "corrupt (Broken) - Notes by Gemini-x.pdf")] = b"%PDF-1.7 truncated"
+    gcs.objects[(module.BUCKET_NAME, prefix + "notes (Nobody)-x.txt")] = b"Shopping list - Transcript\nA: milk\n"
+
+    print(f"{args.files} interviews + 2 bad files, GCS latency {args.gcs_latency_ms} ms, "
+          f"embed {args.embed_ms} ms, Gemini {args.generate_ms} ms")
+    baseline = None
+    for workers in [int(value) for value in args.workers.split(",")]:
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            results = module.process_batch(module.BUCKET_NAME, prefix=prefix, max_workers=workers)
+        elapsed = time.perf_counter() - start
+        baseline = baseline or elapsed
+        statuses = {}
+        for result in results:
+            statuses[result["status"]] = statuses.get(result["status"], 0) + 1
+        print(f"  workers {workers:>3}  {elapsed:7.2f} s  {len(results) / elapsed:6.2f} files/s  "
+              f"speedup {baseline / elapsed:5.2f}x  {statuses}")
+    gcs.close()
+    return 0
+
+
+def bench_cache(args) -> int:
+    module = load_function_module("process-transcription-fn-poc.py", "process_transcription_fn_poc")
+    os.chdir(REPO_DIR)
+    rng = random.Random(args.seed)
+    gcs = FakeGCSServer(latency_seconds=args.gcs_latency_ms / 1000)
+    pool = install_pipeline_fakes(module, gcs, args.embed_ms / 1000, args.generate_ms / 1000)
+    if args.backend == "gcs":
+        backend = module.GCSCacheBackend("stage-cache-bench")
+    else:
+        backend = module.SQLiteCacheBackend(os.path.join(tempfile.mkdtemp(), "stage-cache.sqlite3"))
+    module._stage_cache, module._stage_cache_created = module.StageCache(backend), True
+    names = []
+    for number in range(args.files):
+        names.append(f"30 Minute Interview (Candidate {number}) - Notes by Gemini-francisco.pdf")
+        gcs.objects[(module.BUCKET_NAME, names[-1])] = synthetic_interview_pdf(rng, f"Candidate {number}", args.minutes)
+
+    print(f"{args.files} interviews, {args.backend} cache, GCS latency {args.gcs_latency_ms} ms, "
+          f"embed {args.embed_ms} ms, Gemini {args.generate_ms} ms")
+    for label in ("first delivery", "redelivery"):
+        vertex_calls_before = pool.get("embedding_model").calls + pool.get("generative_model").calls
+        latencies = []
+        for name in names:
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                module.process_single_transcript(module.BUCKET_NAME, name)
+            latencies.append((time.perf_counter() - start) * 1000)
+        vertex_calls = pool.get("embedding_model").calls + pool.get("generative_model").calls - vertex_calls_before
+        print(f"  {label:<15} p50 {percentile(latencies, 0.5):8.1f} ms   p95 {percentile(latencies, 0.95):8.1f} ms   "
+              f"Vertex calls {vertex_calls}")
+    print(f"  cache stats {module._stage_cache.stats}")
+    gcs.close()
+    return 0
+
+
+def bench_embeddings(args) -> int:
+    module = load_function_module("process-transcription-fn-poc.py", "process_transcription_fn_poc")
+    rng = random.Random(args.seed)
+    speakers = ["Francisco Ahijado", "Jean Massucatto"]
+    with contextlib.redirect_stdout(io.StringIO()):
+        dialogue = module.parse_interview_dialogue(synthetic_transcript(rng, args.minutes, speakers), speakers[0])
+    dialogue_text = "\n".join(f"{turn['speaker']}: {turn['text']}" for turn in dialogue)
+    total_tokens = module.estimate_tokens(dialogue_text)
+    chunks = module.chunk_dialogue(dialogue, args.chunk_tokens)
+    texts = [chunk["text"] for chunk in chunks]
+    print(f"{args.minutes}-minute interview: {len(dialogue)} turns, ~{total_tokens} tokens, "
+          f"{len(chunks)} chunks of <= {args.chunk_tokens} tokens; request latency {args.call_ms} ms")
+
+    embedding_model = FakeEmbeddingModel(call_seconds=args.call_ms / 1000, dimensions=args.dimensions)
+    module.RESOURCE_POOL = module.ResourcePool(factories={"embedding_model": lambda: embedding_model})
+    coverage = min(1.0, args.model_limit_tokens / total_tokens)
+    start = time.perf_counter()
+    embedding_model.get_embeddings([dialogue_text])
+    print(f"  {'single input (original)':<34} requests {embedding_model.calls:>3}  {(time.perf_counter() - start) * 1000:8.1f} ms  "
+          f"embedded {coverage:6.1%} of the dialogue (truncated at {args.model_limit_tokens} tokens)")
+    for label, batch_size, concurrency in (("chunks, 1 per request, serial", 1, 1),
+                                           (f"chunks, 1 per request, {args.concurrency} in flight", 1, args.concurrency),
+                                           (f"chunks, batches of {args.batch_size}", args.batch_size, args.concurrency)):
+        embedding_model.calls = 0
+        start = time.perf_counter()
+        vectors = module.embed_texts(texts, batch_size=batch_size, max_concurrent_requests=concurrency)
+        elapsed = (time.perf_counter() - start) * 1000
+        assert len(vectors) == len(texts)
+        print(f"  {label:<34} requests {embedding_model.calls:>3}  {elapsed:8.1f} ms  embedded 100.0% of the dialogue")
+    start = time.perf_counter()
+    module.pool_document_vector(vectors, [chunk["tokens"] for chunk in chunks])
+    print(f"  pooled document vector: {(time.perf_counter() - start) * 1000:.2f} ms")
+    return 0
+
+
+def bench_index(args) -> int:
+    import numpy as np
+    module = load_function_module("process-transcription-fn-poc.py", "process_transcription_fn_poc")
+    rng = np.random.default_rng(args.seed)
+    # Candidatos agrupados en perfiles (como entrevistas del mismo puesto), no vectores uniformes
+    profiles = rng.normal(size=(args.profiles, args.dimensions)).astype(np.float32)
+    vectors = profiles[rng.integers(0, args.profiles, args.candidates)]
+    vectors += 0.6 * rng.normal(size=vectors.shape).astype(np.float32) / np.sqrt(args.dimensions) * np.linalg.norm(profiles[0])
+    ids = [f"candidate-{number}" for number in range(args.candidates)]
+    queries = vectors[rng.choice(args.candidates, args.queries, replace=False)] + 0.01 * rng.normal(size=(args.queries, args.dimensions)).astype(np.float32)
+    print(f"{args.candidates} candidates x {args.dimensions} dimensions ({args.candidates * args.dimensions * 4 / 2**20:.0f} MiB), "
+          f"{args.queries} queries, top-{args.k}")
+
+    index = module.CandidateIndex(dimensions=args.dimensions)
+    start = time.perf_counter()
+    for candidate_id, vector in zip(ids[:args.incremental], vectors[:args.incremental]):
+        index.add(candidate_id, vector)
+    per_append_us = (time.perf_counter() - start) / max(1, args.incremental) * 1e6
+    start = time.perf_counter()
+    index.add_many(ids[args.incremental:], vectors[args.incremental:])
+    print(f"  build: {per_append_us:.1f} us per incremental add(), bulk add_many() {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    def run_queries(**kwargs):
+        latencies, results = [], []
+        for query in queries:
+            start = time.perf_counter()
+            results.append(index.query(query, k=args.k, **kwargs))
+            latencies.append((time.perf_counter() - start) * 1000)
+        return latencies, results
+
+    exact_latencies, exact_results = run_queries()
+    print(f"  exact (matrix-vector)   p50 {percentile(exact_latencies, 0.5):7.2f} ms   p95 {percentile(exact_latencies, 0.95):7.2f} ms")
+    start = time.perf_counter()
+    index.train_ivf(n_lists=args.lists or None)
+    print(f"  IVF training ({len(index.centroids)} lists): {(time.perf_counter() - start):.2f} s")
+    for n_probe in [int(value) for value in args.probes.split(",")]:
+        latencies, results = run_queries(n_probe=n_probe)
+        recall = np.mean([len({candidate for candidate, _ in approximate} & {candidate for candidate, _ in exact}) / args.k
+                          for approximate, exact in zip(results, exact_results)])
+        print(f"  IVF n_probe={n_probe:<3}         p50 {percentile(latencies, 0.5):7.2f} ms   p95 {percentile(latencies, 0.95):7.2f} ms   "
+              f"recall@{args.k} {recall:.3f}")
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        archive = index.to_archive(directory)
+        module.CandidateIndex.from_archive(module.EmbeddingArchive(directory))
+        size = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+        print(f"  {archive.dtype} snapshot {size / 2**20:.0f} MiB, save + load {(time.perf_counter() - start):.2f} s")
+    return 0
+
+
+def bench_archive(args) -> int:
+    import numpy as np
+    module = load_function_module("process-transcription-fn-poc.py", "process_transcription_fn_poc")
+    rng = np.random.default_rng(args.seed)
+    vectors = rng.normal(size=(args.candidates, args.dimensions)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    ids = [f"candidate-{number}" for number in range(args.candidates)]
+    queries = vectors[rng.choice(args.candidates, args.queries, replace=False)]
+    queries = queries + 0.05 * rng.normal(size=queries.shape).astype(np.float32) / np.sqrt(args.dimensions)
+    exact = [set(np.argsort(-(vectors @ query))[:args.k]) for query in queries]
+    rows = {candidate_id: row for row, candidate_id in enumerate(ids)}
+    npy_bytes = args.candidates * (128 + args.dimensions * 8)
+    print(f"{args.candidates} vectors x {args.dimensions} dimensions; one float64 .npy per candidate would be "
+          f"{npy_bytes / 2**20:.0f} MiB in {args.candidates} objects")
+
+    for dtype in ("float32", "float16", "int8"):
+        with tempfile.TemporaryDirectory() as directory:
+            archive = module.EmbeddingArchive(directory, dtype=dtype)
+            start = time.perf_counter()
+            for begin in range(0, args.candidates, args.append_batch):
+                archive.append(ids[begin:begin + args.append_batch], vectors[begin:begin + args.append_batch])
+            write_seconds = time.perf_counter() - start
+            size = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+            start = time.perf_counter()
+            reader = module.EmbeddingArchive(directory)
+            reader.memmap()
+            open_ms = (time.perf_counter() - start) * 1000
+            reader.scan(queries[0], k=args.k)  # page cache caliente, como en una instancia que ya lo leyó
+            start = time.perf_counter()
+            results = [reader.scan(query, k=args.k) for query in queries]
+            scan_seconds = (time.perf_counter() - start) / len(queries)
+            recall = np.mean([len({rows[candidate] for candidate, _ in result} & truth) / args.k
+                              for result, truth in zip(results, exact)])
+            print(f"  {dtype:<8} {size / 2**20:7.1f} MiB ({npy_bytes / size:4.1f}x smaller than .npy)  "
+                  f"append {write_seconds:5.2f} s  open {open_ms:5.2f} ms  scan {scan_seconds * 1000:7.2f} ms "
+                  f"({reader.count * reader.row_bytes / scan_seconds / 2**30:5.2f} GiB/s)  recall@{args.k} {recall:.3f}")
+
+    # Descargar miles de objetos pequeños vs. un archivo contiguo desde el GCS local con latencia
+    gcs = FakeGCSServer(latency_seconds=args.gcs_latency_ms / 1000)
+    module.RESOURCE_POOL = module.ResourcePool(factories={"storage": gcs.client})
+    client = module.RESOURCE_POOL.get("storage")
+    for number in range(args.objects):
+        buffer = io.BytesIO()
+        np.save(buffer, vectors[number].astype(np.float64))
+        gcs.objects[("bench", f"EMBEDDINGS/{ids[number]}.npy")] = buffer.getvalue()
+    start = time.perf_counter()
+    blobs = list(client.list_blobs("bench", prefix="EMBEDDINGS/"))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(lambda blob: np.load(io.BytesIO(blob.download_as_bytes())), blobs))
+    small_objects_seconds = time.perf_counter() - start
+    with tempfile.TemporaryDirectory() as directory:
+        module.EmbeddingArchive(directory, dtype="float16").append(ids[:args.objects], vectors[:args.objects])
+        module.EmbeddingArchive(directory).upload("bench", "ARCHIVE/")
+        start = time.perf_counter()
+        module.EmbeddingArchive.download("bench", "ARCHIVE/", os.path.join(directory, "copy")).memmap()
+        archive_seconds = time.perf_counter() - start
+    print(f"  download {args.objects} vectors from GCS ({args.gcs_latency_ms} ms latency): {args.objects} float64 .npy objects "
+          f"{small_objects_seconds:.2f} s, float16 archive {archive_seconds:.2f} s")
+    gcs.close()
+    return 0
+
+
+def bench_prompt(args) -> int:
+    module = load_function_module("process-transcription-fn-poc.py", "process_transcription_fn_poc")
+    rng = random.Random(args.seed)
+    speakers = ["Jean Massucatto", "Francisco Ahijado"]
+    model = FakeGenerativeModel(call_seconds=args.call_ms / 1000, prefill_tokens_per_second=args.prefill_tps,
+                                output_tokens_per_second=args.decode_tps)
+    module.RESOURCE_POOL = module.ResourcePool(factories={"generative_model": lambda: model})
+    prompt = module.read_prompt_template(os.path.join(REPO_DIR, module.PROMPT)).format(embeddings_str="")
+    segment_prompt = module.read_prompt_template(os.path.join(REPO_DIR, module.SEGMENT_PROMPT))
+    config = {"temperature": module.TEMPERATURE, "max_output_tokens": module.MAX_OUTPUT_TOKENS}
+    print(f"Simulated Gemini: {args.call_ms} ms + {args.prefill_tps} input tokens/s + {args.decode_tps} output tokens/s; "
+          f"budget {module.PROMPT_TOKEN_BUDGET} tokens")
+    budget = module.PROMPT_TOKEN_BUDGET
+    for minutes in [int(value) for value in args.minutes.split(",")]:
+        with contextlib.redirect_stdout(io.StringIO()):
+            dialogue = module.parse_interview_dialogue(synthetic_transcript(rng, minutes, speakers), speakers[0])
+        dialogue_text = "\n".join(f"{turn['speaker']}: {turn['text']}" for turn in dialogue)
+        timings = {}
+        for label, label_budget in (("single call", 10**9), ("budgeted", budget)):
+            module.PROMPT_TOKEN_BUDGET = label_budget
+            model.calls, model.input_tokens = 0, 0
+            start = time.perf_counter()
+            contents, plan = module.assemble_analysis_contents(prompt, dialogue, dialogue_text, speakers[0], segment_prompt)
+            module.generate_text(contents, config)
+            timings[label] = (time.perf_counter() - start, model.calls, model.input_tokens, plan["input_tokens"])
+        module.PROMPT_TOKEN_BUDGET = budget
+        (single_s, _, single_tokens, single_final), (budgeted_s, calls, budgeted_tokens, final_tokens) = timings.values()
+        print(f"  {minutes:>4} min  single call {single_s:6.2f} s ({single_final:>6} input tokens)   "
+              f"budgeted {budgeted_s:6.2f} s ({calls} calls, final call {final_tokens:>6} tokens, {budgeted_tokens:>6} billed)")
+    return 0
+
+
+def bench_pipeline(args) -> int:
+    module = load_function_module("process-transcription-fn-poc.py", "process_transcription_fn_poc")
+    os.chdir(REPO_DIR)
+    rng = random.Random(args.seed)
+    gcs = FakeGCSServer(latency_seconds=args.gcs_latency_ms / 1000)
+    module._stage_cache, module._stage_cache_created = None, True  # every run must do the full work
+    names = []
+    for number in range(args.files):
+        names.append(f"30 Minute Interview (Candidate {number}) - Notes by Gemini-francisco.pdf")
+        gcs.objects[(module.BUCKET_NAME, names[-1])] = synthetic_interview_pdf(rng, f"Candidate {number}", args.minutes)
+    prompt_with_embeddings = module.read_prompt_template(module.PROMPT)
+    prompt_without_embeddings = prompt_with_embeddings.replace("{embeddings_str}", "")
+
+    print(f"{args.files} interviews of {args.minutes} min, GCS latency {args.gcs_latency_ms} ms, "
+          f"embed {args.embed_ms} ms per request, Gemini {args.generate_ms} ms")
+    for prompt_label, template in (("prompt with embeddings", prompt_with_embeddings),
+                                   ("prompt without embeddings", prompt_without_embeddings)):
+        install_pipeline_fakes(module, gcs, args.embed_ms / 1000, args.generate_ms / 1000, prompt_template=template)
+        print(f"  {prompt_label}")
+        for concurrent in (False, True):
+            reports = []
+            for name in names:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    reports.append(module.process_single_transcript(module.BUCKET_NAME, name, concurrent=concurrent)["timing"])
+            walls = [report["wall_seconds"] * 1000 for report in reports]
+            sums = [report["stage_seconds_sum"] * 1000 for report in reports]
+            critical = [report["critical_path_seconds"] * 1000 for report in reports]
+            paths = {}
+            for report in reports:
+                path = " > ".join(report["critical_path"])
+                paths[path] = paths.get(path, 0) + 1
+            print(f"    {'graph' if concurrent else 'sequential':<10}  wall p50 {percentile(walls, 0.5):7.1f} ms  "
+                  f"p95 {percentile(walls, 0.95):7.1f} ms   sum of stages {percentile(sums, 0.5):7.1f} ms   "
+                  f"critical path {percentile(critical, 0.5):7.1f} ms")
+            print(f"                critical path: {max(paths, key=paths.get)}")
+    gcs.close()
+    return 0
+
+
+def bench_quota(args) -> int:
+    module = load_function_module("process-transcription-fn-poc.py", "process_transcription_fn_poc")
+    base_seconds = args.backoff_base_ms / 1000
+    share_per_minute = args.quota_rps * 60 / args.instances
+    layers = {
+        "no retry (original)": lambda: {},
+        "retry + backoff only": lambda: {"generative_model": module.QuotaLimiter(
+            "generative_model", base_seconds=base_seconds)},
+        "retry + adaptive concurrency": lambda: {"generative_model": module.QuotaLimiter(
+            "generative_model", max_concurrency=args.workers, base_seconds=base_seconds)},
+        "retry + adaptive + token bucket": lambda: {"generative_model": module.QuotaLimiter(
+            "generative_model", requests_per_minute=share_per_minute, max_concurrency=args.workers,
+            base_seconds=base_seconds)},
+    }
+    print(f"{args.instances} instances x {args.workers} threads, {args.calls} Gemini calls each, "
+          f"{args.call_ms} ms per call, project quota {args.quota_rps} requests/s")
+    for label, make_limiters in layers.items():
+        quota = FakeQuota(args.quota_rps)
+        pools = [module.ResourcePool(
+            factories={"generative_model": lambda: FakeGenerativeModel(call_seconds=args.call_ms / 1000, quota=quota)},
+            limiters=make_limiters()) for _ in range(args.instances)]
+        outcomes, latencies = {"ok": 0, "failed": 0}, []
+        lock = threading.Lock()
+
+        def call(pool):
+            started = time.perf_counter()
+            try:
+                pool.call("generative_model", lambda model: model.generate_content("x" * 300), tokens=100)
+                outcome = "ok"
+            except Exception:
+                outcome = "failed"
+            with lock:
+                outcomes[outcome] += 1
+                latencies.append((time.perf_counter() - started) * 1000)
+
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            with concurrent.futures.ThreadPoolExecutor(max_workers=args.instances * args.workers) as executor:
+                list(executor.map(call, [pool for pool in pools for _ in range(args.calls)]))
+        elapsed = time.perf_counter() - start
+        retries = sum(pool.limiters["generative_model"].stats["retries"]
+                      for pool in pools if "generative_model" in pool.limiters)
+        print(f"  {label:<32} ok {outcomes['ok']:>4}  failed {outcomes['failed']:>4}  429s {quota.rejected:>5}  "
+              f"retries {retries:>5}  {outcomes['ok'] / elapsed:6.1f} ok/s  p95 {percentile(latencies, 0.95):7.0f} ms")
+
+    # google-cloud-storage retries 429s itself; its limiter (QUOTA_LIMITS) only caps the requests in flight
+    gcs = FakeGCSServer(throttle_fraction=args.gcs_throttle)
+    pool = module.ResourcePool(factories={"storage": gcs.client})
+    failed = 0
+    with contextlib.redirect_stdout(io.StringIO()):
+        for number in range(args.uploads):
+            try:
+                pool.call("storage", lambda client: client.bucket("quota-bench").blob(f"TXT/{number}.txt")
+                          .upload_from_string("dialogue", content_type="text/plain"))
+            except Exception:
+                failed += 1
+    print(f"GCS: {args.uploads} uploads with {args.gcs_throttle:.0%} of requests answered 429: "
+          f"{gcs.throttled} 429s served, {failed} uploads failed")
+    gcs.close()
+    return 0
+
+
+def legacy_parse_analysis(text: str) -> Dict:
+    # Parseo original de process_transcription: quitar los fences y los saltos de línea y json.loads
+    return json.loads(text.replace("```json\n", "").replace("\n", "").replace("  ", "").replace("```", ""))
+
+
+def bench_analysis(args) -> int:
+    module = load_function_module("process-transcription-fn-poc.py", "process_transcription_fn_poc")
+    fields = [name for name, _ in module.ANALYSIS_FIELDS]
+    scenarios = {
+        "well-formed": {},
+        "fenced, raw newlines": {"fenced": True},
+        "1 malformed field": {"malformed_fields": [fields[5]]},
+        "2 malformed fields": {"malformed_fields": [fields[1], fields[7]]},
+        "truncated at 70%": {"truncate_at": 0.7},
+    }
+    config = {"temperature": module.TEMPERATURE, "max_output_tokens": module.MAX_OUTPUT_TOKENS,
+              "top_k": module.TOP_K, "top_p": module.TOP_P}
+    vertex_config = importlib.import_module("vertexai.generative_models").GenerationConfig(
+        **config, response_mime_type="application/json", response_schema=module.analysis_schema(fields))
+    contents = "Interview transcription:\n" + "Candidate: I led the migration of our billing platform.\n" * 200
+    print(f"Simulated Gemini: {args.call_ms} ms + {args.decode_tps} output tokens/s up to max_output_tokens "
+          f"({module.MAX_OUTPUT_TOKENS} for the analysis)")
+    for label, drift in scenarios.items():
+        model = FakeGenerativeModel(call_seconds=args.call_ms / 1000, output_tokens_per_second=args.decode_tps, **drift)
+        start = time.perf_counter()
+        try:
+            legacy_parse_analysis(model.generate_content(contents, generation_config=vertex_config).text)
+        except ValueError:
+            # El JSON mal formado obligaba a reprocesar la transcripción completa
+            legacy_parse_analysis(model.generate_content(contents, generation_config=vertex_config).text)
+        legacy_seconds, legacy_calls = time.perf_counter() - start, model.calls
+
+        model = FakeGenerativeModel(call_seconds=args.call_ms / 1000, output_tokens_per_second=args.decode_tps, **drift)
+        module.RESOURCE_POOL = module.ResourcePool(factories={"generative_model": lambda: model})
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            analysis = module.generate_analysis(contents, config)
+        seconds = time.perf_counter() - start
+        complete = module.ANALYSIS_MISSING_ANSWER not in analysis.values() and len(analysis) == len(fields)
+        print(f"  {label:<22} strip + json.loads {legacy_seconds:6.2f} s ({legacy_calls} calls)   "
+              f"schema + repair {seconds:6.2f} s ({model.calls} calls, {'complete' if complete else 'INCOMPLETE'})")
+    return 0
+
+
+def legacy_render_report(analysis: Dict) -> io.BytesIO:
+    # Reporte original: documento python-docx construido desde cero y guardado en un BytesIO
+    document = importlib.import_module("docx").Document()
+    document.add_heading("Interview Analysis", 0)
+    for item in analysis.keys():
+        document.add_heading(item, level=1)
+        document.add_paragraph(str(analysis.get(item)))
+    word_buffer = io.BytesIO()
+    document.save(word_buffer)
+    word_buffer.seek(0)
+    return word_buffer
+
+
+def measure(operation: Callable[[], object]) -> tuple:
+    import tracemalloc
+    start = time.perf_counter()
+    operation()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    operation()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def bench_report(args) -> int:
+    module = load_function_module("process-transcription-fn-poc.py", "process_transcription_fn_poc")
+    rng = random.Random(args.seed)
+    words = ["migration", "stakeholders", "pipeline", "Kubernetes", "billing", "team", "delivered", "latency"]
+    analyses = [{heading: "\n".join(" ".join(rng.choice(words) for _ in range(19)) for _ in range(10))
+                 for _, heading in module.ANALYSIS_FIELDS} for _ in range(args.reports)]
+    gcs = FakeGCSServer(latency_seconds=args.gcs_latency_ms / 1000)
+    module.RESOURCE_POOL = module.ResourcePool(factories={"storage": gcs.client})
+    legacy_render_report(analyses[0])  # warm-up: imports and python-docx's default template
+    start = time.perf_counter()
+    template = module.RESOURCE_POOL.get("report_template")
+    template_ms = (time.perf_counter() - start) * 1000
+    module.upload_report("warm-up.docx", analyses[0])  # opens the keep-alive connection to the GCS stand-in
+    print(f"Template load (once per instance): {template_ms:.1f} ms; "
+          f"{args.reports} reports of 8 answers x ~190 words; GCS latency {args.gcs_latency_ms} ms")
+
+    def legacy_upload(analysis: Dict, blob_name: str):
+        buffer = legacy_render_report(analysis)
+        module.RESOURCE_POOL.call("storage", lambda client: client.bucket(module.BUCKET_DESTINO).blob(blob_name)
+                                  .upload_from_file(buffer, content_type=module.DOCX_CONTENT_TYPE))
+
+    rows = (
+        ("render: python-docx (original)", lambda batch: [legacy_render_report(analysis) for analysis in batch]),
+        ("render: ReportTemplate", lambda batch: [template.render(module.REPORT_TITLE, module.analysis_sections(analysis),
+                                                                  io.BytesIO()) for analysis in batch]),
+        ("render + upload (original)", lambda batch: [legacy_upload(analysis, f"legacy/{number}.docx")
+                                                      for number, analysis in enumerate(batch)]),
+        ("render + streamed upload", lambda batch: [module.upload_report(f"template/{number}.docx", analysis)
+                                                    for number, analysis in enumerate(batch)]),
+        (f"batch upload_reports ({args.workers} workers)", lambda batch: module.upload_reports(
+            [(f"batch/{number}.docx", analysis) for number, analysis in enumerate(batch)], max_workers=args.workers)),
+    )
+    for label, operation in rows:
+        single_seconds, single_peak = measure(lambda: operation(analyses[:1]))
+        batch_seconds, batch_peak = measure(lambda: operation(analyses))
+        print(f"  {label:<34} per report {single_seconds * 1000:7.2f} ms, peak {single_peak / 1024:7.0f} KiB   "
+              f"per {args.reports} {batch_seconds:6.2f} s, peak {batch_peak / 1024 / 1024:6.1f} MiB")
+    legacy_size = len(legacy_render_report(analyses[0]).getvalue())
+    # Los picos de las filas con subida incluyen los objetos que guarda el servidor GCS local (mismo proceso)
+    print(f"  report size: python-docx {legacy_size / 1024:.0f} KiB, template "
+          f"{len(gcs.objects[(module.BUCKET_DESTINO, 'template/0.docx')]) / 1024:.0f} KiB")
+    gcs.close()
+    return 0
+
+
+def fake_signing_credentials(sign_seconds: float):
+    """
+    Signing credentials stand-in for generate_signed_url(): HMAC instead of the IAM signBlob call that
+    impersonated credentials make for every URL, with `sign_seconds` of simulated latency.
+    """
+    import hmac
+    from google.auth import credentials as auth_credentials
+
+    class FakeSigningCredentials(auth_credentials.Signing, auth_credentials.Credentials):
+        signer_email = "signer@local-bench.iam.gserviceaccount.com"
+        signer = None
+        signs = 0
+
+        def refresh(self, request):
+            self.token = "fake-token"
+
+        def sign_bytes(self, message):
+            FakeSigningCredentials.signs += 1
+            time.sleep(sign_seconds)
+            return hmac.new(b"bench-key", message, hashlib.sha256).digest()
+
+    return FakeSigningCredentials()
+
+
+def legacy_signed_urls(client, bucket_name: str, credentials, signer: str) -> List[Dict]:
+    # signed_urls original: lista todo el bucket y firma cada .docx en cada request
+    urls = []
+    for blob in client.bucket(bucket_name).list_blobs():
+        if blob.name.endswith(".docx"):
+            urls.append({"filename": blob.name, "url": blob.generate_signed_url(
+                expiration=datetime.timedelta(minutes=15), method="GET", version="v4",
+                credentials=credentials, service_account_email=signer)})
+    return urls
+
+
+def bench_signed_urls(args) -> int:
+    module = load_function_module("poc-get-url.py", "poc_get_url")
+    gcs = FakeGCSServer(latency_seconds=args.gcs_latency_ms / 1000)
+    credentials = fake_signing_credentials(args.sign_ms / 1000)
+    module._storage_client = gcs.client()
+    module._signing_credentials, module._signing_credentials_expiry = credentials, time.time() + 86400
+    print(f"GCS latency {args.gcs_latency_ms} ms per request, {args.sign_ms} ms per signature "
+          f"(IAM signBlob with impersonated credentials)")
+    for count in [int(value) for value in args.objects.split(",")]:
+        gcs.objects = {(module.BUCKET_NAME, f"Candidate {number}-recruiter_{number % 7}.docx"): b"PK"
+                       for number in range(count)}
+        gcs.objects.update({(module.BUCKET_NAME, f"TXT/Candidate {number}.txt"): b"" for number in range(count // 4)})
+        name = f"Candidate {count // 2}-recruiter_{(count // 2) % 7}.docx"
+
+        legacy = []
+        for _ in range(args.legacy_runs):
+            requests_before, start = gcs.requests, time.perf_counter()
+            file_list = legacy_signed_urls(module._storage_client, module.BUCKET_NAME, credentials,
+                                           module.SIGNER_SERVICE_ACCOUNT)
+            match = next((file for file in file_list if file["filename"] == name), None)
+            legacy.append(((time.perf_counter() - start) * 1000, gcs.requests - requests_before))
+        assert match is not None
+
+        latencies = []
+        request = types.SimpleNamespace(args={"name": name})
+        for _ in range(args.runs):
+            requests_before, start = gcs.requests, time.perf_counter()
+            body, status, _ = module.signed_urls(request)
+            match = next((file for file in json.loads(body) if file["filename"] == name), None)
+            latencies.append((time.perf_counter() - start) * 1000)
+        assert status == 200 and match is not None
+        requests_per_call = gcs.requests - requests_before
+        print(f"  {count:>6} reports  list + sign all (original) {percentile([l for l, _ in legacy], 0.5):9.1f} ms "
+              f"({legacy[0][1]} GCS requests, {count} signatures)   "
+              f"?name= p50 {percentile(latencies, 0.5):6.1f} ms p95 {percentile(latencies, 0.95):6.1f} ms "
+              f"({requests_per_call} GCS requests, 1 signature)")
+    gcs.close()
+    return 0
+
+
+class GeneratedStream(io.RawIOBase):
+    """
+    Request body produced on the fly from an iterable of byte strings, so the benchmark itself does not
+    hold the payload (a WSGI server reads it from the socket the same way).
+    """
+
+    def __init__(self, pieces: Iterable[bytes]):
+        self._pieces = iter(pieces)
+        self._pending = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self._pending:
+            self._pending = next(self._pieces, None)
+            if self._pending is None:
+                self._pending = b""
+                return 0
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+
+def legacy_upload_to_bucket(request, client_factory: Callable):
+    # upload_to_bucket original: JSON completo, b64decode completo, cliente y get_bucket por request
+    from flask import jsonify
+    request_json = request.get_json(silent=True)
+    if not request_json:
+        return jsonify({"error": "No JSON body provided"}), 400
+    filename, base64_data = request_json.get("filename"), request_json.get("base64")
+    mime_type = request_json.get("mimeType", "application/octet-stream")
+    file_bytes = base64.b64decode(base64_data)
+    bucket = client_factory().get_bucket("transcription_poc_uploads_raw")
+    bucket.blob(filename).upload_from_string(file_bytes, content_type=mime_type)
+    return jsonify({"message": f"File '{filename}' was correctly uploaded"}), 200
+
+
+def rss_kib(field: str) -> int:
+    with open("/proc/self/status") as status:
+        return next(int(line.split()[1]) for line in status if line.startswith(field + ":"))
+
+
+def bench_upload(args) -> int:
+    import multiprocessing
+    gcs = FakeGCSServer(latency_seconds=args.gcs_latency_ms / 1000)
+    block = random.Random(18).randbytes(3 * 256 * 1024)
+    encoded_block = base64.b64encode(block)
+    boundary = "bench-boundary"
+
+    def body(mode: str, blocks: int):
+        if mode in ("original", "json"):
+            # Mismo orden de campos que el Apps Script: filename, base64, mimeType
+            return "application/json", [b'{"filename": "bench.pdf", "base64": "',
+                                         *(encoded_block for _ in range(blocks)), b'", "mimeType": "application/pdf"}']
+        if mode == "multipart":
+            head = (f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="bench.pdf"\r\n'
+                    f'Content-Type: application/pdf\r\n\r\n').encode()
+            return f"multipart/form-data; boundary={boundary}", [head, *(block for _ in range(blocks)),
+                                                                  f"\r\n--{boundary}--\r\n".encode()]
+        return "application/pdf", [block for _ in range(blocks)]
+
+    def run(mode: str, blocks: int, connection):
+        # Proceso hijo: el pico de RSS medido es solo el de la función (el stand-in de GCS vive en el padre)
+        import flask
+        from werkzeug.test import EnvironBuilder
+        module = load_function_module("upload-trigger-1.py", "upload_trigger")
+        module._storage_client = gcs.client()
+        app = flask.Flask("bench")
+
+        def call(blocks: int):
+            content_type, pieces = body(mode, blocks)
+            length = sum(len(piece) for piece in pieces)
+            path = "/?filename=bench.pdf" if mode == "raw" else "/"
+            environ = EnvironBuilder(path, method="POST").get_environ()
+            environ.update({"wsgi.input": GeneratedStream(pieces), "CONTENT_TYPE": content_type,
+                            "CONTENT_LENGTH": str(length)})
+            with app.request_context(environ):
+                if mode == "original":
+                    return legacy_upload_to_bucket(flask.request, gcs.client)
+                return module.upload_to_bucket(flask.request)
+
+        call(1)
+        connection.send("warm")
+        connection.recv()
+        with open("/proc/self/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+        baseline = rss_kib("VmRSS")
+        start = time.perf_counter()
+        _, status = call(blocks)
+        connection.send({"seconds": time.perf_counter() - start, "status": status,
+                         "peak_mib": (rss_kib("VmHWM") - baseline) / 1024})
+
+    context = multiprocessing.get_context("fork")
+    print(f"GCS latency {args.gcs_latency_ms} ms per request; peak = RSS growth of the function process during the request")
+    for size_mib in [int(value) for value in args.sizes_mib.split(",")]:
+        blocks = max(1, size_mib * 1024 * 1024 // len(block))
+        expected = hashlib.md5(block * blocks).digest()
+        print(f"  {size_mib} MiB file ({len(encoded_block) * blocks / 2**20:.0f} MiB as base64)")
+        for mode in args.modes.split(","):
+            parent, child = context.Pipe()
+            process = context.Process(target=run, args=(mode, blocks, child))
+            process.start()
+            parent.recv()
+            requests_before = gcs.requests
+            parent.send("go")
+            result = parent.recv()
+            process.join()
+            stored = gcs.objects.pop(("transcription_poc_uploads_raw", "bench.pdf"), b"")
+            assert result["status"] == 200 and hashlib.md5(stored).digest() == expected, (mode, result)
+            print(f"    {mode:<10} {result['seconds'] * 1000:8.0f} ms   peak {result['peak_mib']:7.1f} MiB "
+                  f"({result['peak_mib'] * 2**20 / len(stored):4.2f}x the file)   "
+                  f"{gcs.requests - requests_before} GCS requests")
+    gcs.close()
+    return 0
+
+
+def legacy_forward_event(cloud_event, metadata_host: str, function_url: str):
+    # eventarc_adapter_function original: token del servidor de metadatos y conexión nueva por evento
+    import requests
+    token = requests.get(f"http://{metadata_host}/computeMetadata/v1/instance/service-accounts/default/identity",
+                         params={"audience": function_url}, headers={"Metadata-Flavor": "Google"})
+    token.raise_for_status()
+    response = requests.post(function_url, headers={"Authorization": f"Bearer {token.text}"},
+                             json={"bucket": cloud_event.data["bucket"], "name": cloud_event.data["name"]})
+    response.raise_for_status()
+
+
+def bench_adapter(args) -> int:
+    module = load_function_module("poc-trigger-email.py", "poc_trigger_email")
+    metadata = FakeMetadataServer(latency_seconds=args.metadata_ms / 1000)
+    main_function = FakeMainFunction(latency_seconds=args.function_ms / 1000, connect_seconds=args.connect_ms / 1000)
+    module.METADATA_IDENTITY_URL = (f"http://{metadata.host}/computeMetadata/v1/instance/"
+                                    "service-accounts/default/identity")
+    module.HTTP_FUNCTION_URL = main_function.url
+    events = [types.SimpleNamespace(data={"bucket": "transcription_poc_processed",
+                                          "name": f"Candidate {number}-recruiter_{number % 5}.docx"})
+              for number in range(args.events)]
+    print(f"{args.events} events, {args.concurrency} concurrent; metadata {args.metadata_ms} ms, main function "
+          f"{args.function_ms} ms, new connection {args.connect_ms} ms")
+
+    def run(label: str, forward: Callable):
+        counters = (metadata.requests, metadata.connections, main_function.requests, main_function.connections)
+        latencies = []
+
+        def one(cloud_event):
+            start = time.perf_counter()
+            forward(cloud_event)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            with concurrent.futures.ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+                list(executor.map(one, events))
+        wall = time.perf_counter() - start
+        print(f"  {label:<40} p50 {percentile(latencies, 0.5):7.1f} ms  p95 {percentile(latencies, 0.95):7.1f} ms  "
+              f"wall {wall:6.2f} s  metadata {metadata.requests - counters[0]:4d} requests "
+              f"{metadata.connections - counters[1]:4d} connections  main function "
+              f"{main_function.requests - counters[2]:4d} POSTs {main_function.connections - counters[3]:4d} connections")
+
+    run("original (token + connection per event)",
+        lambda cloud_event: legacy_forward_event(cloud_event, metadata.host, main_function.url))
+    module.FORWARD_BATCH_SIZE = 1
+    run("cached token + pooled Session", module.eventarc_adapter_function)
+    for batch_size in [int(value) for value in args.batch_sizes.split(",")]:
+        module.FORWARD_BATCH_SIZE, module._batcher = batch_size, None
+        module.FORWARD_BATCH_WINDOW_SECONDS = args.window_ms / 1000
+        run(f"batches of <= {batch_size} ({args.window_ms:g} ms)", module.eventarc_adapter_function)
+    metadata.close()
+    main_function.close()
+    return 0
+
+
+def bench_ledger(args) -> int:
+    module = load_function_module("process-transcription-fn-poc.py", "process_transcription_fn_poc")
+    os.chdir(REPO_DIR)
+    rng = random.Random(args.seed)
+    pdfs = [synthetic_interview_pdf(rng, f"Candidate {number}", args.minutes) for number in range(args.files)]
+    names = [f"30 Minute Interview (Candidate {number}) - Notes by Gemini-francisco.pdf" for number in range(args.files)]
+    print(f"{args.files} interviews; {args.copies} concurrent copies of each event, then one redelivery each, then "
+          f"a re-upload of the same content; GCS latency {args.gcs_latency_ms} ms, Gemini {args.generate_ms} ms")
+
+    for backend_name in ("none", "sqlite", "gcs"):
+        gcs = FakeGCSServer(latency_seconds=args.gcs_latency_ms / 1000)
+        pool = install_pipeline_fakes(module, gcs, args.embed_ms / 1000, args.generate_ms / 1000)
+        module._stage_cache, module._stage_cache_created = None, True  # duplicates must not be hidden by the cache
+        if backend_name == "sqlite":
+            backend = module.SQLiteLedgerBackend(os.path.join(tempfile.mkdtemp(), "ledger.sqlite3"))
+        elif backend_name == "gcs":
+            backend = module.GCSLedgerBackend("ledger-bench")
+        ledger = None if backend_name == "none" else module.IdempotencyLedger(backend, poll_seconds=0.05)
+        module._ledger, module._ledger_created = ledger, True
+        executions = []
+        process_single_transcript = module.process_single_transcript
+
+        def counted(bucket_name, file_name, *rest, **kwargs):
+            executions.append(file_name)
+            return process_single_transcript(bucket_name, file_name, *rest, **kwargs)
+
+        module.process_single_transcript = counted
+        for name, data in zip(names, pdfs):
+            gcs.store(module.BUCKET_NAME, name, data)
+
+        def event(name: str):
+            resource = json.loads(gcs.object_resource(module.BUCKET_NAME, name, gcs.objects[(module.BUCKET_NAME, name)]))
+            return types.SimpleNamespace(data={"bucket": module.BUCKET_NAME, "name": name,
+                                               "generation": resource["generation"], "md5Hash": resource["md5Hash"]})
+
+        phases = [
+            ("concurrent duplicates", [event(name) for name in names for _ in range(args.copies)], args.copies),
+            ("redelivery", [event(name) for name in names], 1),
+        ]
+        print(f"  ledger: {backend_name}")
+        for label, events, concurrency in phases + [("same-content re-upload", None, 1)]:
+            if events is None:
+                for name, data in zip(names, pdfs):
+                    gcs.store(module.BUCKET_NAME, name, data)
+                events = [event(name) for name in names]
+            executions_before = len(executions)
+            vertex_calls_before = pool.get("embedding_model").calls + pool.get("generative_model").calls
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+                    list(executor.map(module.process_transcription, events))
+            wall = time.perf_counter() - start
+            vertex_calls = pool.get("embedding_model").calls + pool.get("generative_model").calls - vertex_calls_before
+            print(f"    {label:<24} deliveries {len(events):4d}  pipeline runs {len(executions) - executions_before:4d}  "
+                  f"Vertex calls {vertex_calls:4d}  wall {wall:6.2f} s")
+        if ledger is not None:
+            print(f"    stats {ledger.stats}")
+        module.process_single_transcript = process_single_transcript
+        gcs.close()
+    return 0
+
+
+# Líneas por página de los documentos del corpus (la misma densidad que synthetic_interview_pdf)
+CORPUS_LINES_PER_PAGE = 60
+SUITE_STAGES = ["spool_and_extract_text", "clean_and_extract_dialogue_segment", "is_job_interview",
+                "parse_interview_dialogue", "docx_report", "process_transcription"]
+
+
+def spool_and_extract_text(module, bucket_name: str, file_name: str) -> str:
+    """
+    The download and extraction steps of `process_transcript_file` on the calling thread:
+    `spool_blob_to_tempfile`, then `extract_document_text` on the spooled file.
+    """
+    local_path = module.spool_blob_to_tempfile(bucket_name, file_name)
+    try:
+        return module.extract_document_text(local_path, file_name)
+    finally:
+        os.remove(local_path)
+
+
+def synthetic_corpus_document(rng: random.Random, pages: int, file_format: str = "pdf",
+                              speakers: Optional[List[str]] = None, filler_density: float = 0.15,
+                              timestamp_fraction: float = 0.5, summary_pages: int = 1,
+                              outline: bool = False) -> bytes:
+    """
+    A Gemini-notes-style document of `pages` pages (CORPUS_LINES_PER_PAGE lines each): `summary_pages`
+    summary pages, then the "Transcript" marker and the dialogue, as a PDF or as UTF-8 text ("txt").
+    With `outline`, the PDF gets "Summary" and "Transcript" bookmarks.
+    """
+    speakers = speakers or ["Francisco Ahijado", "Jean Massucatto"]
+    body_lines = (pages - summary_pages) * CORPUS_LINES_PER_PAGE
+    # Al menos una línea por turno y seis turnos por minuto: sobran líneas y se recortan
+    transcript = synthetic_transcript(rng, body_lines // 6 + 1, speakers, filler_density,
+                                      timestamp_fraction=timestamp_fraction)
+    # Viñetas del resumen: sin "Nombre: " al inicio, no son turnos de diálogo
+    summary = ["- " + " ".join(rng.choice(WORD_SAMPLES) for _ in range(rng.randint(6, 16)))
+               for _ in range((summary_pages - 1) * CORPUS_LINES_PER_PAGE)]
+    lines = ["Notes by Gemini", "Summary"] + summary + [f"{speakers[1]} - Transcript"] + transcript.splitlines()[7:]
+    lines = lines[:2 + len(summary) + body_lines]
+    if file_format == "txt":
+        return ("\n".join(lines) + "\n").encode("utf-8")
+    fitz = importlib.import_module("fitz")
+    document = fitz.open()
+    document.new_page().insert_text((72, 72), "\n".join(lines[:2]), fontsize=9)
+    for start in range(2, len(lines), CORPUS_LINES_PER_PAGE):
+        document.new_page().insert_text((36, 36), "\n".join(lines[start:start + CORPUS_LINES_PER_PAGE]), fontsize=8)
+    if outline:
+        document.set_toc([[1, "Summary", 1], [1, f"{speakers[1]} - Transcript", summary_pages + 1]])
+    return document.tobytes()
+
+
+def compare_to_baseline(results: Dict[str, Dict], baseline: Dict[str, Dict], tolerance: float,
+                        memory_tolerance: float, min_delta_ms: float) -> Dict[str, List[str]]:
+    """
+    Regressions per result key: best-run latency (steadier than the p50 on a busy machine) more than
+    `tolerance` (and `min_delta_ms`) above the baseline, or peak memory more than `memory_tolerance` above it.
+    """
+    regressions: Dict[str, List[str]] = {}
+    for key, result in results.items():
+        previous = baseline.get(key)
+        if previous is None:
+            continue
+        found = []
+        delta_ms = result["min_ms"] - previous["min_ms"]
+        if delta_ms > min_delta_ms and result["min_ms"] > previous["min_ms"] * (1 + tolerance):
+            found.append(f"best run {previous['min_ms']:.2f} -> {result['min_ms']:.2f} ms")
+        if result["peak_kib"] > previous["peak_kib"] * (1 + memory_tolerance) + 64:
+            found.append(f"peak {previous['peak_kib']:.0f} -> {result['peak_kib']:.0f} KiB")
+        if found:
+            regressions[key] = found
+    return regressions
+
+
+def bench_suite(args) -> int:
+    import tracemalloc
+    module = load_function_module("process-transcription-fn-poc.py", "process_transcription_fn_poc")
+    os.chdir(REPO_DIR)
+    rng = random.Random(args.seed)
+    speakers = [speaker.strip() for speaker in args.speakers.split(",")]
+    gcs = FakeGCSServer()
+    install_pipeline_fakes(module, gcs)
+    # Se mide el código, no la cuota: sin QuotaLimiter las llamadas a los stand-ins de Vertex AI no esperan
+    module.RESOURCE_POOL.limiters = {}
+    # Cada repetición hace todo el trabajo: sin caché de etapas ni registro de idempotencia
+    module._stage_cache, module._stage_cache_created = None, True
+    module._ledger, module._ledger_created = None, True
+    template = module.RESOURCE_POOL.get("report_template")
+    sizes = [int(value) for value in args.pages.split(",")]
+    config = {"pages": sizes, "formats": args.formats, "speakers": speakers, "filler_density": args.filler_density,
+              "timestamp_fraction": args.timestamp_fraction, "seed": args.seed, "repeat": args.repeat}
+    print(f"Corpus: {args.formats} documents of {args.pages} pages, speakers {speakers}, filler density "
+          f"{args.filler_density}, timestamps on {args.timestamp_fraction:.0%} of turns; {args.repeat} runs per stage")
+    print(f"  {'stage':<36} {'input':>12} {'p50 ms':>10} {'p95 ms':>10} {'MB/s':>9} {'peak KiB':>10}")
+
+    results: Dict[str, Dict] = {}
+    for file_format in args.formats.split(","):
+        for pages in sizes:
+            data = synthetic_corpus_document(rng, pages, file_format, speakers, args.filler_density,
+                                             args.timestamp_fraction)
+            name = f"{pages} Page Interview ({speakers[1]}) - Notes by Gemini-francisco.{file_format}"
+            gcs.store(module.BUCKET_NAME, name, data)
+            with contextlib.redirect_stdout(io.StringIO()):
+                text = spool_and_extract_text(module, module.BUCKET_NAME, name)
+                segment = module.clean_and_extract_dialogue_segment(text)
+                dialogue = module.parse_interview_dialogue(segment, speakers[1])
+            # El informe lleva el diálogo repartido entre las preguntas, para que crezca con el documento
+            dialogue_lines = [f"{turn['speaker']}: {turn['text']}" for turn in dialogue]
+            share = len(dialogue_lines) // len(module.ANALYSIS_FIELDS) + 1
+            analysis = {heading: "\n".join(dialogue_lines[number * share:(number + 1) * share])
+                        for number, (_, heading) in enumerate(module.ANALYSIS_FIELDS)}
+            event = types.SimpleNamespace(data={"bucket": module.BUCKET_NAME, "name": name})
+            stages = {
+                "spool_and_extract_text": (len(data), lambda: spool_and_extract_text(module, module.BUCKET_NAME, name)),
+                "clean_and_extract_dialogue_segment": (len(text.encode()), lambda: module.clean_and_extract_dialogue_segment(text)),
+                "is_job_interview": (len(segment.encode()), lambda: module.is_job_interview(
+                    segment, module.JOB_INTERVIEW_KEYWORD_SETS, module.MIN_KEYWORD_MATCHES)),
+                "parse_interview_dialogue": (len(segment.encode()), lambda: module.parse_interview_dialogue(segment, speakers[1])),
+                "docx_report": (sum(len(answer.encode()) for answer in analysis.values()), lambda: template.render(
+                    module.REPORT_TITLE, module.analysis_sections(analysis), io.BytesIO())),
+                "process_transcription": (len(data), lambda: module.process_transcription(event)),
+            }
+            print(f"  {file_format}, {pages} pages: {len(data) / 1024:.0f} KiB file, {len(text) / 1024:.0f} KiB text, "
+                  f"{len(dialogue)} turns")
+            for stage in SUITE_STAGES:
+                input_bytes, operation = stages[stage]
+                latencies = []
+                with contextlib.redirect_stdout(io.StringIO()):
+                    operation()  # warm-up
+                    for _ in range(args.repeat):
+                        start = time.perf_counter()
+                        operation()
+                        latencies.append((time.perf_counter() - start) * 1000)
+                    tracemalloc.start()
+                    operation()
+                    peak = tracemalloc.get_traced_memory()[1]
+                    tracemalloc.stop()
+                p50 = percentile(latencies, 0.5)
+                key = f"{stage}/{file_format}/{pages}p"
+                results[key] = {"input_bytes": input_bytes, "min_ms": round(min(latencies), 3), "p50_ms": round(p50, 3),
+                                "p95_ms": round(percentile(latencies, 0.95), 3),
+                                "mb_per_s": round(input_bytes / 2**20 / (p50 / 1000), 2) if p50 else None,
+                                "peak_kib": round(peak / 1024, 1)}
+                print(f"    {stage:<34} {input_bytes / 1024:9.0f} KiB {p50:10.2f} {results[key]['p95_ms']:10.2f} "
+                      f"{results[key]['mb_per_s'] or 0:9.2f} {results[key]['peak_kib']:10.0f}")
+    gcs.close()
+
+    report = {"created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+              "python": sys.version.split()[0], "platform": sys.platform, "cpus": os.cpu_count(),
+              "config": config, "results": results}
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as output:
+            json.dump(report, output, indent=2)
+    status = 0
+    if args.baseline and os.path.exists(args.baseline) and not args.update_baseline:
+        with open(args.baseline, encoding="utf-8") as baseline_file:
+            baseline = json.load(baseline_file)
+        if baseline.get("config") != config or baseline.get("cpus") != report["cpus"]:
+            print(f"Warning: {args.baseline} was recorded with a different corpus or machine; only matching keys are compared.")
+        regressions = compare_to_baseline(results, baseline["results"], args.tolerance, args.memory_tolerance,
+                                          args.min_delta_ms)
+        compared = len(set(results) & set(baseline["results"]))
+        print(f"Baseline {args.baseline} ({baseline.get('created')}): {compared} results compared, "
+              f"{len(regressions)} regressions")
+        for key, found in regressions.items():
+            print(f"  REGRESSION {key}: {'; '.join(found)}")
+        status = 1 if regressions else 0
+    elif args.baseline:
+        with open(args.baseline, "w", encoding="utf-8") as output:
+            json.dump(report, output, indent=2)
+        print(f"Baseline written to {args.baseline}")
+    return status
+
+
+class LineCountingSink(io.TextIOBase):
+    """
+    Line-buffered stdout replacement that counts the lines and characters written and discards them
+    through os.devnull, so every print still costs a write.
+    """
+
+    def __init__(self):
+        self.lines = 0
+        self.chars = 0
+        self._devnull = open(os.devnull, "w", buffering=1)
+
+    def write(self, text: str) -> int:
+        self.lines += text.count("\n")
+        self.chars += len(text)
+        return self._devnull.write(text)
+
+    def close(self):
+        self._devnull.close()
+        super().close()
+
+
+def print_span_tree(spans: List[Dict], indent: str = "    "):
+    """
+    Prints one exported trace as a tree: span name, duration and attributes.
+    """
+    children: Dict[Optional[str], List[Dict]] = {}
+    for span in spans:
+        children.setdefault(span.get("parentSpanId"), []).append(span)
+
+    def show(span: Dict, depth: int):
+        seconds = (int(span["endTimeUnixNano"]) - int(span["startTimeUnixNano"])) / 1e9
+        attributes = {item["key"]: next(iter(item["value"].values())) for item in span["attributes"]}
+        shown = ", ".join(f"{key}={value}" for key, value in attributes.items() if key not in ("file_name", "bucket"))
+        print(f"{indent}{'  ' * depth}{span['name']:<{28 - 2 * depth}} {seconds * 1000:9.1f} ms  {shown}")
+        for child in sorted(children.get(span["spanId"], []), key=lambda child: int(child["startTimeUnixNano"])):
+            show(child, depth + 1)
+
+    for root in children.get(None, []):
+        show(root, 0)
+
+
+def bench_trace(args) -> int:
+    module = load_function_module("process-transcription-fn-poc.py", "process_transcription_fn_poc")
+    os.chdir(REPO_DIR)
+    rng = random.Random(args.seed)
+    gcs = FakeGCSServer()
+    install_pipeline_fakes(module, gcs, args.embed_ms / 1000, args.generate_ms / 1000)
+    module.RESOURCE_POOL.limiters = {}
+    module._stage_cache, module._stage_cache_created = None, True
+    module._ledger, module._ledger_created = None, True
+    collector = FakeOTLPCollector()
+    name = f"{args.pages} Page Interview (Jean Massucatto) - Notes by Gemini-francisco.pdf"
+    gcs.store(module.BUCKET_NAME, name, synthetic_corpus_document(rng, args.pages))
+    event = types.SimpleNamespace(data={"bucket": module.BUCKET_NAME, "name": name})
+    print(f"{args.pages}-page interview, {args.runs} runs per configuration; embed {args.embed_ms} ms, "
+          f"Gemini {args.generate_ms} ms per call")
+
+    configurations = (
+        ("LOG_LEVEL=DEBUG, no spans (original output)", "DEBUG", 0.0, False),
+        ("LOG_LEVEL=INFO, no spans", "INFO", 0.0, False),
+        ("LOG_LEVEL=INFO, spans logged", "INFO", 1.0, False),
+        ("LOG_LEVEL=INFO, spans logged + OTLP export", "INFO", 1.0, True),
+    )
+    for label, level, sample_rate, export in configurations:
+        module.LOG_LEVEL = level
+        module.TRACER = module.Tracer(sample_rate, module.OTLPSpanExporter(collector.url) if export else None)
+        sink = LineCountingSink()
+        latencies = []
+        with contextlib.redirect_stdout(sink):
+            module.process_transcription(event)  # warm-up
+            sink.lines = sink.chars = 0
+            for _ in range(args.runs):
+                start = time.perf_counter()
+                module.process_transcription(event)
+                latencies.append((time.perf_counter() - start) * 1000)
+        sink.close()
+        print(f"  {label:<46} p50 {percentile(latencies, 0.5):8.1f} ms  log lines per run {sink.lines / args.runs:8.0f}  "
+              f"{sink.chars / args.runs / 1024:8.1f} KiB")
+    trace_ids = [span["traceId"] for span in collector.spans if "parentSpanId" not in span]
+    print(f"  collector: {collector.requests} OTLP requests, {len(collector.spans)} spans; last trace:")
+    print_span_tree([span for span in collector.spans if span["traceId"] == trace_ids[-1]])
+    collector.close()
+    gcs.close()
+    return 0
+
+
+# Componentes de la cadena subida → procesamiento → notificación, en orden
+CHAIN_COMPONENTS = ["upload", "process", "embeddings", "gemini", "adapter", "notify", "signed_urls", "apps_script"]
+# Concurrencia por componente (instancias máximas x concurrencia por instancia) y latencia agregada por llamada
+CHAIN_CONCURRENCY = {"upload": 8, "process": 4, "embeddings": 16, "gemini": 8, "adapter": 8, "notify": 8,
+                     "signed_urls": 8, "apps_script": 4}
+CHAIN_LATENCY_MS = {"embeddings": 50.0, "gemini": 500.0, "apps_script": 300.0}
+
+
+class ChainFault(Exception):
+    """
+    Error injected by a ChainComponent before the call reaches its handler.
+    """
+
+
+class ChainComponent:
+    """
+    One component of the replayed chain: at most `concurrency` calls at a time, `latency_seconds` added to
+    every call and an `error_fraction` of the calls failing with `error(message)` before they reach the
+    handler. `failed(result)` marks returned results as failures (HTTP handlers answer errors as
+    (body, status) instead of raising). Records the queue wait (time until a slot is free), the service
+    time and the failures of every call; whoever retries the calls counts `retries` and `dropped`.
+    """
+
+    def __init__(self, name: str, concurrency: int, latency_seconds: float = 0.0, error_fraction: float = 0.0,
+                 error: Callable[[str], Exception] = ChainFault, failed: Optional[Callable[[object], bool]] = None,
+                 seed: int = 23):
+        self.name = name
+        self.concurrency = concurrency
+        self.latency_seconds = latency_seconds
+        self.error_fraction = error_fraction
+        self.error = error
+        self.is_failure = failed
+        self._slots = threading.BoundedSemaphore(concurrency)
+        self._rng = random.Random(f"{seed}-{name}")
+        self._lock = threading.Lock()
+        self.waits: List[float] = []
+        self.services: List[float] = []
+        self.waiting = 0
+        self.max_waiting = 0
+        self.failed = 0
+        self.injected = 0
+        self.retries = 0
+        self.dropped = 0
+
+    def count(self, stat: str):
+        with self._lock:
+            setattr(self, stat, getattr(self, stat) + 1)
+
+    def call(self, operation: Callable, *args, **kwargs):
+        queued_at = time.perf_counter()
+        with self._lock:
+            inject = self._rng.random() < self.error_fraction
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.waiting += 1
+                self.max_waiting = max(self.max_waiting, self.waiting)
+            self._slots.acquire()
+            with self._lock:
+                self.waiting -= 1
+        try:
+            started = time.perf_counter()
+            with self._lock:
+                self.waits.append(started - queued_at)
+            try:
+                time.sleep(self.latency_seconds)
+                if inject:
+                    raise self.error(f"{self.name}: injected failure")
+                result = operation(*args, **kwargs)
+                if self.is_failure and self.is_failure(result):
+                    self.count("failed")
+                return result
+            except Exception:
+                with self._lock:
+                    self.failed += 1
+                    self.injected += inject
+                raise
+            finally:
+                with self._lock:
+                    self.services.append(time.perf_counter() - started)
+        finally:
+            self._slots.release()
+
+    def summary(self) -> Dict:
+        with self._lock:
+            waits, services = list(self.waits), list(self.services)
+
+        def ms(values: List[float], fraction: float) -> float:
+            return round(percentile(values, fraction) * 1000, 1) if values else 0.0
+
+        return {"calls": len(services), "failed": self.failed, "injected": self.injected, "retries": self.retries,
+                "dropped": self.dropped, "queue_p50_ms": ms(waits, 0.5), "queue_p95_ms": ms(waits, 0.95),
+                "queue_max_ms": ms(waits, 1.0), "max_waiting": self.max_waiting,
+                "service_p50_ms": ms(services, 0.5), "service_p95_ms": ms(services, 0.95)}
+
+
+def response_status(result) -> int:
+    # Los handlers HTTP devuelven (body, status[, headers]) o solo el body (200)
+    if isinstance(result, tuple) and len(result) > 1 and isinstance(result[1], int):
+        return result[1]
+    return getattr(result, "status_code", 200)
+
+
+class LocalFunctionServer:
+    """
+    Serves an HTTP Cloud Function handler (functions_framework.http signature) on a local keep-alive
+    werkzeug server, every request going through `component`. Injected failures are answered with 503
+    and exceptions raised by the handler with 500, as Cloud Run would.
+    """
+
+    def __init__(self, handler: Callable, component: ChainComponent):
+        import flask
+        from werkzeug.serving import WSGIRequestHandler, make_server
+        app = flask.Flask(component.name)
+
+        @app.route("/", methods=["GET", "POST"])
+        def entry():
+            try:
+                return component.call(handler, flask.request)
+            except ChainFault as e:
+                return {"error": str(e)}, 503
+            except Exception as e:
+                return {"error": repr(e)}, 500
+
+        class Handler(WSGIRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_request(self, *args, **kwargs):
+                pass
+
+        self._server = make_server("127.0.0.1", 0, app, threaded=True, request_handler=Handler)
+        self.url = f"http://127.0.0.1:{self._server.server_port}/"
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class LocalEventBus:
+    """
+    Eventarc stand-in for google.cloud.storage.object.v1.finalized: every object written to the FakeGCSServer
+    is delivered as a CloudEvent to the subscribers of its bucket (only names ending in `suffix`, if given),
+    each delivery in its own thread through the subscriber's ChainComponent. Failed deliveries are retried
+    with exponential backoff up to `max_attempts` times and then dropped (at-least-once, like Eventarc).
+    """
+
+    def __init__(self, gcs: FakeGCSServer, max_attempts: int = 5, retry_base_seconds: float = 0.2):
+        self.gcs = gcs
+        self.max_attempts = max_attempts
+        self.retry_base_seconds = retry_base_seconds
+        self.subscriptions: List[tuple] = []
+        self.published = 0
+        self.filtered = 0
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        gcs.listeners.append(self.publish)
+
+    def subscribe(self, bucket: str, component: ChainComponent, handler: Callable, suffix: str = ""):
+        self.subscriptions.append((bucket, suffix, component, handler))
+
+    def publish(self, bucket: str, name: str):
+        data = self.gcs.objects.get((bucket, name))
+        if data is None:
+            return
+        event = types.SimpleNamespace(data=json.loads(self.gcs.object_resource(bucket, name, data)),
+                                      type="google.cloud.storage.object.v1.finalized")
+        for subscription_bucket, suffix, component, handler in self.subscriptions:
+            if subscription_bucket != bucket:
+                continue
+            with self._lock:
+                if not name.endswith(suffix):
+                    self.filtered += 1
+                    continue
+                self.published += 1
+                thread = threading.Thread(target=self._deliver, args=(component, handler, event), daemon=True)
+                self._threads.append(thread)
+            thread.start()
+
+    def _deliver(self, component: ChainComponent, handler: Callable, event):
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                component.call(handler, event)
+                return
+            except Exception:
+                if attempt == self.max_attempts:
+                    component.count("dropped")
+                    return
+                component.count("retries")
+                time.sleep(self.retry_base_seconds * 2 ** (attempt - 1))
+
+    def join(self, timeout: float) -> bool:
+        """
+        Waits until no delivery (or retry) is in flight, including the ones started meanwhile; False on timeout.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                alive = [thread for thread in self._threads if thread.is_alive()]
+                self._threads = alive
+            if not alive:
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            alive[0].join(remaining)
+
+
+def component_values(spec: str, defaults: Dict[str, float]) -> Dict[str, float]:
+    """
+    Parses "name=value,..." overrides of per-component settings (see CHAIN_COMPONENTS).
+    """
+    values = {name: float(defaults.get(name, 0.0)) for name in CHAIN_COMPONENTS}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, value = item.partition("=")
+        if name.strip() not in values:
+            raise ValueError(f"Unknown component '{name.strip()}'; expected one of {', '.join(CHAIN_COMPONENTS)}")
+        values[name.strip()] = float(value)
+    return values
+
+
+def bench_chain(args) -> int:
+    import requests
+    api_exceptions = importlib.import_module("google.api_core.exceptions")
+    os.chdir(REPO_DIR)
+    concurrency = component_values(args.concurrency, CHAIN_CONCURRENCY)
+    latency_ms = component_values(args.latency_ms, CHAIN_LATENCY_MS)
+    error_rate = component_values(args.error_rate, {})
+    components = {name: ChainComponent(name, max(1, int(concurrency[name])), latency_ms[name] / 1000,
+                                       error_rate[name], seed=args.seed)
+                  for name in CHAIN_COMPONENTS}
+    for name in ("embeddings", "gemini"):
+        # Vertex AI responde 503: los reintentos los hace el QuotaLimiter de la función
+        components[name].error = api_exceptions.ServiceUnavailable
+    for name in ("upload", "notify", "signed_urls"):
+        components[name].is_failure = lambda result: response_status(result) >= 400
+
+    gcs = FakeGCSServer(latency_seconds=args.gcs_latency_ms / 1000, throttle_fraction=args.gcs_error_rate,
+                        seed=args.seed)
+    metadata = FakeMetadataServer(latency_seconds=args.metadata_ms / 1000)
+    bus = LocalEventBus(gcs, args.max_attempts, args.retry_base_ms / 1000)
+
+    upload = load_function_module("upload-trigger-1.py", "upload_trigger")
+    upload._storage_client = gcs.client()
+    process = load_function_module("process-transcription-fn-poc.py", "process_transcription_fn_poc")
+    embedding_model, generative_model = FakeEmbeddingModel(), FakeGenerativeModel()
+    embed, generate = embedding_model.get_embeddings, generative_model.generate_content
+    embedding_model.get_embeddings = lambda *a, **k: components["embeddings"].call(embed, *a, **k)
+    generative_model.generate_content = lambda *a, **k: components["gemini"].call(generate, *a, **k)
+    process.RESOURCE_POOL = process.ResourcePool(
+        factories={"storage": gcs.client, "embedding_model": lambda: embedding_model,
+                   "generative_model": lambda: generative_model},
+        limiters={name: process.QuotaLimiter(name, base_seconds=args.retry_base_ms / 1000)
+                  for name in ("embedding_model", "generative_model")})
+    process._stage_cache, process._stage_cache_created = None, True
+    process._ledger, process._ledger_created = None, True
+    adapter = load_function_module("poc-trigger-email.py", "poc_trigger_email")
+    notify = load_function_module("poc-main-trigger-email.py", "poc_main_trigger_email")
+    signer = load_function_module("poc-get-url.py", "poc_get_url")
+    signer._storage_client = gcs.client()
+    signer._signing_credentials, signer._signing_credentials_expiry = fake_signing_credentials(0.0), time.time() + 86400
+
+    notified: Dict[str, float] = {}
+    duplicates = []
+    notified_lock = threading.Lock()
+
+    def apps_script(request):
+        with notified_lock:
+            if request.args["name"] in notified:
+                duplicates.append(request.args["name"])
+            else:
+                notified[request.args["name"]] = time.perf_counter()
+        return "Email sent"
+
+    servers = {name: LocalFunctionServer(handler, components[name]) for name, handler in (
+        ("upload", upload.upload_to_bucket), ("notify", notify.hello_http),
+        ("signed_urls", signer.signed_urls), ("apps_script", apps_script))}
+    notify.SIGNED_URL_SERVICE, notify.WEB_APP_URL = servers["signed_urls"].url, servers["apps_script"].url
+    adapter.HTTP_FUNCTION_URL = servers["notify"].url
+    adapter.METADATA_IDENTITY_URL = f"http://{metadata.host}/computeMetadata/v1/instance/service-accounts/default/identity"
+    adapter.FORWARD_BATCH_SIZE, adapter.FORWARD_BATCH_WINDOW_SECONDS = args.batch_size, args.window_ms / 1000
+    bus.subscribe(process.BUCKET_NAME, components["process"], process.process_transcription)
+    bus.subscribe(process.BUCKET_DESTINO, components["adapter"], adapter.eventarc_adapter_function,
+                  suffix=args.adapter_suffix)
+
+    rng = random.Random(args.seed)
+    documents = [base64.b64encode(synthetic_interview_pdf(rng, f"Candidate {number}", args.minutes)).decode()
+                 for number in range(min(args.uploads, args.documents))]
+    uploads = [f"{args.minutes} Minute Interview (Candidate {number}) - Notes by Gemini-recruiter_{number % 7}.pdf"
+               for number in range(args.uploads)]
+    with contextlib.redirect_stdout(io.StringIO()):
+        reports = {f"{process.extract_candidate_name(name)}-{process.extract_reclut(name)}.docx": name
+                   for name in uploads}
+    submitted: Dict[str, float] = {}
+    session = requests.Session()
+
+    def send(number: int, scheduled: float):
+        # Latencia desde la hora programada (carga abierta): una subida atrasada cuenta su espera
+        submitted[uploads[number]] = scheduled
+        body = {"filename": uploads[number], "base64": documents[number % len(documents)], "mimeType": "application/pdf"}
+        for attempt in range(1, args.max_attempts + 1):
+            try:
+                status = session.post(servers["upload"].url, json=body, timeout=60).status_code
+            except requests.exceptions.RequestException:
+                status = 599
+            if status < 500 and status != 429:
+                return
+            if attempt == args.max_attempts:
+                components["upload"].count("dropped")
+                return
+            components["upload"].count("retries")
+            time.sleep(args.retry_base_ms / 1000 * 2 ** (attempt - 1))
+
+    print(f"{args.uploads} uploads of {args.minutes}-min interviews at {args.rate:g}/s (open loop); "
+          f"GCS {args.gcs_latency_ms:g} ms, {args.gcs_error_rate:.0%} 429s; up to {args.max_attempts} attempts per "
+          f"delivery; adapter batches of {args.batch_size}")
+    senders = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        for number in range(args.uploads):
+            scheduled = start + number / args.rate
+            time.sleep(max(0.0, scheduled - time.perf_counter()))
+            sender = threading.Thread(target=send, args=(number, scheduled), daemon=True)
+            sender.start()
+            senders.append(sender)
+        for sender in senders:
+            sender.join()
+        drained = bus.join(args.timeout)
+
+    for name, resource in (("embeddings", "embedding_model"), ("gemini", "generative_model")):
+        # Las llamadas a Vertex AI las reintenta el QuotaLimiter de la función, no el bus
+        components[name].retries = process.RESOURCE_POOL.limiters[resource].stats["retries"]
+        components[name].dropped = process.RESOURCE_POOL.limiters[resource].stats["failed"]
+    latencies = [notified[report] - submitted[upload_name] for report, upload_name in reports.items()
+                 if report in notified]
+    wall = (max(notified.values()) if notified else time.perf_counter()) - start
+    results = {
+        "uploads": args.uploads, "notified": len(latencies), "duplicate_notifications": len(duplicates),
+        "throughput_per_second": round(len(latencies) / wall, 2), "wall_seconds": round(wall, 2),
+        "end_to_end_ms": {f"p{round(fraction * 100)}": round(percentile(latencies, fraction) * 1000, 1)
+                          for fraction in (0.5, 0.95, 0.99)} if latencies else {},
+        "gcs": {"requests": gcs.requests, "throttled": gcs.throttled},
+        "events": {"delivered": bus.published, "filtered": bus.filtered, "drained": drained},
+        "components": {name: component.summary() for name, component in components.items()},
+    }
+    print(f"  notified {len(latencies)}/{args.uploads} ({len(duplicates)} duplicate notifications)  "
+          f"throughput {results['throughput_per_second']:.2f}/s over {wall:.1f} s  end-to-end "
+          + "  ".join(f"{key} {value / 1000:6.2f} s" for key, value in results["end_to_end_ms"].items()))
+    print(f"  GCS {gcs.requests} requests ({gcs.throttled} throttled); {bus.published} events delivered, "
+          f"{bus.filtered} filtered out{'' if drained else '; timed out with deliveries in flight'}")
+    print(f"  {'component':<12} {'slots':>5} {'calls':>6} {'failed':>6} {'injected':>8} {'retries':>7} {'dropped':>7} "
+          f"{'queue p50':>10} {'p95':>8} {'max':>8} {'waiting':>7} {'service p50':>12} {'p95':>8}")
+    for name, summary in results["components"].items():
+        print(f"  {name:<12} {components[name].concurrency:>5} {summary['calls']:>6} {summary['failed']:>6} "
+              f"{summary['injected']:>8} {summary['retries']:>7} {summary['dropped']:>7} "
+              f"{summary['queue_p50_ms']:>7.1f} ms {summary['queue_p95_ms']:>5.1f} ms {summary['queue_max_ms']:>5.0f} ms "
+              f"{summary['max_waiting']:>7} {summary['service_p50_ms']:>9.1f} ms {summary['service_p95_ms']:>5.1f} ms")
+    if args.json:
+        with open(args.json, "w") as output:
+            json.dump(results, output, indent=2)
+    for server in servers.values():
+        server.close()
+    metadata.close()
+    gcs.close()
+    return 0 if len(latencies) == args.uploads else 1
+
+
+@contextlib.contextmanager
+def worker_output_silenced():
+    """
+    Points file descriptor 1 at /dev/null: spawned pool workers inherit it, so their prints are dropped
+    like the ones redirect_stdout() catches in this process.
+    """
+    sys.stdout.flush()
+    saved = os.dup(1)
+    with open(os.devnull, "w") as devnull:
+        os.dup2(devnull.fileno(), 1)
+    try:
+        yield
+    finally:
+        os.dup2(saved, 1)
+        os.close(saved)
+
+
+def bench_cpu(args) -> int:
+    module = load_function_module("process-transcription-fn-poc.py", "process_transcription_fn_poc")
+    os.chdir(REPO_DIR)
+    rng = random.Random(args.seed)
+    gcs = FakeGCSServer()
+    install_pipeline_fakes(module, gcs, args.embed_ms / 1000, args.generate_ms / 1000)
+    module.RESOURCE_POOL.limiters = {}
+    module._stage_cache, module._stage_cache_created = None, True
+    module._ledger, module._ledger_created = None, True
+    prefix = "cpu/"
+    documents = [synthetic_corpus_document(rng, args.pages) for _ in range(min(args.files, args.documents))]
+    names = [f"{prefix}{args.pages} Page Interview (Candidate {number}) - Notes by Gemini-francisco.pdf"
+             for number in range(args.files)]
+    for number, name in enumerate(names):
+        gcs.store(module.BUCKET_NAME, name, documents[number % len(documents)])
+    corpus_mb = sum(len(gcs.objects[(module.BUCKET_NAME, name)]) for name in names) / 1e6
+    sizes = [int(value) for value in args.workers.split(",")]
+    print(f"{args.files} PDFs of {args.pages} pages ({corpus_mb:.1f} MB), {os.cpu_count()} CPUs; "
+          f"{args.threads} batch threads; embed {args.embed_ms} ms, Gemini {args.generate_ms} ms")
+
+    def prepare():
+        # Solo descarga + etapa CPU (process_preparation), con la etapa CPU activada como en process_batch
+        token = module._cpu_stage_active.set(True)
+        try:
+            return module.process_preparation(module.BUCKET_NAME, names, "Francisco Ahijado",
+                                              module.JOB_INTERVIEW_KEYWORD_SETS, module.MIN_KEYWORD_MATCHES,
+                                              max_workers=args.threads)
+        finally:
+            module._cpu_stage_active.reset(token)
+
+    def batch():
+        return module.process_batch(module.BUCKET_NAME, file_names=names, max_workers=args.threads)
+
+    expected = None
+    baselines = {}
+    print(f"  {'CPU stage':<16} {'prepare s':>10} {'files/s':>8} {'MB/s':>7} {'speedup':>8} {'per worker':>10}   "
+          f"{'batch s':>8} {'files/s':>8} {'speedup':>8}")
+    for workers in [0] + sizes:
+        if module._cpu_stage is not None:
+            module._cpu_stage.shutdown()
+        module.CPU_STAGE_WORKERS = workers
+        module._cpu_stage, module._cpu_stage_created = None, False
+        timings = {}
+        # Fuera de la redirección: si create_cpu_stage() pasa a hilos, su WARNING se ve y no se mide eso como procesos
+        if workers and module.get_cpu_stage() is None:
+            raise SystemExit(f"The CPU stage fell back to threads with {workers} workers; see the WARNING above.")
+        with contextlib.redirect_stdout(io.StringIO()), worker_output_silenced():
+            prepare()  # arranque del pool y automatón de palabras clave en cada proceso
+            for label, operation in (("prepare", prepare), ("batch", batch)):
+                best = None
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    results = operation()
+                    best = min(best or float("inf"), time.perf_counter() - start)
+                timings[label] = best
+                if label == "prepare":
+                    turns = [len(result.get("dialogue", [])) for result in results]
+                else:
+                    statuses = {result["status"] for result in results}
+        # La salida tiene que ser la misma con hilos y con procesos
+        expected = expected or turns
+        assert turns == expected and statuses == {"processed"}, (workers, statuses)
+        baselines = baselines or timings
+        speedup = baselines["prepare"] / timings["prepare"]
+        label = "threads only" if workers == 0 else f"{workers} process{'es' if workers > 1 else ''}"
+        print(f"  {label:<16} {timings['prepare']:>10.2f} {args.files / timings['prepare']:>8.1f} "
+              f"{corpus_mb / timings['prepare']:>7.1f} {speedup:>7.2f}x {speedup / max(workers, 1):>9.2f}x   "
+              f"{timings['batch']:>8.2f} {args.files / timings['batch']:>8.1f} "
+              f"{baselines['batch'] / timings['batch']:>7.2f}x")
+    if module._cpu_stage is not None:
+        module._cpu_stage.shutdown()
+    gcs.close()
+    return 0
+
+
+def bench_extract(args) -> int:
+    module = load_function_module("process-transcription-fn-poc.py", "process_transcription_fn_poc")
+    fitz = importlib.import_module("fitz")
+    rng = random.Random(args.seed)
+    print(f"PDFs of {args.pages} pages, {args.summary_pages} of them summary before the 'Transcript' marker; "
+          f"best of {args.repeat} runs (+ segment: extraction and clean_and_extract_dialogue_segment)")
+    print(f"  {'extraction':<24} {'ms':>8} {'+ segment':>10} {'pages out':>9} {'skipped':>8} {'chars':>9} "
+          f"{'peak KiB':>9} {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as directory:
+        for outline in (False, True):
+            path = os.path.join(directory, f"outline-{outline}.pdf")
+            with open(path, "wb") as f:
+                f.write(synthetic_corpus_document(rng, args.pages, summary_pages=args.summary_pages, outline=outline))
+            with fitz.open(path) as pdf_doc:
+                # Las banderas explícitas no cambian el texto de get_text() por defecto
+                original = "".join(page.get_text() for page in pdf_doc)
+            with contextlib.redirect_stdout(io.StringIO()):
+                expected = module.clean_and_extract_dialogue_segment(original)
+            baseline = None
+            for label, skip in (("all pages", False), ("marker-aware", True)):
+                module.PDF_SKIP_SUMMARY_PAGES = skip
+                stats = {}
+                timings = {"extract": float("inf"), "segment": float("inf")}
+                with contextlib.redirect_stdout(io.StringIO()):
+                    for _ in range(args.repeat):
+                        start = time.perf_counter()
+                        text = "".join(module.iter_document_text(path, "bench.pdf", stats))
+                        extracted = time.perf_counter()
+                        segment = module.clean_and_extract_dialogue_segment(text)
+                        timings["extract"] = min(timings["extract"], extracted - start)
+                        timings["segment"] = min(timings["segment"], time.perf_counter() - start)
+                    _, peak = measure(lambda: "".join(module.iter_document_text(path, "bench.pdf")))
+                # El segmento de diálogo tiene que ser el mismo con y sin las páginas de resumen
+                assert segment == expected, (label, outline)
+                assert skip or text == original
+                baseline = baseline or timings["segment"]
+                label = f"{label}{', outline' if outline else ''}"
+                print(f"  {label:<24} {timings['extract'] * 1000:>8.1f} {timings['segment'] * 1000:>10.1f} "
+                      f"{stats['pages']:>9} {stats['skipped_pages']:>8} {stats['text_chars']:>9} {peak / 1024:>9.0f} "
+                      f"{baseline / timings['segment']:>7.2f}x")
+    module.PDF_SKIP_SUMMARY_PAGES = True
+    return 0
+
+
+# Top-level imports of process-transcription-fn-poc.py before heavy dependencies were deferred.
+EAGER_IMPORTS = [
+    "fitz", "functions_framework", "google.cloud.storage", "vertexai", "vertexai.language_models",
+    "flask", "vertexai.generative_models", "google.cloud.aiplatform", "docx", "numpy",
+]
+# Deferred imports, grouped by the pipeline stage that triggers them.
+STAGE_IMPORTS = {
+    "download": ["google.cloud.storage", "requests.adapters"],
+    "extract": ["fitz"],
+    "embed/analyze": ["vertexai", "vertexai.language_models", "vertexai.generative_models", "numpy"],
+    "render": ["docx"],
+}
+
+
+def run_python(code: str, extra_env: Optional[Dict[str, str]] = None, importtime: bool = False):
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", code]
+    env = dict(os.environ, **(extra_env or {}))
+    return subprocess.run(command, capture_output=True, text=True, cwd=REPO_DIR, env=env, check=True)
+
+
+def parse_importtime(stderr: str) -> Dict[str, float]:
+    """
+    Cumulative milliseconds of each top-level import from `python -X importtime` output.
+    """
+    timings = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if name.startswith("  ") or not cumulative.strip().isdigit():
+            continue
+        timings[name.strip()] = int(cumulative) / 1000
+    return timings
+
+
+def bench_startup(args) -> int:
+    load_code = (
+        "import importlib.util, json\n"
+        "spec = importlib.util.spec_from_file_location('p', 'process-transcription-fn-poc.py')\n"
+        "module = importlib.util.module_from_spec(spec); spec.loader.exec_module(module)\n"
+        "for stage_modules in json.loads(%r).values():\n"
+        "    for name in stage_modules: module.lazy_import(name)\n"
+        "print(json.dumps(module.startup_profile_report()))\n"
+    )
+    samples = []
+    for _ in range(args.runs):
+        result = run_python(load_code % json.dumps(STAGE_IMPORTS), {"STARTUP_PROFILE": ""})
+        samples.append(json.loads(result.stdout.strip().splitlines()[-1]))
+    module_load_ms = sorted(sample["module_load_ms"] for sample in samples)[len(samples) // 2]
+    report = samples[-1]
+
+    eager = run_python("import " + ", ".join(EAGER_IMPORTS), importtime=True)
+    eager_timings = parse_importtime(eager.stderr)
+    eager_ms = sum(eager_timings.values())
+    deferred = run_python("import importlib.util; spec = importlib.util.spec_from_file_location('p', "
+                          "'process-transcription-fn-poc.py'); spec.loader.exec_module(importlib.util.module_from_spec(spec))",
+                          importtime=True)
+    interpreter_modules = parse_importtime(run_python("pass", importtime=True).stderr)
+    deferred_timings = {name: ms for name, ms in parse_importtime(deferred.stderr).items()
+                        if name not in interpreter_modules}
+
+    print(f"Cold start (module load, median of {args.runs}): {module_load_ms:.1f} ms   budget {args.budget_ms:.0f} ms")
+    print(f"Previous eager imports: {eager_ms:.1f} ms")
+    print("Top-level imports now paid at cold start:")
+    for name, ms in sorted(deferred_timings.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"  {name:<40} {ms:8.1f} ms")
+    print("Deferred imports, paid only when the stage runs:")
+    for stage, stage_modules in STAGE_IMPORTS.items():
+        stage_ms = sum(report["lazy_imports_ms"].get(name, 0.0) for name in stage_modules)
+        print(f"  {stage:<40} {stage_ms:8.1f} ms  ({', '.join(stage_modules)})")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as output:
+            json.dump({"module_load_ms": module_load_ms, "eager_imports_ms": round(eager_ms, 1),
+                       "top_level_imports_ms": deferred_timings, "lazy_imports_ms": report["lazy_imports_ms"],
+                       "budget_ms": args.budget_ms}, output, indent=2)
+    if module_load_ms > args.budget_ms:
+        print(f"REGRESSION: cold start {module_load_ms:.1f} ms exceeds the {args.budget_ms:.0f} ms budget.")
+        return 1
+    return 0
+
+
+LEGACY_SPEAKER_SPLIT = re.compile(r'((?:\[\d{2}:\d{2}:\d{2}(?:\.\d+)?\]\s*)?[\w\s\-\.]+\s*:\s*)', re.IGNORECASE)
+
+
+def synthetic_dialogue(shape: str, size_bytes: int, rng: random.Random) -> str:
+    """
+    Dialogue texts of roughly `size_bytes` for the parser benchmark:
+    'dialogue' (regular turns), 'no-colon' (long label-like lines without ':') and
+    'one-line' (a single huge line of words, the worst case for the original split regex).
+    """
+    if shape == "dialogue":
+        rng_state = random.Random(rng.random())
+        text = synthetic_transcript(rng_state, 90, ["Jean Massucatto", "Francisco Ahijado", "Third Person"])
+    elif shape == "no-colon":
+        text = "\n".join(" ".join(rng.choice(WORD_SAMPLES) for _ in range(400)) for _ in range(20))
+    else:
+        text = " ".join(rng.choice(WORD_SAMPLES) for _ in range(2000))
+    repeats = max(1, size_bytes // len(text) + 1)
+    separator = " " if shape == "one-line" else "\n"
+    return separator.join([text] * repeats)[:size_bytes]
+
+
+def bench_parser(args) -> int:
+    module = load_function_module("process-transcription-fn-poc.py", "process_transcription_fn_poc")
+    rng = random.Random(args.seed)
+    sizes_kb = [int(size) for size in args.sizes_kb.split(",")]
+    super_linear = False
+    for shape in ("dialogue", "no-colon", "one-line"):
+        print(f"\nShape: {shape}")
+        print(f"  {'size':>8} {'parser ms':>10} {'ns/byte':>8} {'legacy split ms':>16} {'ns/byte':>8}")
+        per_byte = []
+        for size_kb in sizes_kb:
+            text = synthetic_dialogue(shape, size_kb * 1024, rng)
+            with contextlib.redirect_stdout(io.StringIO()):
+                parser_seconds = best_time(lambda: module.parse_interview_dialogue(text, "Jean Massucatto"), args.repeat)
+            per_byte.append(parser_seconds * 1e9 / len(text))
+            if size_kb <= args.legacy_max_kb:
+                legacy_seconds = best_time(lambda: LEGACY_SPEAKER_SPLIT.split(text), 1)
+                legacy = f"{legacy_seconds * 1000:16.1f} {legacy_seconds * 1e9 / len(text):8.0f}"
+            else:
+                legacy = f"{'skipped':>16} {'-':>8}"
+            print(f"  {size_kb:>6}KB {parser_seconds * 1000:10.1f} {per_byte[-1]:8.0f} {legacy}")
+        # Linear time means a flat cost per byte; allow noise, flag a clear upward trend.
+        if per_byte[-1] > 2 * min(per_byte):
+            super_linear = True
+            print("  WARNING: cost per byte grows with input size (super-linear behaviour).")
+    return 1 if super_linear else 0
+
+
+def legacy_keyword_matches(text: str, keywords: List[str]) -> set:
+    """
+    Original `is_job_interview` check: one substring scan per keyword.
+    """
+    text_lower = text.lower()
+    return {keyword.lower() for keyword in keywords if keyword.lower() in text_lower}
+
+
+def bench_keywords(args) -> int:
+    module = load_function_module("process-transcription-fn-poc.py", "process_transcription_fn_poc")
+    rng = random.Random(args.seed)
+    documents = [synthetic_transcript(rng, minutes, ["Jean Massucatto", "Francisco Ahijado"])
+                 for minutes in (5, 30, 90)]
+    documents.append("Quarterly budget review: cost control, CVS pharmacy contract, stakeholder rolecall. " * 200)
+    automaton = module.get_keyword_automaton(module.JOB_INTERVIEW_KEYWORD_SETS)
+    # Same workload for both: every keyword of every set (English + Spanish).
+    all_keywords = sorted({keyword for keywords in module.JOB_INTERVIEW_KEYWORD_SETS.values() for keyword in keywords})
+
+    print(f"Keywords: {len(all_keywords)} in {len(module.JOB_INTERVIEW_KEYWORD_SETS)} sets")
+    print(f"  {'document':>10} {'substring scan':>15} {'automaton':>10}   substring-only matches (false positives)")
+    for text in documents:
+        legacy_seconds = best_time(lambda: legacy_keyword_matches(text, all_keywords), args.repeat)
+        automaton_seconds = best_time(lambda: automaton.score(text), args.repeat)
+        word_matches = set(automaton.count(text)["en"])
+        false_positives = sorted(legacy_keyword_matches(text, module.JOB_INTERVIEW_KEYWORDS) - word_matches)
+        print(f"  {len(text) / 1024:8.0f}KB {legacy_seconds * 1e6:12.0f} us {automaton_seconds * 1e6:7.0f} us   {false_positives}")
+    return 0
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    normalizer_parser = subparsers.add_parser("normalizer", help="TranscriptNormalizer vs. the original cleaning passes")
+    normalizer_parser.add_argument("--samples", type=int, default=20)
+    normalizer_parser.add_argument("--minutes", type=int, default=90)
+    normalizer_parser.add_argument("--fuzz", type=int, default=2000)
+    normalizer_parser.add_argument("--repeat", type=int, default=5)
+    normalizer_parser.add_argument("--seed", type=int, default=7)
+    normalizer_parser.set_defaults(handler=bench_normalizer)
+
+    parser_parser = subparsers.add_parser("parser", help="parse_interview_dialogue scaling on 1 MB+ and pathological dialogues")
+    parser_parser.add_argument("--sizes-kb", default="16,256,1024,2048,4096")
+    parser_parser.add_argument("--legacy-max-kb", type=int, default=16,
+                               help="largest input the original split regex is timed on (it is quadratic on 'one-line')")
+    parser_parser.add_argument("--repeat", type=int, default=3)
+    parser_parser.add_argument("--seed", type=int, default=7)
+    parser_parser.set_defaults(handler=bench_parser)
+
+    keywords_parser = subparsers.add_parser("keywords", help="KeywordAutomaton vs. one substring scan per keyword")
+    keywords_parser.add_argument("--repeat", type=int, default=20)
+    keywords_parser.add_argument("--seed", type=int, default=7)
+    keywords_parser.set_defaults(handler=bench_keywords)
+
+    pool_parser = subparsers.add_parser("pool", help="warm-path latency with per-invocation clients vs. ResourcePool")
+    pool_parser.add_argument("--invocations", type=int, default=30)
+    pool_parser.add_argument("--model-load-ms", type=float, default=150.0,
+                             help="simulated from_pretrained / GenerativeModel construction time")
+    pool_parser.set_defaults(handler=bench_pool)
+
+    batch_parser = subparsers.add_parser("batch", help="process_batch throughput vs. number of workers")
+    batch_parser.add_argument("--files", type=int, default=24)
+    batch_parser.add_argument("--minutes", type=int, default=10, help="length of each synthetic interview")
+    batch_parser.add_argument("--workers", default="1,4,8,16")
+    batch_parser.add_argument("--gcs-latency-ms", type=float, default=20.0)
+    batch_parser.add_argument("--embed-ms", type=float, default=150.0)
+    batch_parser.add_argument("--generate-ms", type=float, default=800.0)
+    batch_parser.add_argument("--seed", type=int, default=7)
+    batch_parser.set_defaults(handler=bench_batch)
+
+    cache_parser = subparsers.add_parser("cache", help="stage cache: first delivery vs. redelivery of the same files")
+    cache_parser.add_argument("--files", type=int, default=10)
+    cache_parser.add_argument("--minutes", type=int, default=10)
+    cache_parser.add_argument("--backend", choices=["sqlite", "gcs"], default="sqlite")
+    cache_parser.add_argument("--gcs-latency-ms", type=float, default=20.0)
+    cache_parser.add_argument("--embed-ms", type=float, default=150.0)
+    cache_parser.add_argument("--generate-ms", type=float, default=800.0)
+    cache_parser.add_argument("--seed", type=int, default=7)
+    cache_parser.set_defaults(handler=bench_cache)
+
+    embeddings_parser = subparsers.add_parser("embeddings", help="chunked, batched embeddings vs. one truncated input")
+    embeddings_parser.add_argument("--minutes", type=int, default=90)
+    embeddings_parser.add_argument("--chunk-tokens", type=int, default=2048)
+    embeddings_parser.add_argument("--model-limit-tokens", type=int, default=8192,
+                                   help="input limit of the original single-input call")
+    embeddings_parser.add_argument("--batch-size", type=int, default=16)
+    embeddings_parser.add_argument("--concurrency", type=int, default=4)
+    embeddings_parser.add_argument("--call-ms", type=float, default=150.0)
+    embeddings_parser.add_argument("--dimensions", type=int, default=3072)
+    embeddings_parser.add_argument("--seed", type=int, default=7)
+    embeddings_parser.set_defaults(handler=bench_embeddings)
+
+    index_parser = subparsers.add_parser("index", help="CandidateIndex build and top-k query latency, exact vs. IVF")
+    index_parser.add_argument("--candidates", type=int, default=20000)
+    index_parser.add_argument("--dimensions", type=int, default=3072)
+    index_parser.add_argument("--profiles", type=int, default=200, help="clusters the synthetic candidates are drawn from")
+    index_parser.add_argument("--incremental", type=int, default=2000, help="vectors added one at a time before the bulk load")
+    index_parser.add_argument("--queries", type=int, default=200)
+    index_parser.add_argument("--k", type=int, default=10)
+    index_parser.add_argument("--lists", type=int, default=0, help="IVF partitions (default 4 * sqrt(n))")
+    index_parser.add_argument("--probes", default="4,8,16")
+    index_parser.add_argument("--seed", type=int, default=7)
+    index_parser.set_defaults(handler=bench_index)
+
+    archive_parser = subparsers.add_parser("archive", help="EmbeddingArchive size, scan speed and recall per dtype")
+    archive_parser.add_argument("--candidates", type=int, default=20000)
+    archive_parser.add_argument("--dimensions", type=int, default=3072)
+    archive_parser.add_argument("--append-batch", type=int, default=500)
+    archive_parser.add_argument("--queries", type=int, default=20)
+    archive_parser.add_argument("--k", type=int, default=10)
+    archive_parser.add_argument("--objects", type=int, default=500, help="per-candidate objects in the download comparison")
+    archive_parser.add_argument("--gcs-latency-ms", type=float, default=10.0)
+    archive_parser.add_argument("--seed", type=int, default=7)
+    archive_parser.set_defaults(handler=bench_archive)
+
+    prompt_parser = subparsers.add_parser("prompt", help="analysis latency vs. interview length, single call vs. budgeted map-reduce")
+    prompt_parser.add_argument("--minutes", default="15,30,60,120,240")
+    prompt_parser.add_argument("--call-ms", type=float, default=300.0)
+    prompt_parser.add_argument("--prefill-tps", type=float, default=4000.0, help="simulated input tokens processed per second")
+    prompt_parser.add_argument("--decode-tps", type=float, default=400.0, help="simulated output tokens per second")
+    prompt_parser.add_argument("--seed", type=int, default=7)
+    prompt_parser.set_defaults(handler=bench_prompt)
+
+    pipeline_parser = subparsers.add_parser("pipeline", help="per-invocation latency: sequential stages vs. the stage graph")
+    pipeline_parser.add_argument("--files", type=int, default=12)
+    pipeline_parser.add_argument("--minutes", type=int, default=30, help="length of each synthetic interview")
+    pipeline_parser.add_argument("--gcs-latency-ms", type=float, default=40.0)
+    pipeline_parser.add_argument("--embed-ms", type=float, default=400.0)
+    pipeline_parser.add_argument("--generate-ms", type=float, default=800.0)
+    pipeline_parser.add_argument("--seed", type=int, default=7)
+    pipeline_parser.set_defaults(handler=bench_pipeline)
+
+    quota_parser = subparsers.add_parser("quota", help="throughput under a shared quota that throttles with 429s")
+    quota_parser.add_argument("--instances", type=int, default=4, help="simulated function instances, each with its own limiter")
+    quota_parser.add_argument("--workers", type=int, default=8, help="threads per instance")
+    quota_parser.add_argument("--calls", type=int, default=40, help="calls per instance")
+    quota_parser.add_argument("--call-ms", type=float, default=100.0)
+    quota_parser.add_argument("--quota-rps", type=float, default=40.0, help="project-wide requests per second")
+    quota_parser.add_argument("--backoff-base-ms", type=float, default=100.0)
+    quota_parser.add_argument("--gcs-throttle", type=float, default=0.2)
+    quota_parser.add_argument("--uploads", type=int, default=50)
+    quota_parser.set_defaults(handler=bench_quota)
+
+    analysis_parser = subparsers.add_parser("analysis", help="malformed Gemini output: full regeneration vs. field repair")
+    analysis_parser.add_argument("--call-ms", type=float, default=200.0)
+    analysis_parser.add_argument("--decode-tps", type=float, default=1000.0, help="simulated output tokens per second")
+    analysis_parser.set_defaults(handler=bench_analysis)
+
+    report_parser = subparsers.add_parser("report", help="DOCX report: python-docx from scratch vs. ReportTemplate")
+    report_parser.add_argument("--reports", type=int, default=100)
+    report_parser.add_argument("--workers", type=int, default=8)
+    report_parser.add_argument("--gcs-latency-ms", type=float, default=0.0)
+    report_parser.add_argument("--seed", type=int, default=7)
+    report_parser.set_defaults(handler=bench_report)
+
+    signed_parser = subparsers.add_parser("signed-urls", help="email notification lookup: list + sign all vs. one object")
+    signed_parser.add_argument("--objects", default="1000,10000,20000", help="reports in the bucket")
+    signed_parser.add_argument("--gcs-latency-ms", type=float, default=5.0)
+    signed_parser.add_argument("--sign-ms", type=float, default=1.0)
+    signed_parser.add_argument("--runs", type=int, default=50)
+    signed_parser.add_argument("--legacy-runs", type=int, default=1)
+    signed_parser.set_defaults(handler=bench_signed_urls)
+
+    upload_parser = subparsers.add_parser("upload", help="upload-trigger-1: base64 JSON in memory vs. streamed uploads")
+    upload_parser.add_argument("--sizes-mib", default="16,64,192")
+    upload_parser.add_argument("--modes", default="original,json,raw,multipart")
+    upload_parser.add_argument("--gcs-latency-ms", type=float, default=5.0)
+    upload_parser.set_defaults(handler=bench_upload)
+
+    adapter_parser = subparsers.add_parser("adapter", help="Eventarc adapter: token + connection per event vs. cache, pool, batches")
+    adapter_parser.add_argument("--events", type=int, default=200)
+    adapter_parser.add_argument("--concurrency", type=int, default=16)
+    adapter_parser.add_argument("--metadata-ms", type=float, default=3.0)
+    adapter_parser.add_argument("--function-ms", type=float, default=150.0)
+    adapter_parser.add_argument("--connect-ms", type=float, default=40.0)
+    adapter_parser.add_argument("--batch-sizes", default="8,32")
+    adapter_parser.add_argument("--window-ms", type=float, default=50.0)
+    adapter_parser.set_defaults(handler=bench_adapter)
+
+    ledger_parser = subparsers.add_parser("ledger", help="duplicate event deliveries with and without the idempotency ledger")
+    ledger_parser.add_argument("--files", type=int, default=10)
+    ledger_parser.add_argument("--copies", type=int, default=3)
+    ledger_parser.add_argument("--minutes", type=int, default=30)
+    ledger_parser.add_argument("--gcs-latency-ms", type=float, default=5.0)
+    ledger_parser.add_argument("--embed-ms", type=float, default=20.0)
+    ledger_parser.add_argument("--generate-ms", type=float, default=300.0)
+    ledger_parser.add_argument("--seed", type=int, default=7)
+    ledger_parser.set_defaults(handler=bench_ledger)
+
+    suite_parser = subparsers.add_parser("suite", help="per-stage scaling on a synthetic corpus, compared with a baseline")
+    suite_parser.add_argument("--pages", default="5,50,500")
+    suite_parser.add_argument("--formats", default="pdf,txt")
+    suite_parser.add_argument("--speakers", default="Francisco Ahijado,Jean Massucatto")
+    suite_parser.add_argument("--filler-density", type=float, default=0.15)
+    suite_parser.add_argument("--timestamp-fraction", type=float, default=0.5)
+    suite_parser.add_argument("--repeat", type=int, default=5)
+    suite_parser.add_argument("--seed", type=int, default=7)
+    suite_parser.add_argument("--baseline", help="baseline JSON: compared with if it exists, written otherwise")
+    suite_parser.add_argument("--update-baseline", action="store_true", help="overwrite the baseline with this run")
+    suite_parser.add_argument("--tolerance", type=float, default=0.25, help="allowed best-run latency increase (fraction)")
+    suite_parser.add_argument("--memory-tolerance", type=float, default=0.10, help="allowed peak memory increase (fraction)")
+    suite_parser.add_argument("--min-delta-ms", type=float, default=2.0, help="latency increases below this are ignored")
+    suite_parser.add_argument("--json", help="write this run's results to this file")
+    suite_parser.set_defaults(handler=bench_suite)
+
+    trace_parser = subparsers.add_parser("trace", help="log volume and span overhead, span tree exported over OTLP")
+    trace_parser.add_argument("--pages", type=int, default=200)
+    trace_parser.add_argument("--runs", type=int, default=5)
+    trace_parser.add_argument("--embed-ms", type=float, default=20.0)
+    trace_parser.add_argument("--generate-ms", type=float, default=200.0)
+    trace_parser.add_argument("--seed", type=int, default=7)
+    trace_parser.set_defaults(handler=bench_trace)
+
+    chain_parser = subparsers.add_parser("chain", help="replay uploads through upload -> process -> notify, per-component queues")
+    chain_parser.add_argument("--uploads", type=int, default=40)
+    chain_parser.add_argument("--rate", type=float, default=2.0, help="uploads per second (open loop)")
+    chain_parser.add_argument("--minutes", type=int, default=10)
+    chain_parser.add_argument("--documents", type=int, default=8, help="distinct PDFs generated and reused")
+    chain_parser.add_argument("--concurrency", default="", help="per-component slots, e.g. process=2,gemini=4")
+    chain_parser.add_argument("--latency-ms", default="", help="per-component added latency, e.g. gemini=800")
+    chain_parser.add_argument("--error-rate", default="", help="per-component injected failures, e.g. apps_script=0.1")
+    chain_parser.add_argument("--gcs-latency-ms", type=float, default=5.0)
+    chain_parser.add_argument("--gcs-error-rate", type=float, default=0.0, help="fraction of GCS requests answered 429")
+    chain_parser.add_argument("--metadata-ms", type=float, default=2.0)
+    chain_parser.add_argument("--max-attempts", type=int, default=5, help="attempts per upload and per event delivery")
+    chain_parser.add_argument("--retry-base-ms", type=float, default=200.0)
+    chain_parser.add_argument("--batch-size", type=int, default=1, help="FORWARD_BATCH_SIZE of the Eventarc adapter")
+    chain_parser.add_argument("--window-ms", type=float, default=50.0)
+    chain_parser.add_argument("--adapter-suffix", default=".docx",
+                              help="objects of the processed bucket delivered to the adapter ('' for all)")
+    chain_parser.add_argument("--timeout", type=float, default=300.0)
+    chain_parser.add_argument("--seed", type=int, default=7)
+    chain_parser.add_argument("--json", help="write the results to this file")
+    chain_parser.set_defaults(handler=bench_chain)
+
+    cpu_parser = subparsers.add_parser("cpu", help="CPU stage (extraction + parsing) on threads vs. a process pool")
+    cpu_parser.add_argument("--files", type=int, default=32)
+    cpu_parser.add_argument("--pages", type=int, default=40)
+    cpu_parser.add_argument("--documents", type=int, default=4, help="distinct PDFs generated and reused")
+    cpu_parser.add_argument("--workers", default=",".join(str(2 ** power) for power in range(
+        (os.cpu_count() or 1).bit_length())), help="CPU stage pool sizes (default: 1, 2, 4... up to the CPU count)")
+    cpu_parser.add_argument("--threads", type=int, default=16, help="batch threads (max_workers)")
+    cpu_parser.add_argument("--repeat", type=int, default=2)
+    cpu_parser.add_argument("--embed-ms", type=float, default=0.0)
+    cpu_parser.add_argument("--generate-ms", type=float, default=0.0)
+    cpu_parser.add_argument("--seed", type=int, default=7)
+    cpu_parser.set_defaults(handler=bench_cpu)
+
+    extract_parser = subparsers.add_parser("extract", help="PDF extraction: every page vs. from the 'Transcript' marker page")
+    extract_parser.add_argument("--pages", type=int, default=120)
+    extract_parser.add_argument("--summary-pages", type=int, default=40, help="summary pages before the marker")
+    extract_parser.add_argument("--repeat", type=int, default=3)
+    extract_parser.add_argument("--seed", type=int, default=7)
+    extract_parser.set_defaults(handler=bench_extract)
+
+    startup_parser = subparsers.add_parser("startup", help="cold-start import profile and regression budget")
+    startup_parser.add_argument("--runs", type=int, default=5)
+    startup_parser.add_argument("--budget-ms", type=float, default=400.0)
+    startup_parser.add_argument("--top", type=int, default=10)
+    startup_parser.add_argument("--json", help="write the profile to this file, to track it over time")
+    startup_parser.set_defaults(handler=bench_startup)
+
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -4,43 +4,127 @@ from google.auth import impersonated_credentials
 from datetime import timedelta
 import json
 import os
+import threading
+import time
 
 # Parámetros globales
 BUCKET_NAME = "transcription_poc_processed"
 SIGNER_SERVICE_ACCOUNT = "poc-service-account@celtic-tendril-455220-v1.iam.gserviceaccount.com"  # reemplaza por tu service account
+SIGNED_URL_EXPIRATION = timedelta(minutes=15)
+REPORT_EXTENSION = ".docx"
+# Las credenciales impersonadas se reutilizan entre requests y se recrean este margen antes de vencer
+SIGNING_CREDENTIALS_LIFETIME = 3600
+SIGNING_CREDENTIALS_REFRESH_MARGIN = 300
+# Listados por prefijo: objetos por página (máximo de la API de GCS: 1000)
+LIST_PAGE_SIZE = 1000
+
+_storage_client = None
+_client_lock = threading.Lock()
+_signing_credentials = None
+_signing_credentials_expiry = 0.0
+_credentials_lock = threading.Lock()
+
+
+def get_storage_client() -> storage.Client:
+    """
+    Storage client shared by every request of the instance.
+    """
+    global _storage_client
+    with _client_lock:
+        if _storage_client is None:
+            _storage_client = storage.Client()
+        return _storage_client
+
+
+def get_signing_credentials() -> impersonated_credentials.Credentials:
+    """
+    Impersonated credentials of SIGNER_SERVICE_ACCOUNT, cached per instance and rebuilt
+    SIGNING_CREDENTIALS_REFRESH_MARGIN seconds before they expire.
+    """
+    global _signing_credentials, _signing_credentials_expiry
+    with _credentials_lock:
+        if _signing_credentials is None or time.time() >= _signing_credentials_expiry - SIGNING_CREDENTIALS_REFRESH_MARGIN:
+            # Impersonar a la service account que sí puede firmar
+            target_scopes = ['https://www.googleapis.com/auth/devstorage.read_only']
+            _signing_credentials = impersonated_credentials.Credentials(
+                source_credentials=get_storage_client()._credentials,
+                target_principal=SIGNER_SERVICE_ACCOUNT,
+                target_scopes=target_scopes,
+                lifetime=SIGNING_CREDENTIALS_LIFETIME
+            )
+            _signing_credentials_expiry = time.time() + SIGNING_CREDENTIALS_LIFETIME
+        return _signing_credentials
+
+
+def sign_blob_url(blob: storage.Blob) -> dict:
+    signed_url = blob.generate_signed_url(
+        expiration=SIGNED_URL_EXPIRATION,
+        method="GET",
+        version="v4",
+        credentials=get_signing_credentials(),
+        service_account_email=SIGNER_SERVICE_ACCOUNT
+    )
+    return {"filename": blob.name, "url": signed_url}
+
+
+def list_signed_urls(bucket: storage.Bucket, prefix: str = "", page_size: int = LIST_PAGE_SIZE,
+                     page_token: str = None):
+    """
+    Signs the .docx objects of one listing page under `prefix`. Returns (urls, next_page_token).
+    """
+    blobs = bucket.list_blobs(prefix=prefix or None, max_results=page_size, page_token=page_token)
+    page = next(blobs.pages, [])
+    urls = [sign_blob_url(blob) for blob in page if blob.name.endswith(REPORT_EXTENSION)]
+    return urls, blobs.next_page_token
+
 
 @functions_framework.http
 def signed_urls(request):
+    """
+    Signed V4 URLs of the reports in BUCKET_NAME.
+
+    Query parameters:
+        name: one .docx report; responds with a one-element list (400 for any other object, 404 if it
+            does not exist). This is the path of the email notification: its cost does not depend on the
+            number of objects in the bucket.
+        prefix: the .docx objects under a prefix.
+        page_size / page_token: one listing page; responds with {"files", "next_page_token"}. page_size
+            must be an integer >= 1 (400 otherwise) and is capped at LIST_PAGE_SIZE.
+    Without parameters, every .docx in the bucket as a list (original behavior, all pages).
+    """
     try:
-        # Inicializar cliente de Storage
-        client = storage.Client()
-        bucket = client.bucket(BUCKET_NAME)
-
-        # Impersonar a la service account que sí puede firmar
-        target_scopes = ['https://www.googleapis.com/auth/devstorage.read_only']
-        credentials = impersonated_credentials.Credentials(
-            source_credentials=client._credentials,
-            target_principal=SIGNER_SERVICE_ACCOUNT,
-            target_scopes=target_scopes,
-            lifetime=300
-        )
-
-        # Listar archivos .docx y generar signed URLs
-        urls = []
-        for blob in bucket.list_blobs():
-            if blob.name.endswith(".docx"):
-                signed_url = blob.generate_signed_url(
-                    expiration=timedelta(minutes=15),
-                    method="GET",
-                    version="v4",
-                    credentials=credentials,
-                    service_account_email=SIGNER_SERVICE_ACCOUNT
-                )
-                urls.append({
-                    "filename": blob.name,
-                    "url": signed_url
-                })
-        print(str(urls))
+        args = request.args if request is not None else {}
+        bucket = get_storage_client().bucket(BUCKET_NAME)
+
+        name = args.get("name")
+        if name:
+            # Solo se firman reportes: TXT/, EMBEDDINGS/, LEDGER/ y el caché quedan fuera
+            if not name.endswith(REPORT_EXTENSION):
+                return (json.dumps({"error": f"Only {REPORT_EXTENSION} reports can be signed: {name}"}), 400,
+                        {'Content-Type': 'application/json'})
+            # Una sola consulta de metadatos: no se lista el bucket
+            blob = bucket.get_blob(name)
+            if blob is None:
+                return (json.dumps({"error": f"Object not found: {name}"}), 404, {'Content-Type': 'application/json'})
+            return (json.dumps([sign_blob_url(blob)]), 200, {'Content-Type': 'application/json'})
+
+        prefix = args.get("prefix", "")
+        if "page_size" in args or "page_token" in args:
+            page_size = args.get("page_size", str(LIST_PAGE_SIZE))
+            if not page_size.isdecimal() or int(page_size) < 1:
+                return (json.dumps({"error": "'page_size' must be an integer >= 1."}), 400,
+                        {'Content-Type': 'application/json'})
+            page_size = min(int(page_size), LIST_PAGE_SIZE)
+            urls, next_page_token = list_signed_urls(bucket, prefix, page_size, args.get("page_token"))
+            return (json.dumps({"files": urls, "next_page_token": next_page_token}), 200,
+                    {'Content-Type': 'application/json'})
+
+        # Listar archivos .docx y generar signed URLs, página por página
+        urls, page_token = list_signed_urls(bucket, prefix)
+        while page_token:
+            page_urls, page_token = list_signed_urls(bucket, prefix, page_token=page_token)
+            urls.extend(page_urls)
+        print(f"Signed {len(urls)} URLs under prefix '{prefix}'")
         return (json.dumps(urls), 200, {'Content-Type': 'application/json'})
 
     except Exception as e:
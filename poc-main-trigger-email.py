@@ -1,4 +1,5 @@
 import functions_framework
+import concurrent.futures
 import requests
 from datetime import timedelta
 import google.auth
@@ -9,6 +10,8 @@ from google.auth.transport.requests import Request
 
 WEB_APP_URL = "https://script.google.com/macros/s/AKfycbzgGsoyPh90b_mWFXd2W3YRnQRMDYCes4oXaKQnbkfK70lplaANsE9OebAh0nZM1gr7/exec"
 SIGNED_URL_SERVICE = "https://poc-get-url-88050344039.us-east1.run.app"
+# Archivos de un mismo lote que se notifican en paralelo
+NOTIFY_MAX_WORKERS = 8
 def transformar_cadena(cadena):
     """
     Extrae una porción de una cadena, reemplaza guiones bajos con puntos y agrega un sufijo.
@@ -52,21 +55,33 @@ def hello_http(request):
         print(f"Error processing the event: {e}")
     # finally:
         # data = cloud_event["data"]
-    try:
-        # Llamada a la Cloud Run que devuelve todas las URLs firmadas
-        response = requests.get(SIGNED_URL_SERVICE)
-        response.raise_for_status()
+    if "events" in request_json:
+        # Lote del adaptador de Eventarc: {"events": [{"bucket", "name"}, ...]}
+        events = request_json["events"]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(NOTIFY_MAX_WORKERS, len(events)))) as executor:
+            outcomes = list(executor.map(lambda event: notify_file(event["bucket"], event["name"]), events))
+        results = [{"name": event["name"], "status": status, **body} for event, (body, status) in zip(events, outcomes)]
+        return {"results": results}, 200 if all(result["status"] < 400 for result in results) else 207
+    return notify_file(request_json["bucket"], request_json["name"])
+
 
-        # Parsear respuesta JSON
-        file_list = response.json()
+def notify_file(bucket, name):
+    email = transformar_cadena(name)
+    print(email)
+    try:
+        # Llamada a la Cloud Run que firma solo este objeto (sin listar el bucket completo)
+        response = requests.get(SIGNED_URL_SERVICE, params={"name": name})
+        if response.status_code == 404:
+            file_list = []
+        else:
+            response.raise_for_status()
+
+            # Parsear respuesta JSON
+            file_list = response.json()
     except requests.exceptions.RequestException as e:
         print(f"Error getting signed URL: {e}")
         return {"Error": str(e)}, 400
 
-    bucket = request_json["bucket"]
-    name = request_json["name"]
-    email = transformar_cadena(name)
-    print(email)
     # Generate the public URL for the file
     match = next((file for file in file_list if file["filename"] == name), None)
 
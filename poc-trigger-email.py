@@ -1,42 +1,221 @@
+import base64
+import json
 import os
+import threading
+import time
 import requests
 import google.auth
 import google.auth.transport.requests
 import functions_framework
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # La URL de tu función HTTP principal se pasa como variable de entorno.
 HTTP_FUNCTION_URL = os.environ.get('HTTP_FUNCTION_URL')
+# Servidor de metadatos; GCE_METADATA_HOST (la misma variable que usa google-auth) permite apuntar a uno local.
+METADATA_SERVER_HOST = os.environ.get('GCE_METADATA_HOST', 'metadata.google.internal')
+METADATA_IDENTITY_URL = (
+    f"http://{METADATA_SERVER_HOST}/computeMetadata/v1/instance/service-accounts/default/identity"
+)
+# Los tokens de identidad se reutilizan hasta este margen (segundos) antes de su "exp".
+TOKEN_REFRESH_MARGIN = 300
+# Reintentos con backoff exponencial del Session compartido (conexión, 429 y 503; los POST sólo con 429).
+HTTP_RETRY_ATTEMPTS = 3
+HTTP_RETRY_BACKOFF = 0.5
+HTTP_TIMEOUT = 60
+# Micro-batching (opcional): eventos que llegan a la misma instancia dentro de la ventana se envían en un
+# solo POST {"events": [...]}. Con FORWARD_BATCH_SIZE = 1 cada evento se envía solo, como antes.
+FORWARD_BATCH_SIZE = int(os.environ.get('FORWARD_BATCH_SIZE', '1'))
+FORWARD_BATCH_WINDOW_SECONDS = float(os.environ.get('FORWARD_BATCH_WINDOW_MS', '50')) / 1000
 
-def get_identity_token(audience_url):
+_token_cache = {}
+# Un lock por audience: pedir el token de una no bloquea a las demás. _token_lock sólo protege el dict.
+_token_locks = {}
+_token_lock = threading.Lock()
+_session = None
+_session_lock = threading.Lock()
+_batcher = None
+
+
+class ForwardRetry(Retry):
+    """
+    Retry del Session compartido: un 503 puede llegar después de que la función principal procesó el
+    POST, así que los POST sólo se repiten con 429 (la petición se rechazó antes de procesarse).
+    """
+
+    def is_retry(self, method, status_code, has_retry_after=False):
+        if method == "POST" and status_code != 429:
+            return False
+        return super().is_retry(method, status_code, has_retry_after)
+
+
+def get_session():
+    """
+    Session HTTP compartido por la instancia: conexiones keep-alive reutilizadas hacia el servidor de
+    metadatos y la función principal, con reintentos y backoff.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            retry = ForwardRetry(
+                total=HTTP_RETRY_ATTEMPTS,
+                backoff_factor=HTTP_RETRY_BACKOFF,
+                # 503 sólo para los GET al servidor de metadatos (ver ForwardRetry)
+                status_forcelist=(429, 503),
+                allowed_methods=frozenset({"GET", "POST"}),
+                respect_retry_after_header=True,
+                # Un error de lectura puede llegar después de que el POST se procesó: no se repite
+                read=0,
+                raise_on_status=False
+            )
+            session = requests.Session()
+            adapter = HTTPAdapter(max_retries=retry, pool_maxsize=32)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session = session
+        return _session
+
+
+def token_expiry(token):
+    """
+    Devuelve el "exp" (epoch) del JWT, o None si no se puede leer.
+    """
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))["exp"])
+    except (IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
+def get_identity_token(audience_url, force_refresh=False):
     """
     Obtiene un token de identidad directamente del servidor de metadatos de GCP.
     Este método es el más robusto y no depende de versiones específicas de google-auth.
+    Los tokens se guardan por audience y se piden de nuevo TOKEN_REFRESH_MARGIN segundos antes de vencer.
+    La petición al servidor de metadatos sólo retiene el lock de su audience.
     """
-    # URL especial del servidor de metadatos, siempre disponible en el entorno de GCP.
-    metadata_server_url = (
-        "http://metadata.google.internal/computeMetadata/v1/instance/service-accounts/default/identity"
-    )
-    
-    # Parámetros para la petición del token.
-    params = {'audience': audience_url}
-    headers = {'Metadata-Flavor': 'Google'}
+    with _token_lock:
+        audience_lock = _token_locks.setdefault(audience_url, threading.Lock())
+    with audience_lock:
+        cached = _token_cache.get(audience_url)
+        if cached and not force_refresh and time.time() < cached[1] - TOKEN_REFRESH_MARGIN:
+            return cached[0]
 
-    try:
-        # Realizar la petición GET al servidor de metadatos.
-        response = requests.get(metadata_server_url, params=params, headers=headers)
-        
-        # Lanza una excepción si la respuesta es un error (ej: 4xx, 5xx).
-        response.raise_for_status() 
-        
-        # El token es el cuerpo de la respuesta en texto plano.
-        identity_token = response.text
+        # Parámetros para la petición del token.
+        params = {'audience': audience_url}
+        headers = {'Metadata-Flavor': 'Google'}
+
+        try:
+            # Realizar la petición GET al servidor de metadatos.
+            response = get_session().get(METADATA_IDENTITY_URL, params=params, headers=headers, timeout=HTTP_TIMEOUT)
+
+            # Lanza una excepción si la respuesta es un error (ej: 4xx, 5xx).
+            response.raise_for_status()
+
+            # El token es el cuerpo de la respuesta en texto plano.
+            identity_token = response.text
+        except requests.exceptions.RequestException as e:
+            print(f"CRITICAL error obtaining token from metadata server: {e}")
+            # It is vital to re-raise the exception so the function execution fails
+            # y puedas ver claramente el problema en los logs.
+            raise
+
+        expiry = token_expiry(identity_token)
+        if expiry is not None:
+            _token_cache[audience_url] = (identity_token, expiry)
         return identity_token
 
-    except requests.exceptions.RequestException as e:
-        print(f"CRITICAL error obtaining token from metadata server: {e}")
-        # It is vital to re-raise the exception so the function execution fails
-        # y puedas ver claramente el problema en los logs.
-        raise
+
+def post_to_main_function(payload):
+    """
+    POST autenticado a HTTP_FUNCTION_URL. Si la función responde 401 (token revocado o vencido antes de
+    tiempo) se pide un token nuevo y se reintenta una vez.
+    """
+    for attempt in range(2):
+        identity_token = get_identity_token(HTTP_FUNCTION_URL, force_refresh=attempt > 0)
+        headers = {
+            'Authorization': f'Bearer {identity_token}',
+            'Content-Type': 'application/json'
+        }
+        response = get_session().post(HTTP_FUNCTION_URL, headers=headers, json=payload, timeout=HTTP_TIMEOUT)
+        if response.status_code != 401:
+            break
+    response.raise_for_status()
+    return response
+
+
+class EventBatcher:
+    """
+    Agrupa los eventos que llegan a la instancia dentro de `window_seconds` (hasta `max_size`) en un solo
+    POST {"events": [...]}. La primera invocación del lote lo envía; todas esperan el resultado y fallan
+    si su evento falló, así Eventarc reintenta sólo esos eventos.
+    """
+
+    class Batch:
+        def __init__(self):
+            self.events = []
+            self.full = threading.Event()
+            self.done = threading.Event()
+            self.results = None
+            self.error = None
+
+    def __init__(self, max_size, window_seconds):
+        self.max_size = max_size
+        self.window_seconds = window_seconds
+        self._lock = threading.Lock()
+        self._open = None
+
+    def submit(self, payload):
+        with self._lock:
+            batch = self._open
+            leader = batch is None
+            if leader:
+                batch = self._open = EventBatcher.Batch()
+            index = len(batch.events)
+            batch.events.append(payload)
+            if len(batch.events) >= self.max_size:
+                self._open = None
+                batch.full.set()
+
+        if leader:
+            batch.full.wait(self.window_seconds)
+            with self._lock:
+                if self._open is batch:
+                    self._open = None
+            try:
+                batch.results = self.send(batch.events)
+            except Exception as e:
+                batch.error = e
+            finally:
+                batch.done.set()
+        else:
+            batch.done.wait()
+
+        if batch.error is not None:
+            raise batch.error
+        result = batch.results[index]
+        if result.get("status", 200) >= 400:
+            raise RuntimeError(f"Main function failed for {payload['name']}: {result}")
+        return result
+
+    def send(self, events):
+        if len(events) == 1:
+            # Un solo evento en la ventana: se envía con el payload original
+            response = post_to_main_function(events[0])
+            return [{"status": response.status_code, "text": response.text}]
+        print(f"Making POST call to {HTTP_FUNCTION_URL} with a batch of {len(events)} events")
+        response = post_to_main_function({"events": events})
+        return response.json()["results"]
+
+
+def get_batcher():
+    global _batcher
+    with _session_lock:
+        if _batcher is None:
+            _batcher = EventBatcher(FORWARD_BATCH_SIZE, FORWARD_BATCH_WINDOW_SECONDS)
+        return _batcher
+
 
 @functions_framework.cloud_event
 def eventarc_adapter_function(cloud_event):
@@ -60,31 +239,24 @@ def eventarc_adapter_function(cloud_event):
     print(f"Event received for: {name} in bucket {bucket}.")
 
     try:
-        # 2. Obtener un token de identidad
-        identity_token = get_identity_token(HTTP_FUNCTION_URL)
-
-        # 3. Preparar la llamada HTTP
-        headers = {
-            'Authorization': f'Bearer {identity_token}',
-            'Content-Type': 'application/json'
-        }
-
         payload = {
             "bucket": bucket,
             "name": name  # O "filename", dependiendo de lo que espere tu función HTTP
         }
-        
-        # Tu función HTTP no parece necesitar un cuerpo (payload), así que lo dejamos vacío.
-        # Si lo necesitaras, lo añadirías aquí con json={'clave': 'valor'}.
-        
-        # 4. Llamar a la función HTTP principal
+
+        if FORWARD_BATCH_SIZE > 1:
+            # 2-4. Enviar junto con los eventos que lleguen en la misma ventana
+            result = get_batcher().submit(payload)
+            print(f"Main function call successful for {name}. Result: {result}")
+            return
+
+        # 2-4. Token de identidad (cacheado) y POST a la función principal por el Session compartido
         print(f"Making POST call to {HTTP_FUNCTION_URL} with payload: {payload}")
-        response = requests.post(HTTP_FUNCTION_URL, headers=headers, json=payload)
-        response.raise_for_status()
-        
+        response = post_to_main_function(payload)
+
         print(f"Main function call successful. Response: {response.status_code} - {response.text}")
 
     except Exception as e:
         print(f"Error during the invocation of the main HTTP function: {e}")
         # Relanzamos la excepción para que el intento se registre como un fallo.
-        raise e
\ No newline at end of file
+        raise e
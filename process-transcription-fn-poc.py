@@ -1,18 +1,250 @@
-from typing import List, Dict, Optional
-import fitz
+import time
+_MODULE_LOAD_STARTED = time.perf_counter()
+from typing import Callable, List, Dict, Optional, Iterable, Iterator, Tuple, Union
+from functools import lru_cache
+import importlib
+import contextlib
 import functions_framework
 import os
-from google.cloud import storage
-import vertexai
-from vertexai.language_models import TextEmbeddingModel, TextGenerationModel
-from flask import Request, Flask, request
+import sys
 import json
-from vertexai.generative_models import GenerativeModel
-from google.cloud import aiplatform
-from docx import Document
+import random
 import re
 from io import BytesIO
-import numpy as np
+import tempfile
+import threading
+import asyncio
+import contextvars
+import hashlib
+import importlib.machinery
+import multiprocessing
+import resource
+import socket
+import sqlite3
+import urllib.request
+import uuid
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Las dependencias pesadas (fitz, docx, vertexai, google-cloud-storage, numpy) se importan con
+# lazy_import() solo cuando la etapa que las usa se ejecuta: un archivo que no es una entrevista
+# nunca paga la importación de vertexai ni de docx. La biblioteca estándar se importa arriba, como os y json.
+# STARTUP_PROFILE=1 registra en los logs el tiempo de carga del módulo y de cada importación diferida.
+STARTUP_PROFILE = os.environ.get("STARTUP_PROFILE", "") == "1"
+IMPORT_TIMINGS: Dict[str, float] = {}
+_LAZY_MODULES: Dict[str, object] = {}
+
+
+def lazy_import(module_name: str):
+    """
+    Imports `module_name` on first use and records how long the import took (IMPORT_TIMINGS, in ms).
+    """
+    module = _LAZY_MODULES.get(module_name)
+    if module is not None:
+        return module
+    # import_module espera a que otro hilo termine de importar el mismo módulo; sys.modules no
+    # (podría devolver un módulo a medio inicializar cuando varios archivos se procesan a la vez)
+    already_loaded = module_name in sys.modules
+    started = time.perf_counter()
+    module = importlib.import_module(module_name)
+    _LAZY_MODULES[module_name] = module
+    if already_loaded:
+        return module
+    IMPORT_TIMINGS[module_name] = round((time.perf_counter() - started) * 1000, 1)
+    if STARTUP_PROFILE:
+        print(json.dumps({"startup_profile": "lazy_import", "module": module_name, "ms": IMPORT_TIMINGS[module_name]}))
+    return module
+
+
+def startup_profile_report() -> Dict:
+    """
+    Cold-start breakdown: module load time plus every deferred import done so far, in milliseconds.
+    """
+    return {
+        "module_load_ms": MODULE_LOAD_MS,
+        "lazy_imports_ms": dict(IMPORT_TIMINGS),
+        "total_ms": round(MODULE_LOAD_MS + sum(IMPORT_TIMINGS.values()), 1),
+    }
+
+
+# Nivel de los logs: los mensajes por turno o por hablante (bucles calientes) son DEBUG y con el nivel por
+# defecto ni se formatean ni se imprimen
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_LEVELS = {"DEBUG": 10, "INFO": 20, "WARNING": 30, "ERROR": 40}
+# Spans por etapa, registrados como líneas JSON: fracción de invocaciones (trazas) que se registran
+TRACE_SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE", "1.0"))
+# Exportador OTLP/HTTP con JSON (opcional), p. ej. "http://localhost:4318" para un OpenTelemetry Collector local
+OTLP_ENDPOINT = os.environ.get("OTEL_EXPORTER_OTLP_ENDPOINT", "")
+OTLP_TIMEOUT_SECONDS = 2.0
+TRACE_SERVICE_NAME = os.environ.get("OTEL_SERVICE_NAME", os.environ.get("K_SERVICE", "process-transcription-fn-poc"))
+
+
+def log_enabled(level: str) -> bool:
+    return LOG_LEVELS.get(level, 20) >= LOG_LEVELS.get(LOG_LEVEL, 20)
+
+
+def log_event(level: str, message: str, **fields):
+    """
+    Prints one JSON log line (Cloud Logging reads "severity" and "message") if `level` passes LOG_LEVEL.
+    """
+    if log_enabled(level):
+        print(json.dumps({"severity": level, "message": message, **fields}, default=str))
+
+
+class Span:
+    """
+    One timed unit of work: wall time, status and attributes such as bytes_in / bytes_out, pages, turns,
+    estimated_tokens or retries. `add()` accumulates a numeric attribute and may be called from any thread.
+    """
+
+    def __init__(self, name: str, trace_id: str, parent: Optional["Span"], sampled: bool, attributes: Dict):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent else None
+        self.sampled = sampled
+        self.attributes = dict(attributes)
+        self.error: Optional[str] = None
+        self.start_ns = time.time_ns()
+        self.end_ns = self.start_ns
+        self._started = time.perf_counter()
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+        # Los spans terminados de la traza se juntan en el span raíz para exportarlos de una vez
+        self.finished: List["Span"] = parent.finished if parent else []
+
+    def set(self, **attributes):
+        with self._lock:
+            self.attributes.update(attributes)
+
+    def add(self, key: str, amount: float = 1):
+        with self._lock:
+            self.attributes[key] = self.attributes.get(key, 0) + amount
+
+    def end(self):
+        self.seconds = time.perf_counter() - self._started
+        self.end_ns = self.start_ns + int(self.seconds * 1e9)
+
+    def to_dict(self) -> Dict:
+        record = {"span": self.name, "trace_id": self.trace_id, "span_id": self.span_id, "parent_id": self.parent_id,
+                  "seconds": round(self.seconds, 4), **self.attributes}
+        if self.error:
+            record["error"] = self.error
+        return record
+
+
+class OTLPSpanExporter:
+    """
+    Sends finished traces to an OpenTelemetry Collector over OTLP/HTTP with JSON encoding
+    (POST <endpoint>/v1/traces), with the standard library only. Export errors are logged and dropped.
+    """
+
+    def __init__(self, endpoint: str, service_name: str = TRACE_SERVICE_NAME, timeout: float = OTLP_TIMEOUT_SECONDS):
+        self.url = endpoint.rstrip("/") + "/v1/traces"
+        self.service_name = service_name
+        self.timeout = timeout
+
+    @staticmethod
+    def _value(value) -> Dict:
+        if isinstance(value, bool):
+            return {"boolValue": value}
+        if isinstance(value, int):
+            return {"intValue": str(value)}
+        if isinstance(value, float):
+            return {"doubleValue": value}
+        return {"stringValue": str(value)}
+
+    def payload(self, spans: List[Span]) -> Dict:
+        return {"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}]},
+            "scopeSpans": [{
+                "scope": {"name": "process-transcription-fn-poc"},
+                "spans": [{
+                    "traceId": span.trace_id,
+                    "spanId": span.span_id,
+                    **({"parentSpanId": span.parent_id} if span.parent_id else {}),
+                    "name": span.name,
+                    "kind": 1,
+                    "startTimeUnixNano": str(span.start_ns),
+                    "endTimeUnixNano": str(span.end_ns),
+                    "attributes": [{"key": key, "value": self._value(value)} for key, value in span.attributes.items()],
+                    "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+                } for span in spans],
+            }],
+        }]}
+
+    def export(self, spans: List[Span]):
+        request = urllib.request.Request(self.url, data=json.dumps(self.payload(spans)).encode("utf-8"),
+                                        headers={"Content-Type": "application/json"}, method="POST")
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                response.read()
+        except Exception as e:
+            print(f"Warning: could not export {len(spans)} spans to {self.url}: {e}")
+
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+
+
+class Tracer:
+    """
+    Spans for the pipeline stages. The first span opened in a context starts a trace, sampled with
+    probability `sample_rate`; spans opened inside it (on the same thread, in StageGraph stages, or on
+    worker threads started through `in_current_context`) are its children. When a sampled span ends it
+    is logged as one JSON line; when its trace ends the whole trace goes to the exporter, if any.
+    """
+
+    def __init__(self, sample_rate: float = TRACE_SAMPLE_RATE, exporter: Optional[OTLPSpanExporter] = None):
+        self.sample_rate = sample_rate
+        self.exporter = exporter
+
+    @contextlib.contextmanager
+    def span(self, name: str, **attributes) -> Iterator[Span]:
+        parent = _current_span.get()
+        if parent is None:
+            span = Span(name, os.urandom(16).hex(), None, random.random() < self.sample_rate, attributes)
+        else:
+            span = Span(name, parent.trace_id, parent, parent.sampled, attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = repr(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end()
+            if span.sampled:
+                span.finished.append(span)
+                print(json.dumps({"severity": "ERROR" if span.error else "INFO", **span.to_dict()}, default=str))
+                if parent is None and self.exporter is not None:
+                    self.exporter.export(span.finished)
+
+
+TRACER = Tracer(exporter=OTLPSpanExporter(OTLP_ENDPOINT) if OTLP_ENDPOINT else None)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def span_add(key: str, amount: float = 1):
+    """
+    Adds `amount` to the attribute `key` of the current span, if there is one.
+    """
+    span = _current_span.get()
+    if span is not None:
+        span.add(key, amount)
+
+
+def in_current_context(function: Callable) -> Callable:
+    """
+    Wraps `function` for a worker thread so it runs in a copy of the caller's context: spans it opens
+    or updates belong to the caller's current span.
+    """
+    context = contextvars.copy_context()
+    return lambda *args: context.copy().run(function, *args)
 
 
 #### BLOQUE DEBUG LOCAL #####
@@ -31,6 +263,46 @@ JOB_INTERVIEW_KEYWORDS = [
         "onboarding", "background", "strengths", "weaknesses", "tell me about yourself"
     ]
 MIN_KEYWORD_MATCHES = 1
+# Peso por palabra clave (1.0 si no aparece): las genéricas pesan menos que las propias de una entrevista
+JOB_INTERVIEW_KEYWORD_WEIGHTS = {
+    "interview": 2.0, "resume": 2.0, "cv": 2.0, "salary": 2.0, "candidate": 2.0,
+    "tell me about yourself": 3.0, "thank you for your time": 2.0, "strengths": 1.5, "weaknesses": 1.5,
+    "team": 0.5, "projects": 0.5, "future": 0.5, "questions": 0.5, "company": 0.5,
+}
+JOB_INTERVIEW_KEYWORDS_ES = {
+    "entrevista": 2.0, "currículum": 2.0, "curriculum": 2.0, "cv": 2.0, "salario": 2.0, "sueldo": 2.0,
+    "pretensiones salariales": 3.0, "candidato": 2.0, "candidata": 2.0, "cuéntame sobre ti": 3.0,
+    "háblame de ti": 3.0, "gracias por tu tiempo": 2.0, "puesto": 1.0, "experiencia": 1.0, "rol": 1.0,
+    "disponibilidad": 1.0, "expectativas": 1.0, "desafíos": 1.0, "fortalezas": 1.5, "debilidades": 1.5,
+    "oportunidad": 1.0, "equipo": 0.5, "proyectos": 0.5, "empresa": 0.5, "preguntas": 0.5,
+}
+# Formas flexionadas (plurales, gerundios) que cuentan como la palabra clave base, con su mismo peso y una sola
+# vez por palabra clave. Se listan una por una en lugar de aceptar cualquier sufijo: "interviewer", "teammate" o
+# "cvs" siguen sin contar.
+JOB_INTERVIEW_KEYWORD_FORMS = {
+    "interview": ("interviews", "interviewing", "interviewed"), "position": ("positions",),
+    "experience": ("experiences",), "resume": ("resumes",), "skills": ("skill",), "salary": ("salaries",),
+    "company": ("companies",), "role": ("roles",), "aspirations": ("aspiration",),
+    "expectations": ("expectation",), "challenges": ("challenge",), "team": ("teams",), "projects": ("project",),
+    "questions": ("question",), "opportunity": ("opportunities",), "candidate": ("candidates",),
+    "background": ("backgrounds",), "strengths": ("strength",), "weaknesses": ("weakness",),
+    "entrevista": ("entrevistas", "entrevistar", "entrevistando", "entrevistado", "entrevistada"),
+    "currículum": ("currículums", "currículo", "currículos"), "curriculum": ("curriculums",),
+    "salario": ("salarios",), "sueldo": ("sueldos",), "candidato": ("candidatos",), "candidata": ("candidatas",),
+    "puesto": ("puestos",), "experiencia": ("experiencias",), "rol": ("roles",), "expectativas": ("expectativa",),
+    "desafíos": ("desafío",), "fortalezas": ("fortaleza",), "debilidades": ("debilidad",),
+    "oportunidad": ("oportunidades",), "equipo": ("equipos",), "proyectos": ("proyecto",), "empresa": ("empresas",),
+    "preguntas": ("pregunta",),
+}
+# Todos los conjuntos se buscan en una sola pasada sobre el texto (ver KeywordAutomaton)
+JOB_INTERVIEW_KEYWORD_SETS = {
+    "en": {keyword: JOB_INTERVIEW_KEYWORD_WEIGHTS.get(keyword, 1.0) for keyword in JOB_INTERVIEW_KEYWORDS},
+    "es": JOB_INTERVIEW_KEYWORDS_ES,
+}
+# Puntaje ponderado mínimo (además de MIN_KEYWORD_MATCHES) para aceptar el archivo como entrevista. 0.0 conserva
+# el criterio original (basta una palabra clave, aunque sea de peso 0.5 como "team"); 1.0 rechaza los archivos que
+# solo tienen palabras genéricas
+MIN_INTERVIEW_SCORE = float(os.environ.get("MIN_INTERVIEW_SCORE", "0.0"))
 
 
 # app = Flask(__name__)
@@ -42,8 +314,1233 @@ EMBEDDING_MODEL = "text-embedding-large-exp-03-07"
 LLM_MODEL = "gemini-1.5-flash-002"
 REGION = "us-central1"
 PROMPT = "prompt.prompt"
+SEGMENT_PROMPT = "segment.prompt"
+# Plantilla DOCX del reporte con los marcadores {{title}}, {{heading}} y {{answer}} (cada uno dentro de un único
+# run); si el archivo no existe se genera una con los estilos por defecto de python-docx. El reporte se escribe
+# directo en la subida a GCS, por fragmentos de REPORT_UPLOAD_CHUNK_SIZE (múltiplo de 256 KB).
+REPORT_TEMPLATE = "report_template.docx"
+REPORT_TITLE = "Interview Analysis"
+REPORT_UPLOAD_CHUNK_SIZE = 1024 * 1024
+DOCX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+# Descarga por rangos (múltiplo de 256 KB) directo a un archivo temporal, sin un único objeto bytes
+DOWNLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+TEXT_READ_CHUNK_CHARS = 1024 * 1024
+# Las páginas de resumen de las notas de Gemini (antes del marcador "Transcript") no se entregan a las etapas
+# siguientes: se salta directo a la página del marcador por el índice del PDF o se ubica página por página
+PDF_SKIP_SUMMARY_PAGES = True
+# Banderas de PyMuPDF con que se sondean las páginas hasta la primera etiqueta de orador (0: sin ligaduras, espacios
+# especiales, recorte a la página ni CIDs; un 25% más barato que las de la extracción completa)
+PDF_PROBE_TEXT_FLAGS = 0
+# Conexiones HTTP keep-alive del cliente de Storage compartido entre invocaciones (y requests concurrentes)
+STORAGE_HTTP_POOL_SIZE = 32
+# Los clientes y modelos de una instancia caliente se recrean pasado este tiempo
+RESOURCE_MAX_AGE_SECONDS = 3600
+# Límites del lado cliente por recurso y por instancia (None = sin límite): requests y tokens estimados por minuto
+# (token bucket) y requests en vuelo. La concurrencia se adapta a los 429 observados: se reduce a la mitad al
+# recibir uno y vuelve a subir de a poco con las llamadas exitosas, así varias instancias que comparten la cuota
+# del proyecto convergen a lo que la cuota permite en lugar de reintentar todas a la vez.
+QUOTA_LIMITS = {
+    "embedding_model": {"requests_per_minute": 600, "tokens_per_minute": None, "max_concurrency": 16},
+    "generative_model": {"requests_per_minute": 200, "tokens_per_minute": 4_000_000, "max_concurrency": 16},
+    # google-cloud-storage ya reintenta los 429 y 5xx (DEFAULT_RETRY): aquí solo se limita la concurrencia
+    "storage": {"requests_per_minute": None, "tokens_per_minute": None, "max_concurrency": STORAGE_HTTP_POOL_SIZE,
+                "max_attempts": 1},
+}
+# Reintentos ante 429 y errores transitorios (5xx, timeouts, conexiones cortadas): backoff exponencial con jitter
+# completo, espera aleatoria entre 0 y min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2**intento)
+RETRY_MAX_ATTEMPTS = 6
+RETRY_BASE_SECONDS = 0.5
+RETRY_MAX_SECONDS = 32.0
+# Archivos procesados a la vez en modo batch (etapas de E/S: GCS y Vertex AI); no supera STORAGE_HTTP_POOL_SIZE
+BATCH_MAX_WORKERS = 8
+TRANSCRIPT_FILE_EXTENSIONS = (".pdf", ".txt")
+# Etapa CPU de los lotes (extracción del PDF, segmento, clasificación y parseo del diálogo) en un pool de procesos:
+# esas funciones retienen el GIL, así que los hilos no escalan con los núcleos. 0 la desactiva (todo en hilos);
+# sin la variable, default_cpu_stage_workers(): un proceso por núcleo si hay más de uno, acotado por la memoria
+CPU_STAGE_WORKERS = int(os.environ["CPU_STAGE_WORKERS"]) if "CPU_STAGE_WORKERS" in os.environ else None
+CPU_STAGE_MAX_WORKERS = 4
+# Memoria por proceso del pool (intérprete, módulo, PyMuPDF y un PDF grande con su texto) y la que se deja al
+# proceso principal; con 512 MB caben 2 procesos, con 256 MB ninguno
+CPU_STAGE_WORKER_MEMORY_BYTES = 128 * 1024 * 1024
+CPU_STAGE_RESERVED_MEMORY_BYTES = 256 * 1024 * 1024
+# "spawn": procesos nuevos que importan el módulo por nombre. "fork" copiaría un proceso con hilos en marcha
+# (lotes, clientes gRPC) y locks que pueden quedar tomados en el hijo
+CPU_STAGE_START_METHOD = os.environ.get("CPU_STAGE_START_METHOD", "spawn")
+# Caché por etapa (diálogo, embedding, análisis) indexada por el contenido del archivo y la configuración.
+# "sqlite": archivo local de la instancia; "gcs": prefijo STAGE_CACHE_PREFIX en STAGE_CACHE_BUCKET (compartido
+# entre instancias; usar un bucket sin triggers de Eventarc); "none": sin caché (por defecto: en Cloud Functions
+# /tmp es memoria y se suma a la de la instancia)
+STAGE_CACHE_BACKEND = os.environ.get("STAGE_CACHE_BACKEND", "none")
+STAGE_CACHE_PATH = os.environ.get("STAGE_CACHE_PATH", os.path.join(tempfile.gettempdir(), "transcription-stage-cache.sqlite3"))
+STAGE_CACHE_BUCKET = os.environ.get("STAGE_CACHE_BUCKET", "")
+STAGE_CACHE_PREFIX = "CACHE/"
+STAGE_CACHE_TTL_SECONDS = 7 * 24 * 3600
+# Tamaño máximo del caché; el SQLite local lo revisa en cada escritura, así que queda por debajo de la memoria de la
+# instancia (16 MiB de 256-512 MB)
+STAGE_CACHE_MAX_BYTES = int(os.environ.get("STAGE_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+# Subir este valor invalida todas las entradas cuando cambia la lógica de extracción o de parseo
+STAGE_CACHE_VERSION = 1
+# Registro de idempotencia por evento (bucket, objeto, generation): una re-entrega de Eventarc o una re-subida
+# con el mismo contenido no repite el pipeline, y una entrega duplicada concurrente espera el resultado de la
+# primera. "gcs": un objeto por evento bajo LEDGER_PREFIX en LEDGER_BUCKET, con precondiciones de generation
+# (compartido entre instancias; usar un bucket sin triggers de Eventarc); "sqlite": archivo local en /tmp, que no
+# sobrevive a un reinicio ni se comparte entre instancias (pruebas locales); "none": desactivado (por defecto,
+# como el caché: solo "gcs" deduplica entregas que llegan a instancias distintas)
+LEDGER_BACKEND = os.environ.get("LEDGER_BACKEND", "none")
+LEDGER_PATH = os.environ.get("LEDGER_PATH", os.path.join(tempfile.gettempdir(), "transcription-ledger.sqlite3"))
+LEDGER_BUCKET = os.environ.get("LEDGER_BUCKET", "")
+LEDGER_PREFIX = "LEDGER/"
+# Lease del procesamiento en curso: quien lo tiene lo renueva cada LEDGER_LEASE_SECONDS / 3; si la instancia
+# muere, otra entrega lo toma cuando vence
+LEDGER_LEASE_SECONDS = 120
+# Una entrega duplicada espera el resultado de la primera hasta LEDGER_WAIT_SECONDS (por debajo del timeout
+# de la función), consultando cada LEDGER_POLL_SECONDS; después falla y Eventarc la reintenta
+LEDGER_WAIT_SECONDS = 480
+LEDGER_POLL_SECONDS = 2.0
+LEDGER_TTL_SECONDS = 30 * 24 * 3600
+# Embeddings por fragmentos: el diálogo se divide en ventanas alineadas a turnos de hasta EMBEDDING_CHUNK_TOKENS
+# tokens (estimados a CHARS_PER_TOKEN caracteres por token, sin llamar al tokenizador) y se envía en lotes
+EMBEDDING_CHUNK_TOKENS = 2048
+CHARS_PER_TOKEN = 3
+# Textos por request de get_embeddings: los modelos Gemini embedding (como text-embedding-large-exp-03-07) aceptan
+# uno solo; text-embedding-005 y text-multilingual-embedding-002 hasta 250, con un máximo de 20k tokens por request
+EMBEDDING_BATCH_LIMITS = {"text-embedding-large-exp-03-07": 1, "gemini-embedding-001": 1}
+EMBEDDING_BATCH_SIZE = EMBEDDING_BATCH_LIMITS.get(EMBEDDING_MODEL, 16)
+EMBEDDING_BATCH_MAX_TOKENS = 20000
+# Requests de embeddings en vuelo a la vez por transcripción (cubre la latencia cuando el lote es de un texto)
+EMBEDDING_MAX_CONCURRENT_REQUESTS = 4
+EMBEDDINGS_PREFIX = "EMBEDDINGS/"
+# Clave de una transcripción en EMBEDDINGS/ y en el índice: "<candidato>-<12 hex del nombre del archivo>"
+TRANSCRIPT_VECTOR_ID_PATTERN = re.compile(r"(.+)-[0-9a-f]{12}")
+# Dimensiones pedidas al modelo (output_dimensionality); None = las del modelo (3072 en los Gemini embedding)
+EMBEDDING_OUTPUT_DIMENSIONALITY: Optional[int] = None
+# Tipo con que se guardan los vectores (EMBEDDINGS/*.npz y el archivo del índice): "float32", "float16"
+# o "int8" (con una escala float32 por vector); float16 pesa la mitad e int8 la cuarta parte que float32
+EMBEDDING_STORAGE_DTYPE = "float16"
+# Índice de similitud entre candidatos: una instantánea (matriz de vectores normalizados + ids) más un vector
+# pendiente por archivo procesado desde la última compactación. Por debajo de CANDIDATE_INDEX_IVF_MIN_CANDIDATES
+# las consultas son exactas (producto matriz-vector); por encima se usa un índice IVF (particiones k-means)
+CANDIDATE_INDEX_SNAPSHOT = "INDEX/candidates/"
+CANDIDATE_INDEX_PENDING_PREFIX = "INDEX/pending/"
+CANDIDATE_INDEX_REFRESH_SECONDS = 300
+# Máximo de resultados por consulta de similar_candidates ("k" se recorta a este valor)
+SIMILAR_CANDIDATES_MAX_K = 100
+CANDIDATE_INDEX_IVF_MIN_CANDIDATES = 20000
+CANDIDATE_INDEX_IVF_PROBES = 8
+# Configuración de generación de Gemini; forma parte de la clave del análisis en caché
+MAX_OUTPUT_TOKENS = 3500
+# La respuesta del análisis se pide con un esquema JSON: un campo de texto por pregunta, en este orden
+# (nombre del campo, título en el DOCX). Los campos que llegan mal formados o truncados se piden de nuevo,
+# solos, en una única llamada de reparación de hasta ANALYSIS_REPAIR_TOKENS_PER_FIELD tokens por campo.
+ANALYSIS_FIELDS = (
+    ("current_role", "1. What does the candidate currently do in their current role?"),
+    ("core_skills", "2. What are their core skills currently?"),
+    ("key_achievement", "3. What is their most challenging job or most significant career achievement to date?"),
+    ("staying_current", "4. How do they stay current in an ever-evolving industry?"),
+    ("reason_for_change", "5. Why are they looking for a new job?"),
+    ("current_compensation", "6. How much do they currently earn?"),
+    ("personality", "7. General comments about your personality."),
+    ("communication_skills", "8. Communication Skills"),
+)
+ANALYSIS_REPAIR_TOKENS_PER_FIELD = 600
+ANALYSIS_MISSING_ANSWER = "Not available: the model's answer to this question could not be parsed."
+# Presupuesto de tokens de entrada (estimados) para una sola llamada de análisis. Por encima, map-reduce: el diálogo
+# se divide en segmentos alineados a turnos que se resumen en paralelo (map) y las 8 preguntas se responden sobre
+# los resúmenes más las intervenciones textuales del candidato para la pregunta 8 (reduce; muestreadas si no caben)
+PROMPT_TOKEN_BUDGET = 24000
+MAP_SEGMENT_TOKENS = 6000
+MAP_MAX_OUTPUT_TOKENS = 800
+MAP_TEMPERATURE = 0.2
+MAP_MAX_CONCURRENT_REQUESTS = 8
+# Intentos por segmento cuando la respuesta llega bloqueada o vacía; si todos fallan el segmento se omite
+MAP_SEGMENT_ATTEMPTS = 2
+# Las etapas de una transcripción forman un grafo de dependencias: las ramas independientes (subir el TXT, los
+# embeddings, Gemini si el prompt no usa los embeddings) corren a la vez. False las ejecuta una tras otra.
+PIPELINE_CONCURRENT_STAGES = True
 # Inicializar Vertex AI
 
+# Reglas de limpieza compiladas una sola vez al cargar el módulo
+# Equivalente a r"\b\d{2}:\d{2}:\d{2}\b"; empezar por un dígito permite a `re` saltar directo a los candidatos
+TIMESTAMP_PATTERN = re.compile(r"\d(?<!\w\d)\d:\d\d:\d\d\b")
+FILLER_WORDS = [
+    "uh", "um", "you know", "okay", "sorry", "well", "so", "i mean", "let me see", "just", "like", "kind of", "perfect", "yeah",
+]
+# Equivalente a "|".join(r"\bfiller\b"); el lookahead descarta rápido las palabras que no empiezan como una muletilla
+FILLER_PATTERN = re.compile(
+    r"\b(?=[" + "".join(sorted({word[0] for word in FILLER_WORDS})) + r"])(?:"
+    + "|".join(re.escape(word) for word in FILLER_WORDS) + r")\b",
+    re.IGNORECASE,
+)
+WHITESPACE_RUN_PATTERN = re.compile(r"\s{2,}")
+# Regex for variations of "Transcript"
+TRANSCRIPT_MARKER_PATTERN = re.compile(r"(?:\)[ ]*)?- Transcript|-\s*Transcript|Transcript", re.IGNORECASE)
+# Patron: línea que comienza con un nombre (solo letras y espacios, sin números ni caracteres raros), seguido exactamente de ": "
+SPEAKER_LINE_PATTERN = re.compile(r"^([A-Za-zÁÉÍÓÚáéíóúÑñüÜ\s]+):\s+[A-Za-zÁÉÍÓÚáéíóúÑñüÜ]", re.MULTILINE)
+
+# Etiqueta de hablante al inicio de línea ("Nombre:" o "[00:00:00] Nombre:"). El largo acotado del nombre
+# evita el backtracking de [\w\s\-\.]+\s*: en líneas largas sin ':' (costo lineal en el tamaño del texto).
+SPEAKER_LABEL_MAX_CHARS = 60
+SPEAKER_LABEL_PATTERN = re.compile(
+    r"[ \t]*(?:\[\d{2}:\d{2}:\d{2}(?:\.\d+)?\][ \t]*)?([^\W\d_][\w \t\-.]{0,%d})[ \t]*:" % (SPEAKER_LABEL_MAX_CHARS - 1)
+)
+TIMESTAMP_LINE_PATTERN = re.compile(r"\s*\d{2}:\d{2}:\d{2}\s*")
+# Tokenizador de palabras en C: bytes UTF-8 con la puntuación ASCII mapeada a espacios (los bytes >= 128,
+# letras acentuadas incluidas, cuentan como parte de la palabra) y la puntuación Unicode habitual reemplazada antes
+WORD_BYTE_TABLE = bytes(byte if chr(byte).isalnum() or byte == ord("_") or byte >= 128 else ord(" ") for byte in range(256))
+UNICODE_PUNCTUATION = ["\u2019", "\u2018", "\u201c", "\u201d", "\u2013", "\u2014", "\u2026", "\xa0", "\xbf", "\xa1"]
+
+
+class TranscriptNormalizer:
+    """
+    Precompiled, single-pass normalizer for transcript text.
+
+    The timestamp, filler, whitespace and speaker rules are compiled once (at module load
+    for the shared `TRANSCRIPT_NORMALIZER` instance) and applied line by line while the
+    text streams in, instead of running one `re.sub` per rule over the whole document.
+    The output is identical to the original multi-pass cleaning:
+    timestamps -> blank lines -> candidate name -> fillers -> whitespace runs -> line filter.
+    """
+
+    def __init__(
+        self,
+        timestamp_pattern: re.Pattern = TIMESTAMP_PATTERN,
+        filler_pattern: re.Pattern = FILLER_PATTERN,
+        whitespace_pattern: re.Pattern = WHITESPACE_RUN_PATTERN,
+        transcript_pattern: re.Pattern = TRANSCRIPT_MARKER_PATTERN,
+        speaker_pattern: re.Pattern = SPEAKER_LINE_PATTERN,
+    ):
+        self.timestamp_pattern = timestamp_pattern
+        self.filler_pattern = filler_pattern
+        self.whitespace_pattern = whitespace_pattern
+        self.transcript_pattern = transcript_pattern
+        self.speaker_pattern = speaker_pattern
+
+    @staticmethod
+    @lru_cache(maxsize=64)
+    def name_pattern(candidate_name: str) -> re.Pattern:
+        """
+        Compiles (once per distinct name) the candidate-name rule. The name is used as a
+        regular expression, exactly like the original `re.sub(candidate_name, ...)`.
+        """
+        return re.compile(candidate_name, re.IGNORECASE)
+
+    @staticmethod
+    def iter_physical_lines(chunks: Union[str, Iterable[str]]) -> Iterator[str]:
+        """
+        Yields the '\\n'-separated lines of a text that may arrive in several chunks
+        (e.g. one chunk per PDF page). Lines split across chunk boundaries are re-joined.
+        """
+        if isinstance(chunks, str):
+            yield from chunks.split("\n")
+            return
+        pending = ""
+        for chunk in chunks:
+            if not chunk:
+                continue
+            parts = (pending + chunk).split("\n")
+            pending = parts.pop()
+            yield from parts
+        yield pending
+
+    def iter_candidate_lines(self, chunks: Union[str, Iterable[str]], candidate_name: str) -> Iterator[str]:
+        """
+        Streams the normalized lines spoken by `candidate_name` (lines starting with "name:").
+
+        Args:
+            chunks (Union[str, Iterable[str]]): Full text, or an iterable of consecutive text chunks.
+            candidate_name (str): Candidate's name to filter relevant lines.
+
+        Yields:
+            str: Each cleaned and stripped candidate line, in document order.
+        """
+        candidate_name_lower = candidate_name.lower()
+        line_prefix = candidate_name_lower + ":"
+        name_pattern = self.name_pattern(candidate_name)
+        filler_sub = self.filler_pattern.sub
+        collapse_sub = self.whitespace_pattern.sub
+
+        current: List[str] = []  # Pieces of the output line being assembled.
+        run_length = 0  # Length of the pending whitespace run.
+        run_char = ""  # The run itself, only relevant when it is a single character.
+        first_line = True
+
+        def finish_line() -> Iterator[str]:
+            for line in "".join(current).splitlines():
+                line = line.strip()
+                if line.lower().startswith(line_prefix):
+                    yield line
+            current.clear()
+
+        for line in self._iter_kept_lines(chunks):
+            line = name_pattern.sub(candidate_name_lower, line)
+            line = filler_sub("", line)
+            if first_line:
+                first_line = False
+            else:
+                # The '\n' that separated this line from the previous one joins the pending run.
+                run_length += 1
+                run_char = "\n"
+            core = line.strip()
+            if not core:
+                run_length += len(line)
+                if line:
+                    run_char = line
+                continue
+            leading = len(line) - len(line.lstrip())
+            if leading:
+                run_length += leading
+                run_char = line[0]
+            # Flush the whitespace run in front of this content: runs of two or more
+            # characters collapse into one space, single characters are kept as they are.
+            if run_length == 1 and run_char == "\n":
+                yield from finish_line()
+            elif run_length == 1:
+                current.append(run_char)
+            elif run_length:
+                current.append(" ")
+            current.append(collapse_sub(" ", core))
+            trailing = len(line) - leading - len(core)
+            run_length = trailing
+            run_char = line[-1] if trailing else ""
+
+        yield from finish_line()
+
+    def _iter_kept_lines(self, chunks: Union[str, Iterable[str]]) -> Iterator[str]:
+        """
+        Removes timestamps and drops the whitespace-only lines that `\\n\\s*\\n` would have
+        collapsed: every blank line except the first and the last line of the text.
+        """
+        timestamp_sub = self.timestamp_pattern.sub
+        previous = None
+        for index, raw_line in enumerate(self.iter_physical_lines(chunks)):
+            if previous is not None and (index == 1 or (previous and not previous.isspace())):
+                yield previous
+            previous = timestamp_sub("", raw_line) if ":" in raw_line else raw_line
+        if previous is not None:
+            yield previous
+
+    def normalize(self, chunks: Union[str, Iterable[str]], candidate_name: str) -> str:
+        """
+        Returns the cleaned candidate lines joined by newlines (see `iter_candidate_lines`).
+        """
+        return "\n".join(self.iter_candidate_lines(chunks, candidate_name))
+
+    def locate_dialogue(self, full_text_content: str) -> Tuple[str, Optional[re.Match]]:
+        """
+        Finds the "Transcript" marker that opens the dialogue.
+
+        Returns:
+            Tuple[str, Optional[re.Match]]: A status and the selected marker. The status is
+                "no_marker", "no_speaker", "before_speaker" (last marker before the first
+                speaker label) or "first_marker" (fallback when every marker comes later).
+        """
+        first_marker = self.transcript_pattern.search(full_text_content)
+        if not first_marker:
+            return "no_marker", None
+        speaker_match = self.speaker_pattern.search(full_text_content)
+        if not speaker_match:
+            return "no_speaker", None
+        last_valid_marker = None
+        # Markers are only scanned up to the first speaker label, not across the whole dialogue.
+        for last_valid_marker in self.transcript_pattern.finditer(full_text_content, 0, speaker_match.start()):
+            pass
+        if last_valid_marker:
+            return "before_speaker", last_valid_marker
+        return "first_marker", first_marker
+
+
+TRANSCRIPT_NORMALIZER = TranscriptNormalizer()
+
+
+def create_storage_client() -> "google.cloud.storage.Client":
+    """
+    Creates the Storage client with a keep-alive connection pool sized for concurrent requests.
+    """
+    client = lazy_import("google.cloud.storage").Client()
+    adapter = lazy_import("requests.adapters").HTTPAdapter(pool_connections=STORAGE_HTTP_POOL_SIZE, pool_maxsize=STORAGE_HTTP_POOL_SIZE)
+    client._http.mount("https://", adapter)
+    return client
+
+
+def read_prompt_template(prompt_path: str = PROMPT) -> str:
+    with open(prompt_path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+_vertexai_lock = threading.Lock()
+_vertexai_initialized = False
+
+
+def init_vertexai():
+    """
+    Initializes the Vertex AI SDK (PROJECT_ID, REGION) once per instance.
+    """
+    global _vertexai_initialized
+    with _vertexai_lock:
+        if not _vertexai_initialized:
+            lazy_import("vertexai").init(project=PROJECT_ID, location=REGION)
+            _vertexai_initialized = True
+
+
+def create_embedding_model() -> "vertexai.language_models.TextEmbeddingModel":
+    init_vertexai()
+    return lazy_import("vertexai.language_models").TextEmbeddingModel.from_pretrained(EMBEDDING_MODEL)
+
+
+def create_generative_model() -> "vertexai.generative_models.GenerativeModel":
+    init_vertexai()
+    return lazy_import("vertexai.generative_models").GenerativeModel(LLM_MODEL)
+
+
+def auth_errors() -> Tuple[type, ...]:
+    """
+    Authentication errors after which a pooled resource is rebuilt and the call retried once.
+    Only evaluated when an exception is being handled, so it adds nothing to the cold start.
+    """
+    auth_exceptions = lazy_import("google.auth.exceptions")
+    api_exceptions = lazy_import("google.api_core.exceptions")
+    return (auth_exceptions.RefreshError, api_exceptions.Unauthorized, api_exceptions.Unauthenticated)
+
+
+def retriable_errors() -> Tuple[type, ...]:
+    """
+    Errors worth retrying: throttling (429 / RESOURCE_EXHAUSTED), server-side 5xx, timeouts and dropped
+    connections. Like auth_errors(), only evaluated while an exception is being handled.
+    """
+    api_exceptions = lazy_import("google.api_core.exceptions")
+    requests_exceptions = lazy_import("requests.exceptions")
+    return (api_exceptions.TooManyRequests, api_exceptions.InternalServerError, api_exceptions.BadGateway,
+            api_exceptions.ServiceUnavailable, api_exceptions.GatewayTimeout, api_exceptions.DeadlineExceeded,
+            requests_exceptions.ConnectionError, requests_exceptions.Timeout, ConnectionError, TimeoutError)
+
+
+def is_throttling_error(error: Exception) -> bool:
+    # ResourceExhausted (gRPC de Vertex AI) es subclase de TooManyRequests (HTTP 429)
+    return isinstance(error, lazy_import("google.api_core.exceptions").TooManyRequests)
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled at `rate_per_minute`. It holds one second of tokens by default,
+    so a burst (e.g. a batch starting) is spread over the minute instead of spent at once.
+    `acquire(amount)` blocks until `amount` tokens are available and returns the seconds waited.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate_per_second = rate_per_minute / 60.0
+        self.capacity = capacity or max(1.0, self.rate_per_second)
+        self.available = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount: float = 1.0) -> float:
+        # Una petición mayor que la capacidad esperaría para siempre: se limita a un bucket lleno
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.available = min(self.capacity, self.available + (now - self.updated) * self.rate_per_second)
+                self.updated = now
+                if self.available >= amount:
+                    self.available -= amount
+                    return waited
+                wait = (amount - self.available) / self.rate_per_second
+            time.sleep(wait)
+            waited += wait
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Limit on calls in flight that adapts to throttling (AIMD): each throttled call halves the limit
+    (at most once per `decrease_interval` seconds, so a burst of 429s counts as one signal) and each
+    successful call raises it by 1/limit, i.e. about one more slot per round of calls.
+    """
+
+    def __init__(self, maximum: int, minimum: int = 1, decrease_interval: float = 1.0):
+        self.maximum = maximum
+        self.minimum = minimum
+        self.limit = float(maximum)
+        self.in_flight = 0
+        self.decrease_interval = decrease_interval
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+
+    def __enter__(self):
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def on_success(self):
+        with self._condition:
+            self.limit = min(float(self.maximum), self.limit + 1.0 / self.limit)
+            self._condition.notify_all()
+
+    def on_throttled(self):
+        with self._condition:
+            now = time.monotonic()
+            if now - self._last_decrease >= self.decrease_interval:
+                self.limit = max(float(self.minimum), self.limit / 2)
+                self._last_decrease = now
+
+
+class QuotaLimiter:
+    """
+    Client-side quota layer for one resource: request and token buckets, an adaptive concurrency
+    limit and retries with exponential backoff and full jitter on retriable errors. The backoff
+    sleep happens outside the concurrency slot, so waiting calls do not hold capacity.
+    """
+
+    def __init__(self, name: str, requests_per_minute: Optional[float] = None,
+                 tokens_per_minute: Optional[float] = None, max_concurrency: Optional[int] = None,
+                 max_attempts: int = RETRY_MAX_ATTEMPTS, base_seconds: float = RETRY_BASE_SECONDS,
+                 max_seconds: float = RETRY_MAX_SECONDS):
+        self.name = name
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.concurrency = AdaptiveConcurrencyLimiter(max_concurrency) if max_concurrency else None
+        self.max_attempts = max_attempts
+        self.base_seconds = base_seconds
+        self.max_seconds = max_seconds
+        self._stats_lock = threading.Lock()
+        self.stats = {"calls": 0, "retries": 0, "throttled": 0, "failed": 0, "rate_wait_seconds": 0.0}
+
+    def _count(self, stat: str, amount: float = 1):
+        with self._stats_lock:
+            self.stats[stat] += amount
+
+    def run(self, operation: Callable[[], object], tokens: int = 0):
+        """
+        Runs `operation()` within the limits, retrying retriable errors up to `max_attempts` times.
+        `tokens` is the estimated size of the request for the tokens-per-minute bucket.
+        """
+        self._count("calls")
+        for attempt in range(1, self.max_attempts + 1):
+            waited = self.requests.acquire() if self.requests else 0.0
+            if self.tokens and tokens:
+                waited += self.tokens.acquire(tokens)
+            if waited:
+                self._count("rate_wait_seconds", waited)
+                span_add("rate_wait_seconds", waited)
+            try:
+                with self.concurrency or contextlib.nullcontext():
+                    result = operation()
+            except Exception as e:
+                if not isinstance(e, retriable_errors()):
+                    raise
+                throttled = is_throttling_error(e)
+                if throttled:
+                    self._count("throttled")
+                    span_add("throttled")
+                    if self.concurrency:
+                        self.concurrency.on_throttled()
+                if attempt == self.max_attempts:
+                    self._count("failed")
+                    raise
+                delay = random.uniform(0, min(self.max_seconds, self.base_seconds * 2 ** (attempt - 1)))
+                print(f"Warning: '{self.name}' call failed ({e!r}); retry {attempt}/{self.max_attempts - 1} "
+                      f"in {delay:.2f} s.")
+                self._count("retries")
+                span_add("retries")
+                time.sleep(delay)
+            else:
+                if self.concurrency:
+                    self.concurrency.on_success()
+                return result
+
+
+def create_quota_limiters(limits: Dict[str, Dict] = QUOTA_LIMITS) -> Dict[str, QuotaLimiter]:
+    return {name: QuotaLimiter(name, **resource_limits) for name, resource_limits in limits.items()}
+
+
+class ResourcePool:
+    """
+    Lazily created clients, models and prompt template, shared by every invocation of a warm instance.
+
+    Each resource is built on first use by its factory and then reused, so the Storage client
+    (and its HTTP connection pool), both Vertex AI model handles and the prompt template are
+    created once per instance instead of once (or three times) per invocation. Creation is
+    guarded by a lock per resource, so concurrent requests never build the same resource twice.
+    Resources are rebuilt after `max_age_seconds`, when their credentials cannot be refreshed,
+    or when a call through `call()` fails with an authentication error. Calls go through the
+    resource's QuotaLimiter (QUOTA_LIMITS), shared by every thread of the instance.
+    """
+
+    def __init__(self, factories: Optional[Dict[str, Callable[[], object]]] = None,
+                 max_age_seconds: float = RESOURCE_MAX_AGE_SECONDS,
+                 limiters: Optional[Dict[str, QuotaLimiter]] = None):
+        self._factories: Dict[str, Callable[[], object]] = {
+            "storage": create_storage_client,
+            "embedding_model": create_embedding_model,
+            "generative_model": create_generative_model,
+            "prompt_template": read_prompt_template,
+            "segment_prompt_template": lambda: read_prompt_template(SEGMENT_PROMPT),
+            "report_template": lambda: ReportTemplate.load(REPORT_TEMPLATE),
+        }
+        if factories:
+            self._factories.update(factories)
+        self.max_age_seconds = max_age_seconds
+        self.limiters = create_quota_limiters() if limiters is None else limiters
+        self._resources: Dict[str, Tuple[object, float]] = {}
+        self._locks = {name: threading.Lock() for name in self._factories}
+        self._stats_lock = threading.Lock()
+        self.stats = {"created": 0, "reused": 0, "refreshed": 0}
+
+    def _count(self, stat: str):
+        with self._stats_lock:
+            self.stats[stat] += 1
+
+    def get(self, name: str):
+        """
+        Returns the resource `name` ("storage", "embedding_model", "generative_model", "prompt_template",
+        "segment_prompt_template" or "report_template"), creating it on first use.
+        """
+        entry = self._resources.get(name)
+        if entry is not None and self._is_healthy(entry):
+            self._count("reused")
+            return entry[0]
+        with self._locks[name]:
+            entry = self._resources.get(name)
+            if entry is None or not self._is_healthy(entry):
+                entry = (self._factories[name](), time.monotonic())
+                self._resources[name] = entry
+                self._count("created")
+            else:
+                self._count("reused")
+            return entry[0]
+
+    def _is_healthy(self, entry: Tuple[object, float]) -> bool:
+        resource_object, created_at = entry
+        if time.monotonic() - created_at > self.max_age_seconds:
+            return False
+        credentials = getattr(resource_object, "_credentials", None)
+        if credentials is not None and getattr(credentials, "expired", False):
+            # Refrescar el token conserva el cliente y sus conexiones abiertas
+            try:
+                credentials.refresh(lazy_import("google.auth.transport.requests").Request())
+            except Exception as e:
+                print(f"Warning: could not refresh expired credentials ({e}); rebuilding the client.")
+                return False
+        return True
+
+    def refresh(self, name: str):
+        """
+        Drops the resource `name` so the next `get()` builds a new one.
+        """
+        with self._locks[name]:
+            self._resources.pop(name, None)
+        self._count("refreshed")
+
+    def call(self, name: str, operation: Callable[[object], object], tokens: int = 0):
+        """
+        Runs `operation(resource)` through the resource's QuotaLimiter, if any (rate limits, adaptive
+        concurrency, retries with backoff); `tokens` is the estimated request size. On an authentication
+        error the resource is rebuilt and the operation retried once.
+        """
+        span_add(f"{name}_calls")
+        if tokens:
+            span_add("estimated_tokens", tokens)
+        limiter = self.limiters.get(name)
+        if limiter is None:
+            return self._call_once(name, operation)
+        return limiter.run(lambda: self._call_once(name, operation), tokens)
+
+    def _call_once(self, name: str, operation: Callable[[object], object]):
+        try:
+            return operation(self.get(name))
+        except auth_errors() as e:
+            print(f"Authentication error using '{name}' ({e}); refreshing it and retrying once.")
+            self.refresh(name)
+            return operation(self.get(name))
+
+
+RESOURCE_POOL = ResourcePool()
+
+
+def content_fingerprint(bucket_name: str, file_name: str) -> Optional[str]:
+    """
+    Hash of the object's bytes taken from its GCS metadata (MD5, or CRC32C plus size for composite
+    objects), so re-uploads of the same file get the same fingerprint without downloading it.
+    Returns None if the object does not exist.
+    """
+    blob = RESOURCE_POOL.call("storage", lambda client: client.bucket(bucket_name).get_blob(file_name))
+    if blob is None:
+        return None
+    if blob.md5_hash:
+        return f"md5:{blob.md5_hash}"
+    return f"crc32c:{blob.crc32c}:{blob.size}"
+
+
+class SQLiteCacheBackend:
+    """
+    Cache entries in a local SQLite file (one table, one row per entry). `total_bytes` tracks the
+    size of the stored values, so StageCache can check the limit on every put.
+    """
+
+    def __init__(self, path: str = STAGE_CACHE_PATH):
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value BLOB, size INTEGER,"
+                " created REAL, accessed REAL)"
+            )
+            self.total_bytes = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def get(self, key: str) -> Optional[Tuple[bytes, float]]:
+        with self._lock, self._connection:
+            row = self._connection.execute("SELECT value, created FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self._connection.execute("UPDATE entries SET accessed = ? WHERE key = ?", (time.time(), key))
+        return row
+
+    def put(self, key: str, value: bytes):
+        now = time.time()
+        with self._lock, self._connection:
+            previous = self._connection.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            self._connection.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value), now, now),
+            )
+            self.total_bytes += len(value) - (previous[0] if previous else 0)
+
+    def delete(self, key: str):
+        with self._lock, self._connection:
+            previous = self._connection.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            self._connection.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self.total_bytes -= previous[0] if previous else 0
+
+    def evict(self, ttl_seconds: float, max_bytes: int) -> int:
+        """
+        Deletes expired entries, then the least recently used ones until the total size fits in `max_bytes`.
+        """
+        with self._lock, self._connection:
+            deleted = self._connection.execute("DELETE FROM entries WHERE created < ?",
+                                               (time.time() - ttl_seconds,)).rowcount
+            total = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            for key, size in self._connection.execute("SELECT key, size FROM entries ORDER BY accessed").fetchall():
+                if total <= max_bytes:
+                    break
+                self._connection.execute("DELETE FROM entries WHERE key = ?", (key,))
+                total -= size
+                deleted += 1
+            self.total_bytes = total
+        return deleted
+
+
+class GCSCacheBackend:
+    """
+    Cache entries as objects under `prefix` in a GCS bucket, shared by every instance.
+    """
+
+    def __init__(self, bucket_name: str, prefix: str = STAGE_CACHE_PREFIX):
+        self.bucket_name = bucket_name
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[Tuple[bytes, float]]:
+        def download(client):
+            blob = client.bucket(self.bucket_name).blob(self.prefix + key)
+            try:
+                # La fecha de creación va dentro del valor (ver StageCache), sin pedir los metadatos del objeto
+                return blob.download_as_bytes(), 0.0
+            except lazy_import("google.api_core.exceptions").NotFound:
+                return None
+
+        return RESOURCE_POOL.call("storage", download)
+
+    def put(self, key: str, value: bytes):
+        RESOURCE_POOL.call("storage", lambda client: client.bucket(self.bucket_name).blob(self.prefix + key)
+                           .upload_from_string(value, content_type="application/json"))
+
+    def delete(self, key: str):
+        def delete_blob(client):
+            try:
+                client.bucket(self.bucket_name).blob(self.prefix + key).delete()
+            except lazy_import("google.api_core.exceptions").NotFound:
+                pass
+
+        RESOURCE_POOL.call("storage", delete_blob)
+
+    def evict(self, ttl_seconds: float, max_bytes: int) -> int:
+        """
+        Deletes objects older than `ttl_seconds`, then the oldest ones until the prefix fits in `max_bytes`.
+        """
+        blobs = RESOURCE_POOL.call("storage", lambda client: list(client.list_blobs(self.bucket_name, prefix=self.prefix)))
+        blobs.sort(key=lambda blob: blob.time_created.timestamp() if blob.time_created else 0.0)
+        total = sum(blob.size or 0 for blob in blobs)
+        expires_before = time.time() - ttl_seconds
+        deleted = 0
+        for blob in blobs:
+            created = blob.time_created.timestamp() if blob.time_created else 0.0
+            if created >= expires_before and total <= max_bytes:
+                break
+            self.delete(blob.name[len(self.prefix):])
+            total -= blob.size or 0
+            deleted += 1
+        return deleted
+
+
+class StageCache:
+    """
+    Content-addressed cache of pipeline stage results (extracted dialogue, embedding, parsed analysis).
+
+    Keys are hashes of the stage name plus everything its result depends on: the fingerprint of the
+    input file and, per stage, the keyword rules, the embedding model, or the prompt template hash and
+    the generation config. Values are JSON with their creation time, so the TTL works the same on every
+    backend. Eviction (TTL, then least recently used down to `max_bytes`) runs every `evict_every` puts,
+    and after any put that takes a backend with a `total_bytes` count (the local one) above `max_bytes`.
+    """
+
+    def __init__(self, backend, ttl_seconds: float = STAGE_CACHE_TTL_SECONDS,
+                 max_bytes: int = STAGE_CACHE_MAX_BYTES, evict_every: int = 50):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.evict_every = evict_every
+        self._lock = threading.Lock()
+        self._puts_since_eviction = 0
+        self.stats: Dict[str, Dict[str, int]] = {}
+
+    @staticmethod
+    def key(stage: str, *parts) -> str:
+        material = json.dumps([STAGE_CACHE_VERSION, stage, *parts], sort_keys=True, default=str)
+        digest = hashlib.sha256(material.encode("utf-8")).hexdigest()
+        return f"{stage}/{digest}"
+
+    def _count(self, stage: str, stat: str):
+        with self._lock:
+            stage_stats = self.stats.setdefault(stage, {"hits": 0, "misses": 0, "puts": 0, "errors": 0})
+            stage_stats[stat] += 1
+
+    def get(self, key: str):
+        """
+        Returns the cached value for `key`, or None on a miss. Backend errors count as misses.
+        """
+        stage = key.split("/", 1)[0]
+        try:
+            entry = self.backend.get(key)
+            if entry is not None:
+                envelope = json.loads(entry[0])
+                if time.time() - envelope["created"] <= self.ttl_seconds:
+                    self._count(stage, "hits")
+                    return envelope["value"]
+                self.backend.delete(key)
+        except Exception as e:
+            print(f"Warning: stage cache read failed for '{key}': {e}")
+            self._count(stage, "errors")
+        self._count(stage, "misses")
+        return None
+
+    def put(self, key: str, value):
+        stage = key.split("/", 1)[0]
+        try:
+            self.backend.put(key, json.dumps({"created": time.time(), "value": value}).encode("utf-8"))
+            self._count(stage, "puts")
+        except Exception as e:
+            print(f"Warning: stage cache write failed for '{key}': {e}")
+            self._count(stage, "errors")
+            return
+        with self._lock:
+            self._puts_since_eviction += 1
+            run_eviction = (self._puts_since_eviction >= self.evict_every
+                            or getattr(self.backend, "total_bytes", 0) > self.max_bytes)
+            if run_eviction:
+                self._puts_since_eviction = 0
+        if run_eviction:
+            try:
+                self.backend.evict(self.ttl_seconds, self.max_bytes)
+            except Exception as e:
+                print(f"Warning: stage cache eviction failed: {e}")
+
+
+def create_stage_cache() -> Optional[StageCache]:
+    """
+    Builds the cache selected by STAGE_CACHE_BACKEND ("sqlite", "gcs" or "none").
+    """
+    if STAGE_CACHE_BACKEND == "none":
+        return None
+    if STAGE_CACHE_BACKEND == "gcs":
+        if STAGE_CACHE_BUCKET:
+            return StageCache(GCSCacheBackend(STAGE_CACHE_BUCKET))
+        print("Warning: STAGE_CACHE_BACKEND=gcs needs STAGE_CACHE_BUCKET; stage cache disabled.")
+        return None
+    return StageCache(SQLiteCacheBackend())
+
+
+_stage_cache_lock = threading.Lock()
+_stage_cache: Optional[StageCache] = None
+_stage_cache_created = False
+
+
+def get_stage_cache() -> Optional[StageCache]:
+    """
+    The instance-wide stage cache, created on first use (None when caching is disabled).
+    """
+    global _stage_cache, _stage_cache_created
+    with _stage_cache_lock:
+        if not _stage_cache_created:
+            _stage_cache = create_stage_cache()
+            _stage_cache_created = True
+    return _stage_cache
+
+
+class SQLiteLedgerBackend:
+    """
+    Ledger records in a local SQLite file. Acquiring runs in an IMMEDIATE transaction, so processes that
+    share the file (and threads of one process) see a single owner per key.
+    """
+
+    def __init__(self, path: str = LEDGER_PATH):
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS ledger (key TEXT PRIMARY KEY, state TEXT, owner TEXT, expires REAL,"
+                " result TEXT, updated REAL)"
+            )
+
+    @staticmethod
+    def _record(row) -> Optional[Dict]:
+        if row is None:
+            return None
+        return {"state": row[0], "owner": row[1], "expires": row[2], "result": json.loads(row[3]) if row[3] else None}
+
+    def get(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            return self._record(self._connection.execute(
+                "SELECT state, owner, expires, result FROM ledger WHERE key = ?", (key,)).fetchone())
+
+    def acquire(self, key: str, owner: str, lease_seconds: float) -> Tuple[str, Optional[Dict]]:
+        now = time.time()
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                record = self._record(self._connection.execute(
+                    "SELECT state, owner, expires, result FROM ledger WHERE key = ?", (key,)).fetchone())
+                if record is not None and (record["state"] == "completed" or record["expires"] > now):
+                    self._connection.execute("COMMIT")
+                    return record["state"], record
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO ledger (key, state, owner, expires, result, updated)"
+                    " VALUES (?, 'in_progress', ?, ?, NULL, ?)", (key, owner, now + lease_seconds, now))
+                self._connection.execute("COMMIT")
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+        return "acquired", record
+
+    def renew(self, key: str, owner: str, lease_seconds: float) -> bool:
+        with self._lock:
+            return self._connection.execute(
+                "UPDATE ledger SET expires = ?, updated = ? WHERE key = ? AND owner = ? AND state = 'in_progress'",
+                (time.time() + lease_seconds, time.time(), key, owner)).rowcount == 1
+
+    def complete(self, key: str, owner: str, result: Dict):
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO ledger (key, state, owner, expires, result, updated)"
+                " VALUES (?, 'completed', ?, 0, ?, ?)", (key, owner, json.dumps(result), time.time()))
+
+    def release(self, key: str, owner: str):
+        with self._lock:
+            self._connection.execute("DELETE FROM ledger WHERE key = ? AND owner = ? AND state = 'in_progress'",
+                                     (key, owner))
+
+    def evict(self, ttl_seconds: float) -> int:
+        with self._lock:
+            return self._connection.execute("DELETE FROM ledger WHERE state = 'completed' AND updated < ?",
+                                            (time.time() - ttl_seconds,)).rowcount
+
+
+class GCSLedgerBackend:
+    """
+    Ledger records as JSON objects under `prefix` in a GCS bucket, shared by every instance. Ownership uses
+    generation preconditions: the first delivery creates the record with ifGenerationMatch=0, and an
+    expired lease is taken over (or renewed) only if the record has not changed since it was read.
+    """
+
+    def __init__(self, bucket_name: str, prefix: str = LEDGER_PREFIX):
+        self.bucket_name = bucket_name
+        self.prefix = prefix
+        self._generations: Dict[Tuple[str, str], int] = {}
+
+    def _blob(self, client, key: str):
+        return client.bucket(self.bucket_name).blob(self.prefix + hashlib.sha256(key.encode("utf-8")).hexdigest())
+
+    def _read(self, client, key: str) -> Optional[Tuple[Dict, int]]:
+        blob = self._blob(client, key)
+        try:
+            record = json.loads(blob.download_as_bytes())
+        except lazy_import("google.api_core.exceptions").NotFound:
+            return None
+        return record, int(blob.generation)
+
+    def _write(self, client, key: str, record: Dict, if_generation_match: Optional[int]) -> Optional[int]:
+        blob = self._blob(client, key)
+        try:
+            blob.upload_from_string(json.dumps(dict(record, key=key)), content_type="application/json",
+                                    if_generation_match=if_generation_match)
+        except lazy_import("google.api_core.exceptions").PreconditionFailed:
+            return None
+        return int(blob.generation)
+
+    def get(self, key: str) -> Optional[Dict]:
+        current = RESOURCE_POOL.call("storage", lambda client: self._read(client, key))
+        return current[0] if current else None
+
+    def acquire(self, key: str, owner: str, lease_seconds: float) -> Tuple[str, Optional[Dict]]:
+        def attempt(client):
+            expected, previous = 0, None
+            for _ in range(5):
+                record = {"state": "in_progress", "owner": owner, "expires": time.time() + lease_seconds, "result": None}
+                generation = self._write(client, key, record, expected)
+                if generation is not None:
+                    self._generations[(key, owner)] = generation
+                    return "acquired", previous
+                current = self._read(client, key)
+                if current is None:
+                    expected, previous = 0, None
+                    continue
+                previous, expected = current
+                if previous["state"] == "completed" or previous["expires"] > time.time():
+                    return previous["state"], previous
+            raise RuntimeError(f"Ledger record '{key}' keeps changing")
+
+        return RESOURCE_POOL.call("storage", attempt)
+
+    def renew(self, key: str, owner: str, lease_seconds: float) -> bool:
+        expected = self._generations.get((key, owner))
+        record = {"state": "in_progress", "owner": owner, "expires": time.time() + lease_seconds, "result": None}
+        generation = RESOURCE_POOL.call("storage", lambda client: self._write(client, key, record, expected))
+        if generation is None:
+            return False
+        self._generations[(key, owner)] = generation
+        return True
+
+    def complete(self, key: str, owner: str, result: Dict):
+        self._generations.pop((key, owner), None)
+        record = {"state": "completed", "owner": owner, "expires": 0, "result": result}
+        RESOURCE_POOL.call("storage", lambda client: self._write(client, key, record, None))
+
+    def release(self, key: str, owner: str):
+        expected = self._generations.pop((key, owner), None)
+
+        def delete(client):
+            try:
+                self._blob(client, key).delete(if_generation_match=expected)
+            except (lazy_import("google.api_core.exceptions").NotFound,
+                    lazy_import("google.api_core.exceptions").PreconditionFailed):
+                pass
+
+        RESOURCE_POOL.call("storage", delete)
+
+    def evict(self, ttl_seconds: float) -> int:
+        """
+        Deletes records older than `ttl_seconds` (an Object Lifecycle rule on the prefix does the same).
+        """
+        expires_before = time.time() - ttl_seconds
+        blobs = RESOURCE_POOL.call("storage", lambda client: list(client.list_blobs(self.bucket_name, prefix=self.prefix)))
+        old = [blob for blob in blobs if blob.time_created and blob.time_created.timestamp() < expires_before]
+        for blob in old:
+            RESOURCE_POOL.call("storage", lambda client: client.bucket(self.bucket_name).blob(blob.name).delete())
+        return len(old)
+
+
+class DuplicateInProgress(Exception):
+    """
+    Raised when another delivery of the same event still holds the lease after LEDGER_WAIT_SECONDS.
+    """
+
+
+class IdempotencyLedger:
+    """
+    At-most-once execution of storage events on top of at-least-once delivery.
+
+    Records are keyed by (bucket, object name, generation); a new generation with the same content (the
+    Apps Script uploading the same transcript again) is matched through a second record keyed by the
+    content fingerprint. The first delivery takes a lease and renews it while it runs; duplicates
+    return the stored result, or wait for the owner and then return it. A failed run releases the lease
+    so the retry can start at once. Backend errors never block processing: the event just runs.
+    """
+
+    def __init__(self, backend, lease_seconds: float = LEDGER_LEASE_SECONDS,
+                 wait_seconds: float = LEDGER_WAIT_SECONDS, poll_seconds: float = LEDGER_POLL_SECONDS,
+                 ttl_seconds: float = LEDGER_TTL_SECONDS, evict_every: int = 100):
+        self.backend = backend
+        self.lease_seconds = lease_seconds
+        self.wait_seconds = wait_seconds
+        self.poll_seconds = poll_seconds
+        self.ttl_seconds = ttl_seconds
+        self.evict_every = evict_every
+        hostname, suffix = socket.gethostname(), uuid.uuid4().hex[:8]
+        self.owner = f"{hostname}-{os.getpid()}-{suffix}"
+        self._lock = threading.Lock()
+        self._completions = 0
+        self.stats = {"executed": 0, "duplicates_completed": 0, "duplicates_waited": 0, "duplicates_same_content": 0,
+                      "lease_takeovers": 0, "lease_lost": 0, "failed": 0, "errors": 0}
+
+    @staticmethod
+    def event_key(bucket_name: str, file_name: str, generation) -> str:
+        return f"event/{bucket_name}/{file_name}#{generation}"
+
+    @staticmethod
+    def content_key(bucket_name: str, file_name: str, fingerprint: str) -> str:
+        return f"content/{bucket_name}/{file_name}#{fingerprint}"
+
+    def _count(self, stat: str):
+        with self._lock:
+            self.stats[stat] += 1
+
+    def _heartbeat(self, key: str, owner: str, stop: threading.Event):
+        while not stop.wait(self.lease_seconds / 3):
+            try:
+                if not self.backend.renew(key, owner, self.lease_seconds):
+                    print(f"Warning: ledger lease on '{key}' was taken over by another delivery.")
+                    self._count("lease_lost")
+                    return
+            except Exception as e:
+                print(f"Warning: ledger lease renewal failed for '{key}': {e}")
+
+    def _acquire(self, key: str, owner: str) -> Tuple[str, Optional[Dict]]:
+        deadline = time.monotonic() + self.wait_seconds
+        waited = False
+        while True:
+            state, record = self.backend.acquire(key, owner, self.lease_seconds)
+            if state == "acquired" and record is not None and waited:
+                # La primera entrega falló (liberó el lease) o murió: esta la reemplaza
+                return "acquired", None
+            if state != "in_progress":
+                return ("waited" if waited and state == "completed" else state), record
+            if time.monotonic() >= deadline:
+                raise DuplicateInProgress(f"'{key}' is still being processed by {record['owner']}")
+            waited = True
+            time.sleep(self.poll_seconds)
+
+    def run(self, bucket_name: str, file_name: str, generation, fingerprint: Optional[str],
+            operation: Callable[[], Dict]) -> Dict:
+        """
+        Runs `operation` once per (bucket, object, generation). Duplicates get the first result with
+        "duplicate" set to "completed", "waited" or "same_content".
+        """
+        key = self.event_key(bucket_name, file_name, generation)
+        owner = f"{self.owner}-{threading.get_ident()}"
+        try:
+            state, record = self._acquire(key, owner)
+        except DuplicateInProgress:
+            raise
+        except Exception as e:
+            print(f"Warning: idempotency ledger unavailable ({e}); processing '{file_name}' without it.")
+            self._count("errors")
+            return operation()
+        if state != "acquired":
+            self._count("duplicates_waited" if state == "waited" else "duplicates_completed")
+            print(f"Duplicate delivery of '{key}' ({state}); reusing the first result.")
+            return dict(record["result"], duplicate=state)
+        if record is not None:
+            self._count("lease_takeovers")
+
+        content_key = self.content_key(bucket_name, file_name, fingerprint) if fingerprint else None
+        if content_key:
+            try:
+                same_content = self.backend.get(content_key)
+            except Exception as e:
+                print(f"Warning: ledger read failed for '{content_key}': {e}")
+                same_content = None
+            if same_content is not None and same_content["state"] == "completed":
+                self._count("duplicates_same_content")
+                print(f"'{key}' has the same content as an already processed upload; reusing its result.")
+                self._finish(key, owner, same_content["result"], None)
+                return dict(same_content["result"], duplicate="same_content")
+
+        stop = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(key, owner, stop), daemon=True)
+        heartbeat.start()
+        try:
+            result = operation()
+        except BaseException:
+            self._count("failed")
+            try:
+                self.backend.release(key, owner)
+            except Exception as e:
+                print(f"Warning: ledger release failed for '{key}': {e}")
+            raise
+        finally:
+            stop.set()
+        self._count("executed")
+        self._finish(key, owner, result, content_key)
+        return result
+
+    def _finish(self, key: str, owner: str, result: Dict, content_key: Optional[str]):
+        try:
+            self.backend.complete(key, owner, result)
+            if content_key:
+                self.backend.complete(content_key, owner, result)
+        except Exception as e:
+            print(f"Warning: ledger write failed for '{key}': {e}")
+            self._count("errors")
+            return
+        with self._lock:
+            self._completions += 1
+            run_eviction = self._completions % self.evict_every == 0
+        if run_eviction:
+            try:
+                self.backend.evict(self.ttl_seconds)
+            except Exception as e:
+                print(f"Warning: ledger eviction failed: {e}")
+
+
+def create_ledger() -> Optional[IdempotencyLedger]:
+    """
+    Builds the ledger selected by LEDGER_BACKEND ("sqlite", "gcs" or "none").
+    """
+    if LEDGER_BACKEND == "none":
+        return None
+    if LEDGER_BACKEND == "gcs":
+        if LEDGER_BUCKET:
+            return IdempotencyLedger(GCSLedgerBackend(LEDGER_BUCKET))
+        print("Warning: LEDGER_BACKEND=gcs needs LEDGER_BUCKET; idempotency ledger disabled.")
+        return None
+    return IdempotencyLedger(SQLiteLedgerBackend())
+
+
+_ledger_lock = threading.Lock()
+_ledger: Optional[IdempotencyLedger] = None
+_ledger_created = False
+
+
+def get_ledger() -> Optional[IdempotencyLedger]:
+    """
+    The instance-wide idempotency ledger, created on first use (None when disabled).
+    """
+    global _ledger, _ledger_created
+    with _ledger_lock:
+        if not _ledger_created:
+            _ledger = create_ledger()
+            _ledger_created = True
+    return _ledger
+
+
+def event_identity(bucket_name: str, file_name: str, data: Dict) -> Tuple[Optional[str], Optional[str]]:
+    """
+    (generation, content fingerprint) of the object in a storage event, from the event payload when it
+    carries them, otherwise from the object's metadata. (None, None) if the object no longer exists.
+    """
+    if data.get("generation") and (data.get("md5Hash") or data.get("crc32c")):
+        fingerprint = f"md5:{data['md5Hash']}" if data.get("md5Hash") else f"crc32c:{data['crc32c']}:{data.get('size')}"
+        return str(data["generation"]), fingerprint
+    blob = RESOURCE_POOL.call("storage", lambda client: client.bucket(bucket_name).get_blob(file_name))
+    if blob is None:
+        return None, None
+    fingerprint = f"md5:{blob.md5_hash}" if blob.md5_hash else f"crc32c:{blob.crc32c}:{blob.size}"
+    return str(blob.generation), fingerprint
+
 
 def limpiar_transcripcion_texto(pdf_bytes: bytes, candidate_name: str) -> str:
     """
@@ -57,43 +1554,27 @@ def limpiar_transcripcion_texto(pdf_bytes: bytes, candidate_name: str) -> str:
         str: Cleaned and processed text.
     """
     try:
-        # Leer el PDF y extraer el texto completo
-        pdf_doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-        full_text = "\n".join(page.get_text() for page in pdf_doc)
+        # Leer el PDF página por página; el normalizador recibe los trozos sin unirlos
+        pdf_doc = lazy_import("fitz").open(stream=pdf_bytes, filetype="pdf")
+        page_texts = []
+        for page_num, page in enumerate(pdf_doc):
+            if page_num:
+                page_texts.append("\n")
+            page_texts.append(page.get_text())
     except Exception as e:
         print(f"Error al leer PDF: {e}")
-        full_text = pdf_bytes.decode("utf-8", errors="ignore")
-
-    # El resto sigue igual que en tu versión original:
-    full_text = re.sub(r"\b\d{2}:\d{2}:\d{2}\b", "", full_text)
-    full_text = re.sub(r"\n\s*\n", "\n", full_text)
-
-    candidate_name_lower = candidate_name.lower()
-    full_text = re.sub(candidate_name, candidate_name_lower, full_text, flags=re.IGNORECASE)
-
-    fillers = [
-        r"\buh\b", r"\bum\b", r"\byou know\b", r"\bokay\b", r"\bsorry\b", r"\bwell\b",
-        r"\bso\b", r"\bi mean\b", r"\blet me see\b", r"\bjust\b", r"\blike\b", r"\bkind of\b", r"\bperfect\b", r"\byeah\b",
-    ]
-    full_text = re.sub("|".join(fillers), "", full_text, flags=re.IGNORECASE)
-    full_text = re.sub(r"\s{2,}", " ", full_text)
-
-    lines = full_text.splitlines()
-    filtered_lines = [
-        line.strip()
-        for line in lines
-        if line.strip().lower().startswith(candidate_name_lower + ":")
-    ]
+        page_texts = [pdf_bytes.decode("utf-8", errors="ignore")]
 
-    return "\n".join(filtered_lines)
+    # Timestamps, líneas vacías, nombre, muletillas y espacios en una sola pasada por línea
+    return TRANSCRIPT_NORMALIZER.normalize(page_texts, candidate_name)
 
 def extract_reclut(file_name: str) -> str:
     """
-    Extracts the recruiter/codename that comes after the last '-' and before '.pdf'.
+    Extracts the recruiter/codename that comes after the last '-' and before '.pdf' (or '.txt').
     """
     file_name = file_name.lower()
     
-    final_match = re.search(r'-([^-]+)\.pdf$', file_name)
+    final_match = re.search(r'-([^-]+)\.(?:pdf|txt)$', file_name)
     if final_match:
         reclut = final_match.group(1).strip()
         return reclut
@@ -131,35 +1612,205 @@ def extract_candidate_name(file_name: str) -> str:
     # No hay nombre entre paréntesis → nombre no disponible
     
 
-def download_and_extract_text(bucket_name: str, file_name: str) -> Optional[str]:
+def current_rss_bytes() -> int:
     """
-    Downloads a file from GCS and extracts its text content.
-    It handles both PDF and plain text files.
+    Returns the current resident set size of this process, in bytes.
+    Falls back to the process-wide peak (ru_maxrss) where /proc is not available.
     """
     try:
-        print(f"Attempting to download and process '{file_name}' from bucket '{bucket_name}'...")
-        client = storage.Client()
-        bucket = client.get_bucket(bucket_name)
-        blob = bucket.blob(file_name)
-
-        file_bytes = blob.download_as_bytes()
-        print(f"File '{file_name}' downloaded successfully ({len(file_bytes)} bytes).")
-
-        if file_name.lower().endswith('.pdf'):
-            print("PDF file detected. Extracting text with PyMuPDF...")
-            text_content = ""
-            with fitz.open(stream=file_bytes, filetype="pdf") as pdf_doc:
-                for page_num, page in enumerate(pdf_doc):
-                    text_content += page.get_text()
-            print("Text extracted from PDF successfully.")
-            return text_content
+        with open("/proc/self/statm", "r") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def spool_blob_to_tempfile(bucket_name: str, file_name: str) -> str:
+    """
+    Downloads a GCS object to a temporary file using ranged reads of DOWNLOAD_CHUNK_SIZE bytes,
+    so the object is never held as a single bytes value. The caller must delete the file.
+    """
+    suffix = os.path.splitext(file_name)[1]
+    with TRACER.span("download", file_name=file_name) as span, \
+            tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as spool_file:
+        def download(client):
+            spool_file.seek(0)
+            spool_file.truncate()
+            blob = client.bucket(bucket_name).blob(file_name, chunk_size=DOWNLOAD_CHUNK_SIZE)
+            blob.download_to_file(spool_file)
+
+        try:
+            RESOURCE_POOL.call("storage", download)
+        except Exception:
+            spool_file.close()
+            os.remove(spool_file.name)
+            raise
+        span.set(bytes_in=spool_file.tell())
+    return spool_file.name
+
+
+def pdf_text_flags() -> int:
+    fitz = lazy_import("fitz")
+    # Las banderas por defecto de get_text("text") (misma salida), sin imágenes, vectores, estructura ni bboxes
+    # exactos: PyMuPDF solo arma los caracteres y sus líneas
+    skipped = ("TEXT_PRESERVE_IMAGES", "TEXT_COLLECT_VECTORS", "TEXT_COLLECT_STRUCTURE", "TEXT_ACCURATE_BBOXES")
+    flags = fitz.TEXTFLAGS_TEXT
+    for name in skipped:
+        flags &= ~getattr(fitz, name, 0)
+    return flags
+
+
+def transcript_outline_page(pdf_doc) -> Optional[int]:
+    """
+    0-based page of the last outline (bookmark) entry whose title is a "Transcript" marker, or None.
+    """
+    pages = [page - 1 for _, title, page in pdf_doc.get_toc(simple=True)
+             if page >= 1 and TRANSCRIPT_MARKER_PATTERN.search(title)]
+    return pages[-1] if pages else None
+
+
+def dialogue_line_start(text: str) -> int:
+    """
+    Offset of the start of the line that holds the marker picked by locate_dialogue() when it comes
+    before the first speaker label (the text can be cut there without changing the dialogue), else 0.
+    """
+    status, marker = TRANSCRIPT_NORMALIZER.locate_dialogue(text)
+    if status != "before_speaker":
+        return 0
+    return text.rfind("\n", 0, marker.start()) + 1
+
+
+def iter_pdf_pages(pdf_doc, stats: Dict) -> Iterator[str]:
+    """
+    Yields the text of the PDF pages from the line of the "Transcript" marker that opens the dialogue,
+    counting the pages left out in stats["skipped_pages"].
+
+    With a "Transcript" outline entry whose page holds the marker, the pages before it are never read.
+    Otherwise pages are only probed (PDF_PROBE_TEXT_FLAGS) up to the first speaker label, and full
+    extraction starts at the page of the marker TranscriptNormalizer.locate_dialogue() picks in the
+    probes. The cut is checked on the fully extracted text, so the dialogue segment is the same as with
+    every page; the probes only differ in ligatures, whitespace, glyphs without Unicode and text outside
+    the page. When every marker comes after the first speaker label, all pages are extracted again in
+    full. A PDF without speaker labels has an empty dialogue segment whatever the flags, so its probes are
+    yielded as they are.
+    """
+    flags = pdf_text_flags()
+    if not PDF_SKIP_SUMMARY_PAGES:
+        for page in pdf_doc:
+            yield page.get_text(flags=flags)
+        return
+
+    start = transcript_outline_page(pdf_doc)
+    if start is not None and start < pdf_doc.page_count:
+        first_text = pdf_doc[start].get_text(flags=flags)
+        # Un índice que no apunta al marcador no se usa
+        if TRANSCRIPT_MARKER_PATTERN.search(first_text):
+            stats["skipped_pages"] = start
+            yield first_text[dialogue_line_start(first_text):]
+            for later in range(start + 1, pdf_doc.page_count):
+                yield pdf_doc[later].get_text(flags=flags)
+            return
+
+    probes: List[str] = []
+    last_marker_page = None
+    for number, page in enumerate(pdf_doc):
+        probe = page.get_text(flags=PDF_PROBE_TEXT_FLAGS)
+        probes.append(probe)
+        # Hasta la primera etiqueta de orador no se sabe qué marcador abre el diálogo
+        if not TRANSCRIPT_NORMALIZER.speaker_pattern.search(probe):
+            # Todo marcador contiene "transcript": una búsqueda en C en vez de la expresión regular
+            if "transcript" in probe.lower():
+                last_marker_page = number
+            continue
+        # Los marcadores anteriores a last_marker_page no pueden ser el último antes del primer orador
+        first = last_marker_page if last_marker_page is not None else number
+        status, marker = TRANSCRIPT_NORMALIZER.locate_dialogue("".join(probes[first:]))
+        if status == "before_speaker":
+            offset = 0
+            for first, probe_text in enumerate(probes[first:], start=first):
+                offset += len(probe_text)
+                if offset > marker.start():
+                    break
         else:
-            print("Text file detected. Decoding as UTF-8.")
-            return file_bytes.decode('utf-8')
+            first = 0
+        texts = [pdf_doc[kept].get_text(flags=flags) for kept in range(first, number + 1)]
+        cut = dialogue_line_start("".join(texts)) if status == "before_speaker" else 0
+        for skipped, text in enumerate(texts):
+            if cut < len(text):
+                break
+            cut -= len(text)
+        stats["skipped_pages"] = first + skipped
+        yield texts[skipped][cut:]
+        yield from texts[skipped + 1:]
+        for later in range(number + 1, pdf_doc.page_count):
+            yield pdf_doc[later].get_text(flags=flags)
+        return
+    yield from probes
+
+
+def iter_document_text(local_path: str, file_name: str, stats: Optional[Dict] = None) -> Iterator[str]:
+    """
+    Yields the text of a local PDF one page at a time (from the transcript page, see iter_pdf_pages),
+    or of a text file in chunks of TEXT_READ_CHUNK_CHARS characters, so consumers can process it lazily.
+
+    Args:
+        local_path (str): Path of the spooled file.
+        file_name (str): Original object name; its extension selects PDF or UTF-8 text.
+        stats (Optional[Dict]): If given, it is filled with file_bytes, pages, skipped_pages, text_chars,
+            max_chunk_chars, peak_rss_bytes and memory_bound_bytes. The bound covers the spooled
+            file (held in memory when /tmp is a tmpfs, as in Cloud Functions) plus one chunk of
+            text at 4 bytes per character; PyMuPDF's per-page working set comes on top.
+    """
+    if stats is None:
+        stats = {}
+    stats.update({
+        "file_bytes": os.path.getsize(local_path),
+        "pages": 0,
+        "skipped_pages": 0,
+        "text_chars": 0,
+        "max_chunk_chars": 0,
+        "peak_rss_bytes": current_rss_bytes(),
+    })
+
+    def track(chunk: str) -> str:
+        stats["pages"] += 1
+        stats["text_chars"] += len(chunk)
+        stats["max_chunk_chars"] = max(stats["max_chunk_chars"], len(chunk))
+        stats["peak_rss_bytes"] = max(stats["peak_rss_bytes"], current_rss_bytes())
+        stats["memory_bound_bytes"] = stats["file_bytes"] + 4 * stats["max_chunk_chars"]
+        return chunk
+
+    if file_name.lower().endswith('.pdf'):
+        with lazy_import("fitz").open(local_path) as pdf_doc:
+            for text in iter_pdf_pages(pdf_doc, stats):
+                yield track(text)
+    else:
+        # newline="" conserva los saltos de línea tal cual, igual que bytes.decode('utf-8')
+        with open(local_path, "r", encoding="utf-8", newline="") as text_file:
+            while True:
+                chunk = text_file.read(TEXT_READ_CHUNK_CHARS)
+                if not chunk:
+                    break
+                yield track(chunk)
+
+
+def extract_document_text(local_path: str, file_name: str) -> str:
+    """
+    Extracts the whole text of a spooled PDF or text file (see `iter_document_text`).
+    """
+    stats = {}
+    with TRACER.span("extract", format=os.path.splitext(file_name)[1].lstrip(".").lower()) as span:
+        # Las páginas se unen una sola vez al final (sin concatenación cuadrática)
+        text_content = "".join(iter_document_text(local_path, file_name, stats))
+        span.set(bytes_in=stats["file_bytes"], pages=stats["pages"], skipped_pages=stats["skipped_pages"],
+                 chars_out=len(text_content), peak_rss_bytes=stats["peak_rss_bytes"])
+    print(
+        f"Text extracted from '{file_name}': {stats['file_bytes']} bytes, {stats['pages']} pages/chunks "
+        f"({stats['skipped_pages']} summary pages skipped), "
+        f"{stats['text_chars']} chars, peak RSS {stats['peak_rss_bytes'] / 2**20:.1f} MiB "
+        f"(extraction bound {stats.get('memory_bound_bytes', stats['file_bytes']) / 2**20:.1f} MiB + PyMuPDF page)."
+    )
+    return text_content
 
-    except Exception as e:
-        print(f"Error during file download or text extraction for '{file_name}': {e}")
-        return None
 
 def clean_and_extract_dialogue_segment(full_text_content: str) -> str:
     """
@@ -170,57 +1821,170 @@ def clean_and_extract_dialogue_segment(full_text_content: str) -> str:
         print("Warning: Full text content is empty. Cannot extract dialogue segment.")
         return ""
 
-    # Regex for variations of "Transcript"
-    transcript_pattern = re.compile(r"(?:\)[ ]*)?- Transcript|-\s*Transcript|Transcript", re.IGNORECASE)
-    # Patron: línea que comienza con un nombre (solo letras y espacios, sin números ni caracteres raros), seguido exactamente de ": "
-    speaker_pattern = re.compile(r"^([A-Za-zÁÉÍÓÚáéíóúÑñüÜ\s]+):\s+[A-Za-zÁÉÍÓÚáéíóúÑñüÜ]", re.MULTILINE)
-
-    # Find all "Transcript" markers
-    transcript_matches = list(transcript_pattern.finditer(full_text_content))
-    if not transcript_matches:
+    with TRACER.span("segment", chars_in=len(full_text_content)) as span:
+        status, marker = TRANSCRIPT_NORMALIZER.locate_dialogue(full_text_content)
+        span.set(status=status, chars_out=len(full_text_content) - marker.end() if marker else 0)
+    if status == "no_marker":
         print("Warning: 'Transcript' keyword not found in the document. Dialogue segment will be empty.")
         return ""
-
-    # Find the first speaker label after all transcript markers
-    speaker_match = speaker_pattern.search(full_text_content)
-    if not speaker_match:
+    if status == "no_speaker":
         print("Warning: No speaker label found after 'Transcript'. Dialogue segment will be empty.")
         return ""
 
-    # Find the last transcript marker before the first speaker label
-    last_valid_marker = None
-    for m in transcript_matches:
-        if m.end() <= speaker_match.start():
-            last_valid_marker = m
-        else:
-            break
-
-    if last_valid_marker:
-        dialogue_start_index = last_valid_marker.end()
-        print(f"Found 'Transcript' marker at index {last_valid_marker.start()}. Extracting subsequent text.")
-        return full_text_content[dialogue_start_index:].strip()
+    if status == "before_speaker":
+        print(f"Found 'Transcript' marker at index {marker.start()}. Extracting subsequent text.")
     else:
         # If all markers are after the first speaker, fallback to the first marker
-        dialogue_start_index = transcript_matches[0].end()
-        print(f"Using first 'Transcript' marker at index {transcript_matches[0].start()} (no marker before first speaker).")
-        return full_text_content[dialogue_start_index:].strip()
+        print(f"Using first 'Transcript' marker at index {marker.start()} (no marker before first speaker).")
+    return full_text_content[marker.end():].strip()
+
+class KeywordAutomaton:
+    """
+    Aho-Corasick automaton over word tokens for several weighted keyword sets.
 
-def is_job_interview(text: str, keywords: List[str], min_keyword_matches: int) -> bool:
+    The text is lowercased and split into words once, and the automaton walks the word
+    sequence a single time, reporting every keyword and phrase ("tell me about yourself")
+    of every set. Matching is word-aligned, so "cv" does not match inside other words and
+    "role" does not match inside "control". `keyword_forms` maps a keyword to inflected forms
+    ("interviews") that are counted as that keyword.
+    """
+
+    def __init__(self, keyword_sets: Dict[str, Dict[str, float]],
+                 keyword_forms: Optional[Dict[str, Iterable[str]]] = None):
+        self.keyword_sets = keyword_sets
+        self._goto: List[Dict[bytes, int]] = [{}]
+        self._fail: List[int] = [0]
+        # Por estado: (conjunto, palabra clave) que terminan ahí, incluidas las heredadas por los enlaces de fallo
+        self._outputs: List[List[Tuple[str, str]]] = [[]]
+        for set_name, keywords in keyword_sets.items():
+            for keyword in keywords:
+                for form in (keyword, *(keyword_forms or {}).get(keyword, ())):
+                    self._add(set_name, form, keyword)
+        self._build_fail_links()
+        self._vocabulary = {word for transitions in self._goto for word in transitions}
+
+    @staticmethod
+    def tokenize(text: str) -> List[bytes]:
+        """
+        Lowercases the text and splits it into words (as UTF-8 bytes) without a Python-level loop.
+        """
+        text = text.lower()
+        if not text.isascii():
+            for punctuation in UNICODE_PUNCTUATION:
+                if punctuation in text:
+                    text = text.replace(punctuation, " ")
+        return text.encode("utf-8").translate(WORD_BYTE_TABLE).split()
+
+    def _add(self, set_name: str, form: str, keyword: str):
+        state = 0
+        for word in self.tokenize(form):
+            next_state = self._goto[state].get(word)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][word] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._outputs.append([])
+            state = next_state
+        if state and (set_name, keyword) not in self._outputs[state]:
+            self._outputs[state].append((set_name, keyword))
+
+    def _build_fail_links(self):
+        queue = list(self._goto[0].values())
+        for state in queue:
+            for word, next_state in self._goto[state].items():
+                fail_state = self._fail[state]
+                while fail_state and word not in self._goto[fail_state]:
+                    fail_state = self._fail[fail_state]
+                self._fail[next_state] = self._goto[fail_state].get(word, 0)
+                self._outputs[next_state] = self._outputs[next_state] + self._outputs[self._fail[next_state]]
+                queue.append(next_state)
+
+    def count(self, text: str) -> Dict[str, Dict[str, int]]:
+        """
+        Returns the number of occurrences of each keyword found, per keyword set.
+        """
+        goto, fail, outputs, vocabulary = self._goto, self._fail, self._outputs, self._vocabulary
+        counts: Dict[str, Dict[str, int]] = {set_name: {} for set_name in self.keyword_sets}
+        state = 0
+        for word in self.tokenize(text):
+            if word not in vocabulary:
+                # A word outside every keyword breaks any phrase in progress.
+                state = 0
+                continue
+            while state and word not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(word, 0)
+            for set_name, keyword in outputs[state]:
+                set_counts = counts[set_name]
+                set_counts[keyword] = set_counts.get(keyword, 0) + 1
+        return counts
+
+    def score(self, text: str) -> Dict[str, Dict]:
+        """
+        Scores the text against every keyword set in one scan.
+
+        Returns:
+            Dict[str, Dict]: Per set, {"counts": {keyword: occurrences}, "distinct": int,
+                "score": float}, where score is the sum of the weights of the distinct keywords found.
+        """
+        results = {}
+        for set_name, set_counts in self.count(text).items():
+            weights = self.keyword_sets[set_name]
+            results[set_name] = {
+                "counts": set_counts,
+                "distinct": len(set_counts),
+                "score": float(sum(weights[keyword] for keyword in set_counts)),
+            }
+        return results
+
+
+@lru_cache(maxsize=8)
+def _build_keyword_automaton(frozen_keyword_sets: Tuple, frozen_keyword_forms: Tuple) -> KeywordAutomaton:
+    return KeywordAutomaton({set_name: dict(keywords) for set_name, keywords in frozen_keyword_sets},
+                            dict(frozen_keyword_forms))
+
+
+def get_keyword_automaton(keywords: Union[List[str], Dict[str, Dict[str, float]]],
+                          keyword_forms: Optional[Dict[str, Iterable[str]]] = None) -> KeywordAutomaton:
+    """
+    Returns the (cached) automaton for a keyword configuration: either a plain list of
+    keywords (a single set, weight 1.0) or named weighted sets like JOB_INTERVIEW_KEYWORD_SETS,
+    plus the inflected forms of each keyword (JOB_INTERVIEW_KEYWORD_FORMS).
+    """
+    if not isinstance(keywords, dict):
+        keywords = {"default": {keyword: 1.0 for keyword in keywords}}
+    frozen = tuple((set_name, tuple(weights.items())) for set_name, weights in keywords.items())
+    frozen_forms = tuple((keyword, tuple(forms)) for keyword, forms in (keyword_forms or {}).items())
+    return _build_keyword_automaton(frozen, frozen_forms)
+
+
+def is_job_interview(
+    text: str,
+    keywords: Union[List[str], Dict[str, Dict[str, float]]],
+    min_keyword_matches: int,
+    min_score: float = MIN_INTERVIEW_SCORE,
+    keyword_forms: Optional[Dict[str, Iterable[str]]] = JOB_INTERVIEW_KEYWORD_FORMS,
+) -> bool:
     """
     Determines if the text corresponds to a job interview based on keywords.
+    The text is accepted when, for at least one keyword set (e.g. English or Spanish), it contains
+    `min_keyword_matches` distinct whole-word keywords and their weights add up to `min_score`.
+    Unlike the original substring check, keywords only match whole words: "interviewer" does not
+    count as "interview", nor "control" as "role". The inflected forms in `keyword_forms`
+    ("interviews", "entrevistas") count as their keyword.
     """
     if not text:
         print("Warning: Text for keyword check is empty.")
         return False
-    text_lower = text.lower()
-    found_keywords_set = set()
-    for keyword in keywords:
-        if keyword.lower() in text_lower:
-            found_keywords_set.add(keyword.lower())
-    num_found = len(found_keywords_set)
-    print(f"Keyword check: Found {num_found} distinct keywords out of {min_keyword_matches} required.")
-    if num_found >= min_keyword_matches:
-        print(f"Matching keywords: {list(found_keywords_set)}")
+    with TRACER.span("classify", chars_in=len(text)) as span:
+        results = get_keyword_automaton(keywords, keyword_forms).score(text)
+        set_name, best = max(results.items(), key=lambda item: item[1]["score"])
+        span.set(keyword_set=set_name, score=float(best["score"]), distinct_keywords=best["distinct"])
+    print(f"Keyword check: Found {best['distinct']} distinct keywords out of {min_keyword_matches} required "
+          f"(set '{set_name}', weighted score {best['score']:.1f} of {min_score} required).")
+    if best["distinct"] >= min_keyword_matches and best["score"] >= min_score:
+        print(f"Matching keywords: {best['counts']}")
         return True
     return False
 
@@ -255,7 +2019,14 @@ def comparar_cadenas_por_palabras(cadena_entrada: str, cadena_referencia: str, u
     # split() sin argumentos maneja múltiples espacios y espacios al inicio/final.
     palabras_entrada = set(cadena_entrada.lower().split())
     palabras_referencia = set(cadena_referencia.lower().split())
+    return comparar_conjuntos_de_palabras(palabras_entrada, palabras_referencia, umbral_mayoria)
 
+
+def comparar_conjuntos_de_palabras(palabras_entrada: set, palabras_referencia: set, umbral_mayoria: float = 0.5) -> bool:
+    """
+    Igual que `comparar_cadenas_por_palabras`, pero recibe los conjuntos de palabras ya normalizados
+    (minúsculas, palabras únicas), para no reconstruirlos cuando la referencia se compara muchas veces.
+    """
     # Manejar casos de cadenas completamente vacías o solo con espacios
     if not palabras_entrada and not palabras_referencia:
         # Ambas cadenas están vacías (o solo contenían espacios)
@@ -295,12 +2066,67 @@ def comparar_cadenas_por_palabras(cadena_entrada: str, cadena_referencia: str, u
 
 
 
+class SpeakerRegistry:
+    """
+    Resolves each distinct speaker label of a dialogue to its display name, only once.
+
+    The primary speaker (e.g. the interviewer) keeps the exact casing provided by the caller,
+    the first other speaker keeps the name as it appears in the transcript, and any further
+    speaker is labelled with its detected name.
+    """
+
+    def __init__(self, primary_speaker_known_name: str):
+        self.primary_speaker_known_name = primary_speaker_known_name
+        self._primary_words = set(primary_speaker_known_name.lower().split())
+        # To store the name of the other main speaker (e.g., interviewee) once identified.
+        self.other_speaker_identified_name: Optional[str] = None
+        self._display_names: Dict[str, str] = {}
+
+    def resolve(self, detected_speaker_actual_name: str) -> str:
+        display_name = self._display_names.get(detected_speaker_actual_name)
+        if display_name is None:
+            display_name = self._resolve_new_label(detected_speaker_actual_name)
+            self._display_names[detected_speaker_actual_name] = display_name
+        return display_name
+
+    def _resolve_new_label(self, detected_speaker_actual_name: str) -> str:
+        if comparar_conjuntos_de_palabras(set(detected_speaker_actual_name.lower().split()), self._primary_words):
+            return self.primary_speaker_known_name
+        if self.other_speaker_identified_name is None:
+            self.other_speaker_identified_name = detected_speaker_actual_name
+            log_event("DEBUG", "Identified other primary speaker", speaker=detected_speaker_actual_name)
+            return detected_speaker_actual_name
+        if detected_speaker_actual_name.lower() == self.other_speaker_identified_name.lower():
+            return self.other_speaker_identified_name
+        # A third participant or a variation of a name: keep the detected name.
+        log_event("DEBUG", "New speaker detected", speaker=detected_speaker_actual_name,
+                  primary=self.primary_speaker_known_name, other=self.other_speaker_identified_name)
+        return detected_speaker_actual_name
+
+
+def split_speaker_label(line: str) -> Tuple[Optional[str], str]:
+    """
+    Splits a dialogue line into its speaker name and text, e.g.
+    "[00:00:05] Jean Massucatto: Hello" -> ("Jean Massucatto", "Hello").
+    Returns (None, line) when the line does not start with a speaker label.
+    """
+    label_match = SPEAKER_LABEL_PATTERN.match(line)
+    if not label_match:
+        return None, line
+    return label_match.group(1).rstrip(), line[label_match.end():]
+
+
 def parse_interview_dialogue(dialogue_text: str, primary_speaker_known_name: str) -> List[Dict[str, str]]:
     """
     Parses the dialogue text and extracts conversation turns, using actual speaker names.
     The primary_speaker_known_name is one of the main speakers (e.g., interviewer).
     Other speaker names are derived from the transcript.
 
+    The text is read in a single pass, line by line: a line that starts with a speaker label
+    ("Name:" or "[timestamp] Name:") opens a new turn and the following lines are appended to it.
+    Labels are matched only at line start with a bounded length, so parsing is linear in the
+    size of the text, and each distinct label is resolved to a display name once (SpeakerRegistry).
+
     Args:
         dialogue_text (str): The clean text containing only the dialogue.
         primary_speaker_known_name (str): The known name of one of the primary speakers.
@@ -315,80 +2141,28 @@ def parse_interview_dialogue(dialogue_text: str, primary_speaker_known_name: str
         return []
 
     parsed_dialogue = []
-    primary_speaker_known_name_lower = primary_speaker_known_name.lower().strip()
-    
-    # To store the name of the other main speaker (e.g., interviewee) once identified.
-    # We store the first encountered name and its casing for consistency.
-    other_speaker_identified_name = None 
-
-    # Regex to split by speaker labels (e.g., "Name:", "[timestamp] Name:")
-    # This pattern captures the speaker label itself.
-    speaker_pattern = re.compile(
-        r'((?:\[\d{2}:\d{2}:\d{2}(?:\.\d+)?\]\s*)?[\w\s\-\.]+\s*:\s*)',
-        re.IGNORECASE
-    )
-    
-    # Split the dialogue by speaker labels. `parts` will contain text before the first label,
-    # then label1, then text1, then label2, then text2, and so on.
-    parts = speaker_pattern.split(dialogue_text)
-    
-    current_speaker_label_from_parts = None # Stores the full speaker label like "massucatto jean:"
-    
-    # Iterate through the parts. Start from index 1 because parts[0] is any text
-    # before the first speaker label (or empty if dialogue starts with a label).
-    for i in range(1, len(parts)):
-        part_content = parts[i].strip()
-        if not part_content: # Skip empty parts that might result from the split
-            continue
-
-        # Check if the current part is a speaker label based on the regex
-        is_speaker_label = bool(speaker_pattern.fullmatch(part_content))
-
-        if is_speaker_label:
-            current_speaker_label_from_parts = part_content
-        elif current_speaker_label_from_parts: 
-            # This part is dialogue text belonging to the previously identified current_speaker_label_from_parts
-            dialogue_segment = part_content
-            
-            # Extract the actual name from the label (stripping timestamps).
-            # e.g., from "massucatto jean:" or "[00:00:00] massucatto jean:"
-            # Group 1 of this match will be the name part.
-            speaker_name_match = re.match(
-                r'(?:\[.*?\]\s*)?([\w\s\-\.]+)\s*:', # Capture group 1 is the name
-                current_speaker_label_from_parts,
-                re.IGNORECASE
-            )
-            if speaker_name_match:
-                detected_speaker_actual_name = speaker_name_match.group(1).strip()
-                speaker_display_name = "" # This will be the name used in the output
-            
-                # Check if the detected speaker is the primary known speaker
-                speaker_name_match_ = comparar_cadenas_por_palabras(
-                current_speaker_label_from_parts, primary_speaker_known_name)
-                if speaker_name_match_:#detected_speaker_actual_name.lower() == primary_speaker_known_name_lower:
-                    speaker_display_name = primary_speaker_known_name # Use the exact casing provided for the primary speaker
-                else:
-                    # This is another speaker
-                    if other_speaker_identified_name is None:
-                        # First time we encounter this "other" speaker. Store their name as identified.
-                        other_speaker_identified_name = detected_speaker_actual_name
-                        speaker_display_name = detected_speaker_actual_name # Use the name as it appeared in the transcript
-                        print(f"Identified other primary speaker as: {other_speaker_identified_name}")
-                    elif detected_speaker_actual_name.lower() == other_speaker_identified_name.lower():
-                        # This is the same "other" speaker identified earlier. Use the consistently stored name.
-                        speaker_display_name = other_speaker_identified_name
-                    else:
-                        # This is a new speaker name, different from the primary and the first "other" speaker.
-                        # This could be a third participant or a variation. We'll label them with their actual detected name.
-                        print(f"Note: New speaker detected '{detected_speaker_actual_name}', different from primary ('{primary_speaker_known_name}') and first other ('{other_speaker_identified_name}').")
-                        speaker_display_name = detected_speaker_actual_name 
-
-                if speaker_display_name and dialogue_segment: # Ensure we have a name and text
-                    parsed_dialogue.append({"speaker": speaker_display_name, "text": dialogue_segment})
-            
-            # Reset current_speaker_label_from_parts as its text has been processed.
-            # The next speaker label will set this again.
-            current_speaker_label_from_parts = None 
+    speakers = SpeakerRegistry(primary_speaker_known_name)
+    current_speaker = None
+    current_text: List[str] = []
+
+    def close_turn():
+        if current_speaker:
+            dialogue_segment = "\n".join(current_text).strip()
+            if dialogue_segment:  # Ensure we have text
+                parsed_dialogue.append({"speaker": current_speaker, "text": dialogue_segment})
+
+    with TRACER.span("parse", chars_in=len(dialogue_text)) as span:
+        for line in dialogue_text.splitlines():
+            detected_speaker_actual_name, text = split_speaker_label(line)
+            if detected_speaker_actual_name:
+                close_turn()
+                current_speaker = speakers.resolve(detected_speaker_actual_name)
+                current_text = [text]
+            elif current_speaker and not TIMESTAMP_LINE_PATTERN.fullmatch(line):
+                # Continuation of the current turn (bare "00:01:23" timestamp lines are skipped).
+                current_text.append(line)
+        close_turn()
+        span.set(turns=len(parsed_dialogue), speakers=len({turn["speaker"] for turn in parsed_dialogue}))
 
     if not parsed_dialogue and dialogue_text:
          print("Warning: Dialogue parsing did not yield any structured turns, though dialogue text was present.")
@@ -396,24 +2170,898 @@ def parse_interview_dialogue(dialogue_text: str, primary_speaker_known_name: str
         print(f"Dialogue parsed into {len(parsed_dialogue)} turns.")
     return parsed_dialogue
 
+def estimate_tokens(text: str) -> int:
+    """
+    Conservative token estimate (CHARS_PER_TOKEN characters per token), without a tokenizer call.
+    """
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def split_long_turn(speaker: str, text: str, max_tokens: int) -> List[str]:
+    """
+    Splits a turn that does not fit in one chunk on word boundaries; every piece keeps the speaker label.
+    """
+    prefix = f"{speaker}: "
+    max_chars = max(1, (max_tokens - 1) * CHARS_PER_TOKEN - len(prefix))
+    pieces, words, length = [], [], 0
+    for word in text.split():
+        while len(word) > max_chars:
+            # Una "palabra" más larga que un fragmento completo (texto sin espacios) se corta sin más
+            if words:
+                pieces.append(prefix + " ".join(words))
+                words, length = [], 0
+            pieces.append(prefix + word[:max_chars])
+            word = word[max_chars:]
+        if words and length + 1 + len(word) > max_chars:
+            pieces.append(prefix + " ".join(words))
+            words, length = [], 0
+        length += len(word) + (1 if words else 0)
+        words.append(word)
+    if words:
+        pieces.append(prefix + " ".join(words))
+    return pieces
+
+
+def chunk_dialogue(dialogue: List[Dict[str, str]], max_tokens: int = EMBEDDING_CHUNK_TOKENS) -> List[Dict]:
+    """
+    Packs consecutive turns ("Speaker: text" lines) into windows of at most `max_tokens` estimated tokens.
+    Windows never cut a turn unless the turn alone is larger than a window.
+
+    Returns:
+        List[Dict]: {"text", "first_turn", "last_turn", "tokens"} per chunk, in dialogue order.
+    """
+    chunks: List[Dict] = []
+    lines: List[str] = []
+    tokens = 0
+    first_turn = 0
+
+    def flush(last_turn: int):
+        if lines:
+            chunks.append({"text": "\n".join(lines), "first_turn": first_turn, "last_turn": last_turn, "tokens": tokens})
+
+    for index, turn in enumerate(dialogue):
+        line = f"{turn['speaker']}: {turn['text']}"
+        line_tokens = estimate_tokens(line)
+        if line_tokens > max_tokens:
+            flush(index - 1)
+            lines, tokens = [], 0
+            for piece in split_long_turn(turn["speaker"], turn["text"], max_tokens):
+                chunks.append({"text": piece, "first_turn": index, "last_turn": index, "tokens": estimate_tokens(piece)})
+            continue
+        if lines and tokens + line_tokens + 1 > max_tokens:
+            flush(index - 1)
+            lines, tokens = [], 0
+        if not lines:
+            first_turn = index
+        lines.append(line)
+        tokens += line_tokens + (1 if len(lines) > 1 else 0)
+    flush(len(dialogue) - 1)
+    return chunks
+
+
+def embed_texts(texts: List[str], batch_size: int = EMBEDDING_BATCH_SIZE,
+                batch_max_tokens: int = EMBEDDING_BATCH_MAX_TOKENS,
+                max_concurrent_requests: int = EMBEDDING_MAX_CONCURRENT_REQUESTS) -> List[List[float]]:
+    """
+    Embeds `texts` with as few get_embeddings requests as the model allows: up to `batch_size` texts and
+    `batch_max_tokens` estimated tokens per request, with up to `max_concurrent_requests` requests in flight.
+    Inputs are never truncated silently (auto_truncate=False). Vectors keep the order of `texts`.
+    """
+    batches: List[List[str]] = []
+    batch_tokens = 0
+    for text in texts:
+        text_tokens = estimate_tokens(text)
+        if not batches or len(batches[-1]) >= batch_size or batch_tokens + text_tokens > batch_max_tokens:
+            batches.append([])
+            batch_tokens = 0
+        batches[-1].append(text)
+        batch_tokens += text_tokens
+
+    options = {"auto_truncate": False}
+    if EMBEDDING_OUTPUT_DIMENSIONALITY:
+        options["output_dimensionality"] = EMBEDDING_OUTPUT_DIMENSIONALITY
+
+    def embed_batch(batch: List[str]) -> List[List[float]]:
+        embeddings = RESOURCE_POOL.call(
+            "embedding_model", lambda embedding_model: embedding_model.get_embeddings(batch, **options),
+            tokens=sum(estimate_tokens(text) for text in batch),
+        )
+        return [list(embedding.values) for embedding in embeddings]
+
+    with TRACER.span("embed", texts=len(texts), requests=len(batches)):
+        if len(batches) <= 1 or max_concurrent_requests <= 1:
+            results = [embed_batch(batch) for batch in batches]
+        else:
+            with ThreadPoolExecutor(max_workers=min(max_concurrent_requests, len(batches)),
+                                    thread_name_prefix="embed") as executor:
+                results = list(executor.map(in_current_context(embed_batch), batches))
+    return [vector for batch_vectors in results for vector in batch_vectors]
+
+
+def pool_document_vector(vectors: List[List[float]], weights: List[float]) -> "numpy.ndarray":
+    """
+    Document vector: mean of the chunk vectors weighted by chunk size, L2-normalized.
+    """
+    np = lazy_import("numpy")
+    matrix = np.asarray(vectors, dtype=np.float32)
+    pooled = np.average(matrix, axis=0, weights=np.asarray(weights, dtype=np.float32))
+    norm = np.linalg.norm(pooled)
+    return pooled / norm if norm else pooled
+
+
+def transcript_vector_id(candidate_name: str, file_name: str) -> str:
+    """
+    Key of one transcript in EMBEDDINGS/ and in the similarity index: the candidate name plus a hash of
+    the source object name, so two transcripts never share an object (every file without a "(Name)"
+    falls back to "nonamecandidate", and a candidate can have several interviews).
+    """
+    digest = hashlib.sha256(file_name.encode("utf-8")).hexdigest()[:12]
+    return f"{candidate_name}-{digest}"
+
+
+def candidate_of(vector_id: str) -> str:
+    """
+    Candidate name of an index id (ids written before transcript_vector_id() are the name itself).
+    """
+    match = TRANSCRIPT_VECTOR_ID_PATTERN.fullmatch(vector_id)
+    return match.group(1) if match else vector_id
+
+
+def persist_embeddings(vector_id: str, chunks: List[Dict], vectors: List[List[float]],
+                       document_vector: "numpy.ndarray") -> str:
+    """
+    Writes the chunk vectors (as EMBEDDING_STORAGE_DTYPE, see `quantize_vectors`), the pooled float32
+    document vector and the chunk turn ranges as one .npz to gs://BUCKET_DESTINO/EMBEDDINGS/<vector_id>.npz.
+    Returns the object name.
+    """
+    np = lazy_import("numpy")
+    chunk_vectors, chunk_scales = quantize_vectors(vectors)
+    scales = {} if chunk_scales is None else {"chunk_scales": chunk_scales}
+    embeddings_bytes = BytesIO()
+    np.savez(
+        embeddings_bytes,
+        chunks=chunk_vectors,
+        **scales,
+        document=document_vector.astype(np.float32),
+        first_turn=np.asarray([chunk["first_turn"] for chunk in chunks], dtype=np.int32),
+        last_turn=np.asarray([chunk["last_turn"] for chunk in chunks], dtype=np.int32),
+        tokens=np.asarray([chunk["tokens"] for chunk in chunks], dtype=np.int32),
+        model=np.asarray(EMBEDDING_MODEL),
+    )
+    embeddings_blob_name = f"{EMBEDDINGS_PREFIX}{vector_id}.npz"
+
+    def upload(client):
+        embeddings_bytes.seek(0)
+        client.bucket(BUCKET_DESTINO).blob(embeddings_blob_name).upload_from_file(
+            embeddings_bytes, content_type="application/octet-stream")
+
+    with TRACER.span("upload_embeddings", bytes_out=embeddings_bytes.getbuffer().nbytes):
+        RESOURCE_POOL.call("storage", upload)
+    return embeddings_blob_name
+
+
+def embed_dialogue(dialogue: List[Dict[str, str]], vector_id: str) -> Dict:
+    """
+    Chunk -> batched embeddings -> pooled document vector -> EMBEDDINGS/ object and similarity index entry,
+    both keyed by `vector_id` (see transcript_vector_id).
+
+    Returns:
+        Dict: {"document": pooled vector as a list, "chunks": number of chunks, "blob": object name}.
+    """
+    chunks = chunk_dialogue(dialogue)
+    vectors = embed_texts([chunk["text"] for chunk in chunks])
+    document_vector = pool_document_vector(vectors, [chunk["tokens"] for chunk in chunks])
+    embeddings_blob_name = persist_embeddings(vector_id, chunks, vectors, document_vector)
+    try:
+        append_candidate_vector(vector_id, document_vector)
+    except Exception as e:
+        # El índice se puede reconstruir desde EMBEDDINGS/ (compact_candidate_index(rebuild=True))
+        print(f"Warning: could not add '{vector_id}' to the similarity index: {e}")
+    print(f"Embeddings saved at: gs://{BUCKET_DESTINO}/{embeddings_blob_name} ({len(chunks)} chunks, "
+          f"{sum(chunk['tokens'] for chunk in chunks)} estimated tokens)")
+    return {"document": document_vector.tolist(), "chunks": len(chunks), "blob": embeddings_blob_name}
+
+
+def quantize_vectors(matrix, dtype: str = EMBEDDING_STORAGE_DTYPE) -> Tuple["numpy.ndarray", Optional["numpy.ndarray"]]:
+    """
+    Converts float vectors to the storage `dtype`. For "int8" every row is scaled by its own
+    max(|x|) / 127 and the float32 scales are returned too (None for the float types).
+    """
+    np = lazy_import("numpy")
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if dtype != "int8":
+        return matrix.astype(dtype), None
+    scales = np.abs(matrix).max(axis=-1, keepdims=True) / 127.0
+    scales[scales == 0] = 1.0
+    return np.rint(matrix / scales).astype(np.int8), scales.reshape(-1).astype(np.float32)
+
+
+def dequantize_vectors(data: "numpy.ndarray", scales: Optional["numpy.ndarray"] = None) -> "numpy.ndarray":
+    np = lazy_import("numpy")
+    matrix = np.asarray(data, dtype=np.float32)
+    return matrix * scales.reshape(-1, 1) if scales is not None else matrix
+
+
+class EmbeddingArchive:
+    """
+    Append-only, memory-mappable archive of embedding vectors in a local directory.
+
+    Files: `vectors.bin` (rows of `dimensions` values of `dtype`, contiguous, row-major), `scales.bin`
+    (one float32 per row, int8 archives only), `ids.jsonl` (one {"id", "offset", "added"} line per row:
+    the byte offset of the row in vectors.bin and, when given, when the vector was added, in epoch
+    seconds) and `archive.json` (dtype, dimensions, count). Appends write
+    the data files first and the header last, so a reader never sees more rows than were fully written.
+    Readers `np.memmap` vectors.bin without copying it; `scan()` walks it in blocks.
+    """
+
+    FILES = ("archive.json", "vectors.bin", "scales.bin", "ids.jsonl")
+
+    def __init__(self, directory: str, dtype: str = EMBEDDING_STORAGE_DTYPE, dimensions: Optional[int] = None):
+        self.directory = directory
+        header_path = os.path.join(directory, "archive.json")
+        if os.path.exists(header_path):
+            with open(header_path, "r", encoding="utf-8") as header_file:
+                header = json.load(header_file)
+            self.dtype, self.dimensions, self.count = header["dtype"], header["dimensions"], header["count"]
+        else:
+            os.makedirs(directory, exist_ok=True)
+            self.dtype, self.dimensions, self.count = dtype, dimensions, 0
+        self._ids: Optional[List[str]] = None
+        self._added: Optional[List[float]] = None
+
+    @property
+    def row_bytes(self) -> int:
+        return self.dimensions * lazy_import("numpy").dtype(self.dtype).itemsize
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def append(self, ids: List[str], vectors, added: Optional[List[float]] = None) -> None:
+        """
+        Appends one row per id (quantized to the archive dtype) and then updates the header.
+        `added` (epoch seconds per row) is kept in ids.jsonl when given.
+        """
+        np = lazy_import("numpy")
+        matrix = np.asarray(vectors, dtype=np.float32).reshape(len(ids), -1)
+        if self.dimensions is None:
+            self.dimensions = matrix.shape[1]
+        if matrix.shape[1] != self.dimensions:
+            raise ValueError(f"Expected vectors of {self.dimensions} dimensions, got {matrix.shape[1]}.")
+        data, scales = quantize_vectors(matrix, self.dtype)
+        with open(self._path("vectors.bin"), "ab") as vectors_file:
+            vectors_file.truncate(self.count * self.row_bytes)  # descarta una escritura interrumpida
+            vectors_file.write(data.tobytes())
+        if scales is not None:
+            with open(self._path("scales.bin"), "ab") as scales_file:
+                scales_file.truncate(self.count * 4)
+                scales_file.write(scales.tobytes())
+        self._truncate_ids()
+        with open(self._path("ids.jsonl"), "a", encoding="utf-8") as ids_file:
+            for row, candidate_id in enumerate(ids, start=self.count):
+                line = {"id": candidate_id, "offset": row * self.row_bytes}
+                if added is not None:
+                    line["added"] = added[row - self.count]
+                ids_file.write(json.dumps(line) + "\n")
+        self.count += len(ids)
+        temporary_header = self._path("archive.json.tmp")
+        with open(temporary_header, "w", encoding="utf-8") as header_file:
+            json.dump({"version": 1, "dtype": self.dtype, "dimensions": self.dimensions, "count": self.count}, header_file)
+        os.replace(temporary_header, self._path("archive.json"))
+        if self._ids is not None:
+            self._ids.extend(ids)
+            self._added.extend(added if added is not None else [0.0] * len(ids))
+
+    def _truncate_ids(self) -> None:
+        """
+        Cuts ids.jsonl back to the first `count` lines, so the next ids start at row `count`.
+        """
+        path = self._path("ids.jsonl")
+        if not os.path.exists(path):
+            return
+        with open(path, "r+b") as ids_file:
+            # Líneas de más: de una escritura interrumpida antes del encabezado, o de un ids.jsonl más nuevo
+            for _ in range(self.count):
+                if not ids_file.readline():
+                    break
+            ids_file.truncate(ids_file.tell())
+
+    def _read_ids(self) -> None:
+        with open(self._path("ids.jsonl"), "r", encoding="utf-8") as ids_file:
+            lines = [json.loads(line) for _, line in zip(range(self.count), ids_file)]
+        self._ids = [line["id"] for line in lines]
+        # Archivos escritos antes de guardar "added": 0.0
+        self._added = [line.get("added", 0.0) for line in lines]
+
+    @property
+    def ids(self) -> List[str]:
+        if self._ids is None:
+            self._read_ids()
+        return self._ids
+
+    @property
+    def added(self) -> List[float]:
+        """
+        When each row was added (epoch seconds; 0.0 when unknown).
+        """
+        if self._added is None:
+            self._read_ids()
+        return self._added
+
+    def memmap(self) -> Tuple["numpy.ndarray", Optional["numpy.ndarray"]]:
+        """
+        Zero-copy views of the stored rows and (int8 only) their scales.
+        """
+        np = lazy_import("numpy")
+        if self.count == 0:
+            return np.zeros((0, self.dimensions or 0), dtype=self.dtype), None
+        data = np.memmap(self._path("vectors.bin"), dtype=self.dtype, mode="r", shape=(self.count, self.dimensions))
+        scales = None
+        if self.dtype == "int8":
+            scales = np.memmap(self._path("scales.bin"), dtype=np.float32, mode="r", shape=(self.count,))
+        return data, scales
+
+    def vectors(self, start: int = 0, stop: Optional[int] = None) -> "numpy.ndarray":
+        data, scales = self.memmap()
+        return dequantize_vectors(data[start:stop], None if scales is None else scales[start:stop])
+
+    def scan(self, query, k: int = 10, block_rows: int = 64) -> List[Tuple[str, float]]:
+        """
+        Top-k rows by dot product with `query` (cosine for normalized vectors). float32 rows are
+        multiplied straight from the memmap; float16/int8 rows are widened into one small reusable
+        float32 buffer per block (it stays in the CPU cache), so nothing is dequantized up front.
+        """
+        np = lazy_import("numpy")
+        data, scales = self.memmap()
+        query_vector = np.asarray(query, dtype=np.float32).reshape(-1)
+        scores = np.empty(self.count, dtype=np.float32)
+        buffer = np.empty((block_rows, self.dimensions or 0), dtype=np.float32)
+        for start in range(0, self.count, block_rows):
+            block = data[start:start + block_rows]
+            if block.dtype != np.float32:
+                np.copyto(buffer[:len(block)], block, casting="unsafe")
+                block = buffer[:len(block)]
+            scores[start:start + len(block)] = block @ query_vector
+        if scales is not None:
+            scores *= scales
+        k = min(k, self.count)
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.ids[row], float(scores[row])) for row in top]
+
+    def upload(self, bucket_name: str, prefix: str) -> None:
+        """
+        Copies the archive files to gs://bucket_name/prefix, header last.
+        """
+        def upload_files(client):
+            bucket = client.bucket(bucket_name)
+            for name in reversed(self.FILES):
+                if os.path.exists(self._path(name)):
+                    bucket.blob(prefix + name).upload_from_filename(self._path(name), content_type="application/octet-stream")
+
+        RESOURCE_POOL.call("storage", upload_files)
+
+    @classmethod
+    def download(cls, bucket_name: str, prefix: str, directory: str) -> Optional["EmbeddingArchive"]:
+        """
+        Downloads an archive written by `upload()` into `directory` (header first). None if there is none.
+        """
+        def download_files(client):
+            bucket = client.bucket(bucket_name)
+            if bucket.get_blob(prefix + "archive.json") is None:
+                return False
+            os.makedirs(directory, exist_ok=True)
+            for name in cls.FILES:
+                blob = bucket.get_blob(prefix + name)
+                if blob is not None:
+                    blob.download_to_filename(os.path.join(directory, name))
+            return True
+
+        return cls(directory) if RESOURCE_POOL.call("storage", download_files) else None
+
+
+class CandidateIndex:
+    """
+    Cosine-similarity index over candidate document vectors.
+
+    Vectors are L2-normalized and stored as rows of one float32 matrix (grown by doubling, so
+    appends are amortized O(1)), with an id -> row map; adding an existing id replaces its vector.
+    `added` keeps when each row was added (epoch seconds), since row order follows listing order
+    after a reload, not time.
+    `query()` scores every row with one matrix-vector product. After `train_ivf()` the rows are
+    also partitioned by spherical k-means and queries only score the `n_probe` closest partitions
+    (approximate, for corpora where brute force gets slow); later appends join their nearest partition.
+    """
+
+    def __init__(self, dimensions: Optional[int] = None, capacity: int = 1024):
+        self.ids: List[str] = []
+        self.rows: Dict[str, int] = {}
+        self.added: List[float] = []
+        self.dimensions = dimensions
+        self._capacity = capacity
+        self._matrix = None
+        self.centroids = None
+        self._assignments = None
+        self._partitions = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def vectors(self) -> "numpy.ndarray":
+        np = lazy_import("numpy")
+        if self._matrix is None:
+            return np.zeros((0, self.dimensions or 0), dtype=np.float32)
+        return self._matrix[:len(self.ids)]
+
+    @staticmethod
+    def _normalize(matrix: "numpy.ndarray") -> "numpy.ndarray":
+        np = lazy_import("numpy")
+        norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+        return matrix / np.where(norms == 0, 1, norms)
+
+    def _reserve(self, rows: int):
+        np = lazy_import("numpy")
+        if self._matrix is None:
+            self._matrix = np.empty((max(self._capacity, rows), self.dimensions), dtype=np.float32)
+        elif rows > self._matrix.shape[0]:
+            grown = np.empty((max(rows, 2 * self._matrix.shape[0]), self.dimensions), dtype=np.float32)
+            grown[:len(self.ids)] = self._matrix[:len(self.ids)]
+            self._matrix = grown
+
+    def add(self, candidate_id: str, vector, added: Optional[float] = None) -> None:
+        self.add_many([candidate_id], [vector], None if added is None else [added])
+
+    def add_many(self, candidate_ids: List[str], vectors, added: Optional[List[float]] = None) -> None:
+        """
+        Appends (or replaces) the vectors of `candidate_ids`; `vectors` is any (n, dimensions) array-like.
+        `added` (epoch seconds per vector) defaults to now.
+        """
+        np = lazy_import("numpy")
+        matrix = self._normalize(np.asarray(vectors, dtype=np.float32).reshape(len(candidate_ids), -1))
+        if self.dimensions is None:
+            self.dimensions = matrix.shape[1]
+        if matrix.shape[1] != self.dimensions:
+            raise ValueError(f"Expected vectors of {self.dimensions} dimensions, got {matrix.shape[1]}.")
+        self._reserve(len(self.ids) + len(candidate_ids))
+        if added is None:
+            added = [time.time()] * len(candidate_ids)
+        new_rows = []
+        for candidate_id, vector, added_at in zip(candidate_ids, matrix, added):
+            row = self.rows.get(candidate_id)
+            if row is None:
+                row = len(self.ids)
+                self.rows[candidate_id] = row
+                self.ids.append(candidate_id)
+                self.added.append(added_at)
+            else:
+                self.added[row] = added_at
+            self._matrix[row] = vector
+            new_rows.append(row)
+        if self.centroids is not None:
+            rows = np.asarray(new_rows)
+            assignments = self._assign(self._matrix[rows])
+            if len(self._assignments) < len(self.ids):
+                self._assignments = np.resize(self._assignments, len(self.ids))
+            self._assignments[rows] = assignments
+            self._partitions = None
+
+    def _assign(self, matrix: "numpy.ndarray", block_rows: int = 8192) -> "numpy.ndarray":
+        np = lazy_import("numpy")
+        return np.concatenate([np.argmax(matrix[start:start + block_rows] @ self.centroids.T, axis=1)
+                               for start in range(0, len(matrix), block_rows)] or [np.zeros(0, dtype=np.int64)])
+
+    def train_ivf(self, n_lists: Optional[int] = None, iterations: int = 10, seed: int = 0) -> None:
+        """
+        Partitions the rows into `n_lists` clusters (default 4 * sqrt(n)) with spherical k-means.
+        """
+        np = lazy_import("numpy")
+        vectors = self.vectors
+        n_lists = min(len(vectors), n_lists or max(1, int(4 * len(vectors) ** 0.5)))
+        rng = np.random.default_rng(seed)
+        self.centroids = vectors[rng.choice(len(vectors), n_lists, replace=False)].copy()
+        for _ in range(iterations):
+            assignments = self._assign(vectors)
+            order = np.argsort(assignments, kind="stable")
+            counts = np.bincount(assignments, minlength=n_lists)
+            non_empty = counts > 0
+            sums = np.add.reduceat(vectors[order], np.concatenate(([0], np.cumsum(counts)[:-1]))[non_empty], axis=0)
+            self.centroids[non_empty] = self._normalize(sums)
+        self._assignments = self._assign(vectors)
+        self._partitions = None
+
+    def _partition_rows(self):
+        np = lazy_import("numpy")
+        if self._partitions is None:
+            assignments = self._assignments[:len(self.ids)]
+            order = np.argsort(assignments, kind="stable")
+            offsets = np.concatenate(([0], np.cumsum(np.bincount(assignments, minlength=len(self.centroids)))))
+            self._partitions = (order, offsets)
+        return self._partitions
+
+    def query(self, vector, k: int = 10, n_probe: Optional[int] = None,
+              exclude: Optional[str] = None) -> List[Tuple[str, float]]:
+        """
+        Top-k candidates by cosine similarity to `vector`, best first, as (candidate_id, score).
+        Exact unless the index has IVF partitions; `n_probe` partitions are scanned then.
+        """
+        np = lazy_import("numpy")
+        if not self.ids:
+            return []
+        query_vector = self._normalize(np.asarray(vector, dtype=np.float32).reshape(-1))
+        if self.centroids is None:
+            rows = None
+            scores = self.vectors @ query_vector
+        else:
+            order, offsets = self._partition_rows()
+            probes = np.argsort(self.centroids @ query_vector)[::-1][:n_probe or CANDIDATE_INDEX_IVF_PROBES]
+            rows = np.concatenate([order[offsets[probe]:offsets[probe + 1]] for probe in probes])
+            scores = self._matrix[rows] @ query_vector
+        wanted = min(len(scores), k + (1 if exclude is not None else 0))
+        if wanted == 0:
+            return []
+        top = np.argpartition(-scores, wanted - 1)[:wanted]
+        top = top[np.argsort(-scores[top])]
+        results = []
+        for position in top:
+            candidate_id = self.ids[position if rows is None else rows[position]]
+            if candidate_id != exclude:
+                results.append((candidate_id, float(scores[position])))
+        return results[:k]
+
+    def to_archive(self, directory: str, dtype: str = EMBEDDING_STORAGE_DTYPE) -> EmbeddingArchive:
+        """
+        Writes the vectors to a new EmbeddingArchive (plus centroids.npy when IVF is trained).
+        """
+        archive = EmbeddingArchive(directory, dtype=dtype, dimensions=self.dimensions)
+        if archive.count:
+            raise ValueError(f"'{directory}' already holds an archive.")
+        archive.append(self.ids, self.vectors, added=self.added)
+        if self.centroids is not None:
+            lazy_import("numpy").save(os.path.join(directory, "centroids.npy"), self.centroids)
+        return archive
+
+    @classmethod
+    def from_archive(cls, archive: EmbeddingArchive) -> "CandidateIndex":
+        np = lazy_import("numpy")
+        index = cls(dimensions=archive.dimensions, capacity=max(1024, archive.count))
+        for start in range(0, archive.count, 16384):
+            index.add_many(archive.ids[start:start + 16384], archive.vectors(start, start + 16384),
+                           archive.added[start:start + 16384])
+        centroids_path = os.path.join(archive.directory, "centroids.npy")
+        if os.path.exists(centroids_path):
+            index.centroids = np.load(centroids_path)
+            index._assignments = index._assign(index.vectors)
+        return index
+
+
+def read_vector_blob(client, blob) -> Tuple[str, "numpy.ndarray", float]:
+    """
+    (candidate_id, document vector, added) from an INDEX/pending/*.npy or EMBEDDINGS/*.npz object;
+    `added` is the object's update time (epoch seconds).
+    """
+    np = lazy_import("numpy")
+    data = np.load(BytesIO(blob.download_as_bytes()))
+    candidate_id = os.path.splitext(os.path.basename(blob.name))[0]
+    added = blob.updated.timestamp() if getattr(blob, "updated", None) else 0.0
+    return candidate_id, (data["document"] if blob.name.endswith(".npz") else data), added
+
+
+def append_candidate_vector(candidate_id: str, vector) -> None:
+    """
+    Records a finished transcript for the similarity index: one small pending object per vector id
+    (merged into the snapshot by `compact_candidate_index()`) and, if this instance has the index
+    loaded, an in-memory append.
+    """
+    np = lazy_import("numpy")
+    buffer = BytesIO()
+    np.save(buffer, np.asarray(vector, dtype=np.float32))
+    pending_blob_name = f"{CANDIDATE_INDEX_PENDING_PREFIX}{candidate_id}.npy"
+    RESOURCE_POOL.call("storage", lambda client: client.bucket(BUCKET_DESTINO).blob(pending_blob_name)
+                       .upload_from_string(buffer.getvalue(), content_type="application/octet-stream"))
+    with _candidate_index_lock:
+        if _candidate_index is not None:
+            _candidate_index[0].add(candidate_id, vector)
+        if _candidate_index_appends is not None:
+            _candidate_index_appends.append((candidate_id, vector, time.time()))
+
+
+def load_candidate_index() -> Tuple["CandidateIndex", List[str]]:
+    """
+    Snapshot plus every pending vector. Returns the index and the names of the pending objects merged.
+    IVF partitions are trained when the corpus reaches CANDIDATE_INDEX_IVF_MIN_CANDIDATES.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        snapshot = EmbeddingArchive.download(BUCKET_DESTINO, CANDIDATE_INDEX_SNAPSHOT, directory)
+        index = CandidateIndex.from_archive(snapshot) if snapshot else CandidateIndex()
+
+    def load(client):
+        pending = list(client.list_blobs(BUCKET_DESTINO, prefix=CANDIDATE_INDEX_PENDING_PREFIX))
+        with ThreadPoolExecutor(max_workers=8, thread_name_prefix="index") as executor:
+            for candidate_id, vector, added in executor.map(lambda blob: read_vector_blob(client, blob), pending):
+                index.add(candidate_id, vector, added)
+        return index, [blob.name for blob in pending]
+
+    index, pending_names = RESOURCE_POOL.call("storage", load)
+    if index.centroids is None and len(index) >= CANDIDATE_INDEX_IVF_MIN_CANDIDATES:
+        index.train_ivf()
+    return index, pending_names
+
+
+def compact_candidate_index(rebuild: bool = False) -> int:
+    """
+    Writes a new snapshot with the pending vectors merged in and deletes the merged pending objects.
+    With `rebuild`, the snapshot is rebuilt from every EMBEDDINGS/*.npz instead. Returns the index size.
+    """
+    if rebuild:
+        def rebuild_from_store(client):
+            # Los pendientes se listan antes que EMBEDDINGS/: embed_dialogue() escribe el .npz antes que el
+            # pendiente, así que todo pendiente listado tiene su .npz en el listado que sigue. Un vector escrito
+            # entre los dos listados conserva su pendiente para la próxima compactación
+            pending = [blob.name for blob in client.list_blobs(BUCKET_DESTINO, prefix=CANDIDATE_INDEX_PENDING_PREFIX)]
+            blobs = [blob for blob in client.list_blobs(BUCKET_DESTINO, prefix=EMBEDDINGS_PREFIX)
+                     if blob.name.endswith(".npz")]
+            index = CandidateIndex(capacity=max(1024, len(blobs)))
+            with ThreadPoolExecutor(max_workers=8, thread_name_prefix="index") as executor:
+                for candidate_id, vector, added in executor.map(lambda blob: read_vector_blob(client, blob), blobs):
+                    index.add(candidate_id, vector, added)
+            # Solo se borran los pendientes cuyo vector quedó en el snapshot nuevo
+            merged = [name for name in pending if os.path.splitext(os.path.basename(name))[0] in index.rows]
+            return index, merged
+
+        index, pending_names = RESOURCE_POOL.call("storage", rebuild_from_store)
+        if len(index) >= CANDIDATE_INDEX_IVF_MIN_CANDIDATES:
+            index.train_ivf()
+    else:
+        index, pending_names = load_candidate_index()
+    with tempfile.TemporaryDirectory() as directory:
+        index.to_archive(directory).upload(BUCKET_DESTINO, CANDIDATE_INDEX_SNAPSHOT)
+        if index.centroids is not None:
+            RESOURCE_POOL.call("storage", lambda client: client.bucket(BUCKET_DESTINO)
+                               .blob(CANDIDATE_INDEX_SNAPSHOT + "centroids.npy")
+                               .upload_from_filename(os.path.join(directory, "centroids.npy")))
+
+    def delete_pending(client):
+        for name in pending_names:
+            try:
+                client.bucket(BUCKET_DESTINO).blob(name).delete()
+            except lazy_import("google.api_core.exceptions").NotFound:
+                pass
+
+    RESOURCE_POOL.call("storage", delete_pending)
+    print(f"Candidate index compacted: {len(index)} candidates, {len(pending_names)} pending vectors merged.")
+    return len(index)
+
+
+# _candidate_index_lock solo protege el índice en memoria (appends y cambio de índice); la recarga desde GCS se hace
+# fuera de él, con _candidate_index_refresh_lock para que una sola recarga corra a la vez
+_candidate_index_lock = threading.Lock()
+_candidate_index_refresh_lock = threading.Lock()
+_candidate_index: Optional[Tuple["CandidateIndex", float]] = None
+# Vectores agregados mientras corre una recarga (None si no hay ninguna): se aplican también al índice nuevo
+_candidate_index_appends: Optional[List[Tuple[str, object, float]]] = None
+
+
+def get_candidate_index(max_age_seconds: float = CANDIDATE_INDEX_REFRESH_SECONDS) -> "CandidateIndex":
+    """
+    The similarity index of this warm instance, reloaded from GCS every `max_age_seconds`. The reload
+    runs without holding the index lock: appends go on, and while one thread reloads the others keep
+    using the previous index (they only wait when there is none yet).
+    """
+    global _candidate_index, _candidate_index_appends
+    with _candidate_index_lock:
+        current = _candidate_index
+    if current is not None and time.monotonic() - current[1] <= max_age_seconds:
+        return current[0]
+    if not _candidate_index_refresh_lock.acquire(blocking=current is None):
+        return current[0]
+    try:
+        with _candidate_index_lock:
+            current = _candidate_index
+            if current is not None and time.monotonic() - current[1] <= max_age_seconds:
+                return current[0]
+            _candidate_index_appends = []
+        try:
+            index = load_candidate_index()[0]
+        finally:
+            with _candidate_index_lock:
+                appends, _candidate_index_appends = _candidate_index_appends, None
+        with _candidate_index_lock:
+            for candidate_id, vector, added in appends:
+                index.add(candidate_id, vector, added)
+            _candidate_index = (index, time.monotonic())
+        return index
+    finally:
+        _candidate_index_refresh_lock.release()
+
+
+def find_similar_candidates(candidate_id: str, k: int = 5) -> List[Tuple[str, float]]:
+    """
+    The `k` past transcripts closest to `candidate_id` (cosine similarity), as (vector id, score).
+    `candidate_id` is a vector id (see transcript_vector_id) or a candidate name, which uses the
+    candidate's most recently added transcript (by CandidateIndex.added, not by row order).
+    """
+    index = get_candidate_index()
+    row = index.rows.get(candidate_id)
+    if row is None:
+        rows = [row for vector_id, row in index.rows.items() if candidate_of(vector_id) == candidate_id]
+        if not rows:
+            raise KeyError(f"Candidate '{candidate_id}' is not in the similarity index.")
+        row = max(rows, key=lambda row: (index.added[row], row))
+    return index.query(index.vectors[row], k=k, exclude=index.ids[row])
+
+
+_cpu_stage_lock = threading.Lock()
+_cpu_stage: Optional[ProcessPoolExecutor] = None
+_cpu_stage_created = False
+# Lo activa process_batch: un evento suelto sigue extrayendo en el hilo de la invocación
+_cpu_stage_active: contextvars.ContextVar = contextvars.ContextVar("cpu_stage_active", default=False)
+
+
+def _init_cpu_worker():
+    # Los procesos del pool no abren spans: el span "cpu_stage" del proceso principal registra su trabajo
+    global TRACER
+    TRACER = Tracer(sample_rate=0.0)
+
+
+def _run_cpu_task(function: Callable, args: Tuple) -> Tuple[object, float, float, int]:
+    started = time.time()
+    result = function(*args)
+    return result, started, time.time() - started, os.getpid()
+
+
+def instance_memory_bytes() -> Optional[int]:
+    """
+    Memory limit of the instance from its cgroup (v2, then v1), or None when it is unknown or unlimited.
+    """
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        try:
+            with open(path, "r") as limit_file:
+                value = limit_file.read().strip()
+        except OSError:
+            continue
+        # "max" (v2) o un valor enorme (v1) significan sin límite
+        return int(value) if value.isdigit() and int(value) < 2 ** 60 else None
+    return None
+
+
+def default_cpu_stage_workers() -> int:
+    """
+    One worker per CPU when there is more than one, at most CPU_STAGE_MAX_WORKERS, and only as many as fit
+    in the instance memory after CPU_STAGE_RESERVED_MEMORY_BYTES.
+    """
+    cpus = os.cpu_count() or 1
+    if cpus <= 1:
+        return 0
+    workers = min(cpus, CPU_STAGE_MAX_WORKERS)
+    memory = instance_memory_bytes()
+    if memory is not None:
+        workers = min(workers, max(memory - CPU_STAGE_RESERVED_MEMORY_BYTES, 0) // CPU_STAGE_WORKER_MEMORY_BYTES)
+    return workers
+
+
+def create_cpu_stage() -> Optional[ProcessPoolExecutor]:
+    """
+    Process pool of CPU_STAGE_WORKERS workers (default_cpu_stage_workers() if unset) for the CPU stage, or
+    None when it is disabled or a new process could not import this module by name: it must be in
+    sys.modules and on sys.path, as functions_framework leaves main.py. Falling back to threads for that
+    reason is logged as a WARNING with the module name and file, since the batch then gets no parallelism.
+    """
+    workers = CPU_STAGE_WORKERS if CPU_STAGE_WORKERS is not None else default_cpu_stage_workers()
+    if workers <= 0:
+        return None
+    reason = None
+    if getattr(sys.modules.get(__name__), "prepare_transcript_file", None) is not prepare_transcript_file:
+        reason = "module is not in sys.modules"
+    elif CPU_STAGE_START_METHOD != "fork":
+        spec = importlib.machinery.PathFinder.find_spec(__name__, sys.path)
+        if spec is None or os.path.realpath(spec.origin) != os.path.realpath(__file__):
+            reason = "module cannot be imported by name from sys.path"
+    if reason:
+        log_event("WARNING", f"CPU stage process pool disabled ({reason}); the CPU stage runs on threads.",
+                  module=__name__, file=__file__, start_method=CPU_STAGE_START_METHOD, workers=workers)
+        return None
+    return ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_cpu_worker,
+        mp_context=multiprocessing.get_context(CPU_STAGE_START_METHOD))
+
+
+def get_cpu_stage() -> Optional[ProcessPoolExecutor]:
+    """
+    The instance-wide CPU stage pool, created on first use (None when it is disabled).
+    """
+    global _cpu_stage, _cpu_stage_created
+    with _cpu_stage_lock:
+        if not _cpu_stage_created:
+            _cpu_stage = create_cpu_stage()
+            _cpu_stage_created = True
+    return _cpu_stage
+
+
+def reset_cpu_stage(broken: ProcessPoolExecutor):
+    # Un pool roto (un proceso murió, p. ej. sin memoria) no acepta más tareas: se recrea en el próximo uso
+    global _cpu_stage, _cpu_stage_created
+    with _cpu_stage_lock:
+        if _cpu_stage is broken:
+            _cpu_stage, _cpu_stage_created = None, False
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def run_cpu_stage(function: Callable, *args):
+    """
+    Runs function(*args) on the CPU stage pool when a batch enabled it, otherwise on the calling thread.
+    Arguments and result are pickled, so pass the path of a spooled file rather than its contents. If a
+    worker dies the pool is rebuilt for the next call and this one runs on the calling thread.
+    """
+    executor = get_cpu_stage() if _cpu_stage_active.get() else None
+    if executor is None:
+        return function(*args)
+    with TRACER.span("cpu_stage", function=function.__name__) as span:
+        submitted = time.time()
+        try:
+            result, started, seconds, pid = executor.submit(_run_cpu_task, function, args).result()
+        except BrokenProcessPool as e:
+            print(f"Warning: CPU stage worker failed ({e!r}); running '{function.__name__}' on this thread.")
+            reset_cpu_stage(executor)
+            return function(*args)
+        span.set(queue_seconds=round(started - submitted, 4), worker_seconds=round(seconds, 4), worker_pid=pid)
+    return result
+
+
+def download_failed_result(file_name: str) -> Dict:
+    return {
+        "file_name": file_name,
+        "is_interview": False,
+        "download_failed": True,
+        "reason": "Failed to download or extract text from the file."
+    }
+
+
 def process_transcript_file(
     bucket_name: str,
     file_name: str,
     person_a_name: str, # This will be passed as primary_speaker_known_name
-    interview_keywords: List[str],
+    interview_keywords: Union[List[str], Dict[str, Dict[str, float]]],
     min_keyword_matches: int
 ) -> Dict:
     """
-    Orchestrates the full processing pipeline for a single transcript file.
+    Orchestrates the full processing pipeline for a single transcript file: the download, then the CPU
+    stage (see prepare_transcript_file), on the CPU stage pool in batches.
     """
     print(f"\n--- Starting processing for: {file_name} ---")
-    file_content = download_and_extract_text(bucket_name, file_name)
+    print(f"Attempting to download and process '{file_name}' from bucket '{bucket_name}'...")
+    try:
+        local_path = spool_blob_to_tempfile(bucket_name, file_name)
+    except Exception as e:
+        print(f"Error during file download or text extraction for '{file_name}': {e}")
+        return download_failed_result(file_name)
+    try:
+        # Solo la ruta cruza al proceso de la etapa CPU: el archivo queda en /tmp (memoria en Cloud Functions)
+        return run_cpu_stage(prepare_transcript_file, local_path, file_name, person_a_name, interview_keywords,
+                             min_keyword_matches)
+    finally:
+        os.remove(local_path)
+
+
+def prepare_transcript_file(
+    local_path: str,
+    file_name: str,
+    person_a_name: str,
+    interview_keywords: Union[List[str], Dict[str, Dict[str, float]]],
+    min_keyword_matches: int
+) -> Dict:
+    """
+    CPU stage of one spooled transcript: text extraction, dialogue segment, interview classification and
+    dialogue parsing. Module-level so the CPU stage pool can run it in another process.
+    """
+    try:
+        file_content = extract_document_text(local_path, file_name)
+    except Exception as e:
+        print(f"Error during file download or text extraction for '{file_name}': {e}")
+        file_content = None
     if not file_content:
-        return {
-            "file_name": file_name,
-            "is_interview": False,
-            "reason": "Failed to download or extract text from the file."
-        }
+        return download_failed_result(file_name)
     dialogue_content = clean_and_extract_dialogue_segment(file_content)
     if not dialogue_content:
         return {
@@ -445,7 +3093,7 @@ def process_transcript_file(
     }
 
 
-def process_preparation(bucket_name: str, file_name: str, person_a_name: str, job_keywords: List[str], min_keyword_matches: int):
+def process_preparation(bucket_name: str, file_name: Union[str, List[str]], person_a_name: str, job_keywords: Union[List[str], Dict[str, Dict[str, float]]], min_keyword_matches: int, max_workers: int = BATCH_MAX_WORKERS):
     # --- CONFIGURATION ---
     YOUR_GCS_BUCKET_NAME = bucket_name
     
@@ -458,7 +3106,8 @@ def process_preparation(bucket_name: str, file_name: str, person_a_name: str, jo
     # The other speaker's name will be taken from the transcript as it appears.
     YOUR_PERSON_A_NAME = person_a_name # Example: "Francisco Ahijado" or "Gemini-francisco"
 
-    FILES_TO_PROCESS = [file_name]#[
+    # Un solo archivo (evento de GCS) o una lista; las listas se procesan con hasta max_workers hilos
+    FILES_TO_PROCESS = [file_name] if isinstance(file_name, str) else list(file_name)#[
     #     "30 Minute Interview With DevEngine (Jean Massucatto) - 2025/06/02 09:25 GMT-04:00 - Notes by Gemini-francisco.pdf"
     #     # You can add more file names here from the bucket "transcription_poc_uploads_raw"
     # ]
@@ -466,16 +3115,20 @@ def process_preparation(bucket_name: str, file_name: str, person_a_name: str, jo
     
 
     # --- PROCESSING ---
-    all_results = []
-    for filename_to_process in FILES_TO_PROCESS:
-        result = process_transcript_file(
+    all_results = run_concurrently(
+        lambda filename_to_process: process_transcript_file(
             YOUR_GCS_BUCKET_NAME,
             filename_to_process,
             YOUR_PERSON_A_NAME, # This is passed as the primary_speaker_known_name
-            JOB_INTERVIEW_KEYWORDS,
-            MIN_KEYWORD_MATCHES
-        )
-        all_results.append(result)
+            job_keywords,
+            min_keyword_matches
+        ),
+        FILES_TO_PROCESS,
+        max_workers,
+    )
+    for result in all_results:
+        if result.get("status") == "error":
+            result.update(is_interview=False, reason=f"Processing failed: {result['error']}")
 
     # --- PRINT REPORT TO CONSOLE (Optional, can be removed if only file output is needed) ---
     print("\n\n--- CONSOLE PROCESSING REPORT (also saved to file) ---")
@@ -486,8 +3139,12 @@ def process_preparation(bucket_name: str, file_name: str, person_a_name: str, jo
         print(f"Is Interview?: {res_item.get('is_interview', False)}")
         
         if res_item.get('is_interview'):
-            print("Extracted Dialogue:")
             dialogue_list = res_item.get('dialogue', [])
+            if dialogue_list and not log_enabled("DEBUG"):
+                # El diálogo turno por turno solo se imprime con LOG_LEVEL=DEBUG
+                print(f"Extracted Dialogue: {len(dialogue_list)} turns")
+                continue
+            print("Extracted Dialogue:")
             if dialogue_list:
                 for turn_count, turn in enumerate(dialogue_list):
                     speaker = turn.get('speaker', 'Unknown Speaker')
@@ -500,6 +3157,789 @@ def process_preparation(bucket_name: str, file_name: str, person_a_name: str, jo
     print("\n--- End of Console Report ---")
     return all_results
 
+def generate_text(contents: str, generation_config: Dict) -> "vertexai.generative_models.GenerationResponse":
+    return RESOURCE_POOL.call(
+        "generative_model", lambda model: model.generate_content(contents, generation_config=generation_config),
+        tokens=estimate_tokens(contents))
+
+
+def analysis_schema(fields: Iterable[str]) -> Dict:
+    """
+    Response schema for the analysis: one required string per field, in ANALYSIS_FIELDS order.
+    """
+    headings = dict(ANALYSIS_FIELDS)
+    fields = [name for name, _ in ANALYSIS_FIELDS if name in set(fields)]
+    return {
+        "type": "OBJECT",
+        "properties": {name: {"type": "STRING", "description": headings[name]} for name in fields},
+        "required": fields,
+        "property_ordering": fields,
+    }
+
+
+class IncrementalAnalysisParser:
+    """
+    Streaming parser for the analysis JSON object. Text is fed as it arrives; each top-level field is
+    decoded and validated as soon as its value ends, so a truncated or partly malformed response still
+    yields every field that came through intact. Text before the opening brace (e.g. a ```json fence)
+    is skipped, and raw newlines inside strings are accepted.
+    """
+
+    def __init__(self, fields: Iterable[str]):
+        self.expected = set(fields)
+        self.fields: Dict[str, str] = {}
+        self.invalid: Dict[str, str] = {}
+        self.text = ""
+        self.closed = False
+        self._position = 0
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._token_start = 0
+        self._key: Optional[str] = None
+        self._in_value = False
+
+    def feed(self, chunk: str):
+        self.text += chunk
+        text = self.text
+        for position in range(self._position, len(text)):
+            char = text[position]
+            if self.closed:
+                break
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._key is None:
+                        self._key = self._decode(text[self._token_start:position + 1])
+            elif char == '"':
+                self._in_string = True
+                if self._depth == 1 and self._key is None:
+                    self._token_start = position
+            elif char in "{[":
+                self._depth += 1
+            elif self._depth == 0:
+                continue  # texto antes del objeto (```json)
+            elif char == ":" and self._depth == 1:
+                self._token_start = position + 1
+                self._in_value = True
+            elif char == "," and self._depth == 1:
+                self._finish_field(text[self._token_start:position])
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._finish_field(text[self._token_start:position])
+                    self.closed = True
+        self._position = len(text)
+
+    @staticmethod
+    def _decode(value_text: str):
+        try:
+            return json.loads(value_text, strict=False)
+        except ValueError:
+            return None
+
+    def finish(self):
+        """
+        Called when the stream ends: keeps a last value that is complete even if the closing brace never came.
+        """
+        if not self.closed and self._in_value and not self._in_string and self._depth == 1:
+            self._finish_field(self.text[self._token_start:])
+
+    def _finish_field(self, value_text: str):
+        key, self._key = self._key, None
+        self._in_value = False
+        if key is None or key in self.fields:
+            return
+        if key not in self.expected:
+            self.invalid.setdefault(str(key), "unexpected field")
+            return
+        value = self._decode(value_text.strip())
+        if isinstance(value, str):
+            self.fields[key] = value
+            self.invalid.pop(key, None)
+        else:
+            self.invalid[key] = "malformed value" if value is None else f"expected a string, got {type(value).__name__}"
+
+    def missing(self) -> List[str]:
+        """
+        Expected fields without a valid value (malformed, truncated or never produced), in ANALYSIS_FIELDS order.
+        """
+        return [name for name, _ in ANALYSIS_FIELDS if name in self.expected and name not in self.fields]
+
+
+def response_text(response) -> str:
+    # Un fragmento sin partes de texto (p. ej. solo finish_reason) levanta ValueError en .text
+    try:
+        return response.text
+    except ValueError:
+        return ""
+
+
+def stream_analysis(contents: str, generation_config: Dict, fields: Iterable[str]) -> IncrementalAnalysisParser:
+    """
+    Streams one schema-constrained analysis call into an IncrementalAnalysisParser for `fields`.
+    The stream is consumed inside RESOURCE_POOL.call(), so a retried call starts a fresh parser.
+    """
+    fields = list(fields)
+    config = dict(generation_config, response_mime_type="application/json", response_schema=analysis_schema(fields))
+
+    def run(model) -> IncrementalAnalysisParser:
+        parser = IncrementalAnalysisParser(fields)
+        generation = lazy_import("vertexai.generative_models").GenerationConfig(**config)
+        for chunk in model.generate_content(contents, generation_config=generation, stream=True):
+            parser.feed(response_text(chunk))
+        parser.finish()
+        return parser
+
+    return RESOURCE_POOL.call("generative_model", run, tokens=estimate_tokens(contents))
+
+
+def generate_analysis(contents: str, generation_config: Dict) -> Dict:
+    """
+    Requests the analysis with `analysis_schema()` and validates it field by field while it streams.
+    Fields that are missing or malformed are requested again, alone, in one repair call with a
+    proportional output limit, instead of regenerating the whole analysis.
+
+    Returns:
+        Dict: {heading: answer} in ANALYSIS_FIELDS order (ANALYSIS_MISSING_ANSWER for fields the repair
+        could not recover either), or {"raw_response": text} if nothing usable came back.
+    """
+    with TRACER.span("gemini", chars_in=len(contents)) as span:
+        return _generate_analysis(contents, generation_config, span)
+
+
+def _generate_analysis(contents: str, generation_config: Dict, span: Span) -> Dict:
+    all_fields = [name for name, _ in ANALYSIS_FIELDS]
+    parser = stream_analysis(contents, generation_config, all_fields)
+    missing = parser.missing()
+    span.set(chars_out=len(parser.text), missing_fields=len(missing))
+    if missing:
+        print(f"Warning: analysis fields missing or malformed: {missing} ({parser.invalid}); "
+              f"requesting only those fields.")
+        headings = dict(ANALYSIS_FIELDS)
+        repair_contents = (
+            contents
+            + "\n\nAnswer ONLY the following questions, following every instruction above, as a JSON object "
+            + "with exactly these fields:\n"
+            + "\n".join(f"- {name}: {headings[name]}" for name in missing)
+        )
+        repair_config = dict(generation_config, max_output_tokens=min(
+            MAX_OUTPUT_TOKENS, ANALYSIS_REPAIR_TOKENS_PER_FIELD * len(missing)))
+        try:
+            repaired = stream_analysis(repair_contents, repair_config, missing)
+            parser.fields.update(repaired.fields)
+        except Exception as e:
+            print(f"Warning: analysis repair call failed ({e!r}).")
+        span.set(repaired_fields=len(missing) - len(parser.missing()))
+        if parser.missing():
+            print(f"Warning: analysis fields still missing after the repair call: {parser.missing()}")
+    if not parser.fields:
+        return {"raw_response": parser.text}
+    return {heading: parser.fields.get(name, ANALYSIS_MISSING_ANSWER) for name, heading in ANALYSIS_FIELDS}
+
+
+def summarize_segments(dialogue: List[Dict[str, str]], segment_prompt_template: str) -> List[Tuple[Dict, str]]:
+    """
+    Map step: splits the dialogue into turn-aligned segments of MAP_SEGMENT_TOKENS and summarizes them
+    in parallel (MAP_MAX_CONCURRENT_REQUESTS calls in flight). Returns (segment, summary) in dialogue order.
+    A segment whose response is blocked, empty or fails after MAP_SEGMENT_ATTEMPTS tries is left out
+    (with a warning) instead of aborting the analysis.
+    """
+    segments = chunk_dialogue(dialogue, MAP_SEGMENT_TOKENS)
+    map_config = {"temperature": MAP_TEMPERATURE, "max_output_tokens": MAP_MAX_OUTPUT_TOKENS, "top_k": TOP_K, "top_p": TOP_P}
+
+    def summarize(numbered_segment: Tuple[int, Dict]) -> str:
+        number, segment = numbered_segment
+        contents = segment_prompt_template.format(
+            segment_number=number, segment_count=len(segments), segment_text=segment["text"])
+        for attempt in range(1, MAP_SEGMENT_ATTEMPTS + 1):
+            try:
+                # Una respuesta bloqueada (o sin candidatos) no tiene texto: response_text() devuelve ""
+                summary = response_text(generate_text(contents, map_config)).strip()
+            except Exception as e:
+                summary = ""
+                print(f"Warning: summary of segment {number}/{len(segments)} failed ({e!r}), attempt {attempt}.")
+            if summary:
+                return summary
+        print(f"Warning: segment {number}/{len(segments)} (turns {segment['first_turn'] + 1}-"
+              f"{segment['last_turn'] + 1}) has no summary; it is left out of the analysis.")
+        return ""
+
+    with TRACER.span("gemini_map", segments=len(segments)) as span, \
+            ThreadPoolExecutor(max_workers=max(1, min(MAP_MAX_CONCURRENT_REQUESTS, len(segments))),
+                               thread_name_prefix="map") as executor:
+        summaries = list(executor.map(in_current_context(summarize), enumerate(segments, start=1)))
+        span.set(chars_out=sum(len(summary) for summary in summaries),
+                 failed_segments=sum(1 for summary in summaries if not summary))
+    return [(segment, summary) for segment, summary in zip(segments, summaries) if summary]
+
+
+def assemble_analysis_contents(prompt: str, dialogue: List[Dict[str, str]], dialogue_text: str,
+                               candidate_name: str, segment_prompt_template: str) -> Tuple[str, Dict]:
+    """
+    Builds the contents of the analysis call within PROMPT_TOKEN_BUDGET estimated tokens.
+
+    Short interviews go as before: prompt + full transcription. Longer ones are condensed with
+    `summarize_segments()`; the reduce call gets the segment summaries for questions 1-7 plus the
+    candidate's turns verbatim for question 8 (Communication Skills), which needs the original wording.
+    When those turns do not fit in what is left of the budget, an evenly spaced sample of them is kept.
+
+    Returns:
+        Tuple[str, Dict]: the contents and a plan {"mode", "input_tokens", "segments"} for logging.
+    """
+    prompt_tokens = estimate_tokens(prompt)
+    dialogue_tokens = estimate_tokens(dialogue_text)
+    if prompt_tokens + dialogue_tokens <= PROMPT_TOKEN_BUDGET:
+        contents = prompt + "\n\nInterview transcription:\n" + dialogue_text
+        return contents, {"mode": "single", "input_tokens": prompt_tokens + dialogue_tokens, "segments": 0}
+
+    summaries = summarize_segments(dialogue, segment_prompt_template)
+    condensed = "\n\n".join(
+        f"[Segment {number}/{len(summaries)}, turns {segment['first_turn'] + 1}-{segment['last_turn'] + 1}]\n{summary}"
+        for number, (segment, summary) in enumerate(summaries, start=1)
+    )
+    candidate_speakers = {speaker for speaker in {turn["speaker"] for turn in dialogue}
+                          if comparar_cadenas_por_palabras(speaker, candidate_name)}
+    candidate_turns = [turn["text"] for turn in dialogue if turn["speaker"] in candidate_speakers]
+    # Si el nombre del archivo no coincide con ningún hablante, se conserva el diálogo completo
+    if not candidate_turns:
+        candidate_turns = dialogue_text.split("\n")
+    head = (
+        prompt
+        + "\n\nInterview transcription (condensed: summaries of consecutive segments, in order; use them for questions 1-7):\n"
+        + condensed
+        + f"\n\n{candidate_name}'s own words, verbatim (use them for question 8, Communication Skills):\n"
+    )
+    # Si todo lo dicho no cabe en el presupuesto restante, se toma una muestra repartida por toda la entrevista
+    remaining_tokens = max(PROMPT_TOKEN_BUDGET - estimate_tokens(head), 0)
+    speech_tokens = sum(estimate_tokens(text) for text in candidate_turns)
+    if speech_tokens > remaining_tokens:
+        stride = -(-speech_tokens // max(remaining_tokens, 1))
+        sampled, used = [], 0
+        for text in candidate_turns[::stride]:
+            used += estimate_tokens(text)
+            if used > remaining_tokens:
+                break
+            sampled.append(text)
+        candidate_turns = sampled
+    contents = head + "\n".join(candidate_turns)
+    return contents, {"mode": "map-reduce", "input_tokens": estimate_tokens(contents), "segments": len(summaries)}
+
+
+class ReportTemplate:
+    """
+    DOCX report template parsed once per instance. Every part of the package except word/document.xml is
+    read once at load; rendering fills the placeholders of document.xml ({{title}}, and a
+    {{heading}} / {{answer}} block repeated per section) and writes the package to any binary stream,
+    such as a GCS upload, without building a python-docx object model per report.
+    """
+
+    DOCUMENT_PART = "word/document.xml"
+    _INVALID_XML_CHARS = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+
+    def __init__(self, package: bytes):
+        with zipfile.ZipFile(BytesIO(package)) as source:
+            document = source.read(self.DOCUMENT_PART).decode("utf-8")
+            self._static_parts = [(info, source.read(info)) for info in source.infolist()
+                                  if info.filename != self.DOCUMENT_PART]
+        heading = document.find("{{heading}}")
+        answer = document.find("{{answer}}", heading)
+        if heading < 0 or answer < 0 or "{{title}}" not in document:
+            raise ValueError("Report template must contain {{title}}, {{heading}} and {{answer}}, each in a single run")
+        block_start = max(document.rfind("<w:p>", 0, heading), document.rfind("<w:p ", 0, heading))
+        block_end = document.index("</w:p>", answer) + len("</w:p>")
+        # xml:space="preserve" conserva los espacios al inicio y al final de cada respuesta
+        preserve = lambda text: re.sub(r"<w:t>(\{\{\w+\}\})", r'<w:t xml:space="preserve">\1', text)
+        self._prefix = preserve(document[:block_start])
+        self._block = preserve(document[block_start:block_end])
+        self._suffix = document[block_end:]
+
+    @classmethod
+    def load(cls, path: str = REPORT_TEMPLATE) -> "ReportTemplate":
+        """
+        Reads the template at `path`, or builds the default one (python-docx styles) if it does not exist.
+        """
+        if os.path.exists(path):
+            with open(path, "rb") as template_file:
+                return cls(template_file.read())
+        document = lazy_import("docx").Document()
+        document.add_heading("{{title}}", 0)
+        document.add_heading("{{heading}}", level=1)
+        document.add_paragraph("{{answer}}")
+        package = BytesIO()
+        document.save(package)
+        return cls(package.getvalue())
+
+    @classmethod
+    def _xml_text(cls, value: object) -> str:
+        # Igual que python-docx: los saltos de línea pasan a <w:br/> y los tabuladores a <w:tab/>
+        text = cls._INVALID_XML_CHARS.sub("", str(value))
+        text = text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+        return (text.replace("\n", '</w:t><w:br/><w:t xml:space="preserve">')
+                .replace("\t", '</w:t><w:tab/><w:t xml:space="preserve">'))
+
+    def render_xml(self, title: str, sections: Iterable[Tuple[str, object]]) -> bytes:
+        parts = [self._prefix.replace("{{title}}", self._xml_text(title))]
+        for heading, answer in sections:
+            parts.append(self._block.replace("{{heading}}", self._xml_text(heading))
+                         .replace("{{answer}}", self._xml_text(answer)))
+        parts.append(self._suffix)
+        return "".join(parts).encode("utf-8")
+
+    def render(self, title: str, sections: Iterable[Tuple[str, object]], stream) -> None:
+        """
+        Writes the report package to `stream` (seekable or not): the template parts read at load,
+        then the filled word/document.xml.
+        """
+        with zipfile.ZipFile(stream, "w", zipfile.ZIP_DEFLATED) as package:
+            for info, data in self._static_parts:
+                package.writestr(info.filename, data)
+            package.writestr(self.DOCUMENT_PART, self.render_xml(title, sections))
+
+
+def analysis_sections(analysis: Dict) -> List[Tuple[str, object]]:
+    """
+    (heading, answer) pairs of the report: the analysis fields, or the fields of its only value when the
+    model wrapped them in a single top-level key.
+    """
+    if len(analysis) == 1 and isinstance(next(iter(analysis.values())), dict):
+        analysis = next(iter(analysis.values()))
+    return [(heading, answer) for heading, answer in analysis.items()]
+
+
+def upload_report(blob_name: str, analysis: Dict, title: str = REPORT_TITLE) -> str:
+    """
+    Renders the analysis with the instance's ReportTemplate straight into a GCS upload of `blob_name` in
+    BUCKET_DESTINO (chunks of REPORT_UPLOAD_CHUNK_SIZE, no full in-memory copy of the document).
+    """
+    template = RESOURCE_POOL.get("report_template")
+    sections = analysis_sections(analysis)
+
+    with TRACER.span("docx_render", sections=len(sections)) as span:
+        def upload(client):
+            blob = client.bucket(BUCKET_DESTINO).blob(blob_name, chunk_size=REPORT_UPLOAD_CHUNK_SIZE)
+            with blob.open("wb", content_type=DOCX_CONTENT_TYPE, ignore_flush=True) as writer:
+                template.render(title, sections, writer)
+                span.set(bytes_out=writer.tell())
+
+        RESOURCE_POOL.call("storage", upload)
+    return blob_name
+
+
+def upload_reports(reports: Iterable[Tuple[str, Dict]], max_workers: int = BATCH_MAX_WORKERS) -> List[Dict]:
+    """
+    Batch mode: renders and uploads many (blob_name, analysis) reports in one process with the same
+    template, `max_workers` at a time. Returns {"report_blob", "status": "uploaded" | "error"} per report.
+    """
+    def render_one(report: Tuple[str, Dict]) -> Dict:
+        blob_name, analysis = report
+        try:
+            return {"report_blob": upload_report(blob_name, analysis), "status": "uploaded"}
+        except Exception as e:
+            print(f"Error rendering report '{blob_name}': {e!r}")
+            return {"report_blob": blob_name, "status": "error", "error": repr(e)}
+
+    reports = list(reports)
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(reports))), thread_name_prefix="report") as executor:
+        return list(executor.map(render_one, reports))
+
+
+def cached_stage(key: Optional[str], compute: Callable[[], object],
+                 cacheable: Callable[[object], bool] = lambda value: True):
+    """
+    Returns the stage result cached under `key`, or computes it and stores it when `cacheable(result)`.
+    `key` None (caching disabled or no content fingerprint) always computes.
+    """
+    cache = get_stage_cache()
+    if cache is None or key is None:
+        return compute()
+    value = cache.get(key)
+    if value is not None:
+        print(f"Stage cache hit: {key}")
+        return value
+    value = compute()
+    if value is not None and cacheable(value):
+        cache.put(key, value)
+    return value
+
+
+class SkipTranscript(Exception):
+    """
+    Raised by a pipeline stage to stop the graph without an error (e.g. the file is not an interview).
+    """
+
+
+class StageGraph:
+    """
+    Dependency graph of blocking pipeline stages. Each stage receives the results of the stages it runs
+    after and starts on a worker thread as soon as they finish, so independent branches overlap.
+    `run()` records the start and end of every stage; `report()` gives the critical path, the chain of
+    dependencies that determined the end-to-end latency.
+    """
+
+    def __init__(self, concurrent: bool = PIPELINE_CONCURRENT_STAGES):
+        self.concurrent = concurrent
+        self.stages: Dict[str, Tuple[Callable, Tuple[str, ...]]] = {}
+        self.timings: Dict[str, Dict[str, float]] = {}
+        self.wall_seconds = 0.0
+
+    def add(self, name: str, function: Callable, after: Iterable[str] = ()) -> "StageGraph":
+        """
+        Adds a stage called as function(*results of `after`). Dependencies must be added first,
+        so the graph has no cycles and insertion order is a valid sequential order.
+        """
+        after = tuple(after)
+        unknown = [dependency for dependency in after if dependency not in self.stages]
+        if unknown or name in self.stages:
+            raise ValueError(f"Stage '{name}': duplicate name or unknown dependencies {unknown}")
+        self.stages[name] = (function, after)
+        return self
+
+    def run(self) -> Dict[str, object]:
+        """
+        Runs every stage and returns {stage: result}. The first stage that raises stops the graph:
+        stages not started yet are cancelled and the exception propagates.
+        """
+        self.timings = {}
+        started = time.perf_counter()
+        try:
+            if self.concurrent:
+                return asyncio.run(self._run_async(started))
+            results = {}
+            for name in self.stages:
+                results[name] = self._run_stage(name, results, started)
+            return results
+        finally:
+            self.wall_seconds = time.perf_counter() - started
+
+    def _run_stage(self, name: str, results: Dict[str, object], started: float):
+        function, after = self.stages[name]
+        stage_started = time.perf_counter()
+        try:
+            with TRACER.span(f"stage.{name}"):
+                return function(*(results[dependency] for dependency in after))
+        finally:
+            self.timings[name] = {"start": stage_started - started, "end": time.perf_counter() - started}
+
+    async def _run_async(self, started: float) -> Dict[str, object]:
+        results: Dict[str, object] = {}
+        tasks = {}
+
+        async def run_when_ready(name: str):
+            after = self.stages[name][1]
+            if after:
+                await asyncio.gather(*(tasks[dependency] for dependency in after))
+            # Las etapas usan clientes bloqueantes (GCS, Vertex AI): cada una corre en un hilo del loop
+            results[name] = await asyncio.to_thread(self._run_stage, name, results, started)
+
+        for name in self.stages:
+            tasks[name] = asyncio.ensure_future(run_when_ready(name))
+        try:
+            await asyncio.gather(*tasks.values())
+        finally:
+            for task in tasks.values():
+                task.cancel()
+        return results
+
+    def critical_path(self) -> List[str]:
+        """
+        Stages from the first to the one that finished last, following at each step back the
+        dependency that finished latest (the one the stage was waiting for).
+        """
+        if not self.timings:
+            return []
+        name = max(self.timings, key=lambda stage: self.timings[stage]["end"])
+        path = [name]
+        while True:
+            after = [dependency for dependency in self.stages[name][1] if dependency in self.timings]
+            if not after:
+                return path[::-1]
+            name = max(after, key=lambda stage: self.timings[stage]["end"])
+            path.append(name)
+
+    def report(self) -> Dict:
+        """
+        Per-stage timing plus wall time, the sum of stage times (the sequential cost) and the critical path.
+        """
+        durations = {name: timing["end"] - timing["start"] for name, timing in self.timings.items()}
+        path = self.critical_path()
+        return {
+            "concurrent": self.concurrent,
+            "wall_seconds": round(self.wall_seconds, 3),
+            "stage_seconds_sum": round(sum(durations.values()), 3),
+            "critical_path": path,
+            "critical_path_seconds": round(sum(durations[name] for name in path), 3),
+            "stages": {name: {"start": round(self.timings[name]["start"], 3), "seconds": round(durations[name], 3)}
+                       for name in self.timings},
+        }
+
+
+def process_single_transcript(bucket_name: str, file_name: str, concurrent: bool = PIPELINE_CONCURRENT_STAGES) -> Dict:
+    """
+    Runs the whole chain for one file as a StageGraph:
+
+        prepare (download -> extract -> classify -> parse) -> embed
+                                                           -> upload_txt
+                                                           -> analyze (after embed only if the prompt uses
+                                                                       the embeddings) -> upload_docx
+
+    Returns {"file_name", "status": "processed" | "skipped", "timing", ...}; errors propagate to the caller.
+    """
+    candidate_name = extract_candidate_name(file_name)
+
+ 
+    print(f"Candidate name: {candidate_name}")
+
+    
+    print(f"Processing file: gs://{bucket_name}/{file_name}")
+    prompt_template = RESOURCE_POOL.get("prompt_template")
+    segment_prompt_template = RESOURCE_POOL.get("segment_prompt_template")
+    generation_config = {
+        "temperature": TEMPERATURE,
+        "max_output_tokens": MAX_OUTPUT_TOKENS,
+        "top_k": TOP_K,
+        "top_p": TOP_P,
+    }
+
+    def prepare() -> Dict:
+        # Las entradas de la caché se indexan por el contenido del archivo: un PDF re-subido o un evento
+        # re-entregado no vuelve a extraer el texto ni a llamar a Vertex AI
+        fingerprint = content_fingerprint(bucket_name, file_name) if get_stage_cache() is not None else None
+        cache_parts = (fingerprint, candidate_name)
+        transcript__ = [cached_stage(
+            StageCache.key("dialogue", *cache_parts, JOB_INTERVIEW_KEYWORD_SETS, JOB_INTERVIEW_KEYWORD_FORMS,
+                           MIN_KEYWORD_MATCHES, MIN_INTERVIEW_SCORE)
+            if fingerprint else None,
+            lambda: process_preparation(
+                bucket_name, file_name, candidate_name, JOB_INTERVIEW_KEYWORD_SETS, MIN_KEYWORD_MATCHES
+            )[0],
+            cacheable=lambda prepared: not prepared.get("download_failed") and prepared.get("status") != "error",
+        )]
+        if not transcript__[0].get("is_interview"):
+            # No se gasta ninguna llamada a Vertex AI en archivos que no son entrevistas
+            raise SkipTranscript(transcript__[0].get("reason"))
+
+        # tsplit = str(transcript__.splitlines())
+        dialogo = transcript__[0].get("dialogue")
+
+        if dialogo:
+            dialogue_text_str = "\n".join([f"{turn['speaker']}: {turn['text']}" for turn in dialogo])
+        else:
+            dialogue_text_str = ""
+            print("Warning: The dialogue is empty or could not be extracted.")
+            # Podrías querer manejar este caso de manera diferente, por ejemplo, no proceder con embeddings o LLM.
+        return {"dialogue": dialogo or [], "dialogue_text": dialogue_text_str,
+                "fingerprint": fingerprint, "cache_parts": cache_parts}
+
+    def embed(prepared: Dict) -> List[float]:
+        # Embeddings por fragmentos alineados a turnos (sin truncar las entrevistas largas), guardados en EMBEDDINGS/;
+        # la caché guarda el vector del documento, así que una transcripción ya procesada no se vuelve a embeber.
+        # La clave incluye el nombre del archivo: EMBEDDINGS/<vector_id>.npz y su entrada en el índice dependen de él,
+        # y un acierto con el mismo contenido bajo otro nombre no los escribiría
+        if not prepared["dialogue_text"]:
+            print("Warning: No embeddings were generated because the dialogue text is empty.")
+            return [] # O maneja el caso de embeddings vacíos como sea apropiado
+        return cached_stage(
+            StageCache.key("embedding", *prepared["cache_parts"], file_name, EMBEDDING_MODEL, EMBEDDING_CHUNK_TOKENS,
+                           EMBEDDING_OUTPUT_DIMENSIONALITY, EMBEDDING_STORAGE_DTYPE) if prepared["fingerprint"] else None,
+            lambda: embed_dialogue(prepared["dialogue"], transcript_vector_id(candidate_name, file_name)),
+        )["document"]
+
+    def upload_txt(prepared: Dict) -> str:
+        # Guardar el diálogo como .txt en la carpeta "TXT"
+        txt_blob_name = f"TXT/{candidate_name}.txt" # Asegúrate que reclut esté definido antes de esta línea
+        txt_bytes = prepared["dialogue_text"].encode("utf-8")
+        with TRACER.span("upload_txt", bytes_out=len(txt_bytes)):
+            RESOURCE_POOL.call(
+                "storage",
+                lambda client: client.bucket(BUCKET_DESTINO).blob(txt_blob_name).upload_from_string(
+                    txt_bytes, content_type="text/plain"),  # Usar dialogue_text_str
+            )
+        print(f"Dialogue saved at: gs://{BUCKET_DESTINO}/{txt_blob_name}")
+        return txt_blob_name
+
+    def analyze(prepared: Dict, embeddings: Optional[List[float]] = None) -> Dict:
+        # Los embeddings ya se guardaron en EMBEDDINGS/ (embed_dialogue); el prompt recibe el vector del documento
+        if embeddings: # Solo guardar si se generaron embeddings
+            embeddings_summary = embeddings[:40]
+            embeddings_str_for_prompt = ", ".join(map(str, embeddings_summary))
+        else:
+            embeddings_str_for_prompt = "No embeddings generated." # O un string vacío
+        prompt = prompt_template.format(embeddings_str=embeddings_str_for_prompt) # Usar la variable correcta
+
+        def generate():
+            # Entrevistas largas: resúmenes por segmento en paralelo y una llamada final dentro de PROMPT_TOKEN_BUDGET
+            contents, plan = assemble_analysis_contents(
+                prompt, prepared["dialogue"], prepared["dialogue_text"], candidate_name, segment_prompt_template)
+            print(f"Analysis plan: {plan}")
+            # Llamar a Gemini con el contenido y el prompt; la respuesta sigue el esquema de ANALYSIS_FIELDS y
+            # se valida campo a campo mientras llega (los campos mal formados se piden de nuevo, solos)
+            return generate_analysis(contents, generation_config)
+
+        prompt_hash = hashlib.sha256((prompt_template + segment_prompt_template).encode("utf-8")).hexdigest()
+        budget = (PROMPT_TOKEN_BUDGET, MAP_SEGMENT_TOKENS, MAP_MAX_OUTPUT_TOKENS, MAP_TEMPERATURE)
+        return cached_stage(
+            StageCache.key("analysis", *prepared["cache_parts"], prompt_hash, LLM_MODEL, generation_config, budget,
+                           ANALYSIS_FIELDS)
+            if prepared["fingerprint"] else None,
+            generate,
+            # Una respuesta incompleta no se guarda: el próximo intento vuelve a llamar a Gemini
+            cacheable=lambda analysis: "raw_response" not in analysis and ANALYSIS_MISSING_ANSWER not in analysis.values(),
+        )
+
+    def upload_docx(json_return: Dict) -> str:
+        reclut = extract_reclut(file_name)
+        output_blob_name = str(candidate_name) + "-" + str(reclut) + ".docx"#.replace(".pdf",".docx")#.replace(".docx", "-interview-analysis.docx")
+
+        # Plantilla cargada una vez por instancia; el documento se escribe directo en la subida al bucket destino
+        upload_report(output_blob_name, json_return)
+
+        print(f"Result saved at: gs://{BUCKET_DESTINO}/{output_blob_name}")
+        return output_blob_name
+
+    # Gemini solo espera a los embeddings si el prompt los incluye; el DOCX solo espera al análisis
+    analysis_after = ("prepare", "embed") if "{embeddings_str}" in prompt_template else ("prepare",)
+    graph = (StageGraph(concurrent)
+             .add("prepare", prepare)
+             .add("embed", embed, after=("prepare",))
+             .add("upload_txt", upload_txt, after=("prepare",))
+             .add("analyze", analyze, after=analysis_after)
+             .add("upload_docx", upload_docx, after=("analyze",)))
+    try:
+        with TRACER.span("pipeline", file_name=file_name, concurrent=concurrent):
+            results = graph.run()
+    except SkipTranscript as skip:
+        print(f"Skipping '{file_name}': {skip}")
+        return {"file_name": file_name, "status": "skipped", "reason": str(skip), "timing": graph.report()}
+    timing = graph.report()
+    print(json.dumps({"pipeline_timing": file_name, **timing}))
+    return {"file_name": file_name, "status": "processed", "txt_blob": results["upload_txt"],
+            "report_blob": results["upload_docx"], "timing": timing}
+
+
+def list_transcript_files(bucket_name: str, prefix: str) -> List[str]:
+    """
+    Names of the PDF and text files under `prefix` in the bucket (folder placeholders are skipped).
+    """
+    blobs = RESOURCE_POOL.call("storage", lambda client: list(client.list_blobs(bucket_name, prefix=prefix)))
+    return [blob.name for blob in blobs if blob.name.lower().endswith(TRANSCRIPT_FILE_EXTENSIONS)]
+
+
+def run_concurrently(operation: Callable[[str], Dict], file_names: List[str], max_workers: int) -> List[Dict]:
+    """
+    Applies `operation` to every file with at most `max_workers` threads, in the caller's context (current
+    span, CPU stage). Results keep the input order; a file that raises gets {"file_name", "status": "error",
+    "error"} instead of aborting the batch.
+    """
+    def run_one(file_name: str) -> Dict:
+        started = time.perf_counter()
+        try:
+            result = operation(file_name)
+        except Exception as e:
+            print(f"Error processing '{file_name}': {e!r}")
+            result = {"file_name": file_name, "status": "error", "error": repr(e)}
+        result["seconds"] = round(time.perf_counter() - started, 3)
+        return result
+
+    if len(file_names) <= 1 or max_workers <= 1:
+        return [run_one(file_name) for file_name in file_names]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(file_names)), thread_name_prefix="batch") as executor:
+        return list(executor.map(in_current_context(run_one), file_names))
+
+
+def process_batch(
+    bucket_name: str,
+    file_names: Optional[List[str]] = None,
+    prefix: Optional[str] = None,
+    max_workers: int = BATCH_MAX_WORKERS,
+) -> List[Dict]:
+    """
+    Runs process_single_transcript() for an explicit list of files or for every transcript under `prefix`,
+    `max_workers` files at a time. The I/O stages (GCS, Vertex AI) run on threads that share the warm
+    RESOURCE_POOL clients; extraction and parsing go to the CPU stage pool (CPU_STAGE_WORKERS processes).
+    Returns one result per file, errors included.
+    """
+    if file_names is None:
+        file_names = list_transcript_files(bucket_name, prefix or "")
+    started = time.perf_counter()
+    # Extracción y parseo en el pool de procesos de la etapa CPU; GCS y Vertex AI siguen en los hilos del lote
+    token = _cpu_stage_active.set(True)
+    try:
+        results = run_concurrently(lambda name: process_single_transcript(bucket_name, name), file_names, max_workers)
+    finally:
+        _cpu_stage_active.reset(token)
+    counts = {}
+    for result in results:
+        counts[result["status"]] = counts.get(result["status"], 0) + 1
+    print(f"Batch of {len(results)} files with {max_workers} workers in {time.perf_counter() - started:.1f}s: {counts}")
+    return results
+
+
+def int_parameter(payload: Dict, name: str, default: int, minimum: int, maximum: int) -> int:
+    """
+    Integer field of an HTTP request body, clamped to [minimum, maximum]. Raises ValueError (answered
+    with a 400) when the value is not an integer.
+    """
+    value = payload.get(name, default)
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ValueError(f"'{name}' must be an integer.")
+    try:
+        value = int(value)
+    except ValueError:
+        raise ValueError(f"'{name}' must be an integer.") from None
+    return max(minimum, min(maximum, value))
+
+
+@functions_framework.http
+def process_transcription_batch(request):
+    """
+    HTTP entry point for bulk uploads. Body: {"prefix": "..."} or {"files": [...]}, optional "bucket"
+    and "max_workers" (clamped to 1..BATCH_MAX_WORKERS). Responds with the per-file results.
+    """
+    payload = request.get_json(silent=True) or {}
+    if not payload.get("files") and payload.get("prefix") is None:
+        return {"error": "Provide 'files' or 'prefix'."}, 400
+    try:
+        max_workers = int_parameter(payload, "max_workers", BATCH_MAX_WORKERS, 1, BATCH_MAX_WORKERS)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    results = process_batch(
+        payload.get("bucket", BUCKET_NAME),
+        file_names=payload.get("files"),
+        prefix=payload.get("prefix"),
+        max_workers=max_workers,
+    )
+    return {"results": results}, 200
+
+
+@functions_framework.http
+def similar_candidates(request):
+    """
+    HTTP entry point for the similarity index. Body: {"candidate": "Name", "k": 5} returns the closest
+    past candidates; {"compact": true} (optionally with "rebuild": true) merges the pending vectors.
+    """
+    payload = request.get_json(silent=True) or {}
+    if payload.get("compact"):
+        return {"candidates": compact_candidate_index(rebuild=bool(payload.get("rebuild")))}, 200
+    if not payload.get("candidate"):
+        return {"error": "Provide 'candidate' or 'compact'."}, 400
+    try:
+        k = int_parameter(payload, "k", 5, 1, SIMILAR_CANDIDATES_MAX_K)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    try:
+        matches = find_similar_candidates(payload["candidate"], k)
+    except KeyError as e:
+        return {"error": str(e)}, 404
+    return {"candidate": payload["candidate"],
+            "similar": [{"candidate": candidate_of(vector_id), "id": vector_id, "score": round(score, 4)}
+                        for vector_id, score in matches]}, 200
+
+
 @functions_framework.cloud_event
 def process_transcription(cloud_event):
     try:
@@ -522,114 +3962,25 @@ def process_transcription(cloud_event):
     
     bucket_name = BUCKET_NAME#data["bucket"]
     file_name = data["name"]
-    candidate_name = extract_candidate_name(file_name)
-
- 
-    print(f"Candidate name: {candidate_name}")
-
-    
-    print(f"Processing file: gs://{bucket_name}/{file_name}")
-    transcript__ = process_preparation(
-        bucket_name, file_name, candidate_name, JOB_INTERVIEW_KEYWORDS, MIN_KEYWORD_MATCHES
-    )
-    
-    # tsplit = str(transcript__.splitlines())
-    dialogo = transcript__[0].get("dialogue")
-    
-    if dialogo:
-        dialogue_text_str = "\n".join([f"{turn['speaker']}: {turn['text']}" for turn in dialogo])
-    else:
-        dialogue_text_str = ""
-        print("Warning: The dialogue is empty or could not be extracted.")
-        # Podrías querer manejar este caso de manera diferente, por ejemplo, no proceder con embeddings o LLM.
-
-    # Generar embeddings del texto (asegúrate de que dialogue_text_str no esté vacío si es un requisito)
-    embedding_model = TextEmbeddingModel.from_pretrained(EMBEDDING_MODEL)
-    
-    # El modelo de embedding espera una lista de textos. Si solo tienes uno, envuélvelo en una lista.
-    if dialogue_text_str:
-        embeddings = embedding_model.get_embeddings([dialogue_text_str])[0].values
-    else:
-        embeddings = [] # O maneja el caso de embeddings vacíos como sea apropiado
-        print("Warning: No embeddings were generated because the dialogue text is empty.")
-
-    # Guardar el diálogo como .txt en la carpeta "TXT"
-    txt_blob_name = f"TXT/{candidate_name}.txt" # Asegúrate que reclut esté definido antes de esta línea
-    txt_blob = storage.Client().bucket(BUCKET_DESTINO).blob(txt_blob_name)
-    txt_blob.upload_from_string(dialogue_text_str, content_type="text/plain") # Usar dialogue_text_str
-    print(f"Dialogue saved at: gs://{BUCKET_DESTINO}/{txt_blob_name}")
-
-    # Guardar los embeddings como .npy en la carpeta "EMBEDDINGS"
-    if embeddings: # Solo guardar si se generaron embeddings
-        # embeddings_blob_name = f"EMBEDDINGS/{candidate_name}.npy"
-        # embeddings_blob = storage.Client().bucket(BUCKET_DESTINO).blob(embeddings_blob_name)
-        # embeddings_bytes = BytesIO()
-        # np.save(embeddings_bytes, np.array(embeddings))
-        # embeddings_bytes.seek(0)
-        # embeddings_blob.upload_from_file(embeddings_bytes, content_type="application/octet-stream")
-        # print(f"Embeddings guardados en: gs://{BUCKET_DESTINO}/{embeddings_blob_name}")
-        # print(f"Embeddings generados para el archivo {file_name}")
-
-        embeddings_summary = embeddings[:40]
-        embeddings_str_for_prompt = ", ".join(map(str, embeddings_summary))
-    else:
-        embeddings_str_for_prompt = "No embeddings generated." # O un string vacío
-
-    with open(PROMPT, "r", encoding="utf-8") as f:
-        prompt_template = f.read()
-    prompt = prompt_template.format(embeddings_str=embeddings_str_for_prompt) # Usar la variable correcta
-
-    # Llamar a Gemini con el contenido y el prompt
-    model = GenerativeModel(LLM_MODEL)
-    response = model.generate_content(
-        prompt + "\n\nInterview transcription:\n" + dialogue_text_str, # Usar dialogue_text_str
-        generation_config={
-            "temperature": TEMPERATURE,
-            "max_output_tokens": 3500,
-            "top_k": TOP_K,
-            "top_p": TOP_P,
-        }
-    )
+    ledger = get_ledger()
+    # Un span raíz por invocación: las etapas, reintentos y tokens quedan en la misma traza
+    with TRACER.span("process_transcription", file_name=file_name, bucket=bucket_name) as span:
+        if ledger is None:
+            process_single_transcript(bucket_name, file_name)
+        else:
+            # Entregas duplicadas (Eventarc es at-least-once) y re-subidas idénticas reutilizan el primer resultado
+            generation, fingerprint = event_identity(bucket_name, file_name, data)
+            if generation is None:
+                print(f"Object gs://{bucket_name}/{file_name} no longer exists; nothing to process.")
+            else:
+                result = ledger.run(bucket_name, file_name, generation, fingerprint,
+                                    lambda: process_single_transcript(bucket_name, file_name))
+                span.set(duplicate=result.get("duplicate", ""))
+            print(json.dumps({"idempotency_ledger": ledger.stats}))
+    if STARTUP_PROFILE:
+        print(json.dumps({"startup_profile": "report", **startup_profile_report()}))
 
-    # Parsear y guardar o loggear la respuesta
-    try:
-        candidates = response.to_dict().get("candidates")[0]
-        texto = candidates.get("content").get("parts")[0].get("text")
-        texto_ = texto.replace("```json\n","").replace("\n","").replace("  ","").replace("```","")
-        json_return = json.loads(texto_)
-        
-    except Exception:
-        result_json = {"raw_response": response.text}
-    reclut = extract_reclut(file_name)
-    output_blob_name = str(candidate_name) + "-" + str(reclut) + ".docx"#.replace(".pdf",".docx")#.replace(".docx", "-interview-analysis.docx")
-    document = Document()
-    document.add_heading("Interview Analysis", 0)
-    if len(list(json_return.keys())) == 1:
-        main_key = list(json_return.keys())[0]
-        json_iter = json_return.get(main_key)
-        for item in json_iter:
-            document.add_heading(item, level=1)
-            document.add_paragraph(str(json_iter.get(item)))
-    else:
-        for item in json_return.keys():
-            document.add_heading(item, level=1)
-            document.add_paragraph(str(json_return.get(item)))
 
-    # Guardar en un buffer
-    
-    word_buffer = BytesIO()
-    document.save(word_buffer)
-    word_buffer.seek(0)
-    # Save the Word document locally
-    # local_output_path = os.path.join(os.getcwd(), output_blob_name)
-    # with open(local_output_path, "wb") as local_file:
-    #     local_file.write(word_buffer.getvalue())
-    # print(f"Resultado guardado localmente en: {local_output_path}")
-
-    # Subir al bucket destino
-    storage_client = storage.Client()
-    output_blob = storage_client.bucket(BUCKET_DESTINO).blob(output_blob_name)
-    output_blob.upload_from_file(word_buffer, content_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document")
-
-    print(f"Result saved at: gs://{BUCKET_DESTINO}/{output_blob_name}")
-    
+MODULE_LOAD_MS = round((time.perf_counter() - _MODULE_LOAD_STARTED) * 1000, 1)
+if STARTUP_PROFILE:
+    print(json.dumps({"startup_profile": "module_load", "ms": MODULE_LOAD_MS}))
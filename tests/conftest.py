@@ -0,0 +1,29 @@
+"""
+Shared fixtures. The Cloud Function source files are deployed as `main.py`, so they are not
+importable packages: each one is loaded from its path, as poc-benchmarks.py does.
+"""
+import importlib.util
+import os
+import sys
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_function_module(file_name: str, module_name: str):
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(REPO_DIR, file_name))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture(scope="session")
+def transcription():
+    return load_function_module("process-transcription-fn-poc.py", "process_transcription_fn_poc")
+
+
+@pytest.fixture(scope="session")
+def upload_trigger():
+    return load_function_module("upload-trigger-1.py", "upload_trigger_1")
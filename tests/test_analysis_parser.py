@@ -0,0 +1,76 @@
+import json
+import random
+
+import pytest
+
+SEEDS = range(20)
+
+
+@pytest.fixture
+def fields(transcription):
+    return [name for name, _ in transcription.ANALYSIS_FIELDS]
+
+
+def answers(fields, rng: random.Random):
+    samples = ['Leads a team of 5, "the platform squad".', "Python, SQL\nand {dbt} [models]", "C:\\path, 50%",
+               "Gana 50.000 € al año", "", "\U0001F600 tab\there"]
+    return {name: rng.choice(samples) for name in fields}
+
+
+def feed_in_pieces(transcription, fields, text, rng):
+    parser = transcription.IncrementalAnalysisParser(fields)
+    position = 0
+    while position < len(text):
+        step = rng.randint(1, 25)
+        parser.feed(text[position:position + step])
+        position += step
+    parser.finish()
+    return parser
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_random_chunking_matches_json_loads(transcription, fields, seed):
+    rng = random.Random(seed)
+    expected = answers(fields, rng)
+    text = json.dumps(expected, ensure_ascii=rng.random() < 0.5, indent=rng.choice([None, 2]))
+    parser = feed_in_pieces(transcription, fields, text, rng)
+    assert parser.fields == expected
+    assert parser.missing() == [] and parser.invalid == {}
+
+
+def test_fence_and_raw_newlines_are_accepted(transcription, fields):
+    expected = {name: f"answer {number}" for number, name in enumerate(fields)}
+    body = json.dumps(expected, indent=2).replace("answer 3", "answer\n3")
+    parser = feed_in_pieces(transcription, fields, "```json\n" + body + "\n```", random.Random(0))
+    assert parser.fields[fields[3]] == "answer\n3"
+    assert parser.missing() == []
+
+
+def test_truncated_response_keeps_the_complete_fields(transcription, fields):
+    text = json.dumps({name: f"answer {number}" for number, name in enumerate(fields)})
+    cut = text.index(f'"{fields[5]}"') + len(fields[5]) + 8
+    parser = feed_in_pieces(transcription, fields, text[:cut], random.Random(1))
+    assert list(parser.fields) == fields[:5]
+    assert parser.missing() == fields[5:]
+
+
+def test_last_value_without_closing_brace(transcription, fields):
+    text = json.dumps({name: "ok" for name in fields})[:-1]
+    parser = feed_in_pieces(transcription, fields, text, random.Random(2))
+    assert parser.missing() == []
+
+
+def test_malformed_wrong_type_and_unexpected_fields(transcription, fields):
+    text = ('{"%s": "ok", "%s": "unterminated \\q", "%s": 42, "extra": "x", "%s": ["a"]}'
+            % (fields[0], fields[1], fields[2], fields[3]))
+    parser = feed_in_pieces(transcription, fields, text, random.Random(3))
+    assert parser.fields == {fields[0]: "ok"}
+    assert parser.invalid == {fields[1]: "malformed value", fields[2]: "expected a string, got int",
+                              "extra": "unexpected field", fields[3]: "expected a string, got list"}
+    assert parser.missing() == fields[1:]
+
+
+def test_first_occurrence_of_a_field_wins(transcription, fields):
+    parser = transcription.IncrementalAnalysisParser(fields)
+    parser.feed('{"%s": "first", "%s": "second"}' % (fields[0], fields[0]))
+    assert parser.fields == {fields[0]: "first"}
@@ -0,0 +1,137 @@
+import io
+import threading
+
+import numpy
+import pytest
+
+
+@pytest.fixture
+def fresh_index(transcription, monkeypatch):
+    monkeypatch.setattr(transcription, "_candidate_index", None)
+    monkeypatch.setattr(transcription, "_candidate_index_appends", None)
+    return transcription
+
+
+def make_index(transcription, ids):
+    index = transcription.CandidateIndex(dimensions=3)
+    for number, vector_id in enumerate(ids):
+        index.add(vector_id, numpy.eye(3, dtype=numpy.float32)[number % 3])
+    return index
+
+
+def test_transcript_ids_do_not_collide(transcription):
+    first = transcription.transcript_vector_id("nonamecandidate", "TRANSCRIPTIONS/a.pdf")
+    second = transcription.transcript_vector_id("nonamecandidate", "TRANSCRIPTIONS/b.pdf")
+    assert first != second
+    assert transcription.candidate_of(first) == "nonamecandidate"
+    assert transcription.candidate_of(transcription.transcript_vector_id("Ana-Maria", "x.docx")) == "Ana-Maria"
+    # Ids anteriores (solo el nombre) siguen resolviendo al candidato
+    assert transcription.candidate_of("Jean Massucatto") == "Jean Massucatto"
+
+
+def test_find_similar_by_candidate_name_uses_latest_transcript(fresh_index, monkeypatch):
+    transcription = fresh_index
+    old_id = transcription.transcript_vector_id("Ana", "old.pdf")
+    new_id = transcription.transcript_vector_id("Ana", "new.pdf")
+    index = make_index(transcription, [old_id, "Bob", new_id])
+    monkeypatch.setattr(transcription, "load_candidate_index", lambda: (index, None))
+    matches = transcription.find_similar_candidates("Ana", k=3)
+    assert new_id not in [vector_id for vector_id, _ in matches]
+    assert matches[0][0] == old_id
+    with pytest.raises(KeyError):
+        transcription.find_similar_candidates("Nobody")
+
+
+def test_reload_does_not_block_appends_or_queries(fresh_index, monkeypatch):
+    transcription = fresh_index
+    monkeypatch.setattr(transcription, "_candidate_index", (make_index(transcription, ["old"]), 0.0))
+    monkeypatch.setattr(transcription, "RESOURCE_POOL", type("Pool", (), {"call": staticmethod(lambda kind, fn: None)}))
+    loading, release = threading.Event(), threading.Event()
+
+    def slow_load():
+        loading.set()
+        assert release.wait(5)
+        return make_index(transcription, ["reloaded"]), None
+
+    monkeypatch.setattr(transcription, "load_candidate_index", slow_load)
+    reloaded = []
+    worker = threading.Thread(target=lambda: reloaded.append(transcription.get_candidate_index(max_age_seconds=0)))
+    worker.start()
+    assert loading.wait(5)
+    # Durante la recarga: otra consulta usa el índice anterior y los appends no esperan
+    assert "old" in transcription.get_candidate_index(max_age_seconds=0).rows
+    transcription.append_candidate_vector("appended", numpy.ones(3, dtype=numpy.float32))
+    release.set()
+    worker.join(5)
+    assert set(reloaded[0].rows) == {"reloaded", "appended"}
+    assert transcription.get_candidate_index().rows == reloaded[0].rows
+
+
+def test_latest_transcript_is_chosen_by_added_time_not_row(fresh_index, monkeypatch, tmp_path):
+    transcription = fresh_index
+    new_id = transcription.transcript_vector_id("Ana", "new.pdf")
+    old_id = transcription.transcript_vector_id("Ana", "old.pdf")
+    # Tras una recarga las filas siguen el orden del listado: el más nuevo puede quedar primero
+    index = transcription.CandidateIndex(dimensions=3)
+    index.add_many([new_id, "Bob", old_id], numpy.eye(3, dtype=numpy.float32), added=[300.0, 200.0, 100.0])
+    reloaded = transcription.CandidateIndex.from_archive(index.to_archive(str(tmp_path / "snapshot")))
+    assert reloaded.added == [300.0, 200.0, 100.0]
+    monkeypatch.setattr(transcription, "load_candidate_index", lambda: (reloaded, []))
+    matches = transcription.find_similar_candidates("Ana", k=3)
+    assert new_id not in [vector_id for vector_id, _ in matches]
+
+
+class StoredBlob:
+    def __init__(self, store, name):
+        self.store, self.name, self.updated = store, name, None
+
+    def download_as_bytes(self):
+        return self.store.objects[self.name]
+
+    def upload_from_filename(self, path, content_type=None):
+        with open(path, "rb") as source:
+            self.store.objects[self.name] = source.read()
+
+    def delete(self):
+        del self.store.objects[self.name]
+
+
+class VectorStore:
+    """
+    Bucket en memoria; `between_listings` corre después del primer listado, como una escritura concurrente.
+    """
+
+    def __init__(self):
+        self.objects, self.between_listings = {}, None
+
+    def put_vector(self, vector_id, vector):
+        buffer = io.BytesIO()
+        numpy.savez(buffer, document=numpy.asarray(vector, dtype=numpy.float32))
+        self.objects[f"EMBEDDINGS/{vector_id}.npz"] = buffer.getvalue()
+        buffer = io.BytesIO()
+        numpy.save(buffer, numpy.asarray(vector, dtype=numpy.float32))
+        self.objects[f"INDEX/pending/{vector_id}.npy"] = buffer.getvalue()
+
+    def list_blobs(self, bucket_name, prefix=None):
+        names = sorted(name for name in self.objects if name.startswith(prefix or ""))
+        hook, self.between_listings = self.between_listings, None
+        if hook:
+            hook()
+        return [StoredBlob(self, name) for name in names]
+
+    def bucket(self, name):
+        return self
+
+    def blob(self, name):
+        return StoredBlob(self, name)
+
+
+def test_rebuild_keeps_pending_vectors_written_during_the_listing(transcription, monkeypatch):
+    store = VectorStore()
+    monkeypatch.setattr(transcription, "RESOURCE_POOL", transcription.ResourcePool(factories={"storage": lambda: store}))
+    store.put_vector("a-000000000001", [1, 0, 0])
+    # Se escribe después del listado de pendientes y antes del de EMBEDDINGS/
+    store.between_listings = lambda: store.put_vector("b-000000000002", [0, 1, 0])
+    assert transcription.compact_candidate_index(rebuild=True) == 2
+    assert "INDEX/pending/a-000000000001.npy" not in store.objects
+    assert "INDEX/pending/b-000000000002.npy" in store.objects
@@ -0,0 +1,54 @@
+import json
+import os
+import shutil
+
+import pytest
+
+from conftest import REPO_DIR, load_function_module
+
+MIB = 1024 * 1024
+
+
+@pytest.mark.parametrize("cpus, memory, expected", [
+    (1, None, 0),
+    (8, None, 4),
+    (8, 256 * MIB, 0),
+    (8, 512 * MIB, 2),
+    (2, 2048 * MIB, 2),
+])
+def test_default_workers_are_bounded_by_cpus_and_memory(transcription, monkeypatch, cpus, memory, expected):
+    monkeypatch.setattr(transcription.os, "cpu_count", lambda: cpus)
+    monkeypatch.setattr(transcription, "instance_memory_bytes", lambda: memory)
+    assert transcription.default_cpu_stage_workers() == expected
+
+
+def test_pool_is_not_created_when_the_module_is_not_importable_by_name(transcription, monkeypatch, capsys):
+    # Cargado por ruta desde tests/conftest.py: un proceso nuevo no podría importarlo
+    monkeypatch.setattr(transcription, "CPU_STAGE_WORKERS", 2)
+    monkeypatch.setattr(transcription, "CPU_STAGE_START_METHOD", "spawn")
+    assert transcription.create_cpu_stage() is None
+    warning = json.loads(capsys.readouterr().out.splitlines()[-1])
+    assert warning["severity"] == "WARNING"
+    assert "runs on threads" in warning["message"]
+    assert warning["module"] == transcription.__name__
+
+
+def test_process_pool_is_used_when_the_module_is_importable(monkeypatch, tmp_path):
+    # Como functions_framework con main.py: el archivo está en sys.path con un nombre importable
+    shutil.copy(os.path.join(REPO_DIR, "process-transcription-fn-poc.py"), tmp_path / "cpu_stage_main.py")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    module = load_function_module(str(tmp_path / "cpu_stage_main.py"), "cpu_stage_main")
+    monkeypatch.setattr(module, "CPU_STAGE_WORKERS", 1)
+    monkeypatch.setattr(module, "CPU_STAGE_START_METHOD", "spawn")
+    executor = module.create_cpu_stage()
+    try:
+        assert isinstance(executor, module.ProcessPoolExecutor)
+        monkeypatch.setattr(module, "_cpu_stage", executor)
+        monkeypatch.setattr(module, "_cpu_stage_created", True)
+        token = module._cpu_stage_active.set(True)
+        try:
+            assert module.run_cpu_stage(os.getpid) != os.getpid()
+        finally:
+            module._cpu_stage_active.reset(token)
+    finally:
+        executor.shutdown()
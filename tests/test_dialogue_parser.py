@@ -0,0 +1,56 @@
+import contextlib
+import io
+
+import pytest
+
+
+def parse(transcription, text, primary="Francisco Ahijado"):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return transcription.parse_interview_dialogue(text, primary)
+
+
+def test_turns_continuations_and_timestamps(transcription):
+    text = ("[00:00:05] francisco ahijado: Hello,\n"
+            "thanks for joining.\n"
+            "00:00:09\n"
+            "Jean Massucatto: Hi! Glad to be here.\n"
+            "  [00:01:10.5] Jean Massucatto: One more thing.\n")
+    assert parse(transcription, text) == [
+        {"speaker": "Francisco Ahijado", "text": "Hello,\nthanks for joining."},
+        {"speaker": "Jean Massucatto", "text": "Hi! Glad to be here."},
+        {"speaker": "Jean Massucatto", "text": "One more thing."},
+    ]
+
+
+def test_other_speaker_keeps_transcript_casing_and_third_speaker_is_kept(transcription):
+    text = "Jean Massucatto: Hi.\nJEAN MASSUCATTO: Again.\nAna-Maria O.: I am taking notes.\nAhijado: Let's start."
+    assert [turn["speaker"] for turn in parse(transcription, text)] == [
+        "Jean Massucatto", "Jean Massucatto", "Ana-Maria O.", "Francisco Ahijado"]
+
+
+@pytest.mark.parametrize("line", [
+    "12:30: lunch",                    # una etiqueta no empieza con un dígito
+    "x" * 61 + ": too long for a label",
+    "No label on this line",
+])
+def test_lines_that_are_not_labels_continue_the_turn(transcription, line):
+    dialogue = parse(transcription, "Jean: Hello\n" + line)
+    assert dialogue == [{"speaker": "Jean", "text": "Hello\n" + line}]
+
+
+def test_text_before_the_first_label_and_empty_turns_are_dropped(transcription):
+    assert parse(transcription, "preamble\nJean:\nJean: Hi") == [{"speaker": "Jean", "text": "Hi"}]
+    assert parse(transcription, "") == []
+    assert parse(transcription, "no speakers at all") == []
+
+
+def test_split_speaker_label(transcription):
+    assert transcription.split_speaker_label("[00:00:05] Jean Massucatto: Hello: world") == (
+        "Jean Massucatto", " Hello: world")
+    assert transcription.split_speaker_label("  - bullet: not a label") == (None, "  - bullet: not a label")
+
+
+def test_long_single_line_is_parsed_in_linear_time(transcription):
+    # El split original con regex era cuadrático en líneas largas sin etiqueta
+    text = "Jean: " + "word " * 200000
+    assert len(parse(transcription, text)) == 1
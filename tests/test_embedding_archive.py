@@ -0,0 +1,60 @@
+import json
+import os
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+
+def unit_rows(count: int, dimensions: int = 8, seed: int = 0):
+    rows = np.random.default_rng(seed).normal(size=(count, dimensions)).astype(np.float32)
+    return rows / np.linalg.norm(rows, axis=1, keepdims=True)
+
+
+@pytest.mark.parametrize("dtype", ["float32", "float16", "int8"])
+def test_scan_returns_the_row_of_each_id(transcription, tmp_path, dtype):
+    archive = transcription.EmbeddingArchive(str(tmp_path), dtype=dtype)
+    rows = unit_rows(6)
+    archive.append([f"id-{row}" for row in range(6)], rows)
+    for row in range(6):
+        assert archive.scan(rows[row], k=1)[0][0] == f"id-{row}"
+
+
+def test_reopened_archive_keeps_count_and_ids(transcription, tmp_path):
+    archive = transcription.EmbeddingArchive(str(tmp_path), dtype="int8")
+    archive.append(["a", "b"], unit_rows(2))
+    archive.append(["c"], unit_rows(1, seed=1))
+    reopened = transcription.EmbeddingArchive(str(tmp_path))
+    assert (reopened.dtype, reopened.dimensions, reopened.count) == ("int8", 8, 3)
+    assert reopened.ids == ["a", "b", "c"]
+
+
+def test_append_after_crash_before_header_write(transcription, tmp_path, monkeypatch):
+    archive = transcription.EmbeddingArchive(str(tmp_path), dtype="int8")
+    first = unit_rows(3)
+    archive.append(["a", "b", "c"], first)
+
+    # Se cae entre los archivos de datos y el reemplazo de archive.json
+    def crash(*args, **kwargs):
+        raise OSError("crash before the header write")
+
+    monkeypatch.setattr(transcription.os, "replace", crash)
+    with pytest.raises(OSError):
+        transcription.EmbeddingArchive(str(tmp_path)).append(["lost-1", "lost-2"], unit_rows(2, seed=1))
+    monkeypatch.undo()
+
+    with open(tmp_path / "ids.jsonl", encoding="utf-8") as ids_file:
+        assert len(ids_file.readlines()) == 5
+    recovered = transcription.EmbeddingArchive(str(tmp_path))
+    assert recovered.count == 3
+    second = unit_rows(2, seed=2)
+    recovered.append(["d", "e"], second)
+
+    reopened = transcription.EmbeddingArchive(str(tmp_path))
+    assert reopened.ids == ["a", "b", "c", "d", "e"]
+    with open(tmp_path / "ids.jsonl", encoding="utf-8") as ids_file:
+        lines = [json.loads(line) for line in ids_file]
+    assert [line["offset"] for line in lines] == [row * reopened.row_bytes for row in range(5)]
+    assert os.path.getsize(tmp_path / "vectors.bin") == 5 * reopened.row_bytes
+    for candidate_id, row in zip(["a", "b", "c", "d", "e"], np.vstack([first, second])):
+        assert reopened.scan(row, k=1)[0][0] == candidate_id
@@ -0,0 +1,40 @@
+import pytest
+
+
+class Request:
+    def __init__(self, payload):
+        self.payload = payload
+
+    def get_json(self, silent=False):
+        return self.payload
+
+
+@pytest.fixture
+def batch_calls(transcription, monkeypatch):
+    calls = []
+    monkeypatch.setattr(transcription, "process_batch", lambda bucket, **kwargs: calls.append(kwargs) or [])
+    return calls
+
+
+@pytest.mark.parametrize("value, expected", [
+    (None, "default"), (3, 3), ("2", 2), (0, 1), (-5, 1), (10 ** 9, "default"),
+])
+def test_batch_max_workers_is_clamped(transcription, batch_calls, value, expected):
+    payload = {"prefix": "bulk/"} if value is None else {"prefix": "bulk/", "max_workers": value}
+    response, status = transcription.process_transcription_batch(Request(payload))
+    assert status == 200
+    assert batch_calls[0]["max_workers"] == (transcription.BATCH_MAX_WORKERS if expected == "default" else expected)
+
+
+@pytest.mark.parametrize("value", ["many", 2.5, True, None, [4], {"n": 4}])
+def test_batch_max_workers_must_be_an_integer(transcription, batch_calls, value):
+    response, status = transcription.process_transcription_batch(Request({"prefix": "bulk/", "max_workers": value}))
+    assert status == 400
+    assert "max_workers" in response["error"]
+    assert batch_calls == []
+
+
+def test_similar_candidates_rejects_bad_k(transcription, monkeypatch):
+    monkeypatch.setattr(transcription, "find_similar_candidates", lambda candidate, k: [])
+    assert transcription.similar_candidates(Request({"candidate": "Ana", "k": "x"}))[1] == 400
+    assert transcription.similar_candidates(Request({"candidate": "Ana", "k": 5}))[1] == 200
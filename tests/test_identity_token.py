@@ -0,0 +1,69 @@
+import base64
+import json
+import threading
+import time
+
+import pytest
+
+from conftest import load_function_module
+
+
+@pytest.fixture
+def trigger(monkeypatch):
+    module = load_function_module("poc-trigger-email.py", "poc_trigger_email")
+    monkeypatch.setattr(module, "_token_cache", {})
+    monkeypatch.setattr(module, "_token_locks", {})
+    return module
+
+
+def make_token(audience):
+    payload = base64.urlsafe_b64encode(json.dumps({"aud": audience, "exp": time.time() + 3600}).encode())
+    return f"header.{payload.decode().rstrip('=')}.signature"
+
+
+class MetadataSession:
+    """
+    Session falso: la petición de `slow_audience` espera a `release`.
+    """
+
+    def __init__(self, slow_audience):
+        self.slow_audience, self.requested, self.release = slow_audience, threading.Event(), threading.Event()
+        self.calls = []
+
+    def get(self, url, params, headers, timeout):
+        self.calls.append(params["audience"])
+        if params["audience"] == self.slow_audience:
+            self.requested.set()
+            assert self.release.wait(5)
+        return type("Response", (), {"text": make_token(params["audience"]), "raise_for_status": lambda self: None})()
+
+
+def test_slow_token_request_does_not_block_other_audiences(trigger, monkeypatch):
+    session = MetadataSession("https://slow")
+    monkeypatch.setattr(trigger, "get_session", lambda: session)
+    tokens = []
+    workers = [threading.Thread(target=lambda: tokens.append(trigger.get_identity_token("https://slow")))
+               for _ in range(2)]
+    for worker in workers:
+        worker.start()
+    assert session.requested.wait(5)
+    # Mientras la otra audience espera al servidor de metadatos
+    fast_token = trigger.get_identity_token("https://fast")
+    assert json.loads(base64.urlsafe_b64decode(fast_token.split(".")[1] + "=="))["aud"] == "https://fast"
+    assert tokens == []
+    session.release.set()
+    for worker in workers:
+        worker.join(5)
+    # Las dos llamadas de la misma audience comparten una sola petición
+    assert session.calls.count("https://slow") == 1
+    assert tokens[0] == tokens[1]
+
+
+def test_posts_are_retried_only_on_429(trigger):
+    retry = trigger.get_session().get_adapter("https://function").max_retries
+    assert isinstance(retry, trigger.ForwardRetry)
+    assert retry.is_retry("POST", 429)
+    assert not retry.is_retry("POST", 503)
+    assert retry.is_retry("GET", 503)
+    # increment() crea el siguiente Retry con la misma clase
+    assert isinstance(retry.new(total=1), trigger.ForwardRetry)
@@ -0,0 +1,101 @@
+import base64
+import json
+import random
+
+import pytest
+
+SEEDS = range(20)
+
+
+def random_splits(data: bytes, rng: random.Random):
+    cuts = sorted(rng.sample(range(1, len(data)), min(len(data) - 1, rng.randint(1, 40))))
+    return [data[start:end] for start, end in zip([0] + cuts, cuts + [len(data)])]
+
+
+def parse(upload_trigger, chunks, stream_field="base64"):
+    parser = upload_trigger.JSONUploadParser(stream_field=stream_field)
+    fields, streamed, ended = {}, bytearray(), False
+    for chunk in chunks:
+        for event, key, value in parser.feed(chunk):
+            if event == "field":
+                fields[key] = value
+            elif event == "data":
+                assert key == stream_field and not ended
+                streamed += value
+            else:
+                ended = True
+    parser.finish()
+    return fields, bytes(streamed), ended
+
+
+def escape_slashes(text: str) -> str:
+    # Algunos serializadores escriben "/" como "\/" (o "\u002f"): el base64 los contiene
+    return text.replace("/", "\\/").replace("+", "\\u002b")
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_random_splits_match_json_loads(upload_trigger, seed):
+    rng = random.Random(seed)
+    payload = {
+        "filename": rng.choice(["entrevista \"final\".pdf", "C:\\temp\\a.txt", "niño\n\tñ.pdf", "emoji \U0001F600.txt"]),
+        "mimeType": "application/pdf",
+        "size": rng.randint(0, 10 ** 9),
+        "ratio": -1.5e-3,
+        "flags": [True, None, {"nested": "a \"}]\" b"}],
+        "meta": {"deep": [[1, 2], {"x": "\\"}]},
+        "done": False,
+        "base64": base64.b64encode(rng.randbytes(rng.randint(0, 3000))).decode("ascii"),
+    }
+    body = escape_slashes(json.dumps(payload, ensure_ascii=rng.random() < 0.5)).encode("utf-8")
+    fields, streamed, ended = parse(upload_trigger, random_splits(body, rng))
+    assert fields == {key: value for key, value in payload.items() if key not in ("flags", "meta", "base64")}
+    assert streamed.decode("ascii") == payload["base64"]
+    assert ended
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_streamed_base64_decodes_across_splits(upload_trigger, seed):
+    rng = random.Random(seed)
+    data = rng.randbytes(rng.randint(1, 5000))
+    encoded = base64.encodebytes(data).decode("ascii")  # con saltos de línea cada 76 caracteres
+    body = ('{"base64": "%s", "filename": "a.bin"}' % escape_slashes(encoded.replace("\n", "\\n"))).encode("ascii")
+    decoder = upload_trigger.Base64StreamDecoder()
+    decoded = bytearray()
+    parser = upload_trigger.JSONUploadParser(stream_field="base64")
+    for chunk in random_splits(body, rng):
+        for event, key, value in parser.feed(chunk):
+            if event == "data":
+                decoded += decoder.feed(value)
+            elif event == "end":
+                decoded += decoder.finish()
+    parser.finish()
+    assert bytes(decoded) == data
+
+
+@pytest.mark.parametrize("escape, expected", [
+    (b"\\/", b"/"), (b"\\\\", b"\\"), (b'\\"', b'"'), (b"\\n", b"\n"), (b"\\u002f", b"/"), (b"\\u00e9", "é".encode()),
+])
+def test_escape_split_at_every_position(upload_trigger, escape, expected):
+    body = b'{"base64": "ab' + escape + b'cd"}'
+    start = body.index(escape)
+    for cut in range(start, start + len(escape) + 1):
+        for stream_field in ("base64", "other"):
+            fields, streamed, _ = parse(upload_trigger, [body[:cut], body[cut:]], stream_field=stream_field)
+            value = streamed if stream_field == "base64" else fields["base64"].encode("utf-8")
+            assert value == b"ab" + expected + b"cd", (cut, stream_field)
+
+
+@pytest.mark.parametrize("body", [
+    b'{"filename": "a"', b'{"filename" "a"}', b'["filename"]', b'{"filename": "a",}x', b'{"a": 1}}',
+])
+def test_invalid_or_incomplete_bodies_are_rejected(upload_trigger, body):
+    with pytest.raises(ValueError):
+        parse(upload_trigger, [body])
+
+
+def test_small_fields_are_bounded(upload_trigger, monkeypatch):
+    monkeypatch.setattr(upload_trigger, "MAX_FIELD_SIZE", 16)
+    with pytest.raises(ValueError):
+        parse(upload_trigger, [b'{"filename": "' + b"x" * 17 + b'"}'])
+    # El campo que se transmite por partes no tiene ese límite
+    assert parse(upload_trigger, [b'{"base64": "' + b"x" * 1000 + b'"}'])[1] == b"x" * 1000
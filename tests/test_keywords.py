@@ -0,0 +1,54 @@
+import contextlib
+import io
+
+import pytest
+
+
+def classify(transcription, text, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return transcription.is_job_interview(text, transcription.JOB_INTERVIEW_KEYWORD_SETS,
+                                              transcription.MIN_KEYWORD_MATCHES, **kwargs)
+
+
+def test_one_low_weight_keyword_is_accepted_as_in_the_original_check(transcription):
+    # "team" pesa 0.5: con el umbral por defecto basta, como con la búsqueda por subcadenas original
+    assert classify(transcription, "Francisco Ahijado: How big is the team these days?")
+
+
+def test_min_score_rejects_generic_keywords_only(transcription):
+    assert not classify(transcription, "Francisco Ahijado: How big is the team these days?", min_score=1.0)
+    assert classify(transcription, "Francisco Ahijado: What salary do you expect?", min_score=1.0)
+
+
+@pytest.mark.parametrize("text", [
+    "Francisco Ahijado: The interviewer will join later.",
+    "Francisco Ahijado: Quarterly cost control review at CVS.",
+])
+def test_keywords_inside_longer_words_do_not_count(transcription, text):
+    assert not classify(transcription, text)
+
+
+def test_phrases_and_spanish_set(transcription):
+    assert classify(transcription, "Francisco Ahijado: So, tell me about yourself.", min_score=3.0)
+    assert classify(transcription, "Francisco Ahijado: ¿Cuáles son tus pretensiones salariales?", min_score=3.0)
+
+
+def test_automaton_counts_match_a_word_scan(transcription):
+    automaton = transcription.KeywordAutomaton({"en": {"team": 1.0, "tell me about yourself": 1.0}})
+    counts = automaton.count("Team, team! Tell me about yourself... teammate")
+    assert counts["en"] == {"team": 2, "tell me about yourself": 1}
+
+
+@pytest.mark.parametrize("text", [
+    "Francisco Ahijado: We are interviewing candidates for two positions; these interviews cover salaries.",
+    "Francisco Ahijado: Estamos haciendo entrevistas a candidatos para dos puestos.",
+])
+def test_plural_and_inflected_forms_count(transcription, text):
+    assert classify(transcription, text, min_score=3.0)
+
+
+def test_inflected_forms_count_once_per_keyword(transcription):
+    automaton = transcription.get_keyword_automaton({"en": {"interview": 2.0}}, transcription.JOB_INTERVIEW_KEYWORD_FORMS)
+    result = automaton.score("Interview, interviews and interviewing; the interviewer.")["en"]
+    assert result["counts"] == {"interview": 3}
+    assert result["score"] == 2.0
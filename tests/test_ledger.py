@@ -0,0 +1,192 @@
+import contextlib
+import io
+import threading
+import time
+
+import pytest
+
+exceptions = pytest.importorskip("google.api_core.exceptions")
+
+
+class FakeBlob:
+    """
+    Lo que usa GCSLedgerBackend de storage.Blob, con las precondiciones de generación de GCS.
+    """
+
+    def __init__(self, client, name):
+        self.client, self.name, self.generation = client, name, None
+
+    def _check(self, if_generation_match):
+        current = self.client.objects.get(self.name, (None, 0))[1]
+        if if_generation_match is not None and if_generation_match != current:
+            raise exceptions.PreconditionFailed(f"{self.name}: generation {current} != {if_generation_match}")
+
+    def download_as_bytes(self):
+        with self.client.lock:
+            if self.name not in self.client.objects:
+                raise exceptions.NotFound(self.name)
+            data, self.generation = self.client.objects[self.name]
+            return data
+
+    def upload_from_string(self, data, content_type=None, if_generation_match=None):
+        hook, self.client.before_write = self.client.before_write, None
+        if hook:
+            hook()
+        with self.client.lock:
+            self._check(if_generation_match)
+            self.client.generation += 1
+            self.generation = self.client.generation
+            self.client.objects[self.name] = (data.encode("utf-8") if isinstance(data, str) else data, self.generation)
+
+    def delete(self, if_generation_match=None):
+        with self.client.lock:
+            if self.name not in self.client.objects:
+                raise exceptions.NotFound(self.name)
+            self._check(if_generation_match)
+            del self.client.objects[self.name]
+
+
+class FakeStorageClient:
+    def __init__(self):
+        self.objects, self.generation, self.lock, self.before_write = {}, 0, threading.Lock(), None
+
+    def bucket(self, name):
+        return self
+
+    def blob(self, name):
+        return FakeBlob(self, name)
+
+
+@pytest.fixture
+def gcs(transcription, monkeypatch):
+    client = FakeStorageClient()
+    monkeypatch.setattr(transcription, "RESOURCE_POOL", transcription.ResourcePool(factories={"storage": lambda: client}))
+    return client
+
+
+@pytest.fixture(params=["sqlite", "gcs"])
+def backend(request, transcription, tmp_path):
+    if request.param == "sqlite":
+        return transcription.SQLiteLedgerBackend(str(tmp_path / "ledger.sqlite3"))
+    request.getfixturevalue("gcs")
+    return transcription.GCSLedgerBackend("ledger-bucket")
+
+
+def test_one_owner_per_key(backend):
+    assert backend.acquire("k", "a", 60) == ("acquired", None)
+    state, record = backend.acquire("k", "b", 60)
+    assert state == "in_progress" and record["owner"] == "a"
+    backend.complete("k", "a", {"status": "ok"})
+    state, record = backend.acquire("k", "b", 60)
+    assert state == "completed" and record["result"] == {"status": "ok"}
+
+
+def test_expired_lease_is_taken_over(backend):
+    backend.acquire("k", "a", -1)
+    state, previous = backend.acquire("k", "b", 60)
+    assert state == "acquired" and previous["owner"] == "a"
+    assert not backend.renew("k", "a", 60)
+    assert backend.renew("k", "b", 60)
+
+
+def test_release_only_removes_own_lease(backend):
+    backend.acquire("k", "a", -1)
+    backend.acquire("k", "b", 60)
+    backend.release("k", "a")
+    assert backend.get("k")["owner"] == "b"
+    backend.release("k", "b")
+    assert backend.get("k") is None
+
+
+def test_concurrent_acquire_has_a_single_winner(backend):
+    barrier = threading.Barrier(8)
+    states = []
+
+    def acquire(owner):
+        barrier.wait()
+        states.append(backend.acquire("k", owner, 60)[0])
+
+    threads = [threading.Thread(target=acquire, args=(f"owner-{number}",)) for number in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(states) == ["acquired"] + ["in_progress"] * 7
+
+
+def test_gcs_takeover_loses_to_a_concurrent_writer(transcription, gcs):
+    backend = transcription.GCSLedgerBackend("ledger-bucket")
+    backend.acquire("k", "a", -1)
+    rival = transcription.GCSLedgerBackend("ledger-bucket")
+    attempts = []
+
+    def rival_takes_over_first():
+        # Entre la lectura del lease vencido y la escritura de "b", "c" toma el registro
+        attempts.append(rival.acquire("k", "c", 60))
+
+    def after_first_attempt():
+        # El primer intento de "b" (ifGenerationMatch=0) falla solo; la carrera es en el reemplazo del lease
+        gcs.before_write = rival_takes_over_first
+
+    gcs.before_write = after_first_attempt
+    state, record = backend.acquire("k", "b", 60)
+    assert attempts[0][0] == "acquired"
+    assert state == "in_progress" and record["owner"] == "c"
+    assert backend.get("k")["owner"] == "c"
+
+
+def test_gcs_renew_and_release_fail_after_takeover(transcription, gcs):
+    first = transcription.GCSLedgerBackend("ledger-bucket")
+    second = transcription.GCSLedgerBackend("ledger-bucket")
+    first.acquire("k", "a", -1)
+    assert second.acquire("k", "b", 60)[0] == "acquired"
+    # La generación que conoce "a" ya no es la actual: no renueva ni borra el lease de "b"
+    assert not first.renew("k", "a", 60)
+    first.release("k", "a")
+    assert first.get("k")["owner"] == "b"
+
+
+def test_ledger_runs_concurrent_duplicates_once(transcription, tmp_path):
+    ledger = transcription.IdempotencyLedger(transcription.SQLiteLedgerBackend(str(tmp_path / "ledger.sqlite3")),
+                                             lease_seconds=30, wait_seconds=5, poll_seconds=0.01)
+    runs = []
+
+    def operation():
+        runs.append(1)
+        time.sleep(0.05)
+        return {"status": "processed"}
+
+    results = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        threads = [threading.Thread(target=lambda: results.append(ledger.run("b", "f.pdf", 1, "md5", operation)))
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # Otra generación con el mismo contenido reutiliza el resultado
+        same_content = ledger.run("b", "f.pdf", 2, "md5", operation)
+    assert len(runs) == 1
+    assert sorted(result.get("duplicate", "") for result in results) == ["", "waited", "waited", "waited"]
+    assert same_content == {"status": "processed", "duplicate": "same_content"}
+
+
+def test_failed_run_releases_the_lease(transcription, tmp_path):
+    ledger = transcription.IdempotencyLedger(transcription.SQLiteLedgerBackend(str(tmp_path / "ledger.sqlite3")))
+
+    def failing():
+        raise RuntimeError("gemini unavailable")
+
+    with pytest.raises(RuntimeError):
+        ledger.run("b", "f.pdf", 1, None, failing)
+    assert ledger.run("b", "f.pdf", 1, None, lambda: {"status": "processed"}) == {"status": "processed"}
+    assert ledger.stats["failed"] == 1 and ledger.stats["executed"] == 1
+
+
+def test_ledger_is_off_by_default_and_gcs_needs_a_bucket(transcription, monkeypatch):
+    assert transcription.LEDGER_BACKEND == "none"
+    assert transcription.create_ledger() is None
+    monkeypatch.setattr(transcription, "LEDGER_BACKEND", "gcs")
+    monkeypatch.setattr(transcription, "LEDGER_BUCKET", "")
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert transcription.create_ledger() is None
@@ -0,0 +1,53 @@
+import pytest
+
+
+class BlockedResponse:
+    # Como GenerationResponse cuando el candidato fue bloqueado: .text levanta ValueError
+    @property
+    def text(self):
+        raise ValueError("Cannot get the response text.")
+
+
+class TextResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+@pytest.fixture
+def dialogue():
+    return [{"speaker": f"Speaker {number % 2}", "text": f"turn {number} " + "word " * 40} for number in range(6)]
+
+
+def summarize(transcription, monkeypatch, dialogue, responses):
+    calls = []
+
+    def fake_generate_text(contents, config):
+        number = int(contents.split("|")[0])
+        calls.append(number)
+        response = responses(number, calls.count(number))
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    monkeypatch.setattr(transcription, "MAP_SEGMENT_TOKENS", 60)
+    monkeypatch.setattr(transcription, "generate_text", fake_generate_text)
+    summaries = transcription.summarize_segments(dialogue, "{segment_number}|{segment_count}|{segment_text}")
+    return summaries, calls
+
+
+def test_blocked_segment_is_retried(transcription, monkeypatch, dialogue):
+    summaries, calls = summarize(transcription, monkeypatch, dialogue, lambda number, attempt: (
+        BlockedResponse() if number == 2 and attempt == 1 else TextResponse(f"summary {number}")))
+    assert [summary for _, summary in summaries] == [f"summary {n}" for n in range(1, len(summaries) + 1)]
+    assert calls.count(2) == 2
+
+
+def test_segment_that_keeps_failing_is_left_out(transcription, monkeypatch, dialogue):
+    summaries, calls = summarize(transcription, monkeypatch, dialogue, lambda number, attempt: (
+        BlockedResponse() if number == 1 else RuntimeError("quota") if number == 3 else
+        TextResponse("  " if number == 4 else f"summary {number}")))
+    segment_count = max(calls)
+    assert segment_count >= 4
+    assert [summary for _, summary in summaries] == [
+        f"summary {n}" for n in range(1, segment_count + 1) if n not in (1, 3, 4)]
+    assert calls.count(1) == calls.count(3) == calls.count(4) == transcription.MAP_SEGMENT_ATTEMPTS
@@ -0,0 +1,85 @@
+import contextlib
+import io
+
+import pytest
+
+fitz = pytest.importorskip("fitz")
+
+SUMMARY = ["Notes by Gemini", "Summary", "The team discussed the role and the next steps.",
+           "- salary expectations and start date were agreed"]
+DIALOGUE = ["Francisco Ahijado: Tell me about your last project.",
+            "Jean Massucatto: We migrated a pipeline to the cloud.",
+            "Francisco Ahijado: And the team size?",
+            "Jean Massucatto: Five engineers."]
+
+
+def write_pdf(path, pages, toc=None):
+    document = fitz.open()
+    for lines in pages:
+        document.new_page().insert_text((36, 36), "\n".join(lines), fontsize=9)
+    if toc:
+        document.set_toc(toc)
+    document.save(str(path))
+    return str(path)
+
+
+def extract(transcription, path, skip):
+    transcription.PDF_SKIP_SUMMARY_PAGES = skip
+    stats = {}
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            text = "".join(transcription.iter_document_text(path, "transcript.pdf", stats))
+            segment = transcription.clean_and_extract_dialogue_segment(text)
+    finally:
+        transcription.PDF_SKIP_SUMMARY_PAGES = True
+    return text, segment, stats["skipped_pages"]
+
+
+def assert_same_segment(transcription, path):
+    _, expected, _ = extract(transcription, path, skip=False)
+    text, segment, skipped = extract(transcription, path, skip=True)
+    assert segment == expected
+    return text, skipped
+
+
+def test_summary_pages_are_skipped(transcription, tmp_path):
+    pages = [SUMMARY, SUMMARY, SUMMARY, ["Jean Massucatto - Transcript"] + DIALOGUE, DIALOGUE]
+    text, skipped = assert_same_segment(transcription, write_pdf(tmp_path / "doc.pdf", pages))
+    assert skipped == 3
+    assert text.startswith("Jean Massucatto - Transcript")
+
+
+def test_marker_page_is_cut_at_the_start_of_the_marker_line(transcription, tmp_path):
+    pages = [SUMMARY, SUMMARY + ["See the Transcript below", "Jean Massucatto - Transcript"] + DIALOGUE]
+    text, skipped = assert_same_segment(transcription, write_pdf(tmp_path / "doc.pdf", pages))
+    assert skipped == 1
+    assert text.startswith("Jean Massucatto - Transcript\n")
+
+
+def test_marker_on_a_page_before_the_first_speaker_page(transcription, tmp_path):
+    pages = [SUMMARY, SUMMARY + ["Jean Massucatto - Transcript"], SUMMARY[2:], DIALOGUE]
+    _, skipped = assert_same_segment(transcription, write_pdf(tmp_path / "doc.pdf", pages))
+    assert skipped == 1
+
+
+def test_speaker_label_before_every_marker_keeps_every_page(transcription, tmp_path):
+    pages = [SUMMARY + ["Action items: send the offer"], SUMMARY, ["Jean Massucatto - Transcript"] + DIALOGUE]
+    _, skipped = assert_same_segment(transcription, write_pdf(tmp_path / "doc.pdf", pages))
+    assert skipped == 0
+
+
+def test_document_without_speaker_labels(transcription, tmp_path):
+    pages = [SUMMARY, SUMMARY + ["Jean Massucatto - Transcript"], SUMMARY]
+    text, skipped = assert_same_segment(transcription, write_pdf(tmp_path / "doc.pdf", pages))
+    assert skipped == 0 and "Jean Massucatto - Transcript" in text
+
+
+def test_outline_jump_and_wrong_outline(transcription, tmp_path):
+    pages = [SUMMARY, SUMMARY, ["Jean Massucatto - Transcript"] + DIALOGUE]
+    path = write_pdf(tmp_path / "outline.pdf", pages, [[1, "Summary", 1], [1, "Transcript", 3]])
+    _, skipped = assert_same_segment(transcription, path)
+    assert skipped == 2
+    # El índice apunta a una página sin marcador: se ubica por sondeo
+    path = write_pdf(tmp_path / "wrong.pdf", pages, [[1, "Transcript", 1]])
+    _, skipped = assert_same_segment(transcription, path)
+    assert skipped == 2
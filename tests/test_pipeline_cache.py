@@ -0,0 +1,57 @@
+import contextlib
+import io
+
+import pytest
+
+
+class FakeStorage:
+    def bucket(self, name):
+        return self
+
+    def blob(self, name):
+        return self
+
+    def upload_from_string(self, data, content_type=None):
+        pass
+
+
+@pytest.fixture
+def pipeline(transcription, monkeypatch, tmp_path):
+    cache = transcription.StageCache(transcription.SQLiteCacheBackend(str(tmp_path / "cache.sqlite3")))
+    monkeypatch.setattr(transcription, "_stage_cache", cache)
+    monkeypatch.setattr(transcription, "_stage_cache_created", True)
+    monkeypatch.setattr(transcription, "RESOURCE_POOL", transcription.ResourcePool(factories={
+        "storage": FakeStorage, "prompt_template": lambda: "Prompt {embeddings_str}",
+        "segment_prompt_template": lambda: "{segment_text}"}))
+    # Mismo contenido para todos los archivos
+    monkeypatch.setattr(transcription, "content_fingerprint", lambda bucket_name, file_name: "same-md5")
+    dialogue = [{"speaker": "Francisco Ahijado", "text": "Tell me about yourself."},
+                {"speaker": "Ana", "text": "I lead a data team."}]
+    monkeypatch.setattr(transcription, "process_preparation", lambda *args, **kwargs: [
+        {"is_interview": True, "dialogue": dialogue}])
+    monkeypatch.setattr(transcription, "generate_analysis", lambda contents, config: {"1.": "answer"})
+    monkeypatch.setattr(transcription, "upload_report", lambda blob_name, analysis: None)
+    embedded = []
+
+    def embed_dialogue(dialogue, vector_id):
+        embedded.append(vector_id)
+        return {"document": [0.6, 0.8], "chunks": 1, "blob": f"EMBEDDINGS/{vector_id}.npz"}
+
+    monkeypatch.setattr(transcription, "embed_dialogue", embed_dialogue)
+
+    def run(file_name):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return transcription.process_single_transcript("bucket", file_name, concurrent=False)
+
+    return run, embedded
+
+
+def test_same_content_under_a_new_name_is_embedded_under_its_own_id(transcription, pipeline):
+    run, embedded = pipeline
+    first = "30 Minute Interview (Ana) - Notes by Gemini-a.pdf"
+    second = "30 Minute Interview (Ana) - Notes by Gemini-b.pdf"
+    assert run(first)["status"] == "processed"
+    assert run(second)["status"] == "processed"
+    # La redelivery del primer archivo sí usa la caché
+    run(first)
+    assert embedded == [transcription.transcript_vector_id("Ana", first), transcription.transcript_vector_id("Ana", second)]
@@ -0,0 +1,26 @@
+import io
+import zipfile
+
+import docx
+
+
+def test_rendered_report_opens_with_python_docx(transcription, tmp_path):
+    template = transcription.ReportTemplate.load(str(tmp_path / "missing.docx"))
+    sections = [("Technical Skills", "Python & SQL <advanced>"), ("Notes", "first line\nsecond line")]
+    stream = io.BytesIO()
+    template.render("Interview report", sections, stream)
+
+    with zipfile.ZipFile(io.BytesIO(stream.getvalue())) as package:
+        assert package.testzip() is None
+        assert package.namelist()[-1] == transcription.ReportTemplate.DOCUMENT_PART
+    document = docx.Document(io.BytesIO(stream.getvalue()))
+    texts = [paragraph.text for paragraph in document.paragraphs]
+    assert texts == ["Interview report", "Technical Skills", "Python & SQL <advanced>", "Notes", "first line\nsecond line"]
+
+
+def test_report_renders_twice_from_the_same_template(transcription, tmp_path):
+    template = transcription.ReportTemplate.load(str(tmp_path / "missing.docx"))
+    for title in ("First", "Second"):
+        stream = io.BytesIO()
+        template.render(title, [("Heading", "Answer")], stream)
+        assert docx.Document(io.BytesIO(stream.getvalue())).paragraphs[0].text == title
@@ -0,0 +1,56 @@
+import json
+
+import pytest
+
+from conftest import load_function_module
+
+
+class FakeBucket:
+    def __init__(self, names):
+        self.names = names
+        self.get_blob_calls = []
+
+    def get_blob(self, name):
+        self.get_blob_calls.append(name)
+        return type("Blob", (), {"name": name})() if name in self.names else None
+
+
+class Request:
+    def __init__(self, args):
+        self.args = args
+
+
+@pytest.fixture
+def get_url(monkeypatch):
+    module = load_function_module("poc-get-url.py", "poc_get_url_handler")
+    bucket = FakeBucket({"report.docx", "TXT/report.txt", "EMBEDDINGS/a-0123456789ab.npz"})
+    monkeypatch.setattr(module, "get_storage_client", lambda: type("Client", (), {"bucket": lambda self, name: bucket})())
+    monkeypatch.setattr(module, "sign_blob_url", lambda blob: {"filename": blob.name, "url": "signed"})
+    monkeypatch.setattr(module, "list_signed_urls", lambda bucket, prefix, page_size=0, page_token=None: ([page_size], None))
+    module.fake_bucket = bucket
+    return module
+
+
+def call(module, args):
+    body, status, _ = module.signed_urls(Request(args))
+    return status, json.loads(body)
+
+
+def test_name_signs_only_reports(get_url):
+    assert call(get_url, {"name": "report.docx"}) == (200, [{"filename": "report.docx", "url": "signed"}])
+    assert call(get_url, {"name": "missing.docx"})[0] == 404
+    for name in ("TXT/report.txt", "EMBEDDINGS/a-0123456789ab.npz", "LEDGER/abc", "report.docx.npz"):
+        assert call(get_url, {"name": name})[0] == 400
+    # Los nombres rechazados no llegan a get_blob
+    assert get_url.fake_bucket.get_blob_calls == ["report.docx", "missing.docx"]
+
+
+@pytest.mark.parametrize("page_size, expected", [("10", 10), ("5000", 1000), ("1", 1)])
+def test_page_size_is_clamped(get_url, page_size, expected):
+    assert call(get_url, {"page_size": page_size}) == (200, {"files": [expected], "next_page_token": None})
+
+
+@pytest.mark.parametrize("page_size", ["abc", "0", "-3", "2.5", "", "²"])
+def test_invalid_page_size_is_rejected(get_url, page_size):
+    status, body = call(get_url, {"page_size": page_size})
+    assert status == 400 and "page_size" in body["error"]
@@ -0,0 +1,25 @@
+def test_local_cache_stays_under_max_bytes_on_every_put(transcription, tmp_path):
+    backend = transcription.SQLiteCacheBackend(str(tmp_path / "cache.sqlite3"))
+    cache = transcription.StageCache(backend, max_bytes=4096, evict_every=50)
+    for number in range(20):
+        cache.put(transcription.StageCache.key("dialogue", number), "x" * 1000)
+        assert backend.total_bytes <= 4096
+    # Las entradas más recientes sobreviven a la expulsión
+    assert cache.get(transcription.StageCache.key("dialogue", 19)) == "x" * 1000
+    assert cache.get(transcription.StageCache.key("dialogue", 0)) is None
+
+
+def test_total_bytes_follows_replace_and_delete(transcription, tmp_path):
+    backend = transcription.SQLiteCacheBackend(str(tmp_path / "cache.sqlite3"))
+    backend.put("a", b"12345")
+    backend.put("a", b"12")
+    backend.put("b", b"123")
+    assert backend.total_bytes == 5
+    backend.delete("a")
+    assert backend.total_bytes == 3
+    assert transcription.SQLiteCacheBackend(str(tmp_path / "cache.sqlite3")).total_bytes == 3
+
+
+def test_cache_is_disabled_by_default(transcription):
+    assert transcription.STAGE_CACHE_BACKEND == "none"
+    assert transcription.create_stage_cache() is None
@@ -0,0 +1,22 @@
+import json
+import subprocess
+import sys
+
+from conftest import REPO_DIR
+
+# Solo los importa la etapa que los usa (lazy_import); la biblioteca estándar se importa al cargar el módulo
+DEFERRED_MODULES = ["numpy", "fitz", "docx", "vertexai", "google.cloud.storage"]
+
+
+def test_module_load_does_not_import_deferred_modules():
+    code = (
+        "import importlib.util, json, sys\n"
+        "spec = importlib.util.spec_from_file_location('p', 'process-transcription-fn-poc.py')\n"
+        "module = importlib.util.module_from_spec(spec); spec.loader.exec_module(module)\n"
+        f"print(json.dumps([[name for name in {DEFERRED_MODULES!r} if name in sys.modules], module.IMPORT_TIMINGS]))\n"
+    )
+    output = subprocess.run([sys.executable, "-c", code], cwd=REPO_DIR, capture_output=True, text=True, check=True)
+    loaded, import_timings = json.loads(output.stdout.splitlines()[-1])
+    assert loaded == []
+    # IMPORT_TIMINGS y startup_profile_report() solo cuentan importaciones diferidas, ninguna al cargar
+    assert import_timings == {}
@@ -0,0 +1,36 @@
+import threading
+import time
+
+import pytest
+
+from conftest import load_function_module
+
+
+@pytest.mark.parametrize("file_name, module_name", [
+    ("poc-get-url.py", "poc_get_url"),
+    ("upload-trigger-1.py", "upload_trigger_1_clients"),
+])
+def test_storage_client_is_created_once_under_concurrency(file_name, module_name, monkeypatch):
+    module = load_function_module(file_name, module_name)
+    created = []
+
+    class SlowClient:
+        def __init__(self):
+            time.sleep(0.05)  # la creación real resuelve credenciales: deja que los hilos se crucen
+            created.append(self)
+
+    monkeypatch.setattr(module.storage, "Client", SlowClient)
+    barrier = threading.Barrier(8)
+    clients = []
+
+    def get():
+        barrier.wait()
+        clients.append(module.get_storage_client())
+
+    threads = [threading.Thread(target=get) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(created) == 1
+    assert all(client is created[0] for client in clients)
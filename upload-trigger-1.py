@@ -1,36 +1,470 @@
 import functions_framework
-import base64
+import binascii
+import itertools
 import json
+import re
+import tempfile
+import threading
+import urllib.parse
 from google.cloud import storage
 from flask import jsonify, Request
+from werkzeug.sansio.multipart import MultipartDecoder, Field, File, Data, Epilogue, NeedData
 
-BUCKET_NAME = "transcription_poc_uploads_raw" 
-@functions_framework.http
-def upload_to_bucket(request):
+BUCKET_NAME = "transcription_poc_uploads_raw"
+# Tamaño de cada chunk de la subida resumable a GCS (múltiplo de 256 KiB): es el buffer máximo en memoria
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+# El body del request se lee en bloques de este tamaño
+REQUEST_READ_SIZE = 256 * 1024
+# Campos chicos del body (filename, mimeType): tamaño máximo que se guarda en memoria
+MAX_FIELD_SIZE = 64 * 1024
+DEFAULT_MIME_TYPE = "application/octet-stream"
+
+_storage_client = None
+_client_lock = threading.Lock()
+
+_BASE64_DELETE = bytes(set(range(256)) - set(b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/="))
+_SCALAR_END = re.compile(rb"[,}\]\s]")
+
+
+def get_storage_client() -> storage.Client:
+    """
+    Storage client shared by every request of the instance.
+    """
+    global _storage_client
+    with _client_lock:
+        if _storage_client is None:
+            _storage_client = storage.Client()
+        return _storage_client
+
+
+def get_bucket() -> storage.Bucket:
+    # Referencia local: sin el round-trip de metadatos de get_bucket()
+    return get_storage_client().bucket(BUCKET_NAME)
+
+
+def read_chunks(stream, size: int = REQUEST_READ_SIZE):
+    while True:
+        chunk = stream.read(size)
+        if not chunk:
+            return
+        yield chunk
+
+
+class Base64StreamDecoder:
+    """
+    Incremental base64.b64decode(): characters outside the alphabet are discarded (as b64decode does by
+    default) and complete 4-character groups are decoded as they arrive.
+    """
+
+    def __init__(self):
+        self._pending = b""
+
+    def feed(self, data: bytes) -> bytes:
+        data = self._pending + data.translate(None, _BASE64_DELETE)
+        usable = len(data) - len(data) % 4
+        self._pending = data[usable:]
+        return binascii.a2b_base64(data[:usable])
+
+    def finish(self) -> bytes:
+        return binascii.a2b_base64(self._pending) if self._pending else b""
+
+
+class JSONUploadParser:
+    """
+    Incremental parser of a flat JSON object. `feed()` returns events: ("field", key, value) for every
+    member (strings up to MAX_FIELD_SIZE, numbers and literals; nested objects and arrays are skipped),
+    except `stream_field`, whose string is returned in pieces as ("data", key, bytes) followed by
+    ("end", key, None) so it never has to be held whole.
+    """
+
+    def __init__(self, stream_field: str):
+        self.stream_field = stream_field
+        self._state = "start"
+        self._buffer = b""
+        self._key = None
+        self._in_key = False
+        self._streaming = False
+        self._raw = bytearray()
+        self._depth = 0
+        self._nested_string = False
+        self._nested_escape = False
+
+    def feed(self, data: bytes) -> list:
+        buffer = self._buffer + data if self._buffer else data
+        events = []
+        position = 0
+        while position < len(buffer):
+            state = self._state
+            if state == "string":
+                position = self._scan_string(buffer, position, events)
+                if self._state == "string":
+                    break
+                continue
+            if state == "scalar":
+                position = self._scan_scalar(buffer, position, events)
+                continue
+            if state == "nested":
+                position = self._skip_nested(buffer, position)
+                continue
+            char = buffer[position:position + 1]
+            position += 1
+            if char in (b" ", b"\t", b"\r", b"\n"):
+                continue
+            if state == "start" and char == b"{":
+                self._state = "key"
+            elif state in ("key", "next_key") and char == b'"':
+                self._start_string(in_key=True)
+            elif state in ("key", "comma") and char == b"}":
+                self._state = "done"
+            elif state == "colon" and char == b":":
+                self._state = "value"
+            elif state == "value" and char == b'"':
+                self._start_string(in_key=False)
+            elif state == "value" and char in (b"{", b"["):
+                self._depth, self._state = 1, "nested"
+            elif state == "value" and char not in (b",", b"}", b"]", b":"):
+                self._raw = bytearray(char)
+                self._state = "scalar"
+            elif state == "comma" and char == b",":
+                self._state = "next_key"
+            else:
+                raise ValueError("Invalid JSON body")
+        self._buffer = buffer[position:]
+        return events
+
+    def finish(self):
+        if self._state != "done" or self._buffer.strip():
+            raise ValueError("Incomplete JSON body")
+
+    def _start_string(self, in_key: bool):
+        self._in_key = in_key
+        self._streaming = not in_key and self._key == self.stream_field
+        self._raw = bytearray()
+        self._state = "string"
+
+    def _append(self, piece: bytes, events: list):
+        if not piece:
+            return
+        if self._streaming:
+            events.append(("data", self._key, piece))
+            return
+        self._raw += piece
+        if len(self._raw) > MAX_FIELD_SIZE:
+            raise ValueError(f"JSON field larger than {MAX_FIELD_SIZE} bytes")
+
+    def _scan_string(self, buffer: bytes, position: int, events: list) -> int:
+        while True:
+            quote = buffer.find(b'"', position)
+            limit = quote if quote != -1 else len(buffer)
+            backslash = buffer.find(b"\\", position, limit)
+            if backslash != -1:
+                self._append(buffer[position:backslash], events)
+                length = 6 if buffer[backslash + 1:backslash + 2] == b"u" else 2
+                if len(buffer) - backslash < length:
+                    # Escape incompleto: se espera al siguiente bloque
+                    return backslash
+                escape = buffer[backslash:backslash + length]
+                if self._streaming:
+                    escape = json.loads(b'"' + escape + b'"').encode("utf-8", "surrogatepass")
+                self._append(escape, events)
+                position = backslash + length
+                continue
+            self._append(buffer[position:limit], events)
+            if quote == -1:
+                return len(buffer)
+            self._end_string(events)
+            return quote + 1
+
+    def _end_string(self, events: list):
+        if self._streaming:
+            events.append(("end", self._key, None))
+            self._state = "comma"
+            return
+        text = json.loads(b'"' + bytes(self._raw) + b'"')
+        if self._in_key:
+            self._key = text
+            self._state = "colon"
+        else:
+            events.append(("field", self._key, text))
+            self._state = "comma"
+
+    def _scan_scalar(self, buffer: bytes, position: int, events: list) -> int:
+        match = _SCALAR_END.search(buffer, position)
+        end = match.start() if match else len(buffer)
+        self._raw += buffer[position:end]
+        if len(self._raw) > MAX_FIELD_SIZE:
+            raise ValueError(f"JSON field larger than {MAX_FIELD_SIZE} bytes")
+        if match:
+            events.append(("field", self._key, json.loads(bytes(self._raw))))
+            self._state = "comma"
+        return end
+
+    def _skip_nested(self, buffer: bytes, position: int) -> int:
+        for position in range(position, len(buffer)):
+            char = buffer[position]
+            if self._nested_escape:
+                self._nested_escape = False
+            elif self._nested_string:
+                if char == 0x5C:
+                    self._nested_escape = True
+                elif char == 0x22:
+                    self._nested_string = False
+            elif char == 0x22:
+                self._nested_string = True
+            elif char in (0x7B, 0x5B):
+                self._depth += 1
+            elif char in (0x7D, 0x5D):
+                self._depth -= 1
+                if not self._depth:
+                    self._state = "comma"
+                    return position + 1
+        return len(buffer)
+
+
+class StreamedUpload:
+    """
+    One object fed in pieces. Once the name is known, data goes into a GCS resumable upload of
+    UPLOAD_CHUNK_SIZE chunks, the only buffer kept in memory; data that arrives before the name
+    (base64 ahead of "filename" in a JSON body) is spooled to a temporary file first.
+    Nothing is finalized on errors, so a partial object never reaches the bucket.
+    """
+
+    def __init__(self, bucket: storage.Bucket):
+        self.bucket = bucket
+        self.blob = None
+        self.size = 0
+        self.mime_type = DEFAULT_MIME_TYPE
+        self._writer = None
+        self._spool = None
+        self._started_mime_type = None
+
+    def start(self, filename: str):
+        if self.blob is not None:
+            return
+        self.blob = self.bucket.blob(filename, chunk_size=UPLOAD_CHUNK_SIZE)
+        self.blob.content_type = self.mime_type
+        self._writer = self.blob.open("wb", ignore_flush=True)
+        if self._spool is not None:
+            self._spool.seek(0)
+            for chunk in read_chunks(self._spool, UPLOAD_CHUNK_SIZE):
+                self._write(chunk)
+            self._spool.close()
+            self._spool = None
+
+    def set_mime_type(self, mime_type: str):
+        self.mime_type = mime_type or DEFAULT_MIME_TYPE
+        if self.blob is not None:
+            self.blob.content_type = self.mime_type
+
+    def write(self, data: bytes):
+        if not data:
+            return
+        self.size += len(data)
+        if self._writer is not None:
+            self._write(data)
+            return
+        if self._spool is None:
+            self._spool = tempfile.SpooledTemporaryFile(max_size=UPLOAD_CHUNK_SIZE)
+        self._spool.write(data)
+
+    def _write(self, data: bytes):
+        self._writer.write(data)
+        if self._started_mime_type is None and self.size >= UPLOAD_CHUNK_SIZE:
+            # El primer chunk ya abrió la sesión con este Content-Type
+            self._started_mime_type = self.blob.content_type
+
+    def commit(self) -> str:
+        self._writer.close()
+        if self._started_mime_type not in (None, self.mime_type):
+            # mimeType llegó después del primer chunk: se corrige en los metadatos del objeto
+            self.blob.content_type = self.mime_type
+            self.blob.patch()
+        return self.blob.name
+
+    def abort(self):
+        if self._writer is not None and not self._writer.closed:
+            self._writer.terminate()
+        if self._spool is not None:
+            self._spool.close()
+
+
+def upload_response(filename: str):
+    return jsonify({
+        "message": f"File '{filename}' was correctly uploaded togs://{BUCKET_NAME}/{filename}"
+    }), 200
+
+
+def upload_json_body(request: Request):
+    """
+    Original contract: {"filename", "base64", "mimeType"}, decoded and uploaded while the body is read.
+    """
+    upload = StreamedUpload(get_bucket())
+    parser = JSONUploadParser(stream_field="base64")
+    decoder = Base64StreamDecoder()
+    try:
+        for chunk in read_chunks(request.stream):
+            for event, key, value in parser.feed(chunk):
+                if event == "data":
+                    upload.write(decoder.feed(value))
+                elif event == "end":
+                    upload.write(decoder.finish())
+                elif key == "filename" and value:
+                    upload.start(str(value))
+                elif key == "mimeType":
+                    upload.set_mime_type(value)
+        parser.finish()
+        if upload.blob is None or not upload.size:
+            upload.abort()
+            return jsonify({"error": "Need required fields"}), 400
+        return upload_response(upload.commit())
+    except BaseException:
+        upload.abort()
+        raise
+
+
+def upload_raw_body(request: Request):
+    """
+    Raw body (any Content-Type), with ?filename= and optionally ?mimeType=; also accepts
+    Transfer-Encoding: chunked.
+    """
+    filename = request.args.get("filename")
+    if not filename:
+        return jsonify({"error": "Need required fields"}), 400
+    upload = StreamedUpload(get_bucket())
+    upload.set_mime_type(request.args.get("mimeType") or request.mimetype)
     try:
-        request_json = request.get_json(silent=True)
-        if not request_json:
-            return jsonify({"error": "No JSON body provided"}), 400
+        upload.start(filename)
+        for chunk in read_chunks(request.stream):
+            upload.write(chunk)
+        if not upload.size:
+            upload.abort()
+            return jsonify({"error": "Need required fields"}), 400
+        return upload_response(upload.commit())
+    except BaseException:
+        upload.abort()
+        raise
 
-        filename = request_json.get("filename")
-        base64_data = request_json.get("base64")
-        mime_type = request_json.get("mimeType", "application/octet-stream")
 
-        if not all([filename, base64_data]):
+def upload_multipart_body(request: Request):
+    """
+    multipart/form-data with one file part; the name comes from ?filename=, a "filename" field or the
+    part's filename, and the type from ?mimeType=, a "mimeType" field or the part's Content-Type.
+    """
+    boundary = request.mimetype_params.get("boundary")
+    if not boundary:
+        return jsonify({"error": "multipart body without boundary"}), 400
+    decoder = MultipartDecoder(boundary.encode())
+    upload = StreamedUpload(get_bucket())
+    fields, field, file_parts = {}, None, 0
+    try:
+        for chunk in itertools.chain(read_chunks(request.stream), [None]):
+            decoder.receive_data(chunk)
+            event = decoder.next_event()
+            while not isinstance(event, (NeedData, Epilogue)):
+                if isinstance(event, File):
+                    file_parts += 1
+                    if file_parts > 1:
+                        upload.abort()
+                        return jsonify({"error": "Only one file per request"}), 400
+                    field = None
+                    upload.set_mime_type(request.args.get("mimeType") or fields.get("mimeType")
+                                         or event.headers.get("Content-Type"))
+                    filename = request.args.get("filename") or fields.get("filename") or event.filename
+                    if filename:
+                        upload.start(filename)
+                elif isinstance(event, Field):
+                    field = (event.name, bytearray())
+                elif isinstance(event, Data) and field is not None:
+                    field[1].extend(event.data)
+                    if len(field[1]) > MAX_FIELD_SIZE:
+                        raise ValueError(f"Form field larger than {MAX_FIELD_SIZE} bytes")
+                    if not event.more_data:
+                        fields[field[0]] = field[1].decode()
+                elif isinstance(event, Data):
+                    upload.write(event.data)
+                event = decoder.next_event()
+        if "mimeType" in fields and not request.args.get("mimeType"):
+            upload.set_mime_type(fields["mimeType"])
+        if upload.blob is None and fields.get("filename"):
+            upload.start(fields["filename"])
+        if upload.blob is None or not upload.size:
+            upload.abort()
             return jsonify({"error": "Need required fields"}), 400
+        return upload_response(upload.commit())
+    except BaseException:
+        upload.abort()
+        raise
+
+
+def start_resumable_session(request: Request):
+    """
+    ?upload=resumable&filename=...[&mimeType=...][&size=...]: opens a GCS resumable session for uploads
+    split across several requests (e.g. files above the client's payload limit).
+    """
+    filename = request.args.get("filename")
+    if not filename:
+        return jsonify({"error": "Need required fields"}), 400
+    blob = get_bucket().blob(filename)
+    session_url = blob.create_resumable_upload_session(
+        content_type=request.args.get("mimeType", DEFAULT_MIME_TYPE),
+        size=request.args.get("size", type=int),
+        checksum=None
+    )
+    upload_id = urllib.parse.parse_qs(urllib.parse.urlsplit(session_url).query)["upload_id"][0]
+    return jsonify({"upload_id": upload_id, "chunk_size": UPLOAD_CHUNK_SIZE}), 200
 
-        # Decodificar el base64
-        file_bytes = base64.b64decode(base64_data)
 
-        # Subir al bucket
-        client = storage.Client()
-        bucket = client.get_bucket(BUCKET_NAME)
-        blob = bucket.blob(filename)
-        blob.upload_from_string(file_bytes, content_type=mime_type)
+def upload_resumable_chunk(request: Request, upload_id: str):
+    """
+    ?upload_id=... with a Content-Range header ("bytes first-last/total", "*" while the total is unknown):
+    forwards one chunk to the session. Chunks other than the last must be multiples of 256 KiB and at
+    most UPLOAD_CHUNK_SIZE; an empty body with "bytes */total" asks for the session status.
+    """
+    content_range = request.headers.get("Content-Range")
+    if not content_range:
+        return jsonify({"error": "Content-Range header required"}), 400
+    if request.content_length is None or request.content_length > UPLOAD_CHUNK_SIZE:
+        return jsonify({"error": f"Chunks need a Content-Length of at most {UPLOAD_CHUNK_SIZE} bytes"}), 413
 
-        return jsonify({
-            "message": f"File '{filename}' was correctly uploaded togs://{BUCKET_NAME}/{filename}"
-        }), 200
+    client = get_storage_client()
+    session_url = f"{client.api_endpoint}/upload/storage/v1/b/{BUCKET_NAME}/o?" + urllib.parse.urlencode(
+        {"uploadType": "resumable", "upload_id": upload_id})
+    response = client._http.put(session_url, data=request.get_data(cache=False),
+                                headers={"Content-Range": content_range})
+    if response.status_code == 308:
+        # Subida incompleta: GCS informa el rango recibido ("bytes=0-N")
+        received = response.headers.get("Range")
+        next_offset = int(received.rsplit("-", 1)[1]) + 1 if received else 0
+        return jsonify({"upload_id": upload_id, "next_offset": next_offset}), 200
+    if response.status_code in (200, 201):
+        return upload_response(response.json()["name"])
+    return jsonify({"error": response.text}), response.status_code
+
+
+@functions_framework.http
+def upload_to_bucket(request):
+    """
+    Uploads one file to BUCKET_NAME without holding it whole in memory. The mode depends on the request:
+
+        ?upload_id=...                 one chunk of a resumable session (see upload_resumable_chunk)
+        ?upload=resumable              opens a resumable session (see start_resumable_session)
+        application/json               {"filename", "base64", "mimeType"} (original contract)
+        multipart/form-data            one file part
+        any other Content-Type         raw bytes with ?filename=
+    """
+    try:
+        upload_id = request.args.get("upload_id")
+        if upload_id:
+            return upload_resumable_chunk(request, upload_id)
+        if request.args.get("upload") == "resumable":
+            return start_resumable_session(request)
+        if request.mimetype == "application/json":
+            return upload_json_body(request)
+        if request.mimetype == "multipart/form-data":
+            return upload_multipart_body(request)
+        return upload_raw_body(request)
 
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
\ No newline at end of file
+        return jsonify({"error": str(e)}), 500